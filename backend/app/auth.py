@@ -81,6 +81,17 @@ def get_current_restaurant(
     
     return restaurant
 
+def get_platform_admin(
+    current_restaurant: models.Restaurant = Depends(get_current_restaurant)
+) -> models.Restaurant:
+    """Current restaurant, if it is listed in PLATFORM_ADMIN_RESTAURANT_IDS"""
+    if current_restaurant.id not in settings.PLATFORM_ADMIN_RESTAURANT_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="This operation is restricted to platform administrators"
+        )
+    return current_restaurant
+
 def authenticate_restaurant(db: Session, restaurant_code: str, password: str) -> Optional[models.Restaurant]:
     """Authenticate restaurant by code and password"""
     restaurant = db.query(models.Restaurant).filter(
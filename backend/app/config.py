@@ -43,12 +43,85 @@ class Settings(BaseSettings):
     MAX_FILE_SIZE: int = Field(default=10485760, env="MAX_FILE_SIZE")  # 10MB default
     ALLOWED_IMAGE_TYPES: List[str] = ["image/jpeg", "image/png", "image/gif", "image/webp"]
     ALLOWED_VIDEO_TYPES: List[str] = ["video/mp4", "video/webm", "video/avi", "video/mov"]
+    MAX_IMAGE_PIXELS: int = Field(default=50000000, env="MAX_IMAGE_PIXELS")  # Decompression bomb guard (~50MP)
+    LOCAL_STORAGE_LAYOUT: str = Field(default="sharded", env="LOCAL_STORAGE_LAYOUT")  # sharded or flat
+    LOCAL_STORAGE_SHARD_DEPTH: int = Field(default=2, env="LOCAL_STORAGE_SHARD_DEPTH")  # Levels of 256 dirs; don't change once files exist
+    
+    # When set (e.g. "/protected-media/"), authenticated media is handed to nginx via X-Accel-Redirect
+    MEDIA_X_ACCEL_REDIRECT_PREFIX: str = Field(default="", env="MEDIA_X_ACCEL_REDIRECT_PREFIX")
+    
+    # Resumable uploads - staged on local disk until finalized
+    RESUMABLE_UPLOAD_DIRECTORY: str = Field(default="./resumable_uploads", env="RESUMABLE_UPLOAD_DIRECTORY")  # Must not be inside UPLOAD_DIRECTORY
+    MAX_RESUMABLE_UPLOAD_SIZE: int = Field(default=524288000, env="MAX_RESUMABLE_UPLOAD_SIZE")  # 500MB default
+    RESUMABLE_UPLOAD_EXPIRY_HOURS: int = Field(default=24, env="RESUMABLE_UPLOAD_EXPIRY_HOURS")
+    
+    # Direct uploads - clients send bytes straight to the store with signed parameters
+    DIRECT_UPLOAD_EXPIRY_SECONDS: int = Field(default=900, env="DIRECT_UPLOAD_EXPIRY_SECONDS")  # How long signed parameters stay valid
+    DIRECT_UPLOAD_STAGING_DIRECTORY: str = Field(default="./direct_uploads", env="DIRECT_UPLOAD_STAGING_DIRECTORY")  # Local PUTs wait here for confirm; must not be inside UPLOAD_DIRECTORY
+    
+    # Local to Cloudinary migration
+    STORAGE_MIGRATION_CONCURRENCY: int = Field(default=4, env="STORAGE_MIGRATION_CONCURRENCY")  # Parallel uploads
+    STORAGE_MIGRATION_BATCH_SIZE: int = Field(default=50, env="STORAGE_MIGRATION_BATCH_SIZE")  # MediaFile rows per commit
+    
+    # Image pipeline - uploads are encoded once with this codec and stored as-is
+    IMAGE_OUTPUT_FORMAT: str = Field(default="webp", env="IMAGE_OUTPUT_FORMAT")  # webp, avif, jpeg or auto
+    IMAGE_QUALITY_TIER: str = Field(default="good", env="IMAGE_QUALITY_TIER")  # low, good, best
+    IMAGE_PROGRESSIVE: bool = Field(default=True, env="IMAGE_PROGRESSIVE")  # Progressive JPEG output
     
     # Cloudinary Configuration
     CLOUDINARY_CLOUD_NAME: str = Field(default="dxmdswaly", env="CLOUDINARY_CLOUD_NAME")
     CLOUDINARY_API_KEY: str = Field(default="415182249976459", env="CLOUDINARY_API_KEY")
     CLOUDINARY_API_SECRET: str = Field(default="1Suf70Le9D-y25qsdJUQwQ2BtyQ", env="CLOUDINARY_API_SECRET")
+    CLOUDINARY_UPLOAD_PREFIX: str = Field(default="", env="CLOUDINARY_UPLOAD_PREFIX")  # API host override, e.g. http://127.0.0.1:9400 for fake_cloudinary.py
     USE_CLOUD_STORAGE: bool = Field(default=True, env="USE_CLOUD_STORAGE")  # Enabled for Cloudinary support
+    STORAGE_BACKEND: str = Field(default="cloudinary", env="STORAGE_BACKEND")  # cloudinary or s3 when cloud storage is on
+    CLOUDINARY_ADMIN_RATE_LIMIT_RESERVE: int = Field(default=50, env="CLOUDINARY_ADMIN_RATE_LIMIT_RESERVE")  # Admin API calls/hour left for the app
+    CLOUDINARY_MAX_CONNECTIONS: int = Field(default=100, env="CLOUDINARY_MAX_CONNECTIONS")  # Pooled connections shared by all API calls
+    CLOUDINARY_MAX_KEEPALIVE_CONNECTIONS: int = Field(default=20, env="CLOUDINARY_MAX_KEEPALIVE_CONNECTIONS")  # Idle connections kept open
+    CLOUDINARY_TIMEOUT_SECONDS: float = Field(default=60.0, env="CLOUDINARY_TIMEOUT_SECONDS")  # Read/write timeout per request
+    CLOUDINARY_CONNECT_TIMEOUT_SECONDS: float = Field(default=5.0, env="CLOUDINARY_CONNECT_TIMEOUT_SECONDS")
+    CLOUDINARY_MAX_RETRIES: int = Field(default=2, env="CLOUDINARY_MAX_RETRIES")  # Retries after connection errors and 5xx responses
+    
+    # Cloudinary circuit breaker - uploads go to local storage while it is open
+    CLOUDINARY_CIRCUIT_FAILURE_RATE: float = Field(default=0.5, env="CLOUDINARY_CIRCUIT_FAILURE_RATE")  # Share of failed calls that opens it
+    CLOUDINARY_CIRCUIT_SLOW_CALL_RATE: float = Field(default=0.5, env="CLOUDINARY_CIRCUIT_SLOW_CALL_RATE")  # Share of slow calls that opens it
+    CLOUDINARY_CIRCUIT_SLOW_CALL_SECONDS: float = Field(default=10.0, env="CLOUDINARY_CIRCUIT_SLOW_CALL_SECONDS")  # A call slower than this is slow
+    CLOUDINARY_CIRCUIT_WINDOW: int = Field(default=20, env="CLOUDINARY_CIRCUIT_WINDOW")  # Recent calls the rates are taken over
+    CLOUDINARY_CIRCUIT_MIN_CALLS: int = Field(default=5, env="CLOUDINARY_CIRCUIT_MIN_CALLS")  # Calls needed before it can open
+    CLOUDINARY_CIRCUIT_OPEN_SECONDS: float = Field(default=30.0, env="CLOUDINARY_CIRCUIT_OPEN_SECONDS")  # Wait before probing again
+    CLOUDINARY_CIRCUIT_HALF_OPEN_PROBES: int = Field(default=2, env="CLOUDINARY_CIRCUIT_HALF_OPEN_PROBES")  # Successful probes that close it
+
+    # Cloudinary resource metadata shown in the admin media views
+    CLOUDINARY_METADATA_TTL_SECONDS: int = Field(default=3600, env="CLOUDINARY_METADATA_TTL_SECONDS")  # How long fetched metadata is reused
+    CLOUDINARY_METADATA_CACHE_SIZE: int = Field(default=10000, env="CLOUDINARY_METADATA_CACHE_SIZE")  # Assets kept, least recently used dropped first
+    CLOUDINARY_METADATA_WAIT_SECONDS: float = Field(default=2.0, env="CLOUDINARY_METADATA_WAIT_SECONDS")  # Longest a view waits for Cloudinary
+    
+    # Gallery contact sheets (one sprite per gallery page)
+    CONTACT_SHEET_WORKERS: int = Field(default=2, env="CONTACT_SHEET_WORKERS")  # Processes composing sheets
+    CONTACT_SHEET_CACHE_MAX_MB: int = Field(default=512, env="CONTACT_SHEET_CACHE_MAX_MB")  # Sheets plus cached thumbnails
+    
+    # Operators - restaurants allowed to run jobs that act across every tenant
+    PLATFORM_ADMIN_RESTAURANT_IDS: Union[str, List[int]] = Field(default="", env="PLATFORM_ADMIN_RESTAURANT_IDS")  # Comma-separated ids
+    
+    @field_validator('PLATFORM_ADMIN_RESTAURANT_IDS', mode='before')
+    @classmethod
+    def parse_platform_admin_ids(cls, v):
+        if isinstance(v, int):
+            return [v]
+        if isinstance(v, str):
+            return [int(restaurant_id) for restaurant_id in v.split(",") if restaurant_id.strip()]
+        return v
+    
+    # Orphaned media garbage collection
+    MEDIA_GC_GRACE_HOURS: int = Field(default=24, env="MEDIA_GC_GRACE_HOURS")  # Never collect assets younger than this
+    
+    # S3-compatible object storage (AWS S3, MinIO, R2, ...)
+    S3_BUCKET: str = Field(default="", env="S3_BUCKET")
+    S3_ENDPOINT_URL: str = Field(default="", env="S3_ENDPOINT_URL")  # Leave empty for AWS
+    S3_REGION: str = Field(default="us-east-1", env="S3_REGION")
+    S3_ACCESS_KEY_ID: str = Field(default="", env="S3_ACCESS_KEY_ID")
+    S3_SECRET_ACCESS_KEY: str = Field(default="", env="S3_SECRET_ACCESS_KEY")
+    S3_PUBLIC_BASE_URL: str = Field(default="", env="S3_PUBLIC_BASE_URL")  # e.g. a CDN in front of the bucket
     
     @field_validator('MAX_FILE_SIZE', mode='before')
     @classmethod
@@ -60,6 +133,16 @@ class Settings(BaseSettings):
                 return 10485760  # Default 10MB
         return v or 10485760
     
+    @field_validator('MAX_IMAGE_PIXELS', mode='before')
+    @classmethod
+    def parse_max_image_pixels(cls, v):
+        if isinstance(v, str):
+            try:
+                return int(v)
+            except ValueError:
+                return 50000000
+        return v or 50000000
+    
     # Environment
     ENVIRONMENT: str = Field(default="production", env="ENVIRONMENT")  # Railway will set this to "production"
     DEBUG: bool = Field(default=False, env="DEBUG")
@@ -97,6 +180,20 @@ class Settings(BaseSettings):
     
     # Logging
     LOG_LEVEL: str = Field(default="INFO", env="LOG_LEVEL")
+    LOG_LEVELS: str = Field(default="", env="LOG_LEVELS")  # Per-logger overrides, e.g. "app.crud=DEBUG,app.utils=WARNING"
+    LOG_FORMAT: str = Field(default="json", env="LOG_FORMAT")  # "json" (one object per line) or "text"
+    
+    # Metrics (Prometheus exposition at /metrics)
+    METRICS_SAMPLE_SECONDS: float = Field(default=15.0, env="METRICS_SAMPLE_SECONDS")  # How often system stats are sampled
+    METRICS_TOKEN: str = Field(default="", env="METRICS_TOKEN")  # Bearer token scrapers must send; open when empty
+    
+    # Profiling (platform admins only, under /api/admin/profiling)
+    PROFILING_ENABLED: bool = Field(default=False, env="PROFILING_ENABLED")  # The endpoints answer 404 unless enabled
+    PROFILING_MAX_SECONDS: int = Field(default=60, env="PROFILING_MAX_SECONDS")  # Longest CPU profile one request can start
+    
+    # Query instrumentation
+    DB_SLOW_QUERY_MS: float = Field(default=500.0, env="DB_SLOW_QUERY_MS")  # Statements slower than this are logged
+    DB_N_PLUS_ONE_THRESHOLD: int = Field(default=5, env="DB_N_PLUS_ONE_THRESHOLD")  # Repeats of one statement per request flagged in debug mode
     
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = Field(default=60, env="RATE_LIMIT_PER_MINUTE")
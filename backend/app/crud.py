@@ -1,9 +1,13 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from typing import List, Optional
+from sqlalchemy import and_, or_, func
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, List, Optional
 from app import models, schemas
 from app.auth import get_password_hash, generate_restaurant_code
 from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Restaurant CRUD
 def create_restaurant(db: Session, restaurant: schemas.RestaurantCreate) -> models.Restaurant:
@@ -111,7 +115,7 @@ def delete_user(db: Session, user_id: int, restaurant_id: int) -> bool:
 # Task CRUD operations  
 def create_task(db: Session, task: schemas.TaskCreate, restaurant_id: int) -> models.Task:
     """Create a new task"""
-    print(f"Creating task: {task.dict()}, restaurant_id: {restaurant_id}")
+    logger.debug("Creating task for restaurant %s: %s", restaurant_id, task)
     
     try:
         # Convert string values to enum objects
@@ -128,7 +132,7 @@ def create_task(db: Session, task: schemas.TaskCreate, restaurant_id: int) -> mo
         day = get_enum_from_value(models.Day, task.day)
         task_type = get_enum_from_value(models.TaskType, task.task_type)
         
-        print(f"Converted enums - category: {category}, day: {day}, task_type: {task_type}")
+        logger.debug("Converted enums - category: %s, day: %s, task_type: %s", category, day, task_type)
         
         db_task = models.Task(
             task=task.task,
@@ -146,11 +150,11 @@ def create_task(db: Session, task: schemas.TaskCreate, restaurant_id: int) -> mo
         db.add(db_task)
         db.commit()
         db.refresh(db_task)
-        print(f"Task created successfully with ID: {db_task.id}")
+        logger.info(f"Task {db_task.id} created for restaurant {restaurant_id}")
         return db_task
     except Exception as e:
         db.rollback()
-        print(f"Error creating task: {str(e)}")
+        logger.error(f"Error creating task for restaurant {restaurant_id}: {str(e)}")
         raise
 
 def get_tasks_by_restaurant(
@@ -168,21 +172,21 @@ def get_tasks_by_restaurant(
                 status_enum = convert_enum_value_to_enum_member(filters.status, models.TaskStatus)
                 query = query.filter(models.Task.status == status_enum)
             except Exception as e:
-                print(f"Error converting status enum: {e}")
+                logger.warning(f"Ignoring invalid status filter: {e}")
         
         if filters.category:
             try:
                 category_enum = convert_enum_value_to_enum_member(filters.category, models.TaskCategory)
                 query = query.filter(models.Task.category == category_enum)
             except Exception as e:
-                print(f"Error converting category enum: {e}")
+                logger.warning(f"Ignoring invalid category filter: {e}")
         
         if filters.day:
             try:
                 day_enum = convert_enum_value_to_enum_member(filters.day, models.Day)
                 query = query.filter(models.Task.day == day_enum)
             except Exception as e:
-                print(f"Error converting day enum: {e}")
+                logger.warning(f"Ignoring invalid day filter: {e}")
                 
         if filters.initials:
             query = query.filter(models.Task.initials == filters.initials)
@@ -192,7 +196,7 @@ def get_tasks_by_restaurant(
                 task_type_enum = convert_enum_value_to_enum_member(filters.task_type, models.TaskType)
                 query = query.filter(models.Task.task_type == task_type_enum)
             except Exception as e:
-                print(f"Error converting task_type enum: {e}")
+                logger.warning(f"Ignoring invalid task_type filter: {e}")
     
     return query.order_by(models.Task.created_at.desc()).all()
 
@@ -230,7 +234,7 @@ def update_task(db: Session, task_id: int, restaurant_id: int, task_update: sche
         if "task_type" in update_data:
             update_data["task_type"] = convert_enum_value_to_enum_member(update_data["task_type"], models.TaskType)
     except Exception as e:
-        print(f"Error converting enum values during task update: {e}")
+        logger.warning(f"Error converting enum values during task {task_id} update: {e}")
         raise
     
     for field, value in update_data.items():
@@ -245,16 +249,25 @@ def delete_task(db: Session, task_id: int, restaurant_id: int) -> bool:
     if not db_task:
         return False
     
+    # Media records cascade with the task
+    removed_media = _media_counts_of(db_task.media_files)
     db.delete(db_task)
     db.commit()
+    for file_type, count in removed_media.items():
+        adjust_media_count(db, restaurant_id, file_type, -count)
     return True
 
 # Media file CRUD
 def create_media_file(db: Session, media_data: dict) -> models.MediaFile:
     db_media = models.MediaFile(**media_data)
+    if db_media.restaurant_id is None:
+        db_media.restaurant_id = db.query(models.Task.restaurant_id).filter(
+            models.Task.id == db_media.task_id
+        ).scalar()
     db.add(db_media)
     db.commit()
     db.refresh(db_media)
+    adjust_media_count(db, db_media.restaurant_id, db_media.file_type, 1)
     return db_media
 
 def get_media_files_by_task(db: Session, task_id: int) -> List[models.MediaFile]:
@@ -262,6 +275,38 @@ def get_media_files_by_task(db: Session, task_id: int) -> List[models.MediaFile]
         models.MediaFile.task_id == task_id
     ).all()
 
+def get_media_file_by_hash(db: Session, content_hash: str, restaurant_id: int) -> Optional[models.MediaFile]:
+    """Find an already stored upload with the same content for this restaurant"""
+    return db.query(models.MediaFile).join(models.Task).filter(
+        models.MediaFile.content_hash == content_hash,
+        models.Task.restaurant_id == restaurant_id
+    ).order_by(models.MediaFile.id).first()
+
+def count_media_file_references(db: Session, media: models.MediaFile) -> int:
+    """Count the media records that share the stored object behind this record"""
+    query = db.query(models.MediaFile).filter(
+        models.MediaFile.storage_type == media.storage_type,
+        models.MediaFile.file_path == media.file_path
+    )
+    if media.content_hash:
+        query = query.filter(models.MediaFile.content_hash == media.content_hash)
+    return query.count()
+
+def delete_media_files_by_task(db: Session, task_id: int) -> int:
+    removed_media = db.query(
+        models.MediaFile.restaurant_id, models.MediaFile.file_type, func.count()
+    ).filter(
+        models.MediaFile.task_id == task_id
+    ).group_by(models.MediaFile.restaurant_id, models.MediaFile.file_type).all()
+    
+    deleted = db.query(models.MediaFile).filter(
+        models.MediaFile.task_id == task_id
+    ).delete(synchronize_session=False)
+    db.commit()
+    for restaurant_id, file_type, count in removed_media:
+        adjust_media_count(db, restaurant_id, file_type, -count)
+    return deleted
+
 def delete_media_file(db: Session, media_id: int) -> bool:
     db_media = db.query(models.MediaFile).filter(
         models.MediaFile.id == media_id
@@ -270,10 +315,138 @@ def delete_media_file(db: Session, media_id: int) -> bool:
     if not db_media:
         return False
     
+    restaurant_id, file_type = db_media.restaurant_id, db_media.file_type
     db.delete(db_media)
     db.commit()
+    adjust_media_count(db, restaurant_id, file_type, -1)
     return True
 
+# Media count CRUD
+MEDIA_TYPES = ("image", "video")
+
+def _media_counts_of(media_files: List[models.MediaFile]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for media in media_files:
+        counts[media.file_type] = counts.get(media.file_type, 0) + 1
+    return counts
+
+def adjust_media_count(db: Session, restaurant_id: Optional[int], file_type: str, delta: int) -> None:
+    """Add to (or subtract from) a restaurant's media counter in a single UPDATE"""
+    if restaurant_id is None:
+        return
+    counter = models.RestaurantMediaCount
+    updated = db.query(counter).filter(
+        counter.restaurant_id == restaurant_id,
+        counter.file_type == file_type
+    ).update({counter.media_count: counter.media_count + delta}, synchronize_session=False)
+    db.commit()
+    
+    # No counter yet: count the records once, which already includes this change
+    if not updated:
+        recalculate_media_counts(db, restaurant_id)
+
+def get_media_counts(db: Session, restaurant_id: int) -> Dict[str, int]:
+    """Media records per file type, counted on first use for restaurants without counters"""
+    counts = dict(db.query(
+        models.RestaurantMediaCount.file_type,
+        models.RestaurantMediaCount.media_count
+    ).filter(
+        models.RestaurantMediaCount.restaurant_id == restaurant_id
+    ).all())
+    if not counts:
+        return recalculate_media_counts(db, restaurant_id)
+    return counts
+
+def recalculate_media_counts(db: Session, restaurant_id: int) -> Dict[str, int]:
+    """Rebuild a restaurant's media counters from its media records"""
+    counts = {file_type: 0 for file_type in MEDIA_TYPES}
+    counts.update(db.query(models.MediaFile.file_type, func.count()).filter(
+        models.MediaFile.restaurant_id == restaurant_id
+    ).group_by(models.MediaFile.file_type).all())
+    
+    db.query(models.RestaurantMediaCount).filter(
+        models.RestaurantMediaCount.restaurant_id == restaurant_id
+    ).delete(synchronize_session=False)
+    for file_type, media_count in counts.items():
+        db.add(models.RestaurantMediaCount(
+            restaurant_id=restaurant_id,
+            file_type=file_type,
+            media_count=media_count
+        ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent recalculation wrote the same counts first
+        db.rollback()
+    return counts
+
+# Storage usage CRUD
+def adjust_storage_usage(db: Session, restaurant_id: int, storage_type: str,
+                         bytes_delta: int, objects_delta: int) -> None:
+    """Add to (or subtract from) a restaurant's storage counters in a single UPDATE"""
+    usage = models.RestaurantStorageUsage
+    
+    def increment() -> int:
+        return db.query(usage).filter(
+            usage.restaurant_id == restaurant_id,
+            usage.storage_type == storage_type
+        ).update({
+            usage.bytes_used: usage.bytes_used + bytes_delta,
+            usage.object_count: usage.object_count + objects_delta
+        }, synchronize_session=False)
+    
+    if increment():
+        db.commit()
+        return
+    
+    db.add(usage(
+        restaurant_id=restaurant_id,
+        storage_type=storage_type,
+        bytes_used=max(bytes_delta, 0),
+        object_count=max(objects_delta, 0)
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request created the row first - apply the delta to it
+        db.rollback()
+        increment()
+        db.commit()
+
+def get_storage_usage(db: Session, restaurant_id: int) -> List[models.RestaurantStorageUsage]:
+    return db.query(models.RestaurantStorageUsage).filter(
+        models.RestaurantStorageUsage.restaurant_id == restaurant_id
+    ).all()
+
+def recalculate_storage_usage(db: Session, restaurant_id: int) -> List[models.RestaurantStorageUsage]:
+    """Rebuild a restaurant's counters from its media records, counting shared objects once"""
+    stored_objects = db.query(
+        models.MediaFile.storage_type,
+        models.MediaFile.file_path,
+        models.MediaFile.file_size
+    ).join(models.Task).filter(
+        models.Task.restaurant_id == restaurant_id
+    ).distinct().subquery()
+    
+    totals = db.query(
+        stored_objects.c.storage_type,
+        func.coalesce(func.sum(stored_objects.c.file_size), 0),
+        func.count()
+    ).group_by(stored_objects.c.storage_type).all()
+    
+    db.query(models.RestaurantStorageUsage).filter(
+        models.RestaurantStorageUsage.restaurant_id == restaurant_id
+    ).delete(synchronize_session=False)
+    for storage_type, bytes_used, object_count in totals:
+        db.add(models.RestaurantStorageUsage(
+            restaurant_id=restaurant_id,
+            storage_type=storage_type,
+            bytes_used=bytes_used,
+            object_count=object_count
+        ))
+    db.commit()
+    return get_storage_usage(db, restaurant_id)
+
 # NFC Cleaning CRUD functions
 def get_active_cleaning_task_by_asset(db: Session, asset_id: str, restaurant_id: int) -> Optional[models.Task]:
     """Get the active cleaning task for a specific asset"""
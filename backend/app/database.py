@@ -1,19 +1,36 @@
+import time
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from app.config import settings
+from app import metrics, query_stats
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            metrics.DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
 
 # Create engine with proper configuration for different databases
 if settings.DATABASE_URL.startswith("sqlite"):
     # SQLite configuration for development
     engine = create_engine(
         settings.DATABASE_URL, 
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False},
+        poolclass=MeteredQueuePool
     )
 elif settings.DATABASE_URL.startswith("postgresql"):
     # PostgreSQL configuration for production
     engine = create_engine(
         settings.DATABASE_URL,
+        poolclass=MeteredQueuePool,
         pool_size=settings.DB_POOL_SIZE,
         max_overflow=settings.DB_MAX_OVERFLOW,
         pool_pre_ping=True,  # Verify connections before use
@@ -24,6 +41,9 @@ else:
     # Default configuration
     engine = create_engine(settings.DATABASE_URL)
 
+metrics.register_engine(engine)
+query_stats.instrument(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
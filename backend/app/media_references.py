@@ -0,0 +1,150 @@
+"""
+Parsed media references and delivery URL building
+
+Task media URLs are parsed once, when they are written, into a
+MediaReference (provider, resource_type, public_id, version, format) that
+is stored next to the URL. Transformed delivery URLs are then built from
+the reference instead of rewriting the URL string on every request.
+"""
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, NamedTuple, Optional
+from urllib.parse import urlparse
+from app import metrics
+
+# https://res.cloudinary.com/<cloud>/<resource_type>/upload/[<transformations>/][v<version>/]<public_id>.<ext>
+CLOUDINARY_URL_PATTERN = re.compile(r'^/([^/]+)/(image|video|raw)/upload/(.+)$')
+VERSION_PATTERN = re.compile(r'^v(\d+)$')
+TRANSFORMATION_PATTERN = re.compile(r'^[a-z]{1,3}_[^/]+$')
+
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'webm', 'mkv', 'm4v'}
+
+# Fixed renditions generated when media is uploaded: name -> (width, height, crop).
+# "fill" crops to the exact box, "fit" scales down to fit inside it.
+RENDITIONS = {
+    'thumbnail': (300, 300, 'fill'),
+    'small': (300, 300, 'fit'),
+    'medium': (600, 600, 'fit'),
+    'large': (1200, 1200, 'fit'),
+    'poster': (1200, 1200, 'fit'),
+}
+IMAGE_RENDITIONS = ('thumbnail', 'small', 'medium', 'large')
+# Video renditions are still frames, delivered as JPEG
+VIDEO_RENDITIONS = ('thumbnail', 'poster')
+VIDEO_RENDITION_FORMAT = 'jpg'
+
+
+def rendition_transformation(name: str) -> str:
+    """Cloudinary transformation for a rendition, in the SDK's canonical order
+
+    Eager derived assets are matched by their transformation string, so
+    URLs built here must spell it exactly as the upload did.
+    """
+    width, height, crop = RENDITIONS[name]
+    return f"c_{crop},h_{height},w_{width}"
+
+
+# Named transformations used for previews
+PREVIEW_TRANSFORMATIONS = {name: rendition_transformation(name) for name in IMAGE_RENDITIONS}
+PREVIEW_TRANSFORMATIONS['original'] = ''
+THUMBNAIL_TRANSFORMATION = rendition_transformation('thumbnail')
+PREVIEW_TRANSFORMATION = rendition_transformation('medium')
+
+
+class MediaReference(NamedTuple):
+    """Structured form of a stored media URL"""
+    provider: str  # "cloudinary", "local" or "external"
+    resource_type: str  # image, video or raw
+    public_id: Optional[str]  # Cloudinary public_id or upload-relative path
+    version: Optional[str]
+    format: Optional[str]
+    cloud_name: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._asdict()
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> Optional["MediaReference"]:
+        if not data:
+            return None
+        try:
+            return cls(**{field: data.get(field) for field in cls._fields})
+        except TypeError:
+            return None
+
+
+def _extension(path: str) -> Optional[str]:
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    return extension or None
+
+
+@lru_cache(maxsize=8192)
+def parse_media_url(url: Optional[str]) -> Optional[MediaReference]:
+    """Parse a media URL into a MediaReference, or None for an empty URL"""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    path = parsed.path
+
+    if parsed.netloc.endswith('cloudinary.com'):
+        match = CLOUDINARY_URL_PATTERN.match(path)
+        if match:
+            cloud_name, resource_type, rest = match.groups()
+            segments = rest.split('/')
+
+            # Everything after the version is the public_id; without a
+            # version, skip leading transformation segments
+            version = None
+            version_index = next((i for i, segment in enumerate(segments) if VERSION_PATTERN.match(segment)), None)
+            if version_index is not None:
+                version = segments[version_index][1:]
+                segments = segments[version_index + 1:]
+            else:
+                while len(segments) > 1 and all(TRANSFORMATION_PATTERN.match(part) for part in segments[0].split(',')):
+                    segments = segments[1:]
+
+            public_id = '/'.join(segments)
+            media_format = None
+            if resource_type != 'raw' and '.' in segments[-1]:
+                public_id, media_format = public_id.rsplit('.', 1)
+                media_format = media_format.lower()
+            return MediaReference('cloudinary', resource_type, public_id, version, media_format, cloud_name)
+
+    media_format = _extension(path)
+    resource_type = 'video' if media_format in VIDEO_EXTENSIONS else 'image'
+    if '/uploads/' in path:
+        return MediaReference('local', resource_type, path.split('/uploads/', 1)[1], None, media_format)
+    return MediaReference('external', resource_type, None, None, media_format)
+
+
+def reference_for(url: Optional[str], stored: Optional[Dict[str, Any]] = None) -> Optional[MediaReference]:
+    """Stored reference when present, otherwise parse (and cache) the URL"""
+    return MediaReference.from_dict(stored) or parse_media_url(url)
+
+
+@lru_cache(maxsize=16384)
+def build_delivery_url(
+    reference: MediaReference,
+    transformation: str = '',
+    media_format: Optional[str] = None
+) -> Optional[str]:
+    """Cloudinary delivery URL for a reference with an optional transformation
+
+    media_format overrides the stored format, e.g. 'jpg' for a video poster
+    frame. Returns None for references that are not on Cloudinary.
+    """
+    if reference.provider != 'cloudinary':
+        return None
+    parts = [f"https://res.cloudinary.com/{reference.cloud_name}/{reference.resource_type}/upload"]
+    if transformation:
+        parts.append(transformation)
+    if reference.version:
+        parts.append(f"v{reference.version}")
+    media_format = media_format or reference.format
+    parts.append(f"{reference.public_id}.{media_format}" if media_format else reference.public_id)
+    return '/'.join(parts)
+
+
+metrics.register_cache("media_url_parse", lambda: parse_media_url.cache_info()[:2])
+metrics.register_cache("delivery_url", lambda: build_delivery_url.cache_info()[:2])
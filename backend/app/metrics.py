@@ -0,0 +1,157 @@
+"""
+Prometheus metrics for the API process
+
+Request, database pool and query, upload and Cloudinary metrics are
+recorded where the work happens; cache hit rates and pool usage are read
+from their owners when /metrics is scraped. System stats come from a background
+sampler, so a scrape never waits on psutil.
+"""
+import asyncio
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+import psutil
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template and status",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being served", ["method"])
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds", "Time to get a connection from the database pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Time to execute one SQL statement", ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements executed while serving one request",
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+)
+DB_SLOW_QUERIES = Counter("db_slow_queries_total", "SQL statements over DB_SLOW_QUERY_MS", ["operation"])
+
+UPLOAD_BYTES = Counter("media_upload_bytes_total", "Bytes of media stored", ["file_type", "storage"])
+UPLOAD_SECONDS = Histogram(
+    "media_upload_duration_seconds", "Time to store one media file", ["file_type", "storage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+
+CLOUDINARY_REQUEST_SECONDS = Histogram(
+    "cloudinary_request_duration_seconds", "Cloudinary API call time including retries",
+    ["operation", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+
+
+def method_label(method: str) -> str:
+    """Request method, with anything unusual folded together to bound label cardinality"""
+    return method if method in HTTP_METHODS else "OTHER"
+
+
+def observe_upload(file_type: str, storage_type: str, file_size: int, seconds: float) -> None:
+    UPLOAD_BYTES.labels(file_type, storage_type).inc(file_size or 0)
+    UPLOAD_SECONDS.labels(file_type, storage_type).observe(seconds)
+
+
+def register_cache(name: str, stats: Callable[[], Tuple[int, int]]) -> None:
+    """Report a cache's (hits, misses) as cache_requests_total{cache=name}"""
+    state_collector.caches[name] = stats
+
+
+def register_engine(engine) -> None:
+    """Report the usage of this engine's connection pool"""
+    state_collector.engine = engine
+
+
+class StateCollector:
+    """Metrics read from their owners at scrape time: caches, the DB pool and system stats"""
+
+    def __init__(self):
+        self.caches: Dict[str, Callable[[], Tuple[int, int]]] = {}
+        self.engine = None
+
+    def collect(self):
+        cache_requests = CounterMetricFamily(
+            "cache_requests", "Cache lookups by result", labels=["cache", "result"]
+        )
+        for name, stats in self.caches.items():
+            try:
+                hits, misses = stats()
+            except Exception as e:
+                logger.warning(f"Failed to read {name} cache stats: {str(e)}")
+                continue
+            cache_requests.add_metric([name, "hit"], hits)
+            cache_requests.add_metric([name, "miss"], misses)
+        yield cache_requests
+
+        pool = self.engine.pool if self.engine is not None else None
+        if pool is not None and hasattr(pool, "checkedout"):
+            connections = GaugeMetricFamily("db_pool_connections", "Database pool connections", labels=["state"])
+            connections.add_metric(["checked_out"], pool.checkedout())
+            connections.add_metric(["idle"], pool.checkedin())
+            connections.add_metric(["overflow"], max(pool.overflow(), 0))
+            yield connections
+            yield GaugeMetricFamily("db_pool_size", "Connections the pool keeps open", value=pool.size())
+
+        sample = system_sampler.latest
+        if sample:
+            yield GaugeMetricFamily("system_cpu_percent", "Host CPU use", value=sample["cpu_percent"])
+            yield GaugeMetricFamily("system_memory_percent", "Host memory use", value=sample["memory_percent"])
+            yield GaugeMetricFamily("system_disk_percent", "Disk use of /", value=sample["disk_percent"])
+
+
+class SystemSampler:
+    """Host CPU, memory and disk use, sampled on an interval off the request path"""
+
+    def __init__(self):
+        self.interval = settings.METRICS_SAMPLE_SECONDS
+        self.latest: Optional[dict] = None
+
+    def _sample(self) -> dict:
+        # cpu_percent without an interval compares against the previous call
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage('/')
+        return {
+            "sampled_at": datetime.utcnow().isoformat(),
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": memory.percent,
+            "memory_used_mb": memory.used // (1024 * 1024),
+            "memory_total_mb": memory.total // (1024 * 1024),
+            "disk_percent": disk.percent,
+            "disk_used_gb": disk.used // (1024 * 1024 * 1024),
+            "disk_total_gb": disk.total // (1024 * 1024 * 1024)
+        }
+
+    async def sample(self) -> dict:
+        loop = asyncio.get_event_loop()
+        self.latest = await loop.run_in_executor(None, self._sample)
+        return self.latest
+
+    async def run(self) -> None:
+        """Sample forever; started once from the app's startup event"""
+        # Start the CPU measurement so the first sample covers a real interval
+        psutil.cpu_percent(interval=None)
+        await asyncio.sleep(1)
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                logger.warning(f"System metrics sample failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+# Create sampler and collector instances
+system_sampler = SystemSampler()
+state_collector = StateCollector()
+REGISTRY.register(state_collector)
@@ -89,7 +89,10 @@ class CustomCORSMiddleware(BaseHTTPMiddleware):
         response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Requested-With, Cache-Control, Pragma, Accept, Upgrade-Insecure-Requests"
         
         # Add iOS-specific headers without modifying content
-        response.headers["Access-Control-Expose-Headers"] = "Content-Length, X-JSON"
+        response.headers["Access-Control-Expose-Headers"] = (
+            "Content-Length, X-JSON, Location, Tus-Resumable, Upload-Offset, Upload-Length, "
+            "Upload-Expires, Accept-Ranges, Content-Range, ETag"
+        )
         response.headers["Vary"] = "Origin"
         
         # Security headers for iOS Safari
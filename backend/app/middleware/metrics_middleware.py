@@ -0,0 +1,49 @@
+import time
+from app import metrics
+
+
+class MetricsMiddleware:
+    """Request latency by route template and status, and requests in flight
+
+    A plain ASGI middleware rather than BaseHTTPMiddleware, so streamed
+    responses pass through untouched and are timed until their last byte.
+    The route template (e.g. /api/tasks/{task_id}) is looked up from the
+    endpoint the router matched; requests that match no route are counted
+    together as "unmatched" so path ids never become label values.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._templates = None
+
+    def _route_template(self, scope) -> str:
+        if self._templates is None:
+            self._templates = {
+                getattr(route, "endpoint", getattr(route, "app", None)): route.path
+                for route in scope["app"].routes
+            }
+        return self._templates.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = metrics.method_label(scope["method"])
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = metrics.HTTP_REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            metrics.HTTP_REQUEST_SECONDS.labels(
+                method, self._route_template(scope), str(status_code)
+            ).observe(time.perf_counter() - start)
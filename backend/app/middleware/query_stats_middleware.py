@@ -0,0 +1,44 @@
+from app.config import settings
+from app import metrics
+from app.query_stats import QueryStats, current_query_stats
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStatsMiddleware:
+    """Count and time the SQL each request runs
+
+    Adds a Server-Timing header (statement count, total and slowest
+    statement time) so the numbers show up in browser devtools, and
+    records the per-request statement count. In debug mode, statements
+    repeated DB_N_PLUS_ONE_THRESHOLD or more times in one request are
+    logged as a likely N+1. The header covers the statements run before
+    the response started; a streamed body's later queries are still
+    counted in the metrics.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats(track_shapes=settings.DEBUG)
+        token = current_query_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_query_stats.reset(token)
+            metrics.DB_QUERIES_PER_REQUEST.observe(stats.count)
+            for count, shape in stats.repeated(settings.DB_N_PLUS_ONE_THRESHOLD):
+                logger.warning(f"Possible N+1 in {scope['method']} {scope['path']}: {count} x {shape}")
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, Boolean, DateTime, ForeignKey, Index, JSON, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
+from app.media_references import parse_media_url
 import enum
 
 Base = declarative_base()
@@ -48,6 +49,8 @@ class Restaurant(Base):
     locations = relationship("Location", back_populates="restaurant", cascade="all, delete-orphan")
     users = relationship("User", back_populates="restaurant", cascade="all, delete-orphan")
     tasks = relationship("Task", back_populates="restaurant", cascade="all, delete-orphan")
+    storage_usage = relationship("RestaurantStorageUsage", cascade="all, delete-orphan")
+    media_counts = relationship("RestaurantMediaCount", cascade="all, delete-orphan")
 
 class Location(Base):
     __tablename__ = "locations"
@@ -93,6 +96,8 @@ class Task(Base):
     video_required = Column(Boolean, default=False)
     image_url = Column(String(1000), nullable=True)
     video_url = Column(String(1000), nullable=True)
+    image_ref = Column(JSON(none_as_null=True), nullable=True)  # Parsed image_url, see app.media_references
+    video_ref = Column(JSON(none_as_null=True), nullable=True)  # Parsed video_url
     decline_reason = Column(Text, nullable=True)
     initials = Column(String(10), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -104,11 +109,23 @@ class Task(Base):
     # ...existing code...
     media_files = relationship("MediaFile", back_populates="task", cascade="all, delete-orphan")
 
+    @validates("image_url", "video_url")
+    def _store_media_reference(self, key, url):
+        # Parse media URLs once on write so readers never have to
+        reference = parse_media_url(url)
+        setattr(self, key.replace("_url", "_ref"), reference.to_dict() if reference else None)
+        return url
+
 class MediaFile(Base):
     __tablename__ = "media_files"
+    __table_args__ = (
+        # Gallery pages are read newest first with a (created_at, id) cursor
+        Index("ix_media_files_gallery", "restaurant_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False)
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=True)  # Denormalized from the task
     filename = Column(String(255), nullable=False)
     original_filename = Column(String(255), nullable=False)
     file_path = Column(String(500), nullable=False)
@@ -116,13 +133,28 @@ class MediaFile(Base):
     file_size = Column(Integer, nullable=False)
     mime_type = Column(String(100), nullable=False)
     file_type = Column(String(20), nullable=False)  # image, video
-    storage_type = Column(String(50), nullable=False)  # "cloudinary" or "local"
+    storage_type = Column(String(50), nullable=False)  # "cloudinary", "s3" or "local"
     cloudinary_id = Column(String(255), nullable=True)  # Cloudinary public_id
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the uploaded bytes
+    renditions = Column(JSON(none_as_null=True), nullable=True)  # Rendition name -> URL, generated at upload
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    placeholder = Column(Text, nullable=True)  # Tiny WebP data URI shown while the media loads
+    detected_type = Column(String(100), nullable=True)  # Sniffed from the magic bytes, not the client
+    duration_seconds = Column(Float, nullable=True)  # Videos, from the container header
+    captured_at = Column(DateTime(timezone=True), nullable=True)  # EXIF or container creation time
+    orientation = Column(Integer, nullable=True)  # EXIF orientation (1-8); video rotation is mapped onto it
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     task = relationship("Task", back_populates="media_files")
 
+    @property
+    def aspect_ratio(self):
+        if self.width and self.height:
+            return round(self.width / self.height, 4)
+        return None
+
 class CleaningLog(Base):
     __tablename__ = "cleaning_logs"
     
@@ -136,3 +168,22 @@ class CleaningLog(Base):
     # Relationships
     task = relationship("Task")
     restaurant = relationship("Restaurant")
+
+class RestaurantStorageUsage(Base):
+    __tablename__ = "restaurant_storage_usage"
+    
+    # Maintained incrementally on save/delete so usage never needs a tree walk
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id", ondelete="CASCADE"), primary_key=True)
+    storage_type = Column(String(50), primary_key=True)  # "cloudinary", "s3" or "local"
+    bytes_used = Column(BigInteger, nullable=False, default=0)
+    object_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class RestaurantMediaCount(Base):
+    __tablename__ = "restaurant_media_counts"
+    
+    # Maintained with every media record write so the gallery never counts rows
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id", ondelete="CASCADE"), primary_key=True)
+    file_type = Column(String(20), primary_key=True)  # image, video
+    media_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,128 @@
+"""
+Per-request SQL statistics
+
+SQLAlchemy cursor events time every statement. Statements run while a
+request is being served are also added to that request's QueryStats
+(count, total time, slowest statement), which the query stats
+middleware reports as a Server-Timing header. Slow statements are logged
+with their parameter values redacted, and in debug mode a statement
+repeated many times within one request is flagged as a likely N+1.
+"""
+import re
+import time
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from app.config import settings
+from app import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+# Placeholder lists such as IN (?, ?, ?) collapse to one, so an expanded
+# IN clause keeps the same shape whatever its length
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """The statement with whitespace, literals and placeholder lists normalised"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    return _NUMBER.sub("N", shape)
+
+
+def operation_label(statement: str) -> str:
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return verb if verb in OPERATIONS else "OTHER"
+
+
+def redact(parameters) -> str:
+    """Parameter types without their values, e.g. [str, int]"""
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: one entry per row
+            return f"{len(parameters)} rows of {redact(parameters[0])}"
+        return "[" + ", ".join(type(value).__name__ for value in parameters) + "]"
+    return type(parameters).__name__
+
+
+class QueryStats:
+    """SQL statements executed while serving one request"""
+
+    def __init__(self, track_shapes: bool = False):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement: Optional[str] = None
+        # Only kept in debug mode, for the N+1 detector
+        self.shapes: Optional[Counter] = Counter() if track_shapes else None
+        # Sync endpoints and dependencies run in the threadpool
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            if seconds >= self.slowest_seconds:
+                self.slowest_seconds = seconds
+                self.slowest_statement = statement
+            if self.shapes is not None:
+                self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int) -> list:
+        """(count, shape) of each statement run at least threshold times"""
+        if self.shapes is None:
+            return []
+        return [(n, shape) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def server_timing(self) -> str:
+        timing = f'db;desc="{self.count} queries";dur={self.total_seconds * 1000:.2f}'
+        if self.count:
+            timing += f', db-slowest;dur={self.slowest_seconds * 1000:.2f}'
+        return timing
+
+
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["query_start_time"].pop()
+    operation = operation_label(statement)
+    metrics.DB_QUERY_SECONDS.labels(operation).observe(seconds)
+
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+
+    if seconds * 1000 >= settings.DB_SLOW_QUERY_MS:
+        metrics.DB_SLOW_QUERIES.labels(operation).inc()
+        logger.warning(
+            f"Slow query ({seconds * 1000:.0f}ms): {_WHITESPACE.sub(' ', statement).strip()} "
+            f"params={redact(parameters)}"
+        )
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    starts = exception_context.connection.info.get("query_start_time") if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def instrument(engine) -> None:
+    """Time every statement this engine executes"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
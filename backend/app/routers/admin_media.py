@@ -1,18 +1,59 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from fastapi.responses import RedirectResponse
-from typing import Optional, List
-from app.auth import get_current_restaurant
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import RedirectResponse, StreamingResponse
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, List, Tuple
+from app.auth import get_current_restaurant, get_platform_admin
 from app.services.cloudinary_service import CloudinaryService
+from app.services.media_reference_backfill import media_reference_backfill
+from app.services.media_record_backfill import media_record_backfill
+from app.services.contact_sheets import contact_sheets
+from app.services.media_export import media_export
+from app.services.cloudinary_metadata import cloudinary_metadata
+from app.services.file_service import file_service
 from app.schemas import Restaurant
+from app.media_references import reference_for
 from app.database import get_db
-from app import models
-from sqlalchemy.orm import Session
+from app import models, crud
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session, joinedload, load_only
+import base64
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/admin/media", tags=["admin-media"])
 
+def _media_by_url(db: Session, task_ids: List[int]) -> Dict[str, models.MediaFile]:
+    """Upload-time renditions and layout data for the media of the given tasks, keyed by media URL"""
+    if not task_ids:
+        return {}
+    media_files = db.query(models.MediaFile).options(
+        load_only(
+            models.MediaFile.file_url, models.MediaFile.renditions, models.MediaFile.width,
+            models.MediaFile.height, models.MediaFile.placeholder
+        )
+    ).filter(models.MediaFile.task_id.in_(task_ids)).all()
+    return {media.file_url: media for media in media_files}
+
+def _layout(media: Optional[models.MediaFile]) -> dict:
+    """Dimensions and placeholder so the UI can lay out and paint before media loads"""
+    return {
+        "width": media.width if media else None,
+        "height": media.height if media else None,
+        "aspect_ratio": media.aspect_ratio if media else None,
+        "placeholder": media.placeholder if media else None
+    }
+
+def _renditions(media: Optional[models.MediaFile]) -> Optional[dict]:
+    return media.renditions if media else None
+
+def _cloudinary_key(url: str, reference: Optional[dict] = None) -> Optional[Tuple[str, str]]:
+    """(resource_type, public_id) of a Cloudinary media URL, for resource metadata lookups"""
+    ref = reference_for(url, reference)
+    if ref is None or ref.provider != 'cloudinary':
+        return None
+    return ref.resource_type, ref.public_id
+
 @router.get("/preview")
 async def get_media_preview(
     url: str = Query(..., description="Media URL to preview"),
@@ -96,33 +137,49 @@ async def get_task_media(
             raise HTTPException(status_code=404, detail="Task not found")
         
         media_items = []
+        media_by_url = _media_by_url(db, [task.id])
+        
+        # Bytes, dimensions and duration of both files in one Cloudinary lookup
+        image_key = _cloudinary_key(task.image_url, task.image_ref) if task.image_url else None
+        video_key = _cloudinary_key(task.video_url, task.video_ref) if task.video_url else None
+        metadata = await cloudinary_metadata.get_many([image_key, video_key])
         
         # Process image URL
         if task.image_url:
-            image_info = CloudinaryService.get_media_info(task.image_url)
-            if image_info.get('is_cloudinary'):
-                preview_data = CloudinaryService.generate_preview_urls(task.image_url)
+            image_media = media_by_url.get(task.image_url)
+            image_renditions = _renditions(image_media)
+            image_info = CloudinaryService.get_media_info(task.image_url, task.image_ref, image_renditions)
+            if image_info.get('is_cloudinary') or image_renditions:
+                preview_data = CloudinaryService.generate_preview_urls(
+                    task.image_url, reference=task.image_ref, renditions=image_renditions
+                )
                 image_info.update(preview_data)
             
             media_items.append({
+                # Local media info reports its type as unknown; the field says what it is
+                **image_info,
                 "type": "image",
                 "url": task.image_url,
                 "field": "image_url",
-                **image_info
+                **_layout(image_media),
+                "metadata": metadata.get(image_key)
             })
         
         # Process video URL
         if task.video_url:
-            video_info = CloudinaryService.get_media_info(task.video_url)
+            video_media = media_by_url.get(task.video_url)
+            video_info = CloudinaryService.get_media_info(task.video_url, task.video_ref, _renditions(video_media))
             if video_info.get('is_cloudinary'):
-                preview_data = CloudinaryService.generate_preview_urls(task.video_url)
+                preview_data = CloudinaryService.generate_preview_urls(task.video_url, reference=task.video_ref)
                 video_info.update(preview_data)
             
             media_items.append({
-                "type": "video", 
+                **video_info,
+                "type": "video",
                 "url": task.video_url,
                 "field": "video_url",
-                **video_info
+                **_layout(video_media),
+                "metadata": metadata.get(video_key)
             })
         
         return {
@@ -170,6 +227,7 @@ async def get_tasks_with_media(
             query = query.filter(models.Task.status == status)
         
         tasks = query.order_by(models.Task.updated_at.desc()).all()
+        media_by_url = _media_by_url(db, [task.id for task in tasks])
         
         result_tasks = []
         for task in tasks:
@@ -193,14 +251,18 @@ async def get_tasks_with_media(
             
             # Add preview URLs for Cloudinary media
             if task.image_url:
-                image_info = CloudinaryService.get_media_info(task.image_url)
+                image_media = media_by_url.get(task.image_url)
+                image_info = CloudinaryService.get_media_info(task.image_url, task.image_ref, _renditions(image_media))
                 task_data["media"]["image_preview"] = image_info.get('thumbnail_url', task.image_url)
                 task_data["media"]["image_type"] = image_info.get('type', 'image')
+                task_data["media"]["image_layout"] = _layout(image_media)
             
             if task.video_url:
-                video_info = CloudinaryService.get_media_info(task.video_url)
+                video_media = media_by_url.get(task.video_url)
+                video_info = CloudinaryService.get_media_info(task.video_url, task.video_ref, _renditions(video_media))
                 task_data["media"]["video_preview"] = video_info.get('thumbnail_url', task.video_url)
                 task_data["media"]["video_type"] = video_info.get('type', 'video')
+                task_data["media"]["video_layout"] = _layout(video_media)
             
             result_tasks.append(task_data)
         
@@ -215,86 +277,252 @@ async def get_tasks_with_media(
         logger.error(f"Error getting tasks with media: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get tasks with media: {str(e)}")
 
+def _encode_cursor(media: models.MediaFile) -> str:
+    return base64.urlsafe_b64encode(f"{media.created_at.isoformat()}|{media.id}".encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, media_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(media_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid gallery cursor")
+
+def _gallery_total(db: Session, restaurant_id: int, media_type: str) -> int:
+    """Media count from the maintained per-restaurant counters"""
+    counts = crud.get_media_counts(db, restaurant_id)
+    if media_type in ("image", "video"):
+        return counts.get(media_type, 0)
+    return sum(counts.values())
+
+def _gallery_page(db: Session, restaurant_id: int, media_type: str,
+                  cursor: Optional[str], limit: int) -> Tuple[List[dict], Optional[str]]:
+    """(gallery items, cursor of the next page) for one page of the gallery, newest first"""
+    query = db.query(models.MediaFile).options(
+        joinedload(models.MediaFile.task).load_only(
+            models.Task.task, models.Task.initials, models.Task.status
+        )
+    ).filter(
+        models.MediaFile.restaurant_id == restaurant_id
+    )
+    
+    # Filter by media type
+    if media_type in ("image", "video"):
+        query = query.filter(models.MediaFile.file_type == media_type)
+    
+    # Keyset pagination: continue strictly after the last item of the previous page
+    if cursor:
+        created_at, media_id = _decode_cursor(cursor)
+        # A cursor only continues the gallery it came from
+        owner_id = db.query(models.MediaFile.restaurant_id).filter(models.MediaFile.id == media_id).scalar()
+        if owner_id is not None and owner_id != restaurant_id:
+            raise HTTPException(status_code=400, detail="Invalid gallery cursor")
+        # Compare against the stored timestamp so it never round-trips through
+        # Python; the encoded one is only used if that item was deleted since
+        anchor = select(models.MediaFile.created_at).where(models.MediaFile.id == media_id).scalar_subquery()
+        query = query.filter(
+            tuple_(models.MediaFile.created_at, models.MediaFile.id) < tuple_(func.coalesce(anchor, created_at), media_id)
+        )
+    
+    # One extra row tells whether there is a next page
+    media_files = query.order_by(
+        models.MediaFile.created_at.desc(), models.MediaFile.id.desc()
+    ).limit(limit + 1).all()
+    next_cursor = _encode_cursor(media_files[limit - 1]) if len(media_files) > limit else None
+    
+    gallery_items = []
+    for media in media_files[:limit]:
+        media_info = CloudinaryService.get_media_info(media.file_url, renditions=media.renditions)
+        gallery_items.append({
+            "id": f"media_{media.id}",
+            "media_id": media.id,
+            "task_id": media.task_id,
+            "task_title": media.task.task,
+            "media_type": media.file_type,
+            "url": media.file_url,
+            "thumbnail_url": media_info.get('thumbnail_url', media.file_url),
+            "preview_url": media_info.get('preview_url', media.file_url) if media.file_type == "image" else media.file_url,
+            "created_at": media.created_at,
+            "initials": media.task.initials,
+            "status": media.task.status.value,
+            **_layout(media)
+        })
+    
+    return gallery_items, next_cursor
+
 @router.get("/gallery")
 async def get_media_gallery(
     media_type: str = Query("all", description="Media type: all, image, video"),
-    page: int = Query(1, description="Page number", ge=1),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
     limit: int = Query(20, description="Items per page", ge=1, le=100),
     current_restaurant: Restaurant = Depends(get_current_restaurant),
     db: Session = Depends(get_db)
 ):
     """Get a gallery view of all media items"""
     try:
-        # Build query
-        query = db.query(models.Task).filter(
-            models.Task.restaurant_id == current_restaurant.id
-        )
+        gallery_items, next_cursor = _gallery_page(db, current_restaurant.id, media_type, cursor, limit)
         
-        # Filter by media type
-        if media_type == "image":
-            query = query.filter(models.Task.image_url.isnot(None))
-        elif media_type == "video":
-            query = query.filter(models.Task.video_url.isnot(None))
-        else:
-            # All media
-            query = query.filter(
-                (models.Task.image_url.isnot(None)) | 
-                (models.Task.video_url.isnot(None))
-            )
-        
-        # Get total count
-        total_count = query.count()
-        
-        # Apply pagination
-        offset = (page - 1) * limit
-        tasks = query.order_by(models.Task.updated_at.desc()).offset(offset).limit(limit).all()
-        
-        gallery_items = []
-        for task in tasks:
-            # Add image if exists
-            if task.image_url and (media_type in ["all", "image"]):
-                image_info = CloudinaryService.get_media_info(task.image_url)
-                gallery_items.append({
-                    "id": f"task_{task.id}_image",
-                    "task_id": task.id,
-                    "task_title": task.task,
-                    "media_type": "image",
-                    "url": task.image_url,
-                    "thumbnail_url": image_info.get('thumbnail_url', task.image_url),
-                    "preview_url": image_info.get('preview_url', task.image_url),
-                    "created_at": task.updated_at,
-                    "initials": task.initials,
-                    "status": task.status.value
-                })
-            
-            # Add video if exists
-            if task.video_url and (media_type in ["all", "video"]):
-                video_info = CloudinaryService.get_media_info(task.video_url)
-                gallery_items.append({
-                    "id": f"task_{task.id}_video",
-                    "task_id": task.id,
-                    "task_title": task.task,
-                    "media_type": "video",
-                    "url": task.video_url,
-                    "thumbnail_url": video_info.get('thumbnail_url', task.video_url),
-                    "preview_url": task.video_url,
-                    "created_at": task.updated_at,
-                    "initials": task.initials,
-                    "status": task.status.value
-                })
-        
-        total_pages = (total_count + limit - 1) // limit
+        # One batched Cloudinary lookup per resource type for the whole page
+        keys = [_cloudinary_key(item["url"]) for item in gallery_items]
+        metadata = await cloudinary_metadata.get_many(keys)
+        for item, key in zip(gallery_items, keys):
+            item["metadata"] = metadata.get(key)
         
         return {
-            "page": page,
             "limit": limit,
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor is not None,
             "total_items": len(gallery_items),
-            "total_pages": total_pages,
-            "total_tasks_with_media": total_count,
+            "total_media": _gallery_total(db, current_restaurant.id, media_type),
             "media_type": media_type,
             "gallery": gallery_items
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting media gallery: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get media gallery: {str(e)}")
+
+@router.get("/gallery/sprite")
+async def get_media_gallery_sprite(
+    request: Request,
+    media_type: str = Query("all", description="Media type: all, image, video"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    limit: int = Query(20, description="Items per page", ge=1, le=100),
+    tile: int = Query(150, description="Tile size in pixels", ge=32, le=300),
+    columns: int = Query(10, description="Tiles per row", ge=1, le=20),
+    current_restaurant: Restaurant = Depends(get_current_restaurant),
+    db: Session = Depends(get_db)
+):
+    """One contact-sheet image for a gallery page plus where each item sits in it"""
+    try:
+        gallery_items, next_cursor = _gallery_page(db, current_restaurant.id, media_type, cursor, limit)
+        response = {
+            "limit": limit,
+            "cursor": cursor,
+            "next_cursor": next_cursor,
+            "media_type": media_type,
+            "sprite_url": None,
+            "items": []
+        }
+        if not gallery_items:
+            return response
+        
+        sheet = await contact_sheets.get_sheet(gallery_items, tile, columns)
+        base_url = str(request.base_url).rstrip("/")
+        response.update({
+            "sprite_url": file_service.local_backend.url(sheet.pop("path"), base_url),
+            **sheet
+        })
+        return response
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error building gallery sprite: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to build gallery sprite: {str(e)}")
+
+@router.get("/export")
+async def export_media(
+    start: date = Query(..., description="First upload date to include (YYYY-MM-DD)"),
+    end: date = Query(..., description="Last upload date to include (YYYY-MM-DD)"),
+    media_type: str = Query("all", description="Media type: all, image, video"),
+    current_restaurant: Restaurant = Depends(get_current_restaurant),
+    db: Session = Depends(get_db)
+):
+    """Stream a ZIP of the media uploaded in a date range, with a CSV manifest"""
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    
+    query = db.query(models.MediaFile, models.Task).join(models.Task).options(
+        load_only(
+            models.MediaFile.id, models.MediaFile.task_id, models.MediaFile.filename,
+            models.MediaFile.file_path, models.MediaFile.file_url, models.MediaFile.file_size,
+            models.MediaFile.mime_type, models.MediaFile.file_type, models.MediaFile.storage_type,
+            models.MediaFile.content_hash, models.MediaFile.captured_at, models.MediaFile.created_at
+        ),
+        load_only(
+            models.Task.id, models.Task.task, models.Task.category, models.Task.day,
+            models.Task.status, models.Task.initials
+        )
+    ).filter(
+        models.MediaFile.restaurant_id == current_restaurant.id,
+        models.MediaFile.created_at >= datetime.combine(start, time.min),
+        models.MediaFile.created_at < datetime.combine(end + timedelta(days=1), time.min)
+    )
+    if media_type in ("image", "video"):
+        query = query.filter(models.MediaFile.file_type == media_type)
+    
+    items = [
+        {
+            "id": media.id,
+            "task_id": media.task_id,
+            "filename": media.filename,
+            "file_path": media.file_path,
+            "file_url": media.file_url,
+            "file_size": media.file_size,
+            "mime_type": media.mime_type,
+            "file_type": media.file_type,
+            "storage_type": media.storage_type,
+            "content_hash": media.content_hash,
+            "captured_at": media.captured_at,
+            "created_at": media.created_at,
+            "task": task.task,
+            "category": task.category.value if task.category else None,
+            "day": task.day.value if task.day else None,
+            "task_status": task.status.value if task.status else None,
+            "initials": task.initials
+        }
+        for media, task in query.order_by(models.MediaFile.created_at, models.MediaFile.id)
+    ]
+    
+    filename = f"media-{current_restaurant.restaurant_code}-{start.isoformat()}-{end.isoformat()}.zip"
+    return StreamingResponse(
+        media_export.stream(items),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/counts/recalculate")
+async def recalculate_media_counts(
+    current_restaurant: Restaurant = Depends(get_current_restaurant),
+    db: Session = Depends(get_db)
+):
+    """Rebuild the gallery's media counters from the media records"""
+    return {
+        "restaurant_id": current_restaurant.id,
+        "media_counts": crud.recalculate_media_counts(db, current_restaurant.id)
+    }
+
+@router.post("/references/backfill", status_code=202)
+async def backfill_media_references(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Parse and store media references for tasks saved before they were recorded"""
+    if media_reference_backfill.is_running:
+        raise HTTPException(
+            status_code=409,
+            detail="A media reference backfill is already running"
+        )
+    
+    return media_reference_backfill.start()
+
+@router.get("/references/backfill/status")
+async def get_reference_backfill_status(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Get progress of the current or last media reference backfill"""
+    return media_reference_backfill.status
+
+@router.post("/records/backfill", status_code=202)
+async def backfill_media_records(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Create media records for task media stored before submissions recorded them"""
+    if media_record_backfill.is_running:
+        raise HTTPException(
+            status_code=409,
+            detail="A media record backfill is already running"
+        )
+    
+    return media_record_backfill.start()
+
+@router.get("/records/backfill/status")
+async def get_record_backfill_status(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Get progress of the current or last media record backfill"""
+    return media_record_backfill.status
@@ -0,0 +1,105 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+from typing import Optional
+from app.auth import get_platform_admin
+from app.services.profiler import sampling_profiler, memory_tracker
+from app.schemas import Restaurant
+from app.config import settings
+
+
+def require_profiling_enabled():
+    """Hide the profiling endpoints unless PROFILING_ENABLED is set"""
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+router = APIRouter(
+    prefix="/admin/profiling",
+    tags=["admin-profiling"],
+    dependencies=[Depends(require_profiling_enabled)]
+)
+
+@router.post("/cpu", status_code=202)
+async def start_cpu_profile(
+    request: Request,
+    seconds: float = Query(10, gt=0, description="How long to sample for"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="Time between samples"),
+    route: Optional[str] = Query(None, description="Only sample requests to this route template, e.g. /api/tasks/{task_id}"),
+    current_restaurant: Restaurant = Depends(get_platform_admin)
+):
+    """Start sampling the process's Python stacks in the background"""
+    if seconds > sampling_profiler.max_seconds:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Profiles are limited to {sampling_profiler.max_seconds} seconds"
+        )
+
+    if sampling_profiler.is_running:
+        raise HTTPException(
+            status_code=409,
+            detail="A CPU profile is already running"
+        )
+
+    endpoints = None
+    if route:
+        # Samples count only while the route's endpoint function is on the stack
+        endpoints = [r.endpoint.__code__ for r in request.app.routes
+                     if isinstance(r, APIRoute) and r.path == route and hasattr(r.endpoint, "__code__")]
+        if not endpoints:
+            raise HTTPException(status_code=404, detail=f"No route {route}")
+
+    return sampling_profiler.start(seconds, interval_ms, route, endpoints)
+
+@router.get("/cpu/status")
+async def get_cpu_profile_status(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Get progress of the current or last CPU profile"""
+    return sampling_profiler.status
+
+@router.post("/cpu/stop")
+async def stop_cpu_profile(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Stop the running CPU profile early, keeping what it sampled"""
+    return sampling_profiler.stop()
+
+@router.get("/cpu/result")
+async def get_cpu_profile(
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$",
+                        description="speedscope JSON, or collapsed stacks for flamegraph.pl"),
+    current_restaurant: Restaurant = Depends(get_platform_admin)
+):
+    """Download the last completed CPU profile"""
+    if sampling_profiler.status["state"] == "idle":
+        raise HTTPException(status_code=404, detail="No CPU profile has been taken")
+
+    if sampling_profiler.is_running:
+        raise HTTPException(status_code=409, detail="The CPU profile is still running")
+
+    if format == "collapsed":
+        return PlainTextResponse(sampling_profiler.collapsed())
+    return sampling_profiler.speedscope()
+
+@router.post("/memory/start")
+async def start_memory_tracing(
+    frames: int = Query(10, ge=1, le=100, description="Stack frames kept per allocation"),
+    current_restaurant: Restaurant = Depends(get_platform_admin)
+):
+    """Start tracemalloc and take the baseline snapshot"""
+    return await memory_tracker.start(frames)
+
+@router.post("/memory/snapshot")
+async def diff_memory_snapshot(
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    limit: int = Query(25, ge=1, le=500),
+    reset: bool = Query(True, description="Compare the next snapshot against this one"),
+    current_restaurant: Restaurant = Depends(get_platform_admin)
+):
+    """Take a snapshot and report the allocations that grew most since the last one"""
+    if not memory_tracker.is_tracing:
+        raise HTTPException(status_code=409, detail="Memory tracing is not running")
+
+    return await memory_tracker.diff(group_by, limit, reset)
+
+@router.post("/memory/stop")
+async def stop_memory_tracing(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Stop tracemalloc and free its traces"""
+    return memory_tracker.stop()
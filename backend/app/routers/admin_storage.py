@@ -1,65 +1,147 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
 from typing import Optional
-from app.auth import get_current_restaurant
+from app.auth import get_current_restaurant, get_platform_admin
+from app.database import get_db
+from app import crud
 from app.services.file_service import file_service
+from app.services.storage_migration import storage_migration_job
+from app.services.local_layout_migration import local_layout_migration
+from app.services.media_gc import media_gc
+from app.services.circuit_breaker import cloudinary_breaker
+from app.services.cloudinary_reconciler import cloudinary_reconciler
 from app.schemas import Restaurant
+from app.config import settings
 
 router = APIRouter(prefix="/admin/storage", tags=["admin-storage"])
 
-@router.post("/migrate")
+STORAGE_BACKEND_NAMES = {
+    "local": "Local Storage",
+    "cloudinary": "Cloudinary",
+    "s3": "S3-compatible Object Storage"
+}
+
+@router.post("/migrate", status_code=202)
 async def migrate_to_cloud_storage(
     task_id: Optional[str] = Query(None, description="Specific task ID to migrate (optional)"),
-    current_restaurant: Restaurant = Depends(get_current_restaurant)
+    current_restaurant: Restaurant = Depends(get_platform_admin)
 ):
-    """Migrate local files to Google Cloud Storage"""
-    # Note: Any authenticated restaurant can use admin storage features
-    # You may want to add additional role checks here
-    
-    if not file_service.use_cloud_storage:
+    """Start migrating local files to Cloudinary in the background"""
+    if not file_service.use_cloud_storage or not file_service.cloudinary_configured:
         raise HTTPException(
             status_code=400, 
-            detail="Cloud storage not configured. Please set up Google Cloud Storage first."
+            detail="Cloud storage not configured. Please set up Cloudinary first."
         )
     
-    result = await file_service.migrate_to_cloud_storage(task_id)
-    return result
+    if storage_migration_job.is_running:
+        raise HTTPException(
+            status_code=409,
+            detail="A storage migration is already running"
+        )
+    
+    # Files already recorded in the migration manifest are skipped, so a
+    # run that was interrupted picks up where it stopped
+    return storage_migration_job.start(task_id)
+
+@router.get("/migrate/status")
+async def get_migration_status(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Get progress of the current or last storage migration"""
+    return storage_migration_job.status
 
 @router.get("/status")
 async def get_storage_status(current_restaurant: Restaurant = Depends(get_current_restaurant)):
     """Get current storage configuration status"""
+    backend = file_service.backend
+    bucket_name = None
+    circuit = None
+    if backend.storage_type == "s3":
+        bucket_name = backend.bucket
+    elif backend.storage_type == "cloudinary":
+        bucket_name = settings.CLOUDINARY_CLOUD_NAME
+        circuit = cloudinary_breaker.snapshot()
+    
     return {
         "cloud_storage_enabled": file_service.use_cloud_storage,
-        "bucket_name": file_service.gcs_bucket_name if file_service.use_cloud_storage else None,
-        "storage_type": "Google Cloud Storage" if file_service.use_cloud_storage else "Local Storage",
-        "fallback_available": True  # Always have local storage as fallback
+        "storage_backend": backend.storage_type,
+        "bucket_name": bucket_name,
+        "storage_type": STORAGE_BACKEND_NAMES[backend.storage_type],
+        "fallback_available": True,  # Always have local storage as fallback
+        "circuit": circuit,
+        "tasks_pending_reconciliation": len(file_service.fallback_tasks),
+        "reconciliation": cloudinary_reconciler.status
     }
 
 @router.post("/test")
 async def test_storage_connection(current_restaurant: Restaurant = Depends(get_current_restaurant)):
     """Test storage connection and permissions"""
     try:
-        if file_service.use_cloud_storage:
-            # Test bucket access
-            bucket = file_service.gcs_bucket
-            if bucket.exists():
-                return {
-                    "status": "success",
-                    "message": f"Successfully connected to bucket: {file_service.gcs_bucket_name}",
-                    "bucket_location": bucket.location,
-                    "storage_class": bucket.storage_class
-                }
-            else:
-                return {
-                    "status": "warning",
-                    "message": f"Bucket {file_service.gcs_bucket_name} does not exist but can be created"
-                }
-        else:
-            return {
-                "status": "info",
-                "message": "Using local storage - cloud storage not configured"
-            }
+        return await file_service.backend.check()
     except Exception as e:
         return {
             "status": "error",
             "message": f"Storage test failed: {str(e)}"
         }
+
+@router.post("/reshard", status_code=202)
+async def reshard_local_storage(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Move local files from the flat per-task directories into the sharded layout"""
+    if local_layout_migration.is_running:
+        raise HTTPException(
+            status_code=409,
+            detail="A local layout migration is already running"
+        )
+    
+    return local_layout_migration.start()
+
+@router.get("/reshard/status")
+async def get_reshard_status(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Get progress of the current or last local layout migration"""
+    return local_layout_migration.status
+
+def _usage_response(restaurant_id: int, rows: list) -> dict:
+    return {
+        "restaurant_id": restaurant_id,
+        "total_bytes": sum(row.bytes_used for row in rows),
+        "total_objects": sum(row.object_count for row in rows),
+        "by_storage_type": {
+            row.storage_type: {"bytes_used": row.bytes_used, "object_count": row.object_count}
+            for row in rows
+        }
+    }
+
+@router.get("/usage")
+async def get_storage_usage(
+    current_restaurant: Restaurant = Depends(get_current_restaurant),
+    db: Session = Depends(get_db)
+):
+    """Get storage used by this restaurant's media from the maintained counters"""
+    return _usage_response(current_restaurant.id, crud.get_storage_usage(db, current_restaurant.id))
+
+@router.post("/usage/recalculate")
+async def recalculate_storage_usage(
+    current_restaurant: Restaurant = Depends(get_current_restaurant),
+    db: Session = Depends(get_db)
+):
+    """Rebuild this restaurant's storage counters from its media records"""
+    return _usage_response(current_restaurant.id, crud.recalculate_storage_usage(db, current_restaurant.id))
+
+@router.post("/gc", status_code=202)
+async def collect_orphaned_media(
+    dry_run: bool = Query(True, description="Only report orphaned media without deleting it"),
+    current_restaurant: Restaurant = Depends(get_platform_admin)
+):
+    """Find stored media that no task or media record references, and delete it"""
+    # The scan covers every restaurant's storage, so it is limited to
+    # operators listed in PLATFORM_ADMIN_RESTAURANT_IDS
+    if media_gc.is_running:
+        raise HTTPException(
+            status_code=409,
+            detail="Media garbage collection is already running"
+        )
+    
+    return media_gc.start(dry_run)
+
+@router.get("/gc/status")
+async def get_gc_status(current_restaurant: Restaurant = Depends(get_platform_admin)):
+    """Get progress and findings of the current or last garbage collection"""
+    return media_gc.status
@@ -3,8 +3,8 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.database import get_db
 from app.config import settings
+from app.metrics import system_sampler
 import os
-import psutil
 import sys
 from datetime import datetime
 
@@ -87,6 +87,156 @@ async def fix_media_table(db: Session = Depends(get_db)):
             END $$;
             """,
             
+            # Add content_hash column if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'content_hash') THEN
+                    ALTER TABLE media_files ADD COLUMN content_hash VARCHAR(64);
+                END IF;
+            END $$;
+            """,
+            
+            # Index content_hash for duplicate upload lookups
+            """
+            CREATE INDEX IF NOT EXISTS ix_media_files_content_hash ON media_files (content_hash);
+            """,
+            
+            # Add renditions column if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'renditions') THEN
+                    ALTER TABLE media_files ADD COLUMN renditions JSON;
+                END IF;
+            END $$;
+            """,
+            
+            # Add width column if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'width') THEN
+                    ALTER TABLE media_files ADD COLUMN width INTEGER;
+                END IF;
+            END $$;
+            """,
+            
+            # Add height column if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'height') THEN
+                    ALTER TABLE media_files ADD COLUMN height INTEGER;
+                END IF;
+            END $$;
+            """,
+            
+            # Add placeholder column if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'placeholder') THEN
+                    ALTER TABLE media_files ADD COLUMN placeholder TEXT;
+                END IF;
+            END $$;
+            """,
+            
+            # Add image_ref column (parsed image_url) to tasks if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'tasks' AND column_name = 'image_ref') THEN
+                    ALTER TABLE tasks ADD COLUMN image_ref JSON;
+                END IF;
+            END $$;
+            """,
+            
+            # Add video_ref column (parsed video_url) to tasks if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'tasks' AND column_name = 'video_ref') THEN
+                    ALTER TABLE tasks ADD COLUMN video_ref JSON;
+                END IF;
+            END $$;
+            """,
+            
+            # Add restaurant_id column (denormalized from the task) if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'restaurant_id') THEN
+                    ALTER TABLE media_files ADD COLUMN restaurant_id INTEGER REFERENCES restaurants(id);
+                END IF;
+            END $$;
+            """,
+            
+            # Fill restaurant_id for media recorded before it was stored
+            """
+            UPDATE media_files 
+            SET restaurant_id = tasks.restaurant_id 
+            FROM tasks 
+            WHERE media_files.task_id = tasks.id AND media_files.restaurant_id IS NULL;
+            """,
+            
+            # Index the gallery's keyset order
+            """
+            CREATE INDEX IF NOT EXISTS ix_media_files_gallery ON media_files (restaurant_id, created_at, id);
+            """,
+            
+            # Add detected_type column (type sniffed from the bytes) if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'detected_type') THEN
+                    ALTER TABLE media_files ADD COLUMN detected_type VARCHAR(100);
+                END IF;
+            END $$;
+            """,
+            
+            # Add duration_seconds column if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'duration_seconds') THEN
+                    ALTER TABLE media_files ADD COLUMN duration_seconds DOUBLE PRECISION;
+                END IF;
+            END $$;
+            """,
+            
+            # Add captured_at column (EXIF or container creation time) if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'captured_at') THEN
+                    ALTER TABLE media_files ADD COLUMN captured_at TIMESTAMP WITH TIME ZONE;
+                END IF;
+            END $$;
+            """,
+            
+            # Add orientation column if it doesn't exist
+            """
+            DO $$ 
+            BEGIN 
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                              WHERE table_name = 'media_files' AND column_name = 'orientation') THEN
+                    ALTER TABLE media_files ADD COLUMN orientation INTEGER;
+                END IF;
+            END $$;
+            """,
+            
             # Update existing records with default values
             """
             UPDATE media_files 
@@ -137,24 +287,14 @@ async def fix_media_table(db: Session = Depends(get_db)):
 
 @router.get("/metrics")
 async def get_metrics():
-    """Basic metrics endpoint for monitoring"""
+    """Basic metrics endpoint for monitoring (Prometheus scrapes /metrics)"""
     try:
-        # Get system metrics
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
+        # Sampled in the background, so this never waits on the CPU measurement
+        system = system_sampler.latest or await system_sampler.sample()
         
         return {
             "timestamp": datetime.utcnow().isoformat(),
-            "system": {
-                "cpu_percent": cpu_percent,
-                "memory_percent": memory.percent,
-                "memory_used_mb": memory.used // (1024 * 1024),
-                "memory_total_mb": memory.total // (1024 * 1024),
-                "disk_percent": disk.percent,
-                "disk_used_gb": disk.used // (1024 * 1024 * 1024),
-                "disk_total_gb": disk.total // (1024 * 1024 * 1024)
-            },
+            "system": system,
             "application": {
                 "environment": settings.ENVIRONMENT,
                 "debug": settings.DEBUG,
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import Response
+from typing import Optional
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.config import settings
+import hmac
+
+router = APIRouter(tags=["metrics"])
+
+# A plain def, so collection runs in the threadpool rather than on the event loop
+@router.get("/metrics", include_in_schema=False)
+def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus exposition of request, database, upload, Cloudinary, cache and system metrics"""
+    if settings.METRICS_TOKEN and not hmac.compare_digest(
+        authorization or "", f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
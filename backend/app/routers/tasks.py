@@ -1,9 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+import io
+import base64
+import mimetypes
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query, Request, UploadFile
 from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
 from typing import List, Optional
 from app.database import get_db
 from app import crud, schemas, auth, models
 from app.services.cloudinary_service import CloudinaryService
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.file_service import file_service
+from app.services.media_gc import media_gc
+from app.services.contact_sheets import contact_sheets
 import logging
 
 logger = logging.getLogger(__name__)
@@ -56,22 +64,10 @@ async def create_task(
     """Create a new task"""
     from app.utils import convert_enum_for_api
     
-    print(f"Create task request received: {task.dict()}")
-    print(f"Task category type: {type(task.category)}, value: {task.category}")
-    print(f"Task day type: {type(task.day)}, value: {task.day}")
-    print(f"Task task_type type: {type(task.task_type)}, value: {task.task_type}")
-    
-    # Check if we're getting enum objects or strings
-    if hasattr(task.category, 'value'):
-        print(f"Category enum value: {task.category.value}")
-    if hasattr(task.day, 'value'):
-        print(f"Day enum value: {task.day.value}")
-    if hasattr(task.task_type, 'value'):
-        print(f"Task_type enum value: {task.task_type.value}")
-    
     # Use authenticated restaurant ID
     restaurant_id = current_restaurant.id
-    print(f"Using authenticated restaurant ID: {restaurant_id}")
+    logger.debug("Create task request for restaurant %s - category: %r, day: %r, task_type: %r",
+                 restaurant_id, task.category, task.day, task.task_type)
     
     try:
         # Verify restaurant exists
@@ -83,7 +79,6 @@ async def create_task(
             )
         
         # Now create the task
-        print("Creating task in database")
         db_task = crud.create_task(db, task, restaurant_id)
         
         # Convert SQLAlchemy object to dictionary
@@ -147,6 +142,48 @@ async def update_task(
             detail=f"Error updating task: {str(e)}"
         )
 
+def _record_submitted_media(db: Session, task_id: int, restaurant_id: int, media_data: dict) -> None:
+    """Media record for proof uploaded with a submission, so the gallery and storage usage include it"""
+    try:
+        # Resubmissions upload to the same public_id, replacing the stored object
+        replaced = db.query(models.MediaFile).filter(
+            models.MediaFile.task_id == task_id,
+            models.MediaFile.storage_type == media_data["storage_type"],
+            models.MediaFile.file_path == media_data["file_path"]
+        ).all()
+        for media in replaced:
+            crud.adjust_storage_usage(db, restaurant_id, media.storage_type, -media.file_size, -1)
+            crud.delete_media_file(db, media.id)
+        
+        crud.create_media_file(db, {"task_id": task_id, "restaurant_id": restaurant_id, **media_data})
+        crud.adjust_storage_usage(db, restaurant_id, media_data["storage_type"], media_data["file_size"], 1)
+    except Exception as e:
+        # The proof is stored and on the task; only the bookkeeping is missing
+        logger.error(f"Failed to record submitted media for task {task_id}: {str(e)}")
+
+async def _save_submitted_media_locally(data: str, task_id: int, file_type: str, base_url: str) -> dict:
+    """Save base64 proof with the file service while Cloudinary's circuit is open"""
+    header, _, encoded = data.rpartition(",")
+    content_type = header[5:].split(";")[0] if header.startswith("data:") else "image/png"
+    content = base64.b64decode(encoded)
+    upload = UploadFile(
+        file=io.BytesIO(content),
+        size=len(content),
+        filename=f"task_{task_id}{mimetypes.guess_extension(content_type) or ''}",
+        headers=Headers({"content-type": content_type})
+    )
+    save = file_service.save_image if file_type == "image" else file_service.save_video
+    # Storage usage is counted when the media is recorded, not by the file service
+    file_data = await save(upload, str(task_id))
+    if file_data["storage_type"] == "local":
+        file_data["file_url"] = file_service.get_file_url(file_data["file_path"], base_url, "local")
+    rendition_paths = file_data.pop("rendition_paths", None)
+    if rendition_paths:
+        file_data["renditions"] = {
+            name: file_service.get_file_url(path, base_url, "local") for name, path in rendition_paths.items()
+        }
+    return file_data
+
 @router.patch("/{task_id}/submit", response_model=schemas.Task)
 async def submit_task(
     task_id: int,
@@ -164,18 +201,28 @@ async def submit_task(
     # Process image upload if base64 data is provided
     image_url = submission_data.image_url
     video_url = submission_data.video_url
+    uploaded_media = []
     
     try:
         # Handle image upload to Cloudinary if base64 data is provided
         if image_url and CloudinaryService.is_base64_image(image_url):
             logger.info(f"Base64 image detected for task {task_id}, uploading to Cloudinary...")
-            cloudinary_url = CloudinaryService.upload_base64_image(
-                image_url, 
-                folder=f"tasks/restaurant_{restaurant_id}",
-                public_id=f"task_{task_id}_{submission_data.initials or 'user'}"
-            )
+            try:
+                image_media = await CloudinaryService.upload_base64_image_media(
+                    image_url, 
+                    folder=f"tasks/restaurant_{restaurant_id}",
+                    public_id=f"task_{task_id}_{submission_data.initials or 'user'}"
+                )
+            except CircuitOpenError:
+                # Saved locally now and pushed to Cloudinary once it recovers
+                logger.warning(f"Cloudinary circuit open, saving image for task {task_id} locally")
+                image_media = await _save_submitted_media_locally(
+                    image_url, task_id, "image", str(request.base_url).rstrip("/")
+                )
             
-            if cloudinary_url:
+            if image_media:
+                cloudinary_url = image_media["file_url"]
+                uploaded_media.append(image_media)
                 image_url = cloudinary_url
                 logger.info(f"Successfully uploaded image to Cloudinary: {cloudinary_url}")
             else:
@@ -190,13 +237,21 @@ async def submit_task(
         # Handle video upload to Cloudinary if base64 data is provided
         if video_url and CloudinaryService.is_base64_image(video_url):
             logger.info(f"Base64 video detected for task {task_id}, uploading to Cloudinary...")
-            cloudinary_url = CloudinaryService.upload_video_base64(
-                video_url,
-                folder=f"tasks/restaurant_{restaurant_id}",
-                public_id=f"task_{task_id}_video_{submission_data.initials or 'user'}"
-            )
+            try:
+                video_media = await CloudinaryService.upload_video_base64_media(
+                    video_url,
+                    folder=f"tasks/restaurant_{restaurant_id}",
+                    public_id=f"task_{task_id}_video_{submission_data.initials or 'user'}"
+                )
+            except CircuitOpenError:
+                logger.warning(f"Cloudinary circuit open, saving video for task {task_id} locally")
+                video_media = await _save_submitted_media_locally(
+                    video_url, task_id, "video", str(request.base_url).rstrip("/")
+                )
             
-            if cloudinary_url:
+            if video_media:
+                cloudinary_url = video_media["file_url"]
+                uploaded_media.append(video_media)
                 video_url = cloudinary_url
                 logger.info(f"Successfully uploaded video to Cloudinary: {cloudinary_url}")
             else:
@@ -223,6 +278,9 @@ async def submit_task(
                 detail="Task not found"
             )
         
+        for media_data in uploaded_media:
+            _record_submitted_media(db, task_id, restaurant_id, media_data)
+        
         return updated_task
         
     except HTTPException:
@@ -263,6 +321,7 @@ async def decline_task(
     task_id: int,
     decline_data: schemas.TaskDecline,
     request: Request,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant_or_none)
 ):
@@ -272,6 +331,10 @@ async def decline_task(
     if current_restaurant:
         restaurant_id = current_restaurant.id
     
+    # Capture the stored media before the task forgets about it
+    task = crud.get_task_by_id(db, task_id, restaurant_id)
+    assets = media_gc.collect_task_assets(task) if task else []
+    
     task_update = schemas.TaskUpdate(
         status=schemas.TaskStatus.DECLINED,
         decline_reason=decline_data.reason,
@@ -285,12 +348,19 @@ async def decline_task(
             detail="Task not found"
         )
     
+    # The declined proof is discarded, so its stored objects are too
+    crud.delete_media_files_by_task(db, task_id)
+    db.refresh(updated_task)
+    background_tasks.add_task(media_gc.release, assets)
+    background_tasks.add_task(contact_sheets.invalidate_tasks, [task_id])
+    
     return updated_task
 
 @router.delete("/{task_id}")
 async def delete_task(
     task_id: int,
     request: Request,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant_or_none)
 ):
@@ -300,12 +370,18 @@ async def delete_task(
     if current_restaurant:
         restaurant_id = current_restaurant.id
     
+    # Media rows cascade with the task; the stored objects are released afterwards
+    task = crud.get_task_by_id(db, task_id, restaurant_id)
+    assets = media_gc.collect_task_assets(task) if task else []
+    
     success = crud.delete_task(db, task_id, restaurant_id)
     if not success:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Task not found"
         )
+    background_tasks.add_task(media_gc.release, assets)
+    background_tasks.add_task(contact_sheets.invalidate_tasks, [task_id])
     return {"message": "Task deleted successfully"}
 
 @router.get("/{task_id}/media", response_model=List[schemas.MediaFile])
@@ -1,29 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile, File, Form, Request, Header
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from typing import Optional
 import os
+import json
 from app.database import get_db
 from app import crud, schemas, auth, models
 from app.services.file_service import file_service
+from app.services.resumable_upload_service import resumable_upload_service
+from app.services.direct_uploads import direct_upload_service
+from app.services.media_delivery import media_file_response
+from app.services.contact_sheets import contact_sheets
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/upload", tags=["uploads"])
 
+TUS_VERSION = "1.0.0"
+
+def _resolve_file_url(file_data: dict) -> str:
+    """Public URL for a saved file"""
+    if file_data.get("storage_type") == "cloudinary" or file_data.get("file_url"):
+        return file_data.get("file_url")
+    # Use production URL if in production environment
+    from app.config import settings
+    base_url = "https://radiant-amazement-production-d68f.up.railway.app" if settings.ENVIRONMENT == "production" else "http://localhost:8000"
+    return file_service.get_file_url(file_data["file_path"], base_url, "local")
+
+def _resolve_renditions(file_data: dict) -> Optional[dict]:
+    """Public URLs for the renditions saved with a file"""
+    rendition_paths = file_data.pop("rendition_paths", None)
+    if rendition_paths:
+        return {name: _resolve_file_url({"file_path": path}) for name, path in rendition_paths.items()}
+    return file_data.get("renditions")
+
 @router.get("/health")
 async def upload_health():
     """Check upload service health"""
     try:
         from app.services.file_service import file_service
         
-        # Test Cloudinary connection if enabled
+        from app.services.circuit_breaker import cloudinary_breaker
+        
+        # Test Cloudinary connection if enabled; an open circuit is not pinged
         cloudinary_status = "disabled"
-        if file_service.use_cloud_storage:
-            try:
-                import cloudinary.api
-                cloudinary.api.ping()
-                cloudinary_status = "connected"
-            except Exception as e:
-                cloudinary_status = f"error: {str(e)}"
+        if file_service.cloudinary_configured:
+            if not cloudinary_breaker.accepting_calls:
+                cloudinary_status = "circuit open - uploads saved locally"
+            else:
+                try:
+                    await file_service.backend.check()
+                    cloudinary_status = "connected"
+                except Exception as e:
+                    cloudinary_status = f"error: {str(e)}"
         
         # Test local storage
         import os
@@ -32,6 +62,7 @@ async def upload_health():
         return {
             "status": "healthy",
             "cloudinary": cloudinary_status,
+            "cloudinary_circuit": cloudinary_breaker.snapshot(),
             "local_storage": local_status,
             "upload_directory": file_service.upload_dir,
             "max_file_size": file_service.max_file_size,
@@ -61,24 +92,24 @@ async def upload_image(
                 detail="Task not found"
             )
         
-        # Save file
-        file_data = await file_service.save_image(file, task_id)
+        # Save file (identical content already stored for this restaurant is reused)
+        file_data = await file_service.save_image(file, task_id, db, current_restaurant.id)
+        
+        # Resolve the public URL before recording the media
+        file_url = _resolve_file_url(file_data)
+        renditions = _resolve_renditions(file_data)
         
         # Create media record
         media_data = {
             "task_id": int(task_id),
-            **file_data
+            "restaurant_id": current_restaurant.id,
+            **file_data,
+            "file_url": file_url,
+            "renditions": renditions
         }
         db_media = crud.create_media_file(db, media_data)
         
         # Update task with image URL
-        if file_data.get("storage_type") == "cloudinary":
-            file_url = file_data.get("file_url")
-        else:
-            # Use production URL if in production environment
-            from app.config import settings
-            base_url = "https://radiant-amazement-production-d68f.up.railway.app" if settings.ENVIRONMENT == "production" else "http://localhost:8000"
-            file_url = file_service.get_file_url(file_data["file_path"], base_url, "local")
         crud.update_task(db, int(task_id), current_restaurant.id, 
                         schemas.TaskUpdate(image_url=file_url))
         
@@ -117,24 +148,24 @@ async def upload_video(
                 detail="Task not found"
             )
         
-        # Save file
-        file_data = await file_service.save_video(file, task_id)
+        # Save file (identical content already stored for this restaurant is reused)
+        file_data = await file_service.save_video(file, task_id, db, current_restaurant.id)
+        
+        # Resolve the public URL before recording the media
+        file_url = _resolve_file_url(file_data)
+        renditions = _resolve_renditions(file_data)
         
         # Create media record
         media_data = {
             "task_id": int(task_id),
-            **file_data
+            "restaurant_id": current_restaurant.id,
+            **file_data,
+            "file_url": file_url,
+            "renditions": renditions
         }
         db_media = crud.create_media_file(db, media_data)
         
         # Update task with video URL
-        if file_data.get("storage_type") == "cloudinary":
-            file_url = file_data.get("file_url")
-        else:
-            # Use production URL if in production environment
-            from app.config import settings
-            base_url = "https://radiant-amazement-production-d68f.up.railway.app" if settings.ENVIRONMENT == "production" else "http://localhost:8000"
-            file_url = file_service.get_file_url(file_data["file_path"], base_url, "local")
         crud.update_task(db, int(task_id), current_restaurant.id, 
                         schemas.TaskUpdate(video_url=file_url))
         
@@ -156,10 +187,264 @@ async def upload_video(
             detail=f"Video upload failed: {str(e)}"
         )
 
-@router.get("/serve/{task_id}/{filename}")
+@router.post("/resumable", status_code=status.HTTP_201_CREATED)
+async def create_resumable_upload(
+    upload: schemas.ResumableUploadCreate,
+    current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant),
+    db: Session = Depends(get_db)
+):
+    """Start a resumable (tus-style) video upload"""
+    task = crud.get_task_by_id(db, upload.task_id, current_restaurant.id)
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    
+    # Reject unsupported types before any bytes are sent
+    if upload.content_type not in file_service.allowed_video_types:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File type {upload.content_type} not allowed. Allowed types: {file_service.allowed_video_types}"
+        )
+    
+    info = resumable_upload_service.create_session(
+        upload.task_id, current_restaurant.id, upload.filename, upload.content_type, upload.length
+    )
+    
+    return Response(
+        status_code=status.HTTP_201_CREATED,
+        content=schemas.ResumableUploadStatus(**info).model_dump_json(),
+        media_type="application/json",
+        headers={
+            "Location": f"/api/upload/resumable/{info['upload_id']}",
+            "Tus-Resumable": TUS_VERSION,
+            "Upload-Offset": "0",
+            "Upload-Length": str(info["length"]),
+            "Upload-Expires": info["expires_at"]
+        }
+    )
+
+@router.head("/resumable/{upload_id}")
+async def get_resumable_upload_offset(
+    upload_id: str,
+    current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant)
+):
+    """Report how many bytes of a resumable upload have been received"""
+    info = resumable_upload_service.get_session(upload_id, current_restaurant.id)
+    return Response(
+        status_code=status.HTTP_200_OK,
+        headers={
+            "Tus-Resumable": TUS_VERSION,
+            "Upload-Offset": str(info["offset"]),
+            "Upload-Length": str(info["length"]),
+            "Upload-Expires": info["expires_at"],
+            "Cache-Control": "no-store"
+        }
+    )
+
+@router.patch("/resumable/{upload_id}")
+async def append_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant)
+):
+    """Append a chunk of bytes at Upload-Offset"""
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Chunks must be sent as application/offset+octet-stream"
+        )
+    
+    info = await resumable_upload_service.append_chunk(
+        upload_id, current_restaurant.id, upload_offset, request.stream()
+    )
+    return Response(
+        status_code=status.HTTP_204_NO_CONTENT,
+        headers={
+            "Tus-Resumable": TUS_VERSION,
+            "Upload-Offset": str(info["offset"]),
+            "Upload-Expires": info["expires_at"]
+        }
+    )
+
+@router.post("/resumable/{upload_id}/finalize", response_model=schemas.UploadResponse)
+async def finalize_resumable_upload(
+    upload_id: str,
+    current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant),
+    db: Session = Depends(get_db)
+):
+    """Store a completed resumable upload and attach it to its task"""
+    # Held until the session is deleted so a repeated finalize cannot race this one
+    async with resumable_upload_service.lock(upload_id):
+        info = resumable_upload_service.complete_session(upload_id, current_restaurant.id)
+        
+        try:
+            task = crud.get_task_by_id(db, info["task_id"], current_restaurant.id)
+            if not task:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Task not found"
+                )
+        
+            file_data = await file_service.save_video_file(
+                resumable_upload_service.data_path(upload_id),
+                str(info["task_id"]),
+                info["content_type"],
+                info["filename"],
+                db,
+                current_restaurant.id
+            )
+            file_url = _resolve_file_url(file_data)
+            renditions = _resolve_renditions(file_data)
+        
+            # Create media record
+            media_data = {
+                "task_id": info["task_id"],
+                "restaurant_id": current_restaurant.id,
+                **file_data,
+                "file_url": file_url,
+                "renditions": renditions
+            }
+            crud.create_media_file(db, media_data)
+        
+            # Update task with video URL
+            crud.update_task(db, info["task_id"], current_restaurant.id,
+                            schemas.TaskUpdate(video_url=file_url))
+        
+            resumable_upload_service.delete_session(upload_id)
+        
+            return schemas.UploadResponse(
+                url=file_url,
+                filename=file_data["filename"],
+                file_size=file_data["file_size"]
+            )
+        
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"❌ Resumable upload finalize error: {str(e)}")
+            import traceback
+            print(f"📋 Traceback: {traceback.format_exc()}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Video upload failed: {str(e)}"
+            )
+
+def _record_direct_upload(db: Session, background_tasks: BackgroundTasks,
+                          task_id: int, restaurant_id: int, file_data: dict) -> dict:
+    """Record a verified direct upload once, whether confirm or the notification gets here first"""
+    file_url = _resolve_file_url(file_data)
+    existing = db.query(models.MediaFile).filter(
+        models.MediaFile.task_id == task_id,
+        models.MediaFile.file_path == file_data["file_path"]
+    ).first()
+    if existing:
+        return {**file_data, "file_url": existing.file_url}
+    
+    crud.create_media_file(db, {
+        "task_id": task_id,
+        "restaurant_id": restaurant_id,
+        **file_data,
+        "file_url": file_url
+    })
+    try:
+        crud.adjust_storage_usage(db, restaurant_id, file_data["storage_type"], file_data["file_size"], 1)
+    except Exception as e:
+        logger.warning(f"Failed to update storage usage: {e}")
+    
+    media_url = {"video_url": file_url} if file_data["file_type"] == "video" else {"image_url": file_url}
+    crud.update_task(db, task_id, restaurant_id, schemas.TaskUpdate(**media_url))
+    background_tasks.add_task(contact_sheets.invalidate_tasks, [task_id])
+    return {**file_data, "file_url": file_url}
+
+@router.post("/direct", response_model=schemas.DirectUploadIntent, status_code=status.HTTP_201_CREATED)
+async def create_direct_upload(
+    upload: schemas.DirectUploadCreate,
+    request: Request,
+    current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant),
+    db: Session = Depends(get_db)
+):
+    """Signed, time-limited parameters for uploading straight to the media store"""
+    task = crud.get_task_by_id(db, upload.task_id, current_restaurant.id)
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    
+    return direct_upload_service.create_intent(
+        upload.task_id, current_restaurant.id, upload.filename, upload.content_type,
+        upload.length, str(request.base_url).rstrip("/")
+    )
+
+@router.put("/direct/local/{token}", status_code=status.HTTP_204_NO_CONTENT)
+async def receive_direct_upload(token: str, request: Request):
+    """Presigned PUT target when media is stored locally; the token is the credential"""
+    await direct_upload_service.receive_local(token, request.headers.get("content-type"), request.stream())
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.post("/direct/confirm", response_model=schemas.UploadResponse)
+async def confirm_direct_upload(
+    confirmation: schemas.DirectUploadConfirm,
+    background_tasks: BackgroundTasks,
+    current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant),
+    db: Session = Depends(get_db)
+):
+    """Verify a direct upload and attach it to its task"""
+    claims = direct_upload_service.verify_token(confirmation.token, current_restaurant.id)
+    if not crud.get_task_by_id(db, claims["task_id"], current_restaurant.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found"
+        )
+    
+    file_data = await direct_upload_service.confirm(claims, confirmation.result)
+    media = _record_direct_upload(db, background_tasks, claims["task_id"], current_restaurant.id, file_data)
+    return schemas.UploadResponse(
+        url=media["file_url"],
+        filename=media["filename"],
+        file_size=media["file_size"]
+    )
+
+@router.post("/direct/cloudinary/notify")
+async def cloudinary_upload_notification(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """Cloudinary's upload webhook; records direct uploads whose client never confirmed"""
+    body = await request.body()
+    if not direct_upload_service.verify_notification(
+        body, request.headers.get("X-Cld-Timestamp"), request.headers.get("X-Cld-Signature")
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid notification signature"
+        )
+    
+    notification = json.loads(body)
+    task_id = direct_upload_service.task_id_for(notification.get("public_id"))
+    if notification.get("notification_type") != "upload" or task_id is None:
+        return {"status": "ignored"}
+    
+    task = db.query(models.Task).filter(models.Task.id == task_id).first()
+    if not task:
+        return {"status": "ignored"}
+    
+    file_data = await direct_upload_service.notification_media(notification)
+    if file_data is None:
+        return {"status": "ignored"}
+    
+    _record_direct_upload(db, background_tasks, task.id, task.restaurant_id, file_data)
+    return {"status": "recorded"}
+
+@router.api_route("/serve/{task_id}/{filename}", methods=["GET", "HEAD"])
 async def serve_file(
     task_id: str,
     filename: str,
+    request: Request,
     current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant),
     db: Session = Depends(get_db)
 ):
@@ -172,25 +457,41 @@ async def serve_file(
             detail="Task not found"
         )
     
-    # Construct file path
-    file_path = os.path.join(
-        file_service.upload_dir, 
-        "task_completions", 
-        task_id, 
-        filename
+    # Duplicate uploads share the object stored under the first task's directory
+    media = db.query(models.MediaFile).filter(
+        models.MediaFile.task_id == int(task_id),
+        models.MediaFile.filename == filename,
+        models.MediaFile.storage_type == "local"
+    ).first()
+    
+    # Files without a media record are looked up in both directory layouts
+    file_path = media.file_path if media else file_service.local_backend.locate(
+        f"task_completions/{task_id}/{filename}"
     )
     
-    if not os.path.exists(file_path):
+    # Never serve anything outside the upload directory
+    upload_root = os.path.realpath(file_service.upload_dir)
+    real_path = os.path.realpath(file_path) if file_path else ""
+    if not real_path.startswith(upload_root + os.sep) or not os.path.isfile(real_path):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found"
         )
     
-    return FileResponse(file_path)
+    # Supports Range requests for video seeking, ETag revalidation and
+    # optional X-Accel-Redirect hand-off to nginx
+    return media_file_response(
+        real_path,
+        request.headers,
+        method=request.method,
+        upload_dir=upload_root,
+        media_type=media.mime_type if media else None
+    )
 
 @router.delete("/media/{media_id}")
 async def delete_media(
     media_id: int,
+    background_tasks: BackgroundTasks,
     current_restaurant: models.Restaurant = Depends(auth.get_current_restaurant),
     db: Session = Depends(get_db)
 ):
@@ -214,8 +515,10 @@ async def delete_media(
             detail="Task not found"
         )
     
-    # Delete file from disk
-    file_service.delete_file(media.file_path)
+    # Delete the stored file only when no other media record still references it
+    if crud.count_media_file_references(db, media) <= 1:
+        if await file_service.delete_file(media.file_path, media.storage_type, media.file_type):
+            crud.adjust_storage_usage(db, current_restaurant.id, media.storage_type, -media.file_size, -1)
     
     # Delete media record
     success = crud.delete_media_file(db, media_id)
@@ -225,4 +528,6 @@ async def delete_media(
             detail="Failed to delete media record"
         )
     
+    # Gallery sheets showing this task must not keep serving the removed media
+    background_tasks.add_task(contact_sheets.invalidate_tasks, [task.id])
     return {"message": "Media file deleted successfully"}
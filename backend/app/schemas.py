@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List, Union
+from typing import Any, Dict, Optional, List, Union
 from datetime import datetime
 from app.models import TaskStatus, TaskCategory, TaskType, Day  # Import from models
 
@@ -142,6 +142,15 @@ class MediaFileBase(BaseModel):
 class MediaFile(MediaFileBase):
     id: int
     task_id: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    aspect_ratio: Optional[float] = None
+    placeholder: Optional[str] = None
+    renditions: Optional[Dict[str, str]] = None
+    detected_type: Optional[str] = None
+    duration_seconds: Optional[float] = None
+    captured_at: Optional[datetime] = None
+    orientation: Optional[int] = None
     created_at: datetime
 
     class Config:
@@ -177,6 +186,37 @@ class UploadResponse(BaseModel):
     filename: str
     file_size: int
 
+class ResumableUploadCreate(BaseModel):
+    task_id: int
+    filename: str
+    content_type: str
+    length: int
+
+class ResumableUploadStatus(BaseModel):
+    upload_id: str
+    offset: int
+    length: int
+    expires_at: datetime
+
+class DirectUploadCreate(BaseModel):
+    task_id: int
+    filename: str
+    content_type: str
+    length: int
+
+class DirectUploadIntent(BaseModel):
+    token: str
+    storage_type: str
+    method: str
+    upload_url: str
+    fields: Dict[str, str] = {}  # Form fields to post with the file (Cloudinary)
+    headers: Dict[str, str] = {}  # Headers the presigned PUT must carry
+    expires_at: datetime
+
+class DirectUploadConfirm(BaseModel):
+    token: str
+    result: Optional[Dict[str, Any]] = None  # Cloudinary's upload response, passed on unchanged
+
 # Error schemas
 class ErrorResponse(BaseModel):
     detail: str
@@ -0,0 +1,201 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Iterator, Optional, Tuple
+import cloudinary.exceptions
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Stop calling a degraded service and probe it before trusting it again
+
+    Outcomes of the last ``window_size`` calls are kept. Once at least
+    ``min_calls`` have been seen, the circuit opens when the share of failed
+    calls reaches ``failure_rate`` or the share of calls slower than
+    ``slow_call_seconds`` reaches ``slow_call_rate``. While open, calls fail
+    at once with CircuitOpenError. After ``open_seconds`` up to
+    ``half_open_probes`` calls are let through; if they all succeed (and are
+    not slow) the circuit closes, otherwise it opens again.
+
+    Exceptions in ``ignored_exceptions`` are the caller's fault (a bad
+    file, a missing asset) and count as successful calls.
+    """
+
+    def __init__(self, name: str, failure_rate: float, slow_call_rate: float, slow_call_seconds: float,
+                 window_size: int, min_calls: int, open_seconds: float, half_open_probes: int,
+                 ignored_exceptions: Tuple[type, ...] = ()):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.ignored_exceptions = ignored_exceptions
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self.last_closed_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected_calls = 0
+        # (failed, slow) for each recent call
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window_size)
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def _open(self, reason: str) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._outcomes.clear()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        logger.warning(f"{self.name} circuit opened: {reason}")
+
+    def _close(self) -> None:
+        self.state = CLOSED
+        self.opened_at = None
+        self.last_closed_at = time.time()
+        self._outcomes.clear()
+        logger.info(f"{self.name} circuit closed after {self._probe_successes} successful probes")
+
+    def _acquire(self) -> bool:
+        """Whether a call may go ahead; True for a half-open probe"""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    self.rejected_calls += 1
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                self.state = HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+                logger.info(f"{self.name} circuit half-open, probing")
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self.rejected_calls += 1
+                    raise CircuitOpenError(f"{self.name} circuit is half-open and its probes are in flight")
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def _record(self, probe: bool, failed: bool, slow: bool) -> None:
+        with self._lock:
+            if probe:
+                if self.state != HALF_OPEN:
+                    return  # Another probe already decided the outcome
+                self._probes_in_flight -= 1
+                if failed or slow:
+                    self._open("probe failed" if failed else "probe was slow")
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._close()
+                return
+
+            if self.state != CLOSED:
+                return  # Started before the circuit opened
+            self._outcomes.append((failed, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            failures = sum(1 for outcome in self._outcomes if outcome[0]) / len(self._outcomes)
+            slow_calls = sum(1 for outcome in self._outcomes if outcome[1]) / len(self._outcomes)
+            if failures >= self.failure_rate:
+                self._open(f"{failures:.0%} of the last {len(self._outcomes)} calls failed")
+            elif slow_calls >= self.slow_call_rate:
+                self._open(f"{slow_calls:.0%} of the last {len(self._outcomes)} calls took over "
+                           f"{self.slow_call_seconds}s")
+
+    def _release(self, probe: bool) -> None:
+        with self._lock:
+            if probe and self.state == HALF_OPEN:
+                self._probes_in_flight -= 1
+
+    @contextmanager
+    def guard(self, timed: bool = True) -> Iterator[None]:
+        """Run the enclosed call through the breaker (works around awaits too)
+
+        timed=False leaves bulk transfers, whose duration follows their size,
+        out of the latency threshold.
+        """
+        probe = self._acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except self.ignored_exceptions:
+            self._record(probe, False, False)
+            raise
+        except Exception:
+            self._record(probe, True, False)
+            raise
+        except BaseException:
+            # A cancelled request says nothing about the service
+            self._release(probe)
+            raise
+        else:
+            elapsed = time.monotonic() - started
+            self._record(probe, False, timed and elapsed > self.slow_call_seconds)
+
+    def trip(self, reason: str) -> None:
+        """Open the circuit without waiting for the window to fill"""
+        with self._lock:
+            self._open(reason)
+
+    @property
+    def is_closed(self) -> bool:
+        return self.state == CLOSED
+
+    @property
+    def accepting_calls(self) -> bool:
+        """Whether a call now would be attempted (closed, or due for a probe)"""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= self.open_seconds
+            if self.state == HALF_OPEN:
+                return self._probes_in_flight < self.half_open_probes
+            return True
+
+    def snapshot(self) -> dict:
+        """State and recent outcomes for health endpoints"""
+        with self._lock:
+            outcomes = list(self._outcomes)
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, round(self.open_seconds - (time.monotonic() - self.opened_at), 1))
+            return {
+                "name": self.name,
+                "state": self.state,
+                "recent_calls": len(outcomes),
+                "recent_failures": sum(1 for outcome in outcomes if outcome[0]),
+                "recent_slow_calls": sum(1 for outcome in outcomes if outcome[1]),
+                "retry_in_seconds": retry_in,
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected_calls
+            }
+
+
+# Create breaker instance
+cloudinary_breaker = CircuitBreaker(
+    "cloudinary",
+    failure_rate=settings.CLOUDINARY_CIRCUIT_FAILURE_RATE,
+    slow_call_rate=settings.CLOUDINARY_CIRCUIT_SLOW_CALL_RATE,
+    slow_call_seconds=settings.CLOUDINARY_CIRCUIT_SLOW_CALL_SECONDS,
+    window_size=settings.CLOUDINARY_CIRCUIT_WINDOW,
+    min_calls=settings.CLOUDINARY_CIRCUIT_MIN_CALLS,
+    open_seconds=settings.CLOUDINARY_CIRCUIT_OPEN_SECONDS,
+    half_open_probes=settings.CLOUDINARY_CIRCUIT_HALF_OPEN_PROBES,
+    # Rejected files, missing assets and Admin API rate limits are not an outage
+    ignored_exceptions=(cloudinary.exceptions.BadRequest, cloudinary.exceptions.NotFound,
+                        cloudinary.exceptions.RateLimited)
+)
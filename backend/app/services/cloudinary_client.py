@@ -0,0 +1,235 @@
+import os
+import time
+import random
+import asyncio
+import email.utils
+from typing import Dict, List, Optional, Union
+import aiofiles
+import httpx
+import cloudinary
+import cloudinary.exceptions
+from cloudinary import utils
+from app.config import settings
+from app import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Same chunk size as the SDK's upload_large
+UPLOAD_CHUNK_SIZE = 20 * 1024 * 1024
+RETRY_STATUSES = {500, 502, 503, 504}
+ERRORS = {
+    400: cloudinary.exceptions.BadRequest,
+    401: cloudinary.exceptions.AuthorizationRequired,
+    403: cloudinary.exceptions.NotAllowed,
+    404: cloudinary.exceptions.NotFound,
+    409: cloudinary.exceptions.AlreadyExists,
+    420: cloudinary.exceptions.RateLimited,
+    429: cloudinary.exceptions.RateLimited,
+}
+
+
+class AdminResponse(dict):
+    """Admin API result with the rate limit headers the SDK exposes as well"""
+    rate_limit_remaining: Optional[int] = None
+    rate_limit_reset_at: Optional[tuple] = None
+
+
+def _form(params: dict) -> Dict[str, Union[str, List[str]]]:
+    """Request fields the way the SDK sends them: lists as key[], empty values dropped"""
+    fields = {}
+    for key, value in params.items():
+        if isinstance(value, list):
+            fields[f"{key}[]"] = [str(item) for item in value]
+        elif value:
+            fields[key] = str(value)
+    return fields
+
+
+class CloudinaryClient:
+    """Async Upload and Admin API client on one pooled set of connections
+
+    Requests are built and signed the way the SDK does it, with cloud name,
+    keys and upload_prefix read from cloudinary.config(). They go out on a
+    shared httpx.AsyncClient with keep-alive, so concurrent uploads are
+    bounded by the connection pool rather than by executor threads.
+    Connection errors and 5xx responses are retried with jittered
+    exponential backoff; uploads only when they name their public_id, so a
+    retry overwrites instead of creating a second asset.
+    """
+
+    def __init__(self):
+        self.max_retries = settings.CLOUDINARY_MAX_RETRIES
+        self.limits = httpx.Limits(
+            max_connections=settings.CLOUDINARY_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.CLOUDINARY_MAX_KEEPALIVE_CONNECTIONS
+        )
+        self.timeout = httpx.Timeout(
+            settings.CLOUDINARY_TIMEOUT_SECONDS,
+            connect=settings.CLOUDINARY_CONNECT_TIMEOUT_SECONDS
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared connection pool (one per event loop, as connections belong to a loop)"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                headers={"User-Agent": cloudinary.get_user_agent()}
+            )
+            self._loop = loop
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    def _api_url(self, *path: str) -> str:
+        config = cloudinary.config()
+        prefix = config.upload_prefix or "https://api.cloudinary.com"
+        return "/".join([prefix, cloudinary.API_VERSION, config.cloud_name, *path])
+
+    async def _request(self, method: str, url: str, operation: str, retry: bool = True,
+                       **kwargs) -> httpx.Response:
+        """Send with retries; the whole call is timed under its operation"""
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = await self._send(method, url, retry, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            metrics.CLOUDINARY_REQUEST_SECONDS.labels(operation, status).observe(time.perf_counter() - start)
+
+    async def _send(self, method: str, url: str, retry: bool, **kwargs) -> httpx.Response:
+        attempts = self.max_retries + 1 if retry else 1
+        for attempt in range(attempts):
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                    return response
+                reason = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                if attempt == attempts - 1:
+                    raise cloudinary.exceptions.Error(f"Cloudinary request failed: {e!r}") from e
+                reason = repr(e)
+            delay = 0.25 * 2 ** attempt * (0.5 + random.random())
+            logger.warning(f"Cloudinary {method} {url} failed ({reason}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _result(response: httpx.Response) -> dict:
+        try:
+            result = response.json()
+        except ValueError:
+            raise cloudinary.exceptions.Error(
+                f"Error parsing server response ({response.status_code}) - {response.text[:200]}"
+            )
+        if response.status_code >= 400 or "error" in result:
+            message = (result.get("error") or {}).get("message") or response.reason_phrase
+            raise ERRORS.get(response.status_code, cloudinary.exceptions.GeneralError)(message)
+        return result
+
+    async def _upload_api(self, action: str, params: dict, resource_type: str, retry: bool,
+                          file: Optional[Union[bytes, str]] = None, filename: str = "file",
+                          headers: Optional[dict] = None) -> dict:
+        data = _form(utils.sign_request(params, {}))
+        files = None
+        if isinstance(file, bytes):
+            files = {"file": (filename, file)}
+        elif file is not None:
+            # Data URIs and remote URLs are sent as a plain field
+            data["file"] = file
+        response = await self._request(
+            "POST", utils.cloudinary_api_url(action, resource_type=resource_type), action,
+            retry=retry, data=data, files=files, headers=headers
+        )
+        return self._result(response)
+
+    async def upload(self, file: Union[bytes, str], **options) -> dict:
+        """Upload bytes, a data URI or a remote URL (like cloudinary.uploader.upload)"""
+        return await self._upload_api(
+            "upload", utils.build_upload_params(**options), options.get("resource_type", "image"),
+            retry=bool(options.get("public_id")), file=file, filename=options.get("filename") or "file"
+        )
+
+    async def upload_large(self, file_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE, **options) -> dict:
+        """Upload a file from disk in chunks (like cloudinary.uploader.upload_large)
+
+        Chunks are read one at a time, so memory stays at one chunk whatever
+        the file size. Each chunk names its byte range, so it is safe to retry.
+        """
+        resource_type = options.get("resource_type", "raw")
+        file_size = os.path.getsize(file_path)
+        filename = options.get("filename") or os.path.basename(file_path)
+        upload_id = utils.random_public_id()
+        result = None
+        offset = 0
+        async with aiofiles.open(file_path, 'rb') as f:
+            while True:
+                chunk = await f.read(chunk_size)
+                if not chunk:
+                    break
+                headers = {
+                    "Content-Range": f"bytes {offset}-{offset + len(chunk) - 1}/{file_size}",
+                    "X-Unique-Upload-Id": upload_id
+                }
+                result = await self._upload_api(
+                    "upload", utils.build_upload_params(**options), resource_type,
+                    retry=True, file=chunk, filename=filename, headers=headers
+                )
+                # Later chunks go to the asset the first one created
+                options["public_id"] = result.get("public_id")
+                offset += len(chunk)
+        return result
+
+    async def destroy(self, public_id: str, resource_type: str = "image", invalidate: bool = False) -> dict:
+        """Delete one asset (like cloudinary.uploader.destroy)"""
+        params = {"public_id": public_id, "timestamp": utils.now(), "type": "upload", "invalidate": invalidate}
+        return await self._upload_api("destroy", params, resource_type, retry=True)
+
+    async def _admin_api(self, method: str, path: List[str], params: Optional[dict] = None) -> AdminResponse:
+        config = cloudinary.config()
+        operation = path[0] if method == "GET" else f"{method.lower()}_{path[0]}"
+        response = await self._request(
+            method, self._api_url(*path), operation,
+            params=_form(utils.normalize_params(params or {})),
+            auth=(config.api_key, config.api_secret)
+        )
+        result = AdminResponse(self._result(response))
+        remaining = response.headers.get("X-FeatureRateLimit-Remaining")
+        if remaining is not None:
+            result.rate_limit_remaining = int(remaining)
+        reset_at = response.headers.get("X-FeatureRateLimit-Reset")
+        if reset_at:
+            result.rate_limit_reset_at = email.utils.parsedate(reset_at)
+        return result
+
+    async def ping(self) -> AdminResponse:
+        return await self._admin_api("GET", ["ping"])
+
+    async def resources(self, resource_type: str = "image", type: str = "upload", **options) -> AdminResponse:
+        """List assets, by prefix or by public_ids (like cloudinary.api.resources)"""
+        return await self._admin_api("GET", ["resources", resource_type, type], options)
+
+    async def resource(self, public_id: str, resource_type: str = "image", type: str = "upload",
+                       **options) -> AdminResponse:
+        """Details of one asset (like cloudinary.api.resource)"""
+        return await self._admin_api("GET", ["resources", resource_type, type, public_id], options)
+
+    async def delete_resources(self, public_ids: List[str], resource_type: str = "image", type: str = "upload",
+                               **options) -> AdminResponse:
+        """Delete up to 100 assets in one call (like cloudinary.api.delete_resources)"""
+        return await self._admin_api(
+            "DELETE", ["resources", resource_type, type], {"public_ids": public_ids, **options}
+        )
+
+
+# Create client instance
+cloudinary_client = CloudinaryClient()
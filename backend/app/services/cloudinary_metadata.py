@@ -0,0 +1,142 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.config import settings
+from app import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Admin API limit of public_ids per resources call
+BATCH_SIZE = 100
+# Assets Cloudinary did not return are asked for again sooner
+MISSING_TTL_SECONDS = 60
+# Resource fields the admin views show
+METADATA_FIELDS = ("bytes", "width", "height", "duration", "format", "created_at")
+
+Key = Tuple[str, str]  # (resource_type, public_id)
+
+
+def _metadata(resource: dict) -> dict:
+    return {field: resource.get(field) for field in METADATA_FIELDS}
+
+
+class CloudinaryMetadataCache:
+    """Resource metadata (bytes, dimensions, duration) for Cloudinary assets
+
+    Lookups for a page of media are batched into one Admin API resources
+    call per resource type (up to 100 public_ids each) and kept in a local
+    LRU store for a TTL. Concurrent lookups of the same asset share one
+    request. Upload responses carry the same fields, so new uploads are
+    remembered as they are stored and a fresh page usually needs no call.
+    """
+
+    def __init__(self):
+        self.ttl = settings.CLOUDINARY_METADATA_TTL_SECONDS
+        self.max_entries = settings.CLOUDINARY_METADATA_CACHE_SIZE
+        self.wait_seconds = settings.CLOUDINARY_METADATA_WAIT_SECONDS
+        self._entries: "OrderedDict[Key, Tuple[float, Optional[dict]]]" = OrderedDict()
+        self._pending: Dict[Key, asyncio.Future] = {}
+        self._fetches = set()
+        self.stats = {"hits": 0, "misses": 0, "upstream_calls": 0, "upstream_errors": 0}
+
+    def _store(self, key: Key, metadata: Optional[dict], ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, metadata)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _cached(self, key: Key) -> Tuple[bool, Optional[dict]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, metadata = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, metadata
+
+    def remember(self, result: dict) -> None:
+        """Cache the metadata of an upload response or Admin API resource"""
+        if result.get("public_id") and result.get("resource_type"):
+            self._store((result["resource_type"], result["public_id"]), _metadata(result), self.ttl)
+
+    def forget(self, resource_type: str, public_id: str) -> None:
+        self._entries.pop((resource_type, public_id), None)
+
+    async def _fetch(self, resource_type: str, public_ids: List[str]) -> None:
+        """One Admin API call for up to BATCH_SIZE assets of one type; settles their pending lookups"""
+        from app.services.cloudinary_client import cloudinary_client
+        from app.services.storage_backends import get_storage_backend
+
+        found = {}
+        try:
+            self.stats["upstream_calls"] += 1
+            response = await get_storage_backend("cloudinary")._admin_call(
+                cloudinary_client.resources, resource_type=resource_type, type="upload",
+                public_ids=public_ids, max_results=len(public_ids)
+            )
+            for resource in response.get("resources", []):
+                found[resource["public_id"]] = _metadata(resource)
+            for public_id in public_ids:
+                if public_id in found:
+                    self._store((resource_type, public_id), found[public_id], self.ttl)
+                else:
+                    self._store((resource_type, public_id), None, MISSING_TTL_SECONDS)
+        except Exception as e:
+            # Not cached, so the next view asks again
+            self.stats["upstream_errors"] += 1
+            logger.warning(f"Failed to fetch Cloudinary metadata for {len(public_ids)} {resource_type}s: {str(e)}")
+        finally:
+            for public_id in public_ids:
+                future = self._pending.pop((resource_type, public_id), None)
+                if future is not None and not future.done():
+                    future.set_result(found.get(public_id))
+
+    async def get_many(self, keys: Iterable[Optional[Key]]) -> Dict[Key, Optional[dict]]:
+        """Metadata for each (resource_type, public_id); None where unknown
+
+        Waits at most wait_seconds for Cloudinary; a slower fetch still
+        completes in the background and fills the cache for the next view.
+        """
+        results: Dict[Key, Optional[dict]] = {}
+        waiting: Dict[Key, asyncio.Future] = {}
+        to_fetch: Dict[str, List[str]] = {}
+        loop = asyncio.get_running_loop()
+
+        for key in dict.fromkeys(key for key in keys if key):
+            hit, metadata = self._cached(key)
+            if hit:
+                self.stats["hits"] += 1
+                results[key] = metadata
+                continue
+            self.stats["misses"] += 1
+            future = self._pending.get(key)
+            if future is None or future.get_loop() is not loop:
+                future = self._pending[key] = loop.create_future()
+                to_fetch.setdefault(key[0], []).append(key[1])
+            waiting[key] = future
+
+        for resource_type, public_ids in to_fetch.items():
+            for start in range(0, len(public_ids), BATCH_SIZE):
+                fetch = asyncio.create_task(self._fetch(resource_type, public_ids[start:start + BATCH_SIZE]))
+                self._fetches.add(fetch)
+                fetch.add_done_callback(self._fetches.discard)
+
+        if waiting:
+            # asyncio.wait leaves unfinished fetches running when it times out
+            done, _ = await asyncio.wait(waiting.values(), timeout=self.wait_seconds)
+            if len(done) < len(waiting):
+                logger.warning(f"Cloudinary metadata not back within {self.wait_seconds}s, answering without it")
+            for key, future in waiting.items():
+                results[key] = future.result() if future.done() else None
+        return results
+
+
+# Create service instance
+cloudinary_metadata = CloudinaryMetadataCache()
+metrics.register_cache(
+    "cloudinary_metadata", lambda: (cloudinary_metadata.stats["hits"], cloudinary_metadata.stats["misses"])
+)
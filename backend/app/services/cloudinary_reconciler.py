@@ -0,0 +1,81 @@
+import time
+import asyncio
+from datetime import datetime
+from typing import Optional
+from app.config import settings
+from app.services.circuit_breaker import cloudinary_breaker
+from app.services.file_service import file_service
+from app.services.storage_migration import storage_migration_job
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CloudinaryReconciler:
+    """Push uploads that fell back to local storage to Cloudinary once it recovers
+
+    Each pass probes an open circuit with a ping (so no user upload has to
+    be the probe), and once the circuit is closed hands the tasks that fell
+    back to the storage migration job, which uploads their files and points
+    the MediaFile rows and task URLs at Cloudinary.
+    """
+
+    def __init__(self):
+        self.interval = settings.CLOUDINARY_CIRCUIT_OPEN_SECONDS
+        self._run_started_at: Optional[float] = None
+        self.status = {"runs": 0, "last_run_at": None, "last_run_tasks": 0}
+
+    async def _probe(self) -> None:
+        backend = file_service.backend
+        while not cloudinary_breaker.is_closed and cloudinary_breaker.accepting_calls:
+            try:
+                await backend.check()
+            except Exception as e:
+                logger.info(f"Cloudinary probe failed: {str(e)}")
+                return
+
+    def _finish_run(self) -> None:
+        """Forget tasks the last run migrated; anything that failed is retried"""
+        status = storage_migration_job.status
+        if status.get("state") == "completed" and status.get("failed") == 0:
+            for task_id in status.get("task_ids") or []:
+                # A task that fell back again during the run stays pending
+                if file_service.fallback_tasks.get(task_id, 0) < self._run_started_at:
+                    file_service.fallback_tasks.pop(task_id, None)
+        self._run_started_at = None
+
+    async def reconcile(self) -> None:
+        """One pass: probe, then start a migration of pending tasks if Cloudinary is healthy"""
+        if file_service.backend.storage_type != "cloudinary":
+            return
+        if storage_migration_job.is_running:
+            return
+        if self._run_started_at is not None:
+            self._finish_run()
+
+        await self._probe()
+        if not cloudinary_breaker.is_closed or not file_service.fallback_tasks:
+            return
+
+        task_ids = sorted(file_service.fallback_tasks)
+        logger.info(f"Cloudinary is healthy again, reconciling {len(task_ids)} tasks saved locally")
+        self._run_started_at = time.time()
+        self.status.update(
+            runs=self.status["runs"] + 1,
+            last_run_at=datetime.utcnow().isoformat(),
+            last_run_tasks=len(task_ids)
+        )
+        storage_migration_job.start(task_ids=task_ids)
+
+    async def run(self) -> None:
+        """Reconcile periodically"""
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Cloudinary reconciliation failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+# Create reconciler instance
+cloudinary_reconciler = CloudinaryReconciler()
@@ -1,11 +1,24 @@
 import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 from cloudinary.utils import cloudinary_url
 import base64
+import hashlib
+import io
 import re
-from typing import Optional
+import time
+from typing import Optional, Tuple
+from fastapi import HTTPException
 from app.config import settings
+from app import metrics
+from app.services.image_pipeline import image_pipeline
+from app.services import media_metadata
+from app.services.storage_backends import CloudinaryStorageBackend
+from app.services.circuit_breaker import CircuitOpenError, cloudinary_breaker
+from app.services.cloudinary_client import cloudinary_client
+from app.services.cloudinary_metadata import cloudinary_metadata
+from app.media_references import (
+    PREVIEW_TRANSFORMATIONS, PREVIEW_TRANSFORMATION, THUMBNAIL_TRANSFORMATION, VIDEO_RENDITION_FORMAT,
+    build_delivery_url, parse_media_url, reference_for, rendition_transformation
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,6 +28,7 @@ cloudinary.config(
     cloud_name=settings.CLOUDINARY_CLOUD_NAME,
     api_key=settings.CLOUDINARY_API_KEY,
     api_secret=settings.CLOUDINARY_API_SECRET,
+    upload_prefix=settings.CLOUDINARY_UPLOAD_PREFIX or None,
     secure=True
 )
 
@@ -63,7 +77,47 @@ class CloudinaryService:
         return data_url, 'png'
     
     @staticmethod
-    def upload_base64_image(
+    def _media_record(result: dict, resource_type: str, mime_type: str, original: bytes,
+                      placeholder: Optional[str] = None, detected_type: Optional[str] = None,
+                      metadata: Optional[dict] = None) -> dict:
+        """MediaFile fields for an upload response"""
+        metadata = metadata or {}
+        cloudinary_metadata.remember({"resource_type": resource_type, **result})
+        filename = f"{result['public_id'].rsplit('/', 1)[-1]}.{result.get('format')}"
+        return {
+            "filename": filename,
+            "original_filename": filename,
+            "file_path": result["public_id"],
+            "file_url": result["secure_url"],
+            "file_size": result["bytes"],
+            "mime_type": mime_type,
+            "file_type": resource_type,
+            "storage_type": "cloudinary",
+            "cloudinary_id": result["public_id"],
+            "content_hash": hashlib.sha256(original).hexdigest(),
+            "renditions": CloudinaryStorageBackend.renditions_from_result(result, resource_type),
+            "width": result.get("width"),
+            "height": result.get("height"),
+            "placeholder": placeholder,
+            "detected_type": detected_type,
+            "duration_seconds": metadata.get("duration_seconds"),
+            "captured_at": metadata.get("captured_at"),
+            "orientation": metadata.get("orientation")
+        }
+    
+    @staticmethod
+    def _sniff(content: bytes, allowed_types: list) -> str:
+        """Type from the decoded bytes; the data URL's label is not trusted"""
+        detected_type = media_metadata.sniff_type(content[:media_metadata.SNIFF_BYTES])
+        if not media_metadata.is_allowed(detected_type, allowed_types):
+            raise HTTPException(
+                status_code=415,
+                detail=f"File content ({detected_type or 'unknown'}) is not an allowed type. Allowed types: {allowed_types}"
+            )
+        return detected_type
+    
+    @staticmethod
+    async def upload_base64_image(
         base64_data: str, 
         folder: str = "task_images",
         public_id: Optional[str] = None
@@ -72,47 +126,88 @@ class CloudinaryService:
         Upload base64 image to Cloudinary
         Returns the secure URL of uploaded image or None if failed
         """
+        media = await CloudinaryService.upload_base64_image_media(base64_data, folder, public_id)
+        return media["file_url"] if media else None
+    
+    @staticmethod
+    async def upload_base64_image_media(
+        base64_data: str, 
+        folder: str = "task_images",
+        public_id: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Upload base64 image to Cloudinary with its renditions
+        Returns the MediaFile fields of the upload or None if failed;
+        raises CircuitOpenError while Cloudinary is known to be down
+        """
         try:
             logger.info(f"Attempting to upload image to Cloudinary folder: {folder}")
+            format_type = 'png'
             
             # Extract base64 data if it's a data URL
             if base64_data.startswith('data:image/'):
                 base64_data, format_type = CloudinaryService.extract_base64_data(base64_data)
                 logger.info(f"Detected image format: {format_type}")
             
-            # Upload to Cloudinary
             upload_options = {
                 "folder": folder,
                 "resource_type": "image",
-                "quality": "auto:good",
-                "fetch_format": "auto",
-                "crop": "limit",
-                "width": 1920,
-                "height": 1080
+                **CloudinaryStorageBackend.eager_options("image")
             }
             
             if public_id:
                 upload_options["public_id"] = public_id
             
-            # Upload using base64 data
-            result = cloudinary.uploader.upload(
-                f"data:image/png;base64,{base64_data}",
-                **upload_options
-            )
+            original = base64.b64decode(base64_data)
+            detected_type = CloudinaryService._sniff(original, settings.ALLOWED_IMAGE_TYPES)
+            metadata = media_metadata.image_metadata(original)
+            mime_type = detected_type
+            placeholder = None
+            
+            # Encode once locally and store the result as-is, so Cloudinary
+            # does not transform (and lose quality on) the image a second time
+            try:
+                processed = image_pipeline.process(original, with_placeholder=True)
+                upload_data = processed.content
+                mime_type = processed.mime_type
+                placeholder = processed.placeholder
+            except HTTPException:
+                # Oversized images are rejected rather than passed through
+                raise
+            except Exception as e:
+                logger.warning(f"Image pipeline failed, uploading original with Cloudinary limits: {str(e)}")
+                # Stored as uploaded, so its EXIF (and GPS) has to go here
+                upload_data = f"data:{detected_type};base64,{base64.b64encode(media_metadata.strip_exif(original)).decode()}"
+                upload_options.update({
+                    "quality": "auto:good",
+                    "crop": "limit",
+                    "width": 1920,
+                    "height": 1080
+                })
+            
+            start = time.perf_counter()
+            with cloudinary_breaker.guard():
+                result = await cloudinary_client.upload(upload_data, **upload_options)
+            metrics.observe_upload("image", "cloudinary", result.get("bytes"), time.perf_counter() - start)
             
             secure_url = result.get('secure_url')
             logger.info(f"Successfully uploaded image to Cloudinary: {secure_url}")
             logger.info(f"Cloudinary response: {result}")
             
-            return secure_url
-            
+            return CloudinaryService._media_record(result, "image", mime_type, original, placeholder,
+                                                   detected_type, metadata)
+
+        except (HTTPException, CircuitOpenError):
+            # Let the caller report rejected images (e.g. 413) as they are,
+            # and save the image locally while Cloudinary is down
+            raise
         except Exception as e:
             logger.error(f"Failed to upload image to Cloudinary: {str(e)}")
             logger.error(f"Base64 data length: {len(base64_data) if base64_data else 0}")
             return None
     
     @staticmethod
-    def upload_video_base64(
+    async def upload_video_base64(
         base64_data: str, 
         folder: str = "task_videos",
         public_id: Optional[str] = None
@@ -121,6 +216,20 @@ class CloudinaryService:
         Upload base64 video to Cloudinary
         Returns the secure URL of uploaded video or None if failed
         """
+        media = await CloudinaryService.upload_video_base64_media(base64_data, folder, public_id)
+        return media["file_url"] if media else None
+    
+    @staticmethod
+    async def upload_video_base64_media(
+        base64_data: str, 
+        folder: str = "task_videos",
+        public_id: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Upload base64 video to Cloudinary with its poster and thumbnail frames
+        Returns the MediaFile fields of the upload or None if failed;
+        raises CircuitOpenError while Cloudinary is known to be down
+        """
         try:
             logger.info(f"Attempting to upload video to Cloudinary folder: {folder}")
             
@@ -132,86 +241,87 @@ class CloudinaryService:
                     base64_data = match.group(2)
                     logger.info(f"Detected video format: {format_type}")
             
+            original = base64.b64decode(base64_data)
+            detected_type = CloudinaryService._sniff(original, settings.ALLOWED_VIDEO_TYPES)
+            buffer = io.BytesIO(original)
+            metadata = media_metadata.video_metadata(buffer, detected_type)
+            if media_metadata.strip_video_location(buffer, detected_type):
+                base64_data = base64.b64encode(buffer.getvalue()).decode()
+            
             # Upload to Cloudinary
             upload_options = {
                 "folder": folder,
                 "resource_type": "video",
-                "quality": "auto:good"
+                "quality": "auto:good",
+                **CloudinaryStorageBackend.eager_options("video")
             }
             
             if public_id:
                 upload_options["public_id"] = public_id
             
             # Upload using base64 data
-            result = cloudinary.uploader.upload(
-                f"data:video/mp4;base64,{base64_data}",
-                **upload_options
-            )
+            start = time.perf_counter()
+            with cloudinary_breaker.guard(timed=False):
+                result = await cloudinary_client.upload(
+                    f"data:{detected_type};base64,{base64_data}",
+                    **upload_options
+                )
+            metrics.observe_upload("video", "cloudinary", result.get("bytes"), time.perf_counter() - start)
             
             secure_url = result.get('secure_url')
             logger.info(f"Successfully uploaded video to Cloudinary: {secure_url}")
             
-            return secure_url
+            return CloudinaryService._media_record(result, "video", detected_type, original,
+                                                   detected_type=detected_type, metadata=metadata)
             
+        except (HTTPException, CircuitOpenError):
+            raise
         except Exception as e:
             logger.error(f"Failed to upload video to Cloudinary: {str(e)}")
             return None
     
     @staticmethod
-    def get_media_info(url: str) -> dict:
-        """Get media information from Cloudinary URL"""
+    def get_media_info(url: str, reference: Optional[dict] = None,
+                       renditions: Optional[dict] = None) -> dict:
+        """Get media information from a media URL
+        
+        reference is the parsed reference stored with the URL; without it
+        the URL is parsed (and cached) here. renditions are the URLs
+        generated at upload time and take precedence over built ones.
+        """
+        renditions = renditions or {}
         try:
-            # Parse Cloudinary URL to extract details
-            # URL format: https://res.cloudinary.com/cloud_name/resource_type/upload/v123456/folder/public_id.ext
-            if 'cloudinary.com' not in url:
+            ref = reference_for(url, reference)
+            if ref is None or ref.provider != 'cloudinary':
                 return {
                     "is_cloudinary": False,
                     "url": url,
                     "type": "unknown",
+                    "thumbnail_url": renditions.get('thumbnail', url),
+                    "preview_url": renditions.get('medium', url),
                     "message": "Not a Cloudinary URL"
                 }
             
-            parts = url.split('/')
-            if len(parts) < 6:
-                return {
-                    "is_cloudinary": True,
-                    "url": url,
-                    "type": "unknown",
-                    "message": "Invalid Cloudinary URL format"
-                }
-            
-            resource_type = parts[4]  # 'image' or 'video'
-            filename_with_ext = parts[-1]
-            filename_parts = filename_with_ext.split('.')
-            extension = filename_parts[-1].lower() if len(filename_parts) > 1 else 'unknown'
-            
-            # Extract public_id for additional operations
-            public_id_with_ext = parts[-1]
-            public_id = public_id_with_ext.split('.')[0]
-            if len(parts) >= 3:
-                folder = parts[-2]
-                full_public_id = f"{folder}/{public_id}"
-            else:
-                full_public_id = public_id
+            filename = ref.public_id.rsplit('/', 1)[-1]
+            if ref.format:
+                filename = f"{filename}.{ref.format}"
             
             media_info = {
                 "is_cloudinary": True,
                 "url": url,
-                "type": resource_type,
-                "extension": extension,
-                "public_id": full_public_id,
-                "filename": filename_with_ext,
+                "type": ref.resource_type,
+                "extension": ref.format or 'unknown',
+                "public_id": ref.public_id,
+                "filename": filename,
                 "preview_url": url,
                 "thumbnail_url": None,
                 "download_url": url
             }
             
             # Generate different sizes for images
-            if resource_type == 'image':
-                # Generate thumbnail URL (300x300, cropped)
-                thumbnail_url = url.replace('/upload/', '/upload/w_300,h_300,c_fill/')
-                # Generate medium preview URL (800x600, fit)
-                preview_url = url.replace('/upload/', '/upload/w_800,h_600,c_fit/')
+            if ref.resource_type == 'image':
+                thumbnail_url = renditions.get('thumbnail') or build_delivery_url(ref, THUMBNAIL_TRANSFORMATION)
+                preview_url = renditions.get('medium') or build_delivery_url(ref, PREVIEW_TRANSFORMATION)
                 
                 media_info.update({
                     "thumbnail_url": thumbnail_url,
@@ -223,16 +333,18 @@ class CloudinaryService:
                     }
                 })
             
-            # For videos, generate thumbnail from first frame
-            elif resource_type == 'video':
-                # Generate video thumbnail (first frame)
-                thumbnail_url = url.replace('/video/upload/', '/image/upload/').replace(f'.{extension}', '.jpg')
-                if '/upload/' in thumbnail_url:
-                    thumbnail_url = thumbnail_url.replace('/upload/', '/upload/w_300,h_300,c_fill/')
+            # For videos, Cloudinary renders a poster frame when asked for a jpg
+            elif ref.resource_type == 'video':
+                thumbnail_url = renditions.get('thumbnail') or build_delivery_url(
+                    ref, THUMBNAIL_TRANSFORMATION, VIDEO_RENDITION_FORMAT
+                )
                 
                 media_info.update({
                     "thumbnail_url": thumbnail_url,
                     "video_thumbnail": thumbnail_url,
+                    "poster_url": renditions.get('poster') or build_delivery_url(
+                        ref, rendition_transformation('poster'), VIDEO_RENDITION_FORMAT
+                    ),
                     "streaming_url": url
                 })
             
@@ -248,37 +360,33 @@ class CloudinaryService:
             }
     
     @staticmethod
-    def generate_preview_urls(url: str, sizes: list = None) -> dict:
+    def generate_preview_urls(url: str, sizes: list = None, reference: Optional[dict] = None,
+                              renditions: Optional[dict] = None) -> dict:
         """Generate multiple preview URLs for different sizes"""
         if sizes is None:
             sizes = ['thumbnail', 'small', 'medium', 'large']
+        renditions = renditions or {}
         
         try:
-            media_info = CloudinaryService.get_media_info(url)
-            if not media_info.get('is_cloudinary'):
+            ref = reference_for(url, reference)
+            is_cloudinary = ref is not None and ref.provider == 'cloudinary'
+            if not is_cloudinary and not renditions:
                 return {"error": "Not a Cloudinary URL"}
             
-            size_configs = {
-                'thumbnail': 'w_150,h_150,c_fill',
-                'small': 'w_300,h_300,c_fit',
-                'medium': 'w_600,h_600,c_fit', 
-                'large': 'w_1200,h_1200,c_fit',
-                'original': ''
-            }
-            
             preview_urls = {}
             for size in sizes:
-                if size in size_configs:
-                    transform = size_configs[size]
-                    if transform:
-                        preview_url = url.replace('/upload/', f'/upload/{transform}/')
-                    else:
-                        preview_url = url
-                    preview_urls[size] = preview_url
+                if size in PREVIEW_TRANSFORMATIONS:
+                    transform = PREVIEW_TRANSFORMATIONS[size]
+                    if not transform:
+                        preview_urls[size] = url
+                    elif size in renditions:
+                        preview_urls[size] = renditions[size]
+                    elif is_cloudinary:
+                        preview_urls[size] = build_delivery_url(ref, transform)
             
             return {
                 "original_url": url,
-                "media_type": media_info.get('type'),
+                "media_type": ref.resource_type,
                 "previews": preview_urls
             }
             
@@ -287,24 +395,23 @@ class CloudinaryService:
             return {"error": str(e)}
 
     @staticmethod
-    def delete_by_url(url: str) -> bool:
+    def parse_public_id(url: str) -> Optional[Tuple[str, str]]:
+        """Extract (resource_type, public_id) from a Cloudinary delivery URL"""
+        ref = parse_media_url(url)
+        if ref is None or ref.provider != 'cloudinary':
+            return None
+        return ref.resource_type, ref.public_id
+
+    @staticmethod
+    async def delete_by_url(url: str) -> bool:
         """Delete image/video from Cloudinary using URL"""
         try:
-            # Extract public_id from URL
-            # Cloudinary URLs look like: https://res.cloudinary.com/cloud_name/image/upload/v123456/folder/public_id.ext
-            parts = url.split('/')
-            if len(parts) >= 2:
-                # Get the public_id (last part without extension)
-                public_id_with_ext = parts[-1]
-                public_id = public_id_with_ext.split('.')[0]
-                
-                # Include folder if present
-                if len(parts) >= 3:
-                    folder = parts[-2]
-                    public_id = f"{folder}/{public_id}"
-                
-                # Delete from Cloudinary
-                result = cloudinary.uploader.destroy(public_id)
+            parsed = CloudinaryService.parse_public_id(url)
+            if parsed:
+                resource_type, public_id = parsed
+                with cloudinary_breaker.guard():
+                    result = await cloudinary_client.destroy(public_id, resource_type=resource_type)
+                cloudinary_metadata.forget(resource_type, public_id)
                 logger.info(f"Deleted from Cloudinary: {public_id}, result: {result}")
                 return result.get('result') == 'ok'
             
@@ -0,0 +1,283 @@
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+import httpx
+from PIL import Image, ImageOps
+from app.config import settings
+from app import metrics
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tiles whose thumbnail could not be fetched are painted in this colour
+EMPTY_TILE_COLOR = (229, 231, 235)
+SHEET_QUALITY = 75
+FETCH_CONCURRENCY = 8
+
+
+def _atomic_write(path: str, content: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def compose_sheet(tile_paths: List[Optional[str]], columns: int, tile: int, output_path: str) -> None:
+    """Paste thumbnails into a grid and write it as WebP (runs in a worker process)"""
+    rows = max(1, -(-len(tile_paths) // columns))
+    sheet = Image.new("RGB", (columns * tile, rows * tile), EMPTY_TILE_COLOR)
+    for index, path in enumerate(tile_paths):
+        if not path:
+            continue
+        try:
+            with Image.open(path) as img:
+                img.draft("RGB", (tile, tile))
+                cell = ImageOps.fit(img.convert("RGB"), (tile, tile), Image.Resampling.LANCZOS)
+        except Exception:
+            continue
+        sheet.paste(cell, ((index % columns) * tile, (index // columns) * tile))
+
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    sheet.save(tmp_path, format="WEBP", quality=SHEET_QUALITY, method=4)
+    os.replace(tmp_path, output_path)
+
+
+class ContactSheetService:
+    """One sprite image per gallery page instead of one request per thumbnail
+
+    Sheets are keyed by a hash of the page content (item ids and thumbnail
+    URLs, which are unique per stored object), so new, replaced or removed
+    media yield a new sheet. Thumbnails are read from local renditions or a
+    local cache of remote ones, and composed in a process pool so Pillow
+    work never holds the event loop or the GIL of the API process.
+    """
+
+    def __init__(self):
+        self.upload_dir = settings.UPLOAD_DIRECTORY
+        self.cache_dir = os.path.join(self.upload_dir, "cache")
+        self.sheet_dir = os.path.join(self.cache_dir, "contact_sheets")
+        self.thumbnail_dir = os.path.join(self.cache_dir, "thumbnails")
+        self.max_cache_bytes = settings.CONTACT_SHEET_CACHE_MAX_MB * 1024 * 1024
+        self.workers = settings.CONTACT_SHEET_WORKERS
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._building: Dict[str, asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0}
+        self.remote_origins = self._remote_origins()
+
+    @staticmethod
+    def _remote_origins() -> List[Tuple[str, str, str]]:
+        """(scheme, host, path prefix) of the stores thumbnails may be fetched from"""
+        origins = [("https", "res.cloudinary.com", f"/{settings.CLOUDINARY_CLOUD_NAME}/")]
+        if settings.S3_BUCKET:
+            if settings.S3_PUBLIC_BASE_URL:
+                base = settings.S3_PUBLIC_BASE_URL.rstrip("/")
+            elif settings.S3_ENDPOINT_URL:
+                base = f"{settings.S3_ENDPOINT_URL.rstrip('/')}/{settings.S3_BUCKET}"
+            else:
+                base = f"https://{settings.S3_BUCKET}.s3.{settings.S3_REGION}.amazonaws.com"
+            parsed = urlsplit(base)
+            origins.append((parsed.scheme, parsed.netloc, parsed.path.rstrip("/") + "/"))
+        return origins
+
+    def _is_our_store(self, url: str) -> bool:
+        """Only fetch from our own media stores - task URLs are client supplied"""
+        try:
+            parsed = urlsplit(url)
+        except ValueError:
+            return False
+        return any(
+            parsed.scheme == scheme and parsed.netloc == host and parsed.path.startswith(prefix)
+            for scheme, host, prefix in self.remote_origins
+        )
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a threaded server process can deadlock the child
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def sheet_id(self, items: List[dict], tile: int, columns: int) -> str:
+        content = json.dumps([tile, columns] + [[item["id"], item["thumbnail_url"]] for item in items])
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def sheet_path(self, sheet_id: str) -> str:
+        return os.path.join(self.sheet_dir, sheet_id[:2], f"{sheet_id}.webp")
+
+    def _thumbnail_cache_path(self, url: str) -> str:
+        digest = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.thumbnail_dir, digest[:2], digest)
+
+    def _local_path(self, url: str) -> Optional[str]:
+        """File behind an /uploads URL, if it is inside the upload directory"""
+        relative_path = url.split("/uploads/", 1)[1].split("?")[0]
+        path = os.path.realpath(os.path.join(self.upload_dir, *relative_path.split("/")))
+        if not path.startswith(os.path.realpath(self.upload_dir) + os.sep):
+            return None
+        return path if os.path.isfile(path) else None
+
+    async def _thumbnail(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore,
+                         url: Optional[str]) -> Optional[str]:
+        if not url:
+            return None
+        if "/uploads/" in url:
+            return self._local_path(url)
+
+        if not self._is_our_store(url):
+            return None
+
+        path = self._thumbnail_cache_path(url)
+        if os.path.isfile(path):
+            return path
+        try:
+            async with semaphore:
+                response = await client.get(url)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Failed to fetch thumbnail {url}: {str(e)}")
+            return None
+        if not response.headers.get("content-type", "").startswith("image/"):
+            return None
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, _atomic_write, path, response.content)
+        return path
+
+    def layout(self, items: List[dict], tile: int, columns: int) -> List[dict]:
+        """Where each item sits in the sheet"""
+        return [
+            {
+                "id": item["id"],
+                "task_id": item["task_id"],
+                "media_type": item["media_type"],
+                "x": (index % columns) * tile,
+                "y": (index // columns) * tile,
+                "width": tile,
+                "height": tile
+            }
+            for index, item in enumerate(items)
+        ]
+
+    async def _build(self, sheet_id: str, items: List[dict], tile: int, columns: int) -> None:
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+        # Redirects are not followed so a fetch never leaves our stores
+        async with httpx.AsyncClient(timeout=30, follow_redirects=False) as client:
+            tile_paths = await asyncio.gather(
+                *(self._thumbnail(client, semaphore, item["thumbnail_url"]) for item in items)
+            )
+
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            self._executor(), compose_sheet, list(tile_paths), columns, tile, self.sheet_path(sheet_id)
+        )
+        # The sidecar lets invalidate_tasks find the sheets a task appears on
+        sidecar = {"task_ids": sorted({item["task_id"] for item in items}),
+                   "thumbnail_urls": [item["thumbnail_url"] for item in items]}
+        await loop.run_in_executor(
+            None, _atomic_write, self.sheet_path(sheet_id)[:-len(".webp")] + ".json", json.dumps(sidecar).encode()
+        )
+        await loop.run_in_executor(None, self.prune)
+
+    async def get_sheet(self, items: List[dict], tile: int, columns: int) -> dict:
+        """Build (or reuse) the sheet for a gallery page and return its coordinate map"""
+        sheet_id = self.sheet_id(items, tile, columns)
+        path = self.sheet_path(sheet_id)
+        cached = os.path.isfile(path)
+        self.stats["hits" if cached else "misses"] += 1
+
+        if not cached:
+            # Concurrent requests for the same page share one build
+            build = self._building.get(sheet_id)
+            if build is None:
+                build = asyncio.create_task(self._build(sheet_id, items, tile, columns))
+                self._building[sheet_id] = build
+                build.add_done_callback(lambda _: self._building.pop(sheet_id, None))
+            await build
+
+        rows = max(1, -(-len(items) // columns))
+        return {
+            "sheet_id": sheet_id,
+            "path": path,
+            "cached": cached,
+            "tile": tile,
+            "columns": columns,
+            "width": columns * tile,
+            "height": rows * tile,
+            "items": self.layout(items, tile, columns)
+        }
+
+    def invalidate_tasks(self, task_ids: Iterable[int]) -> int:
+        """Drop every cached sheet and remote thumbnail that shows one of these tasks"""
+        task_ids = set(task_ids)
+        removed = 0
+        if not os.path.isdir(self.sheet_dir):
+            return removed
+        for root, _, files in os.walk(self.sheet_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                sidecar_path = os.path.join(root, name)
+                try:
+                    with open(sidecar_path) as f:
+                        sidecar = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if not task_ids.intersection(sidecar.get("task_ids", [])):
+                    continue
+                for url in sidecar.get("thumbnail_urls", []):
+                    if url and "/uploads/" not in url:
+                        self._remove(self._thumbnail_cache_path(url))
+                self._remove(sidecar_path[:-len(".json")] + ".webp")
+                self._remove(sidecar_path)
+                removed += 1
+        return removed
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def prune(self) -> None:
+        """Keep the cache under its size budget, dropping the least recently written files"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_cache_bytes:
+            return
+        for _, size, path in sorted(entries):
+            self._remove(path)
+            total -= size
+            # A sheet and its sidecar go together
+            if path.startswith(self.sheet_dir):
+                stem = os.path.splitext(path)[0]
+                self._remove(stem + (".json" if path.endswith(".webp") else ".webp"))
+            if total <= self.max_cache_bytes * 0.8:
+                return
+
+
+# Create service instance
+contact_sheets = ContactSheetService()
+metrics.register_cache("contact_sheets", lambda: (contact_sheets.stats["hits"], contact_sheets.stats["misses"]))
@@ -0,0 +1,348 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+import aiofiles
+import mimetypes
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+from cloudinary.utils import verify_api_response_signature, verify_notification_signature
+from fastapi import HTTPException, status
+from jose import JWTError, jwt
+from app.config import settings
+from app.services import media_metadata
+from app.services.cloudinary_metadata import cloudinary_metadata
+from app.services.file_service import file_service
+from app.services.storage_backends import CloudinaryStorageBackend, StorageBackend, StoredObject, get_storage_backend
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PURPOSE = "direct_upload"
+# Keys handed out for direct uploads: task_completions/<task_id>/<uuid><ext>
+DIRECT_KEY = re.compile(r"^task_completions/(\d+)/[0-9a-f-]{36}(\.\w+)?$")
+# Extensions mimetypes doesn't know for allowed content types
+EXTENSIONS = {"video/avi": ".avi", "video/mov": ".mov", "video/quicktime": ".mov"}
+
+
+class DirectUploadService:
+    """Signed, time-limited uploads that go straight to the media store
+
+    An intent names the object key and signs the parameters the client needs
+    to upload it (Cloudinary signed upload fields, or a presigned PUT). The
+    bytes never pass through the API; confirm() then checks what actually
+    arrived - signature, size and magic bytes - before it is recorded. The
+    intent itself is a short-lived JWT, so no server-side state is kept.
+    
+    Local PUTs are staged outside UPLOAD_DIRECTORY, which is served
+    publicly at /uploads, and only moved into it once confirm() has
+    verified them. Object keys take their extension from the declared,
+    allowed content type, never from the client's filename.
+    """
+
+    def __init__(self):
+        self.expiry = timedelta(seconds=settings.DIRECT_UPLOAD_EXPIRY_SECONDS)
+        self.staging_dir = settings.DIRECT_UPLOAD_STAGING_DIRECTORY
+
+    @property
+    def backend(self) -> StorageBackend:
+        return file_service.backend
+
+    def _limits(self, content_type: str) -> tuple:
+        """(file type, maximum size) for a declared content type"""
+        if content_type in file_service.allowed_image_types:
+            return "image", settings.MAX_FILE_SIZE
+        if content_type in file_service.allowed_video_types:
+            return "video", settings.MAX_RESUMABLE_UPLOAD_SIZE
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File type {content_type} not allowed"
+        )
+
+    def create_intent(self, task_id: int, restaurant_id: int, filename: str, content_type: str,
+                      length: int, base_url: str) -> dict:
+        """Signed upload parameters for one object"""
+        file_type, max_size = self._limits(content_type)
+        if length <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Upload length must be greater than zero"
+            )
+        if length > max_size:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Upload length {length} exceeds maximum allowed size {max_size}"
+            )
+
+        extension = EXTENSIONS.get(content_type) or mimetypes.guess_extension(content_type) or ""
+        key = f"task_completions/{task_id}/{uuid.uuid4()}{extension}"
+        expires_at = datetime.utcnow() + self.expiry
+        claims = {
+            "purpose": TOKEN_PURPOSE,
+            "restaurant_id": restaurant_id,
+            "task_id": task_id,
+            "key": key,
+            "filename": filename,
+            "content_type": content_type,
+            "file_type": file_type,
+            "length": length,
+            "storage_type": self.backend.storage_type,
+            "exp": expires_at
+        }
+        token = jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+        if self.backend.storage_type == "cloudinary":
+            upload = self.backend.signed_upload(
+                key, content_type, f"{base_url}/api/upload/direct/cloudinary/notify"
+            )
+        elif self.backend.storage_type == "s3":
+            upload = self.backend.presigned_put(key, content_type, int(self.expiry.total_seconds()))
+        else:
+            # Local storage has no store of its own to sign for; the API accepts the PUT
+            upload = {
+                "method": "PUT",
+                "upload_url": f"{base_url}/api/upload/direct/local/{token}",
+                "headers": {"Content-Type": content_type}
+            }
+
+        return {
+            "token": token,
+            "storage_type": self.backend.storage_type,
+            "expires_at": expires_at,
+            "fields": {},
+            "headers": {},
+            **upload
+        }
+
+    def verify_token(self, token: str, restaurant_id: Optional[int] = None) -> dict:
+        """Claims of a valid, unexpired intent (for this restaurant, if given)"""
+        try:
+            claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            claims = None
+        if not claims or claims.get("purpose") != TOKEN_PURPOSE:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Invalid or expired upload token"
+            )
+        if restaurant_id is not None and claims["restaurant_id"] != restaurant_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload not found"
+            )
+        return claims
+
+    async def receive_local(self, token: str, content_type: Optional[str], chunks: AsyncIterator[bytes]) -> None:
+        """Accept the PUT of a local-storage intent, written once and never overwritten"""
+        claims = self.verify_token(token)
+        if claims["storage_type"] != "local":
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+        if content_type != claims["content_type"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Content-Type does not match the upload intent"
+            )
+
+        path = self.staged_path(claims["key"])
+        if os.path.exists(path) or get_storage_backend("local").locate(claims["key"]):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload already received")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        received = 0
+        try:
+            async with aiofiles.open(tmp_path, 'wb') as f:
+                async for data in chunks:
+                    received += len(data)
+                    if received > claims["length"]:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail="Body exceeds the declared upload length"
+                        )
+                    await f.write(data)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def staged_path(self, key: str) -> str:
+        """Where a local PUT waits for confirm; keys come from signed intents only"""
+        return os.path.join(self.staging_dir, *key.split("/"))
+
+    async def _inspect(self, claims: dict) -> Optional[tuple]:
+        """(stored object, first bytes, staged) for an intent's upload, or None"""
+        staged_path = self.staged_path(claims["key"]) if claims["storage_type"] == "local" else None
+        if staged_path and os.path.isfile(staged_path):
+            with open(staged_path, 'rb') as f:
+                head = f.read(media_metadata.SNIFF_BYTES)
+            stored = StoredObject(key=claims["key"], file_path=staged_path,
+                                  file_size=os.path.getsize(staged_path), storage_type="local")
+            return stored, head, True
+        # Local uploads found here were verified by an earlier confirm
+        inspected = await get_storage_backend(claims["storage_type"]).inspect(claims["key"], media_metadata.SNIFF_BYTES)
+        return (*inspected, False) if inspected else None
+
+    async def _reject(self, storage_type: str, file_path: str, file_type: str,
+                      status_code: int, detail: str) -> None:
+        """Delete an upload that failed verification and report why"""
+        try:
+            await get_storage_backend(storage_type).delete(file_path, file_type)
+        except Exception as e:
+            logger.warning(f"Failed to delete rejected direct upload {file_path}: {str(e)}")
+        raise HTTPException(status_code=status_code, detail=detail)
+
+    async def confirm(self, claims: dict, result: Optional[dict] = None) -> dict:
+        """Verify the uploaded object and return its MediaFile fields
+
+        result is Cloudinary's upload response, which the client passes on;
+        its signature proves it came from Cloudinary for our public_id.
+        """
+        if claims["storage_type"] == "cloudinary":
+            return await self._confirm_cloudinary(claims, result or {})
+
+        inspected = await self._inspect(claims)
+        if inspected is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Nothing has been uploaded yet")
+        stored, head, staged = inspected
+
+        if stored.file_size != claims["length"]:
+            await self._reject(stored.storage_type, stored.file_path, claims["file_type"], status.HTTP_400_BAD_REQUEST,
+                               f"Uploaded {stored.file_size} bytes, expected {claims['length']}")
+        detected_type = media_metadata.sniff_type(head)
+        allowed_types = file_service.allowed_image_types if claims["file_type"] == "image" else file_service.allowed_video_types
+        if not media_metadata.is_allowed(detected_type, allowed_types):
+            await self._reject(stored.storage_type, stored.file_path, claims["file_type"], status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                               f"File content ({detected_type or 'unknown'}) is not an allowed {claims['file_type']} type")
+
+        if staged:
+            # Verified: only now does it become publicly reachable
+            local = get_storage_backend("local")
+            try:
+                stored = await local.put_file(claims["key"], stored.file_path, claims["content_type"], move=True)
+            except FileNotFoundError:
+                # A concurrent confirm moved it first
+                inspected = await local.inspect(claims["key"], 0)
+                if inspected is None:
+                    raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Nothing has been uploaded yet")
+                stored = inspected[0]
+
+        return {
+            "filename": os.path.basename(claims["key"]),
+            "original_filename": claims["filename"],
+            "file_path": stored.file_path,
+            "file_url": stored.file_url,
+            "file_size": stored.file_size,
+            "mime_type": detected_type,
+            "file_type": claims["file_type"],
+            "storage_type": stored.storage_type,
+            "detected_type": detected_type
+        }
+
+    async def _confirm_cloudinary(self, claims: dict, result: dict) -> dict:
+        public_id = os.path.splitext(claims["key"])[0]
+        if result.get("public_id") != public_id or not verify_api_response_signature(
+            result.get("public_id"), result.get("version"), result.get("signature")
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Upload result is not a signed Cloudinary response for this upload"
+            )
+        if result.get("resource_type") != claims["file_type"]:
+            await self._reject("cloudinary", public_id, result.get("resource_type"), status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                               f"Cloudinary stored a {result.get('resource_type')}, expected {claims['file_type']}")
+        if int(result.get("bytes") or 0) > self._limits(claims["content_type"])[1]:
+            await self._reject("cloudinary", public_id, claims["file_type"], status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                               "Uploaded file exceeds the maximum allowed size")
+        return self.cloudinary_media(result, claims["filename"])
+
+    def cloudinary_media(self, result: dict, original_filename: Optional[str] = None) -> dict:
+        """MediaFile fields for a Cloudinary upload response or notification"""
+        resource_type = result["resource_type"]
+        cloudinary_metadata.remember(result)
+        filename = f"{result['public_id'].rsplit('/', 1)[-1]}.{result.get('format')}"
+        detected_type = mimetypes.guess_type(filename)[0] or f"{resource_type}/{result.get('format')}"
+        return {
+            "filename": filename,
+            "original_filename": original_filename or result.get("original_filename") or filename,
+            "file_path": result["public_id"],
+            "file_url": result["secure_url"],
+            "file_size": result["bytes"],
+            "mime_type": detected_type,
+            "file_type": resource_type,
+            "storage_type": "cloudinary",
+            "cloudinary_id": result["public_id"],
+            "renditions": CloudinaryStorageBackend.renditions_from_result(result, resource_type),
+            "width": result.get("width"),
+            "height": result.get("height"),
+            "detected_type": detected_type,
+            "duration_seconds": result.get("duration")
+        }
+
+    def verify_notification(self, body: bytes, timestamp: Optional[str], signature: Optional[str]) -> bool:
+        """Whether a Cloudinary notification was signed with our API secret"""
+        if not timestamp or not signature:
+            return False
+        try:
+            return verify_notification_signature(body.decode(), int(timestamp), signature,
+                                                 valid_for=int(self.expiry.total_seconds()) + 3600)
+        except Exception:
+            return False
+
+    async def notification_media(self, notification: dict) -> Optional[dict]:
+        """MediaFile fields for a verified upload notification, or None if it is not ours to record"""
+        resource_type = notification.get("resource_type")
+        if resource_type not in ("image", "video"):
+            return None
+        max_size = settings.MAX_FILE_SIZE if resource_type == "image" else settings.MAX_RESUMABLE_UPLOAD_SIZE
+        if int(notification.get("bytes") or 0) > max_size:
+            try:
+                await get_storage_backend("cloudinary").delete(notification["public_id"], resource_type)
+            except Exception as e:
+                logger.warning(f"Failed to delete oversized direct upload {notification['public_id']}: {str(e)}")
+            return None
+        return self.cloudinary_media(notification)
+
+    def task_id_for(self, public_id: str) -> Optional[int]:
+        """Task a directly uploaded object belongs to, from its key"""
+        match = DIRECT_KEY.match(public_id or "")
+        return int(match.group(1)) if match else None
+
+    def _expired_staged_files(self) -> list:
+        # Nothing can be confirmed once its intent has expired
+        cutoff = time.time() - self.expiry.total_seconds() - 60
+        expired = []
+        for root, _, files in os.walk(self.staging_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        expired.append(path)
+                except OSError:
+                    pass
+        return expired
+
+    async def cleanup_staging(self) -> int:
+        """Delete staged local uploads whose intent expired without a confirm"""
+        loop = asyncio.get_event_loop()
+        expired = await loop.run_in_executor(None, self._expired_staged_files)
+        for path in expired:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(expired)
+
+    async def run_janitor(self, interval_seconds: int = 600) -> None:
+        """Periodically remove unconfirmed staged uploads"""
+        while True:
+            try:
+                removed = await self.cleanup_staging()
+                if removed:
+                    logger.info(f"Removed {removed} unconfirmed direct uploads")
+            except Exception as e:
+                logger.error(f"Direct upload janitor failed: {str(e)}")
+            await asyncio.sleep(interval_seconds)
+
+
+# Create service instance
+direct_upload_service = DirectUploadService()
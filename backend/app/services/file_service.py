@@ -1,17 +1,25 @@
 import os
+import time
 import uuid
-import aiofiles
 import asyncio
 import base64
+import hashlib
 import tempfile
 from typing import List, Optional
 from fastapi import UploadFile, HTTPException, status
-from PIL import Image
+from sqlalchemy.orm import Session
 import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 import io
 from app.config import settings
+from app import crud, metrics
+from app.services.image_pipeline import image_pipeline
+from app.services import media_metadata
+from app.media_references import IMAGE_RENDITIONS
+from app.services.storage_backends import StorageBackend, StoredObject, get_storage_backend
+from app.services.circuit_breaker import CircuitOpenError, cloudinary_breaker
+import logging
+
+logger = logging.getLogger(__name__)
 
 class FileUploadService:
     def __init__(self):
@@ -20,29 +28,37 @@ class FileUploadService:
         self.allowed_image_types = settings.ALLOWED_IMAGE_TYPES
         self.allowed_video_types = settings.ALLOWED_VIDEO_TYPES
         
-        # Cloudinary configuration
+        # Cloud storage configuration
         self.use_cloud_storage = settings.USE_CLOUD_STORAGE
         self.cloudinary_configured = False
+        self.local_backend: StorageBackend = get_storage_backend("local")
+        self.backend: StorageBackend = self.local_backend
         
-        if self.use_cloud_storage:
+        if self.use_cloud_storage and settings.STORAGE_BACKEND == "s3":
             try:
-                # Configure Cloudinary
-                cloudinary.config(
-                    cloud_name=settings.CLOUDINARY_CLOUD_NAME,
-                    api_key=settings.CLOUDINARY_API_KEY,
-                    api_secret=settings.CLOUDINARY_API_SECRET,
-                    secure=True
-                )
-                
-                # Test connection
-                cloudinary.api.ping()
-                self.cloudinary_configured = True
-                print(f"✅ Cloudinary initialized - Cloud: {settings.CLOUDINARY_CLOUD_NAME}")
-                
+                self.backend = get_storage_backend("s3")
+                logger.info(f"S3 storage initialized - Bucket: {settings.S3_BUCKET}")
             except Exception as e:
-                print(f"⚠️ Failed to initialize Cloudinary: {e}")
+                logger.warning(f"Failed to initialize S3 storage: {e}")
                 self.use_cloud_storage = False
-                self.cloudinary_configured = False
+        elif self.use_cloud_storage:
+            # Configure Cloudinary
+            cloudinary.config(
+                cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+                api_key=settings.CLOUDINARY_API_KEY,
+                api_secret=settings.CLOUDINARY_API_SECRET,
+                upload_prefix=settings.CLOUDINARY_UPLOAD_PREFIX or None,
+                secure=True
+            )
+            self.cloudinary_configured = True
+            self.backend = get_storage_backend("cloudinary")
+            logger.info(f"Cloudinary initialized - Cloud: {settings.CLOUDINARY_CLOUD_NAME}")
+            if settings.CLOUDINARY_UPLOAD_PREFIX:
+                logger.warning(f"Cloudinary API calls go to {settings.CLOUDINARY_UPLOAD_PREFIX}")
+        
+        # Task id -> when an upload for it last fell back to local storage;
+        # the reconciler pushes these to Cloudinary once it is healthy again
+        self.fallback_tasks = {}
         
         # Create local upload directories as fallback
         if not self.use_cloud_storage:
@@ -50,6 +66,23 @@ class FileUploadService:
             os.makedirs(os.path.join(self.upload_dir, "videos"), exist_ok=True)
             os.makedirs(os.path.join(self.upload_dir, "task_completions"), exist_ok=True)
 
+    async def check_cloud_storage(self) -> None:
+        """Test the Cloudinary connection at startup
+        
+        A failed ping opens the circuit rather than switching to local
+        storage for the life of the process.
+        """
+        if not self.cloudinary_configured:
+            return
+        try:
+            await self.backend.check()
+            logger.info(f"Cloudinary reachable - Cloud: {settings.CLOUDINARY_CLOUD_NAME}")
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            logger.warning(f"Cloudinary unreachable at startup, saving locally until it recovers: {e}")
+            cloudinary_breaker.trip(f"startup ping failed: {e}")
+
     def _validate_file_size(self, file: UploadFile) -> None:
         """Validate file size"""
         if hasattr(file.file, 'seek') and hasattr(file.file, 'tell'):
@@ -79,16 +112,94 @@ class FileUploadService:
                 detail=f"File type {file.content_type} not allowed. Allowed types: {self.allowed_video_types}"
             )
 
+    def _sniff_type(self, head: bytes, allowed_types: List[str]) -> str:
+        """Type from the magic bytes; rejects content that is not an allowed type whatever its label"""
+        detected_type = media_metadata.sniff_type(head)
+        if not media_metadata.is_allowed(detected_type, allowed_types):
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"File content ({detected_type or 'unknown'}) is not an allowed type. Allowed types: {allowed_types}"
+            )
+        return detected_type
+
+    def _sniff_upload(self, file: UploadFile, allowed_types: List[str]) -> str:
+        """Sniff the first bytes of an upload before the whole body is read"""
+        head = file.file.read(media_metadata.SNIFF_BYTES)
+        file.file.seek(0)
+        return self._sniff_type(head, allowed_types)
+
+    def _inspect_video_file(self, file_path: str, detected_type: str) -> dict:
+        """Read a video's header metadata and strip its location, in place"""
+        with open(file_path, 'r+b') as f:
+            metadata = media_metadata.video_metadata(f, detected_type)
+            media_metadata.strip_video_location(f, detected_type)
+        return metadata
+
+    def _metadata_fields(self, detected_type: str, metadata: dict) -> dict:
+        """MediaFile fields for the metadata read at ingest"""
+        return {
+            "detected_type": detected_type,
+            "duration_seconds": metadata.get("duration_seconds"),
+            "captured_at": metadata.get("captured_at"),
+            "orientation": metadata.get("orientation")
+        }
+
     def _generate_filename(self, original_filename: str) -> str:
         """Generate unique filename"""
         file_extension = os.path.splitext(original_filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_extension}"
         return unique_filename
 
-    async def save_image(self, file: UploadFile, task_id: str) -> dict:
+    def _compute_content_hash(self, content: bytes) -> str:
+        """SHA-256 of the bytes as uploaded, before any optimization"""
+        return hashlib.sha256(content).hexdigest()
+
+    def _compute_file_hash(self, file_path: str) -> str:
+        """SHA-256 of a file on disk, read in 1MB blocks"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _find_stored_duplicate(self, db: Optional[Session], restaurant_id: Optional[int],
+                               content_hash: str, original_filename: str) -> Optional[dict]:
+        """Reuse an already stored object when the same content was uploaded before"""
+        if db is None or restaurant_id is None:
+            return None
+        
+        existing = crud.get_media_file_by_hash(db, content_hash, restaurant_id)
+        if not existing:
+            return None
+        
+        logger.info(f"Reusing stored file for duplicate upload: {existing.file_path}")
+        return {
+            "filename": existing.filename,
+            "original_filename": original_filename,
+            "file_path": existing.file_path,
+            "file_url": existing.file_url,
+            "file_size": existing.file_size,
+            "mime_type": existing.mime_type,
+            "file_type": existing.file_type,
+            "storage_type": existing.storage_type,
+            "cloudinary_id": existing.cloudinary_id,
+            "renditions": existing.renditions,
+            "width": existing.width,
+            "height": existing.height,
+            "placeholder": existing.placeholder,
+            "detected_type": existing.detected_type,
+            "duration_seconds": existing.duration_seconds,
+            "captured_at": existing.captured_at,
+            "orientation": existing.orientation,
+            "content_hash": content_hash
+        }
+
+    async def save_image(self, file: UploadFile, task_id: str,
+                         db: Optional[Session] = None, restaurant_id: Optional[int] = None) -> dict:
         """Save uploaded image file"""
         self._validate_file_size(file)
         self._validate_image_type(file)
+        detected_type = self._sniff_upload(file, self.allowed_image_types)
         
         # Generate unique filename
         filename = self._generate_filename(file.filename)
@@ -96,21 +207,49 @@ class FileUploadService:
         # Read file content
         content = await file.read()
         
-        # Optimize image
+        # Identical content (e.g. a retried submission) is stored only once
+        content_hash = self._compute_content_hash(content)
+        duplicate = self._find_stored_duplicate(db, restaurant_id, content_hash, file.filename)
+        if duplicate:
+            return duplicate
+        
+        metadata = media_metadata.image_metadata(content)
+        content_type = detected_type
+        processed = None
+        
+        # Optimize image - the codec is chosen once here and nothing downstream re-encodes
         try:
-            content = await self._optimize_image_content(content)
+            processed = image_pipeline.process(content, with_placeholder=True)
+            content = processed.content
+            content_type = processed.mime_type
+            filename = f"{os.path.splitext(filename)[0]}{processed.extension}"
+        except HTTPException:
+            raise
         except Exception as e:
-            print(f"Image optimization failed: {e}")
+            logger.warning(f"Image optimization failed, storing the original: {e}")
+            # The original is stored as uploaded, so drop its EXIF (and GPS) here;
+            # re-encoded images never carry EXIF
+            content = media_metadata.strip_exif(content)
         
-        if self.use_cloud_storage and self.cloudinary_configured:
-            return await self._save_to_cloudinary(content, filename, task_id, file.content_type, "image", file.filename)
-        else:
-            return await self._save_to_local(content, filename, task_id, file.content_type, "image", file.filename)
+        file_data = await self._store(content, filename, task_id, content_type, "image", file.filename)
+        file_data["content_hash"] = content_hash
+        file_data.update(self._metadata_fields(detected_type, metadata))
+        if processed:
+            # Lets the UI lay out and paint the gallery before any image arrives
+            file_data.update(width=processed.width, height=processed.height, placeholder=processed.placeholder)
+        elif metadata:
+            file_data.update(width=metadata["width"], height=metadata["height"])
+        if file_data["storage_type"] == "local":
+            file_data["rendition_paths"] = await self._local_renditions(file_data["file_path"], content)
+        self._record_usage(db, restaurant_id, file_data)
+        return file_data
 
-    async def save_video(self, file: UploadFile, task_id: str) -> dict:
+    async def save_video(self, file: UploadFile, task_id: str,
+                         db: Optional[Session] = None, restaurant_id: Optional[int] = None) -> dict:
         """Save uploaded video file"""
         self._validate_file_size(file)
         self._validate_video_type(file)
+        detected_type = self._sniff_upload(file, self.allowed_video_types)
         
         # Generate unique filename
         filename = self._generate_filename(file.filename)
@@ -118,270 +257,181 @@ class FileUploadService:
         # Read file content
         content = await file.read()
         
-        if self.use_cloud_storage and self.cloudinary_configured:
-            return await self._save_to_cloudinary(content, filename, task_id, file.content_type, "video", file.filename)
-        else:
-            return await self._save_to_local(content, filename, task_id, file.content_type, "video", file.filename)
+        # Identical content (e.g. a retried submission) is stored only once
+        content_hash = self._compute_content_hash(content)
+        duplicate = self._find_stored_duplicate(db, restaurant_id, content_hash, file.filename)
+        if duplicate:
+            return duplicate
+        
+        # Header metadata and location removal work on the buffer without decoding it
+        buffer = io.BytesIO(content)
+        metadata = media_metadata.video_metadata(buffer, detected_type)
+        if media_metadata.strip_video_location(buffer, detected_type):
+            content = buffer.getvalue()
+        
+        file_data = await self._store(content, filename, task_id, file.content_type, "video", file.filename)
+        file_data["content_hash"] = content_hash
+        file_data.update(self._metadata_fields(detected_type, metadata))
+        if metadata.get("width"):
+            file_data.update(width=metadata["width"], height=metadata["height"])
+        self._record_usage(db, restaurant_id, file_data)
+        return file_data
 
-    async def _save_to_cloudinary(self, content: bytes, filename: str, task_id: str, 
-                                content_type: str, file_type: str, original_filename: str) -> dict:
-        """Save file to Cloudinary"""
+    async def save_video_file(self, source_path: str, task_id: str, content_type: str,
+                              original_filename: str, db: Optional[Session] = None,
+                              restaurant_id: Optional[int] = None) -> dict:
+        """Save a video that was assembled on local disk (e.g. by a resumable upload)"""
+        if content_type not in self.allowed_video_types:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"File type {content_type} not allowed. Allowed types: {self.allowed_video_types}"
+            )
+        
+        with open(source_path, 'rb') as f:
+            detected_type = self._sniff_type(f.read(media_metadata.SNIFF_BYTES), self.allowed_video_types)
+        
+        # Hash in blocks so large videos are never held in memory
+        loop = asyncio.get_event_loop()
+        content_hash = await loop.run_in_executor(None, self._compute_file_hash, source_path)
+        duplicate = self._find_stored_duplicate(db, restaurant_id, content_hash, original_filename)
+        if duplicate:
+            os.remove(source_path)
+            return duplicate
+        
+        metadata = await loop.run_in_executor(None, self._inspect_video_file, source_path, detected_type)
+        
+        filename = self._generate_filename(original_filename)
+        key = self._object_key(task_id, filename)
+        
+        start = time.perf_counter()
+        try:
+            # Streamed from disk; locally the assembled file is renamed into place, not copied
+            stored = await self.backend.put_file(key, source_path, content_type, move=True)
+        except CircuitOpenError:
+            logger.warning(f"{self.backend.storage_type} circuit open, saving task {task_id} video locally")
+            stored = await self.local_backend.put_file(key, source_path, content_type, move=True)
+            self._mark_fallback(task_id)
+        except Exception as e:
+            if self.backend is self.local_backend:
+                raise
+            logger.error(f"Failed to upload to {self.backend.storage_type}, falling back to local storage: {e}")
+            stored = await self.local_backend.put_file(key, source_path, content_type, move=True)
+            self._mark_fallback(task_id)
+        metrics.observe_upload("video", stored.storage_type, stored.file_size, time.perf_counter() - start)
+        
+        file_data = self._file_data(stored, filename, original_filename, content_type, "video")
+        file_data["content_hash"] = content_hash
+        file_data.update(self._metadata_fields(detected_type, metadata))
+        if metadata.get("width"):
+            file_data.update(width=metadata["width"], height=metadata["height"])
+        self._record_usage(db, restaurant_id, file_data)
+        return file_data
+
+    def _record_usage(self, db: Optional[Session], restaurant_id: Optional[int], file_data: dict) -> None:
+        """Count a newly stored object against the restaurant's storage usage"""
+        if db is None or restaurant_id is None:
+            return
+        try:
+            crud.adjust_storage_usage(db, restaurant_id, file_data["storage_type"], file_data["file_size"], 1)
+        except Exception as e:
+            logger.warning(f"Failed to update storage usage: {e}")
+
+    async def _local_renditions(self, file_path: str, content: bytes) -> Optional[dict]:
+        """Encode the fixed renditions with Pillow and write them next to the file"""
         try:
-            # Create a folder structure: task_completions/task_id/
-            folder = f"task_completions/{task_id}"
-            
-            # Generate public_id without extension
-            public_id = f"{folder}/{filename.rsplit('.', 1)[0]}"
-            
-            # Upload to Cloudinary
             loop = asyncio.get_event_loop()
-            
-            if file_type == "image":
-                # Upload image with optimization
-                result = await loop.run_in_executor(
-                    None,
-                    cloudinary.uploader.upload,
-                    content,
-                    {
-                        "public_id": public_id,
-                        "folder": folder,
-                        "resource_type": "image",
-                        "format": "webp",  # Convert to WebP for better compression
-                        "quality": "auto:good",
-                        "fetch_format": "auto",
-                        "crop": "limit",
-                        "width": 1920,
-                        "height": 1080
-                    }
-                )
-            else:
-                # Upload video
-                result = await loop.run_in_executor(
-                    None,
-                    cloudinary.uploader.upload,
-                    content,
-                    {
-                        "public_id": public_id,
-                        "folder": folder,
-                        "resource_type": "video",
-                        "quality": "auto:good"
-                    }
-                )
-            
-            return {
-                "filename": filename,
-                "original_filename": original_filename,
-                "file_path": result["public_id"],
-                "file_url": result["secure_url"],
-                "file_size": result["bytes"],
-                "mime_type": content_type,
-                "file_type": file_type,
-                "storage_type": "cloudinary",
-                "cloudinary_id": result["public_id"]
-            }
-            
+            renditions = await loop.run_in_executor(None, image_pipeline.renditions, content, IMAGE_RENDITIONS)
+            return await self.local_backend.put_renditions(file_path, renditions)
         except Exception as e:
-            print(f"❌ Failed to upload to Cloudinary: {e}")
-            print(f"📋 Error details: {type(e).__name__}: {str(e)}")
-            import traceback
-            print(f"📋 Traceback: {traceback.format_exc()}")
-            # Fallback to local storage
-            print("🔄 Falling back to local storage...")
-            return await self._save_to_local(content, filename, task_id, content_type, file_type, original_filename)
+            # Renditions are an optimization; previews fall back to the original
+            logger.warning(f"Failed to generate renditions for {file_path}: {e}")
+            return None
+
+    def _mark_fallback(self, task_id: str) -> None:
+        """Remember a task whose upload was saved locally instead of to Cloudinary"""
+        if self.backend.storage_type == "cloudinary":
+            self.fallback_tasks[str(task_id)] = time.time()
 
-    async def _save_to_local(self, content: bytes, filename: str, task_id: str,
-                           content_type: str, file_type: str, original_filename: str) -> dict:
-        """Save file to local storage"""
+    def _object_key(self, task_id: str, filename: str) -> str:
+        """Backend independent key: task_completions/<task_id>/<filename>"""
+        return f"task_completions/{task_id}/{filename}"
+
+    def _file_data(self, stored: StoredObject, filename: str, original_filename: str,
+                   content_type: str, file_type: str) -> dict:
+        """MediaFile fields for a stored object"""
+        return {
+            "filename": filename,
+            "original_filename": original_filename,
+            "file_path": stored.file_path,
+            "file_url": stored.file_url,
+            "file_size": stored.file_size,
+            "mime_type": content_type,
+            "file_type": file_type,
+            "storage_type": stored.storage_type,
+            "cloudinary_id": stored.cloudinary_id,
+            "renditions": stored.renditions,
+            "width": stored.width,
+            "height": stored.height
+        }
+
+    async def _store(self, content: bytes, filename: str, task_id: str,
+                     content_type: str, file_type: str, original_filename: str) -> dict:
+        """Save file with the configured backend, falling back to local storage"""
+        key = self._object_key(task_id, filename)
+        start = time.perf_counter()
         try:
-            # Create task-specific directory
-            task_dir = os.path.join(self.upload_dir, "task_completions", str(task_id))
-            os.makedirs(task_dir, exist_ok=True)
-            
-            file_path = os.path.join(task_dir, filename)
-            
-            # Save file
-            async with aiofiles.open(file_path, 'wb') as buffer:
-                await buffer.write(content)
-            
-            print(f"✅ Successfully saved file locally: {file_path}")
-            
-            return {
-                "filename": filename,
-                "original_filename": original_filename,
-                "file_path": file_path,
-                "file_size": len(content),
-                "mime_type": content_type,
-                "file_type": file_type,
-                "storage_type": "local"
-            }
+            stored = await self.backend.put(key, content, content_type)
+        except CircuitOpenError:
+            # Cloudinary is known to be down; don't wait on it
+            logger.warning(f"{self.backend.storage_type} circuit open, saving task {task_id} {file_type} locally")
+            stored = await self.local_backend.put(key, content, content_type)
+            self._mark_fallback(task_id)
         except Exception as e:
-            print(f"❌ Failed to save file locally: {e}")
-            print(f"📋 Error details: {type(e).__name__}: {str(e)}")
-            import traceback
-            print(f"📋 Traceback: {traceback.format_exc()}")
-            raise Exception(f"Failed to save file: {str(e)}")
+            if self.backend is self.local_backend:
+                logger.error(f"Failed to save file locally: {e}")
+                raise Exception(f"Failed to save file: {str(e)}")
+            logger.exception(f"Failed to upload to {self.backend.storage_type}, falling back to local storage: {e}")
+            # Fallback to local storage
+            stored = await self.local_backend.put(key, content, content_type)
+            self._mark_fallback(task_id)
+        
+        metrics.observe_upload(file_type, stored.storage_type, stored.file_size, time.perf_counter() - start)
+        if stored.storage_type == "local":
+            logger.debug(f"Saved file locally: {stored.file_path}")
+        return self._file_data(stored, filename, original_filename, content_type, file_type)
 
     async def _optimize_image_content(self, content: bytes) -> bytes:
         """Optimize image content while maintaining quality"""
         try:
-            # Load image from bytes
-            img = Image.open(io.BytesIO(content))
-            
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
-            # Resize if too large (max 1920x1080)
-            max_width, max_height = 1920, 1080
-            if img.width > max_width or img.height > max_height:
-                img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-            
-            # Save optimized image to bytes
-            output = io.BytesIO()
-            img.save(output, format='JPEG', optimize=True, quality=85)
-            return output.getvalue()
+            return image_pipeline.process(content).content
+        except HTTPException:
+            raise
         except Exception as e:
-            print(f"Error optimizing image: {e}")
+            logger.warning(f"Error optimizing image: {e}")
             return content  # Return original if optimization fails
 
     async def _optimize_image(self, file_path: str) -> None:
         """Optimize image file size while maintaining quality (legacy method for local files)"""
         try:
-            with Image.open(file_path) as img:
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Resize if too large (max 1920x1080)
-                max_width, max_height = 1920, 1080
-                if img.width > max_width or img.height > max_height:
-                    img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-                
-                # Save with optimization
-                img.save(file_path, optimize=True, quality=85)
+            img = image_pipeline.load_scaled(file_path)
+            
+            # Save with optimization
+            img.save(file_path, optimize=True, quality=85)
         except Exception as e:
-            print(f"Error optimizing image: {e}")
+            logger.warning(f"Error optimizing image: {e}")
 
-    def delete_file(self, file_path: str, storage_type: str = "local") -> bool:
-        """Delete a file from local storage or Cloudinary"""
+    async def delete_file(self, file_path: str, storage_type: str = "local",
+                          resource_type: str = "image") -> bool:
+        """Delete a file from whichever backend stored it"""
         try:
-            if storage_type == "cloudinary" and self.use_cloud_storage and self.cloudinary_configured:
-                # file_path is the public_id for Cloudinary
-                cloudinary.uploader.destroy(file_path)
-                return True
-            else:
-                # Local storage
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    return True
-            return False
+            return await get_storage_backend(storage_type).delete(file_path, resource_type)
         except Exception as e:
-            print(f"Error deleting file {file_path}: {e}")
+            logger.warning(f"Error deleting file {file_path}: {e}")
             return False
 
     def get_file_url(self, file_path: str, base_url: str, storage_type: str = "local") -> str:
         """Generate URL for accessing the file"""
-        if storage_type == "cloudinary":
-            # For Cloudinary, file_path is already the full URL
-            return file_path
-        else:
-            # Convert absolute path to relative path for URL
-            relative_path = os.path.relpath(file_path, self.upload_dir)
-            return f"{base_url}/uploads/{relative_path.replace(os.sep, '/')}"
-
-    async def migrate_to_cloud_storage(self, task_id: Optional[str] = None) -> dict:
-        """Migrate existing local files to Cloudinary"""
-        if not self.use_cloud_storage or not self.cloudinary_configured:
-            return {"error": "Cloudinary not configured"}
-        
-        migrated_files = []
-        failed_files = []
-        
-        try:
-            base_path = os.path.join(self.upload_dir, "task_completions")
-            if task_id:
-                # Migrate specific task
-                task_path = os.path.join(base_path, str(task_id))
-                if os.path.exists(task_path):
-                    await self._migrate_directory(task_path, f"task_completions/{task_id}", migrated_files, failed_files)
-            else:
-                # Migrate all tasks
-                if os.path.exists(base_path):
-                    for task_dir in os.listdir(base_path):
-                        task_path = os.path.join(base_path, task_dir)
-                        if os.path.isdir(task_path):
-                            await self._migrate_directory(task_path, f"task_completions/{task_dir}", migrated_files, failed_files)
-            
-            return {
-                "migrated_files": len(migrated_files),
-                "failed_files": len(failed_files),
-                "migrated": migrated_files,
-                "failed": failed_files
-            }
-        except Exception as e:
-            return {"error": f"Migration failed: {e}"}
-
-    async def _migrate_directory(self, local_dir: str, cloudinary_folder: str, migrated_files: list, failed_files: list):
-        """Migrate a directory to Cloudinary"""
-        for filename in os.listdir(local_dir):
-            file_path = os.path.join(local_dir, filename)
-            if os.path.isfile(file_path):
-                try:
-                    # Read local file
-                    async with aiofiles.open(file_path, 'rb') as f:
-                        content = await f.read()
-                    
-                    # Determine file type and upload to Cloudinary
-                    if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.webp')):
-                        resource_type = "image"
-                        public_id = f"{cloudinary_folder}/{filename.rsplit('.', 1)[0]}"
-                        
-                        loop = asyncio.get_event_loop()
-                        result = await loop.run_in_executor(
-                            None,
-                            cloudinary.uploader.upload,
-                            content,
-                            {
-                                "public_id": public_id,
-                                "resource_type": "image",
-                                "format": "webp",
-                                "quality": "auto:good"
-                            }
-                        )
-                        
-                    elif filename.lower().endswith(('.mp4', '.webm', '.avi', '.mov')):
-                        resource_type = "video"
-                        public_id = f"{cloudinary_folder}/{filename.rsplit('.', 1)[0]}"
-                        
-                        loop = asyncio.get_event_loop()
-                        result = await loop.run_in_executor(
-                            None,
-                            cloudinary.uploader.upload,
-                            content,
-                            {
-                                "public_id": public_id,
-                                "resource_type": "video",
-                                "quality": "auto:good"
-                            }
-                        )
-                    else:
-                        continue  # Skip unsupported files
-                    
-                    migrated_files.append({
-                        "local_path": file_path,
-                        "cloudinary_public_id": result["public_id"],
-                        "cloudinary_url": result["secure_url"],
-                        "size": result["bytes"]
-                    })
-                    
-                    print(f"✅ Migrated: {file_path} -> {result['secure_url']}")
-                    
-                except Exception as e:
-                    failed_files.append({
-                        "local_path": file_path,
-                        "error": str(e)
-                    })
-                    print(f"❌ Failed to migrate {file_path}: {e}")
+        return get_storage_backend(storage_type).url(file_path, base_url)
 
 # Create service instance
 file_service = FileUploadService()
@@ -0,0 +1,215 @@
+import io
+import base64
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import HTTPException, status
+from PIL import Image, ImageOps, features
+from app.config import settings
+from app.media_references import RENDITIONS
+import logging
+
+logger = logging.getLogger(__name__)
+
+# AVIF ships with Pillow >= 11.3; older Pillow needs the pillow-avif-plugin package
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# Encoder quality for each codec at each tier. The numbers differ per codec
+# because each quality scale maps to a different visual quality.
+QUALITY_TIERS = {
+    "JPEG": {"low": 70, "good": 85, "best": 92},
+    "WEBP": {"low": 65, "good": 80, "best": 90},
+    "AVIF": {"low": 45, "good": 60, "best": 75},
+}
+
+# Longest side and WebP quality of the inline placeholder (LQIP)
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 30
+
+MIME_TYPES = {
+    "JPEG": ("image/jpeg", ".jpg"),
+    "WEBP": ("image/webp", ".webp"),
+    "AVIF": ("image/avif", ".avif"),
+}
+
+
+def avif_supported() -> bool:
+    """Check whether the installed Pillow can encode AVIF"""
+    try:
+        return bool(features.check("avif"))
+    except ValueError:
+        # Older Pillow does not know the feature name; fall back to the plugin registry
+        return "AVIF" in Image.SAVE
+
+
+@dataclass
+class ProcessedImage:
+    """Result of a single decode/resize/encode pass"""
+    content: bytes
+    format: str
+    mime_type: str
+    extension: str
+    width: int
+    height: int
+    placeholder: Optional[str] = None  # Tiny blurred preview as a data URI
+
+
+class ImagePipeline:
+    """Decode, resize and encode an uploaded image exactly once"""
+
+    def __init__(self, output_format: str = None, quality_tier: str = None,
+                 progressive: bool = None, max_size: Tuple[int, int] = (1920, 1080),
+                 max_pixels: int = None):
+        self.output_format = (output_format or settings.IMAGE_OUTPUT_FORMAT).upper()
+        self.quality_tier = (quality_tier or settings.IMAGE_QUALITY_TIER).lower()
+        self.progressive = settings.IMAGE_PROGRESSIVE if progressive is None else progressive
+        self.max_size = max_size
+        self.max_pixels = max_pixels or settings.MAX_IMAGE_PIXELS
+
+        if self.quality_tier not in QUALITY_TIERS["JPEG"]:
+            logger.warning(f"Unknown image quality tier '{self.quality_tier}', using 'good'")
+            self.quality_tier = "good"
+
+    def negotiate_format(self) -> str:
+        """Pick the codec to encode with, falling back when AVIF is unavailable"""
+        fmt = self.output_format
+        if fmt == "JPG":
+            fmt = "JPEG"
+        if fmt == "AUTO":
+            fmt = "AVIF" if avif_supported() else "WEBP"
+        if fmt == "AVIF" and not avif_supported():
+            logger.warning("AVIF encoding not available, falling back to WebP")
+            fmt = "WEBP"
+        if fmt not in QUALITY_TIERS:
+            logger.warning(f"Unknown image output format '{fmt}', using WebP")
+            fmt = "WEBP"
+        return fmt
+
+    def open(self, source) -> Image.Image:
+        """Open an image lazily, rejecting decompression bombs with the same 413"""
+        try:
+            return Image.open(source)
+        except Image.DecompressionBombError:
+            # Pillow refuses images over twice its own pixel limit before
+            # validate_pixels sees them; a stored original must not slip through
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Image dimensions exceed maximum allowed {self.max_pixels} pixels"
+            )
+
+    def validate_pixels(self, img: Image.Image) -> None:
+        """Reject images whose decoded size would exceed the pixel budget"""
+        pixels = img.width * img.height
+        if pixels > self.max_pixels:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Image dimensions {img.width}x{img.height} exceed maximum allowed {self.max_pixels} pixels"
+            )
+
+    def fit_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Largest size with the same aspect ratio that fits in max_size"""
+        max_width, max_height = self.max_size
+        scale = min(max_width / width, max_height / height, 1.0)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def load_scaled(self, source) -> Image.Image:
+        """Decode an image at the smallest scale that still covers the output size"""
+        img = self.open(source)
+
+        # Check the header dimensions before any pixel data is decoded
+        self.validate_pixels(img)
+
+        # Photos taken in portrait are stored sideways with an EXIF orientation,
+        # so the target box has to be rotated to match the stored pixels
+        orientation = img.getexif().get(0x0112, 1)
+        if orientation in (5, 6, 7, 8):
+            target_width, target_height = self.fit_size(img.height, img.width)[::-1]
+        else:
+            target_width, target_height = self.fit_size(img.width, img.height)
+
+        # JPEG can be decoded at 1/2, 1/4 or 1/8 scale straight from the DCT
+        # coefficients, so a 12MP photo never lands in memory at full size
+        if img.format == 'JPEG':
+            img.draft('RGB', (target_width, target_height))
+
+        ImageOps.exif_transpose(img, in_place=True)
+
+        # Single resample from the draft size to the final size
+        final_size = self.fit_size(img.width, img.height)
+        if final_size != img.size:
+            img = img.resize(final_size, Image.Resampling.LANCZOS)
+
+        return img
+
+    def encode(self, img: Image.Image, fmt: Optional[str] = None) -> ProcessedImage:
+        """Encode a decoded image with the negotiated codec and quality tier"""
+        fmt = fmt or self.negotiate_format()
+        quality = QUALITY_TIERS[fmt][self.quality_tier]
+
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        if fmt == "JPEG" or not has_alpha:
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+        elif img.mode != 'RGBA':
+            img = img.convert('RGBA')
+
+        output = io.BytesIO()
+        if fmt == "JPEG":
+            img.save(output, format=fmt, quality=quality, optimize=True, progressive=self.progressive)
+        elif fmt == "WEBP":
+            img.save(output, format=fmt, quality=quality, method=4)
+        else:
+            img.save(output, format=fmt, quality=quality)
+
+        mime_type, extension = MIME_TYPES[fmt]
+        return ProcessedImage(
+            content=output.getvalue(),
+            format=fmt,
+            mime_type=mime_type,
+            extension=extension,
+            width=img.width,
+            height=img.height
+        )
+
+    def placeholder(self, img: Image.Image) -> str:
+        """A few hundred bytes of WebP the UI can stretch and blur while the real image loads"""
+        tiny = img.copy()
+        tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BILINEAR)
+        if tiny.mode not in ('RGB', 'L'):
+            tiny = tiny.convert('RGB')
+        output = io.BytesIO()
+        tiny.save(output, format="WEBP", quality=PLACEHOLDER_QUALITY)
+        return f"data:image/webp;base64,{base64.b64encode(output.getvalue()).decode()}"
+
+    def process(self, content: bytes, fmt: Optional[str] = None,
+                with_placeholder: bool = False) -> ProcessedImage:
+        """Run the full pipeline over raw upload bytes"""
+        img = self.load_scaled(io.BytesIO(content))
+        processed = self.encode(img, fmt)
+        if with_placeholder:
+            processed.placeholder = self.placeholder(img)
+        return processed
+
+    def renditions(self, content: bytes, names: Iterable[str],
+                   fmt: Optional[str] = None) -> Dict[str, ProcessedImage]:
+        """Decode an already processed image once and encode each named rendition"""
+        img = self.open(io.BytesIO(content))
+        self.validate_pixels(img)
+        img.load()
+
+        results = {}
+        for name in names:
+            width, height, crop = RENDITIONS[name]
+            if crop == "fill":
+                variant = ImageOps.fit(img, (width, height), Image.Resampling.LANCZOS)
+            else:
+                variant = img.copy()
+                variant.thumbnail((width, height), Image.Resampling.LANCZOS)
+            results[name] = self.encode(variant, fmt)
+        return results
+
+
+# Create pipeline instance
+image_pipeline = ImagePipeline()
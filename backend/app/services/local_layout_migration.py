@@ -0,0 +1,170 @@
+import os
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy.orm import joinedload
+from app.config import settings
+from app.database import SessionLocal
+from app import models
+from app.services.storage_backends import LocalStorageBackend
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLayoutMigration:
+    """Move local uploads from the flat task_completions/<task_id>/ tree into the sharded layout
+
+    Files are renamed (never copied) and MediaFile rows plus the task URLs
+    that pointed at them are updated in batches. A final pass repairs rows
+    whose file was moved by a run that stopped before its batch committed,
+    so the job is safe to re-run.
+    """
+
+    def __init__(self):
+        self.upload_dir = settings.UPLOAD_DIRECTORY
+        self.batch_size = settings.STORAGE_MIGRATION_BATCH_SIZE
+        self._task: Optional[asyncio.Task] = None
+        self.status = {"state": "idle"}
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> dict:
+        """Start the migration in the background"""
+        if self.is_running:
+            return self.status
+
+        self.status = {
+            "state": "running",
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "moved": 0,
+            "bytes_moved": 0,
+            "records_updated": 0,
+            "records_repaired": 0
+        }
+        self._task = asyncio.create_task(self._run())
+        return self.status
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self._migrate)
+            self.status["state"] = "completed"
+        except Exception as e:
+            logger.error(f"Local layout migration failed: {str(e)}")
+            self.status["state"] = "failed"
+            self.status["error"] = str(e)
+        finally:
+            self.status["finished_at"] = datetime.utcnow().isoformat()
+
+    def _migrate(self) -> None:
+        backend = LocalStorageBackend(self.upload_dir, layout="sharded")
+        flat_base = backend.flat_path_for("task_completions")
+        moves: Dict[str, str] = {}
+
+        if os.path.isdir(flat_base):
+            for task_entry in os.scandir(flat_base):
+                if not task_entry.is_dir():
+                    continue
+                # Each task directory is small; list it before renaming out of it
+                for entry in list(os.scandir(task_entry.path)):
+                    if not entry.is_file():
+                        continue
+                    key = f"task_completions/{task_entry.name}/{entry.name}"
+                    old_path = backend.flat_path_for(key)
+                    new_path = backend.sharded_path_for(key)
+                    size = entry.stat().st_size
+                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                    os.replace(old_path, new_path)
+                    moves[old_path] = new_path
+                    self.status["moved"] += 1
+                    self.status["bytes_moved"] += size
+
+                    if len(moves) >= self.batch_size:
+                        self.status["records_updated"] += self._apply_moves(backend, moves)
+                        moves = {}
+
+                # Remove the emptied flat task directory
+                try:
+                    os.rmdir(task_entry.path)
+                except OSError:
+                    pass
+
+        self.status["records_updated"] += self._apply_moves(backend, moves)
+        self.status["records_repaired"] += self._repair(backend)
+
+    def _apply_moves(self, backend: LocalStorageBackend, moves: Dict[str, str]) -> int:
+        """Point MediaFile rows and task URLs at the moved files in one transaction"""
+        if not moves:
+            return 0
+        db = SessionLocal()
+        try:
+            media_files = db.query(models.MediaFile).options(
+                joinedload(models.MediaFile.task)
+            ).filter(
+                models.MediaFile.storage_type == "local",
+                models.MediaFile.file_path.in_(list(moves.keys()))
+            ).all()
+
+            for media in media_files:
+                old_path = media.file_path
+                new_path = moves[old_path]
+                old_url = media.file_url
+                new_url = old_url.replace(backend.url(old_path), backend.url(new_path))
+                task = media.task
+                if task is not None:
+                    if task.image_url == old_url:
+                        task.image_url = new_url
+                    if task.video_url == old_url:
+                        task.video_url = new_url
+                media.file_path = new_path
+                media.file_url = new_url
+                if media.renditions:
+                    # Renditions sit next to the file and moved with it
+                    old_dir_url = backend.url(os.path.dirname(old_path))
+                    new_dir_url = backend.url(os.path.dirname(new_path))
+                    media.renditions = {
+                        name: url.replace(old_dir_url, new_dir_url) for name, url in media.renditions.items()
+                    }
+
+            db.commit()
+            return len(media_files)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _repair(self, backend: LocalStorageBackend) -> int:
+        """Fix rows still pointing at a flat path whose file already moved"""
+        flat_prefix = backend.flat_path_for("task_completions") + os.sep
+        db = SessionLocal()
+        try:
+            stale_paths = [
+                file_path for (file_path,) in db.query(models.MediaFile.file_path).filter(
+                    models.MediaFile.storage_type == "local",
+                    models.MediaFile.file_path.startswith(flat_prefix)
+                ).distinct().yield_per(1000)
+                if not os.path.exists(file_path)
+            ]
+        finally:
+            db.close()
+
+        moves = {}
+        for old_path in stale_paths:
+            key = os.path.relpath(old_path, self.upload_dir).replace(os.sep, "/")
+            new_path = backend.sharded_path_for(key)
+            if os.path.exists(new_path):
+                moves[old_path] = new_path
+        repaired = 0
+        items = list(moves.items())
+        for i in range(0, len(items), self.batch_size):
+            repaired += self._apply_moves(backend, dict(items[i:i + self.batch_size]))
+        return repaired
+
+
+# Create job instance
+local_layout_migration = LocalLayoutMigration()
@@ -0,0 +1,205 @@
+import os
+import re
+import stat
+import mimetypes
+import anyio
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from app.config import settings
+
+# Uploaded files are written once under a unique name and never modified,
+# so clients and proxies may cache them for a year without revalidating
+IMMUTABLE_PUBLIC = "public, max-age=31536000, immutable"
+IMMUTABLE_PRIVATE = "private, max-age=31536000, immutable"
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def strong_etag(stat_result: os.stat_result) -> str:
+    """Strong validator for a file that is never rewritten in place"""
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single byte range into an inclusive (start, end) pair
+
+    Returns None when the header should be ignored (malformed or multiple
+    ranges) and raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, file_size - length), file_size - 1
+    start = int(first)
+    end = int(last) if last else file_size - 1
+    if start >= file_size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, file_size - 1)
+
+
+class MediaFileResponse(Response):
+    """File response with HTTP Range, strong ETags and zero-copy sending"""
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, request_headers: Headers, method: str = "GET",
+                 stat_result: Optional[os.stat_result] = None, media_type: Optional[str] = None,
+                 cache_control: str = IMMUTABLE_PRIVATE):
+        self.path = path
+        self.stat_result = stat_result or os.stat(path)
+        self.send_header_only = method.upper() == "HEAD"
+        self.background = None
+        self.offset = 0
+
+        file_size = self.stat_result.st_size
+        self.count = file_size
+        etag = strong_etag(self.stat_result)
+        media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": formatdate(self.stat_result.st_mtime, usegmt=True),
+            "cache-control": cache_control,
+            "content-type": media_type
+        }
+
+        if self._not_modified(request_headers, etag):
+            self.status_code = 304
+            self.count = 0
+            self.send_header_only = True
+            del headers["content-type"]
+        else:
+            self.status_code = 200
+            range_header = request_headers.get("range")
+            if range_header and self._if_range_matches(request_headers, etag):
+                try:
+                    byte_range = parse_range(range_header, file_size)
+                except ValueError:
+                    self.status_code = 416
+                    self.count = 0
+                    self.send_header_only = True
+                    headers["content-range"] = f"bytes */{file_size}"
+                    byte_range = None
+                if byte_range:
+                    start, end = byte_range
+                    self.status_code = 206
+                    self.offset = start
+                    self.count = end - start + 1
+                    headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+            headers["content-length"] = str(self.count)
+
+        self.init_headers(headers)
+
+    def _not_modified(self, request_headers: Headers, etag: str) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(self.stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _if_range_matches(self, request_headers: Headers, etag: str) -> bool:
+        """A Range is only honoured if the client's copy is still current"""
+        if_range = request_headers.get("if-range")
+        if not if_range:
+            return True
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            return if_range == etag
+        try:
+            return int(self.stat_result.st_mtime) <= parsedate_to_datetime(if_range).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        if self.send_header_only or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        # Servers implementing the ASGI zero-copy extension hand the file
+        # descriptor to sendfile(2) instead of reading it into Python
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0
+                })
+            if remaining > 0:
+                # File shrank underneath us - close the body rather than hang
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def media_file_response(path: str, request_headers: Headers, method: str = "GET",
+                        upload_dir: Optional[str] = None, media_type: Optional[str] = None,
+                        cache_control: str = IMMUTABLE_PRIVATE) -> Response:
+    """Serve a local media file, or hand it to nginx once access has been checked"""
+    upload_dir = upload_dir or settings.UPLOAD_DIRECTORY
+    prefix = settings.MEDIA_X_ACCEL_REDIRECT_PREFIX
+    if prefix:
+        relative_path = os.path.relpath(path, upload_dir).replace(os.sep, "/")
+        return Response(
+            status_code=200,
+            media_type=media_type or mimetypes.guess_type(path)[0] or "application/octet-stream",
+            headers={
+                "X-Accel-Redirect": f"{prefix.rstrip('/')}/{relative_path}",
+                "Cache-Control": cache_control
+            }
+        )
+    return MediaFileResponse(path, request_headers, method=method, media_type=media_type,
+                             cache_control=cache_control)
+
+
+class MediaStaticFiles(StaticFiles):
+    """StaticFiles mount for uploads with range support and immutable caching"""
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        if status_code != 200 or not stat.S_ISREG(stat_result.st_mode):
+            return super().file_response(full_path, stat_result, scope, status_code)
+        return MediaFileResponse(
+            str(full_path),
+            Headers(scope=scope),
+            method=scope["method"],
+            stat_result=stat_result,
+            cache_control=IMMUTABLE_PUBLIC
+        )
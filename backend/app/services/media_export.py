@@ -0,0 +1,165 @@
+import io
+import os
+import csv
+import asyncio
+import zipfile
+import tempfile
+import mimetypes
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, Iterator, List, Optional, Tuple
+from app.services.storage_backends import STREAM_CHUNK_SIZE, get_storage_backend
+import logging
+
+logger = logging.getLogger(__name__)
+
+FETCH_CONCURRENCY = 4
+# Fetched objects wait in memory up to this size, then on disk, until the writer reaches them
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_COLUMNS = [
+    "file", "media_id", "task_id", "task", "category", "day", "task_status", "initials",
+    "media_type", "mime_type", "file_size", "content_hash", "captured_at", "uploaded_at",
+    "url", "export_status"
+]
+
+
+class _ZipSink:
+    """Write-only target for ZipFile; whatever it wrote is drained and sent on"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _zip_time(value: Optional[datetime]) -> Tuple[int, int, int, int, int, int]:
+    value = value if value and value.year >= 1980 else datetime.utcnow()
+    return value.timetuple()[:6]
+
+
+class MediaExport:
+    """Stream a ZIP of stored media with a CSV manifest
+
+    Up to ``concurrency`` objects are fetched from their storage backend ahead
+    of the writer and copied into the archive in order. The archive is
+    written without seeking (entries use data descriptors), so bytes go out
+    as soon as the first object arrives and memory is bounded by the fetch
+    window, not by the size of the archive.
+    """
+
+    def __init__(self, concurrency: int = FETCH_CONCURRENCY):
+        self.concurrency = concurrency
+
+    @staticmethod
+    def archive_name(media: dict) -> str:
+        """Where an item goes in the archive: <upload date>/task-<id>-<media id><ext>"""
+        extension = os.path.splitext(media["filename"])[1] or mimetypes.guess_extension(media["mime_type"] or "") or ""
+        uploaded = media["created_at"].strftime("%Y-%m-%d") if media["created_at"] else "undated"
+        return f"{uploaded}/task-{media['task_id']}-{media['id']}{extension}"
+
+    async def _fetch(self, media: dict) -> tempfile.SpooledTemporaryFile:
+        loop = asyncio.get_event_loop()
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        try:
+            backend = get_storage_backend(media["storage_type"])
+            async for chunk in backend.stream(media["file_path"], media["file_type"]):
+                await loop.run_in_executor(None, spool.write, chunk)
+            spool.seek(0)
+            return spool
+        except BaseException:
+            spool.close()
+            raise
+
+    def _manifest_row(self, media: dict, export_status: str) -> dict:
+        return {
+            "file": self.archive_name(media) if export_status == "included" else "",
+            "media_id": media["id"],
+            "task_id": media["task_id"],
+            "task": media["task"],
+            "category": media["category"],
+            "day": media["day"],
+            "task_status": media["task_status"],
+            "initials": media["initials"],
+            "media_type": media["file_type"],
+            "mime_type": media["mime_type"],
+            "file_size": media["file_size"],
+            "content_hash": media["content_hash"],
+            "captured_at": media["captured_at"].isoformat() if media["captured_at"] else "",
+            "uploaded_at": media["created_at"].isoformat() if media["created_at"] else "",
+            "url": media["file_url"],
+            "export_status": export_status
+        }
+
+    async def stream(self, items: List[dict]) -> AsyncIterator[bytes]:
+        """Yield the archive for items (MediaFile fields plus their task's) as it is written"""
+        loop = asyncio.get_event_loop()
+        sink = _ZipSink()
+        manifest = io.StringIO()
+        writer = csv.DictWriter(manifest, fieldnames=MANIFEST_COLUMNS)
+        writer.writeheader()
+        queued: Iterator[dict] = iter(items)
+        pending: Deque[Tuple[dict, asyncio.Future]] = deque()
+
+        def fill_window() -> None:
+            while len(pending) < self.concurrency:
+                media = next(queued, None)
+                if media is None:
+                    return
+                pending.append((media, asyncio.ensure_future(self._fetch(media))))
+
+        try:
+            with zipfile.ZipFile(sink, "w") as archive:
+                fill_window()
+                while pending:
+                    media, fetch = pending.popleft()
+                    try:
+                        spool = await fetch
+                    except Exception as e:
+                        logger.warning(f"Export could not fetch media {media['id']}: {str(e)}")
+                        writer.writerow(self._manifest_row(media, "missing"))
+                        continue
+                    finally:
+                        # Fetch the next object while this one is written
+                        fill_window()
+
+                    with spool:
+                        entry = zipfile.ZipInfo(self.archive_name(media), date_time=_zip_time(media["created_at"]))
+                        # Photos and videos are already compressed
+                        entry.compress_type = zipfile.ZIP_STORED
+                        entry.file_size = spool.seek(0, os.SEEK_END)
+                        spool.seek(0)
+                        with archive.open(entry, "w") as target:
+                            while True:
+                                block = await loop.run_in_executor(None, spool.read, STREAM_CHUNK_SIZE)
+                                if not block:
+                                    break
+                                target.write(block)
+                                yield sink.drain()
+                    writer.writerow(self._manifest_row(media, "included"))
+
+                manifest_entry = zipfile.ZipInfo(MANIFEST_NAME, date_time=_zip_time(None))
+                manifest_entry.compress_type = zipfile.ZIP_DEFLATED
+                archive.writestr(manifest_entry, manifest.getvalue())
+            # Closing the archive wrote the central directory
+            yield sink.drain()
+        finally:
+            # The client went away or the archive failed; drop whatever is still in flight
+            for _, fetch in pending:
+                if fetch.done() and not fetch.cancelled() and fetch.exception() is None:
+                    fetch.result().close()
+                fetch.cancel()
+
+
+# Create service instance
+media_export = MediaExport()
@@ -0,0 +1,261 @@
+import os
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app import models, crud
+from app.services.cloudinary_service import CloudinaryService
+from app.services.storage_backends import (
+    RENDITION_SEPARATOR, LocalStorageBackend, get_storage_backend, is_rendition
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Folders our upload paths write to (FileUploadService and base64 task submissions)
+CLOUDINARY_PREFIXES = ("task_completions/", "tasks/", "task_images/", "task_videos/")
+
+# (storage_type, locator) - locator is the public_id for Cloudinary, the
+# object key for S3 and the file path for local storage
+Reference = Tuple[str, str]
+
+
+def reference_from_url(url: Optional[str], local: LocalStorageBackend) -> Optional[Tuple[str, str, str]]:
+    """(storage_type, locator, resource_type) for a media URL stored on a task"""
+    if not url:
+        return None
+    parsed = CloudinaryService.parse_public_id(url)
+    if parsed:
+        resource_type, public_id = parsed
+        return "cloudinary", public_id, resource_type
+    if "/uploads/" in url:
+        relative_path = url.split("/uploads/", 1)[1].split("?")[0]
+        return "local", local.flat_path_for(relative_path), "image"
+    return None
+
+
+class MediaGarbageCollector:
+    """Find and delete stored media that nothing references any more
+
+    References are MediaFile rows and task image/video URLs. Candidates are
+    every asset in our Cloudinary folders plus every file in the local
+    upload tree. Assets younger than the grace period are never collected
+    so uploads whose database rows are still being written are safe.
+    """
+
+    def __init__(self):
+        self.grace_period = timedelta(hours=settings.MEDIA_GC_GRACE_HOURS)
+        self._task: Optional[asyncio.Task] = None
+        self.status = {"state": "idle"}
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, dry_run: bool = True) -> dict:
+        """Start a collection run in the background"""
+        if self.is_running:
+            return self.status
+
+        self.status = {
+            "state": "running",
+            "dry_run": dry_run,
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "references": 0,
+            "scanned": 0,
+            "orphaned": 0,
+            "orphaned_bytes": 0,
+            "deleted": 0,
+            "delete_calls": 0,
+            "sample": []
+        }
+        self._task = asyncio.create_task(self._run(dry_run))
+        return self.status
+
+    def _load_references(self) -> Set[Reference]:
+        local = LocalStorageBackend()
+        references: Set[Reference] = set()
+        db = SessionLocal()
+        try:
+            for storage_type, file_path, cloudinary_id in db.query(
+                models.MediaFile.storage_type,
+                models.MediaFile.file_path,
+                models.MediaFile.cloudinary_id
+            ).yield_per(1000):
+                references.add((storage_type, file_path))
+                if cloudinary_id:
+                    references.add(("cloudinary", cloudinary_id))
+
+            for image_url, video_url in db.query(models.Task.image_url, models.Task.video_url).filter(
+                or_(models.Task.image_url.isnot(None), models.Task.video_url.isnot(None))
+            ).yield_per(1000):
+                for url in (image_url, video_url):
+                    reference = reference_from_url(url, local)
+                    if reference:
+                        references.add(reference[:2])
+        finally:
+            db.close()
+        return references
+
+    def _record_orphan(self, storage_type: str, locator: str, size: int) -> None:
+        self.status["orphaned"] += 1
+        self.status["orphaned_bytes"] += size or 0
+        if len(self.status["sample"]) < 50:
+            self.status["sample"].append({"storage_type": storage_type, "locator": locator, "bytes": size})
+
+    async def _delete(self, storage_type: str, locators: List[str], resource_type: str, dry_run: bool) -> None:
+        if dry_run or not locators:
+            return
+        backend = get_storage_backend(storage_type)
+        self.status["deleted"] += await backend.delete_many(locators, resource_type)
+        self.status["delete_calls"] += -(-len(locators) // backend.batch_delete_size)
+
+    async def _collect_cloudinary(self, references: Set[Reference], cutoff: datetime, dry_run: bool) -> None:
+        backend = get_storage_backend("cloudinary")
+        for resource_type in ("image", "video"):
+            batch: List[str] = []
+            for prefix in CLOUDINARY_PREFIXES:
+                async for resource in backend.list_resources(prefix, resource_type):
+                    self.status["scanned"] += 1
+                    public_id = resource["public_id"]
+                    created_at = datetime.strptime(resource["created_at"], "%Y-%m-%dT%H:%M:%SZ")
+                    if ("cloudinary", public_id) in references or created_at > cutoff:
+                        continue
+                    self._record_orphan("cloudinary", public_id, resource.get("bytes"))
+                    batch.append(public_id)
+                    if len(batch) >= backend.batch_delete_size:
+                        await self._delete("cloudinary", batch, resource_type, dry_run)
+                        batch = []
+            await self._delete("cloudinary", batch, resource_type, dry_run)
+            self.status["rate_limit_remaining"] = backend.rate_limit_remaining
+
+    async def _collect_local(self, references: Set[Reference], cutoff: datetime, dry_run: bool) -> None:
+        local = get_storage_backend("local")
+        cutoff_timestamp = (cutoff - datetime(1970, 1, 1)).total_seconds()
+        # Renditions are kept while the file they were derived from is referenced
+        referenced_stems = {
+            os.path.splitext(locator)[0] for storage_type, locator in references if storage_type == "local"
+        }
+
+        def find_orphans() -> List[str]:
+            orphans = []
+            for task_dir in local.iter_directories("task_completions"):
+                for entry in os.scandir(task_dir):
+                    if not entry.is_file():
+                        continue
+                    self.status["scanned"] += 1
+                    stat = entry.stat()
+                    if is_rendition(entry.path):
+                        referenced = entry.path.rsplit(RENDITION_SEPARATOR, 1)[0] in referenced_stems
+                    else:
+                        referenced = ("local", entry.path) in references
+                    if referenced or stat.st_mtime > cutoff_timestamp:
+                        continue
+                    self._record_orphan("local", entry.path, stat.st_size)
+                    orphans.append(entry.path)
+            return orphans
+
+        loop = asyncio.get_event_loop()
+        orphans = await loop.run_in_executor(None, find_orphans)
+        await self._delete("local", orphans, "image", dry_run)
+
+    async def _run(self, dry_run: bool) -> None:
+        from app.services.file_service import file_service
+
+        try:
+            loop = asyncio.get_event_loop()
+            references = await loop.run_in_executor(None, self._load_references)
+            self.status["references"] = len(references)
+            cutoff = datetime.utcnow() - self.grace_period
+
+            if file_service.cloudinary_configured:
+                await self._collect_cloudinary(references, cutoff, dry_run)
+            await self._collect_local(references, cutoff, dry_run)
+            self.status["state"] = "completed"
+        except Exception as e:
+            logger.error(f"Media garbage collection failed: {str(e)}")
+            self.status["state"] = "failed"
+            self.status["error"] = str(e)
+        finally:
+            self.status["finished_at"] = datetime.utcnow().isoformat()
+
+    def collect_task_assets(self, task: models.Task) -> List[dict]:
+        """Stored objects behind a task's media, captured before the task changes"""
+        local = LocalStorageBackend()
+        assets = {}
+        for media in task.media_files:
+            assets[(media.storage_type, media.file_path)] = {
+                "storage_type": media.storage_type,
+                "locator": media.file_path,
+                "resource_type": media.file_type,
+                "file_size": media.file_size,
+                "restaurant_id": task.restaurant_id
+            }
+        for url in (task.image_url, task.video_url):
+            reference = reference_from_url(url, local)
+            if reference and reference[:2] not in assets:
+                assets[reference[:2]] = {
+                    "storage_type": reference[0],
+                    "locator": reference[1],
+                    "resource_type": reference[2],
+                    "file_size": None,  # Not counted in storage usage
+                    "restaurant_id": task.restaurant_id
+                }
+        return list(assets.values())
+
+    def _is_referenced(self, db: Session, asset: dict) -> bool:
+        locator = asset["locator"]
+        if db.query(models.MediaFile).filter(
+            models.MediaFile.storage_type == asset["storage_type"],
+            or_(models.MediaFile.file_path == locator, models.MediaFile.cloudinary_id == locator)
+        ).first():
+            return True
+        # Task URLs embed the public_id or upload-relative path
+        url_part = locator if asset["storage_type"] == "cloudinary" else (
+            os.path.relpath(locator, settings.UPLOAD_DIRECTORY).replace(os.sep, "/")
+        )
+        return db.query(models.Task).filter(
+            or_(models.Task.image_url.contains(url_part), models.Task.video_url.contains(url_part))
+        ).first() is not None
+
+    async def release(self, assets: List[dict]) -> int:
+        """Delete the given assets unless something still references them"""
+        def unreferenced() -> List[dict]:
+            db = SessionLocal()
+            try:
+                return [asset for asset in assets if not self._is_referenced(db, asset)]
+            finally:
+                db.close()
+
+        loop = asyncio.get_event_loop()
+        grouped: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        for asset in await loop.run_in_executor(None, unreferenced):
+            grouped[(asset["storage_type"], asset["resource_type"])].append(asset)
+
+        deleted = 0
+        for (storage_type, resource_type), group in grouped.items():
+            try:
+                backend = get_storage_backend(storage_type)
+                deleted += await backend.delete_many([asset["locator"] for asset in group], resource_type)
+            except Exception as e:
+                # The next garbage collection run will pick these up
+                logger.error(f"Failed to release {len(group)} {storage_type} assets: {str(e)}")
+                continue
+
+            db = SessionLocal()
+            try:
+                for asset in group:
+                    if asset["file_size"] is not None:
+                        crud.adjust_storage_usage(db, asset["restaurant_id"], storage_type, -asset["file_size"], -1)
+            finally:
+                db.close()
+        return deleted
+
+
+# Create collector instance
+media_gc = MediaGarbageCollector()
@@ -0,0 +1,358 @@
+"""
+Media metadata read from the uploaded bytes at ingest
+
+Types are sniffed from magic bytes instead of trusting the client's
+Content-Type. Images give their EXIF capture time and orientation; MP4/MOV
+and WebM/Matroska give duration and resolution from the container headers,
+reached by seeking so the media data itself is never read or decoded.
+Location data is removed from the copy we store.
+"""
+import io
+import os
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Iterator, Optional, Tuple
+from PIL import Image
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Enough of the file to recognise every format below
+SNIFF_BYTES = 64
+
+# Sniffed types that our allowed-type settings spell differently
+TYPE_ALIASES = {
+    "video/quicktime": "video/mov",
+    "video/x-msvideo": "video/avi",
+}
+
+IMAGE_FTYP_BRANDS = {b"avif": "image/avif", b"avis": "image/avif", b"heic": "image/heic",
+                     b"heix": "image/heic", b"mif1": "image/heif", b"msf1": "image/heif"}
+
+EXIF_ORIENTATION = 0x0112
+EXIF_DATETIME = 0x0132
+EXIF_IFD = 0x8769
+EXIF_DATETIME_ORIGINAL = 0x9003
+EXIF_OFFSET_TIME_ORIGINAL = 0x9011
+
+# Video rotation (degrees clockwise) as the equivalent EXIF orientation
+ROTATION_ORIENTATION = {0: 1, 90: 6, 180: 3, 270: 8}
+
+MP4_EPOCH = datetime(1904, 1, 1, tzinfo=timezone.utc)
+MATROSKA_EPOCH = datetime(2001, 1, 1, tzinfo=timezone.utc)
+MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"udta", b"edts"}
+MP4_LOCATION = b"\xa9xyz"
+
+# EBML element ids (with their length marker bits)
+EBML_HEADER = 0x1A45DFA3
+EBML_DOCTYPE = 0x4282
+MKV_SEGMENT = 0x18538067
+MKV_INFO = 0x1549A966
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_DATE_UTC = 0x4461
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_TYPE = 0x83
+MKV_VIDEO = 0xE0
+MKV_PIXEL_WIDTH = 0xB0
+MKV_PIXEL_HEIGHT = 0xBA
+MKV_CLUSTER = 0x1F43B675
+MKV_MAX_LEAF = 64 * 1024  # Header values are tiny; never read a large payload
+
+
+def sniff_type(head: bytes) -> Optional[str]:
+    """MIME type from a file's first bytes, or None if it is not a format we know"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in IMAGE_FTYP_BRANDS:
+            return IMAGE_FTYP_BRANDS[brand]
+        return "video/quicktime" if brand == b"qt  " else "video/mp4"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "video/webm" if b"webm" in head else "video/x-matroska"
+    return None
+
+
+def is_allowed(detected_type: Optional[str], allowed_types) -> bool:
+    """Whether a sniffed type is one of the allowed (client-facing) types"""
+    return detected_type is not None and (
+        detected_type in allowed_types or TYPE_ALIASES.get(detected_type) in allowed_types
+    )
+
+
+def _exif_datetime(value: Optional[str], offset: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        captured_at = datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    if offset:
+        try:
+            captured_at = captured_at.replace(tzinfo=datetime.strptime(offset.strip("\x00 "), "%z").tzinfo)
+        except ValueError:
+            pass
+    return captured_at
+
+
+def image_metadata(content: bytes) -> dict:
+    """Dimensions, capture time and orientation from the image header and EXIF"""
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            exif = img.getexif()
+            exif_ifd = exif.get_ifd(EXIF_IFD)
+            return {
+                "width": img.width,
+                "height": img.height,
+                "orientation": exif.get(EXIF_ORIENTATION),
+                "captured_at": _exif_datetime(
+                    exif_ifd.get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME),
+                    exif_ifd.get(EXIF_OFFSET_TIME_ORIGINAL)
+                )
+            }
+    except Exception as e:
+        logger.warning(f"Could not read image metadata: {str(e)}")
+        return {}
+
+
+def strip_exif(content: bytes) -> bytes:
+    """Drop EXIF (and with it GPS) from JPEG or PNG bytes without re-encoding
+
+    Only needed for originals stored as uploaded; the image pipeline never
+    writes EXIF into the images it encodes.
+    """
+    if content.startswith(b"\xff\xd8"):
+        output = bytearray(content[:2])
+        position = 2
+        while position + 4 <= len(content) and content[position] == 0xFF:
+            marker = content[position + 1]
+            if marker == 0xDA:  # Start of scan - the rest is image data
+                break
+            length = struct.unpack(">H", content[position + 2:position + 4])[0]
+            segment = content[position:position + 2 + length]
+            if not (marker == 0xE1 and segment[4:10] == b"Exif\x00\x00"):
+                output += segment
+            position += 2 + length
+        return bytes(output + content[position:])
+
+    if content.startswith(b"\x89PNG\r\n\x1a\n"):
+        output = bytearray(content[:8])
+        position = 8
+        while position + 12 <= len(content):
+            length = struct.unpack(">I", content[position:position + 4])[0]
+            chunk = content[position:position + 12 + length]
+            if content[position + 4:position + 8] != b"eXIf":
+                output += chunk
+            position += 12 + length
+        return bytes(output + content[position:])
+
+    return content
+
+
+def _mp4_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int, int]]:
+    """(type, box offset, payload offset, box end) for each box between start and end"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = position + 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            payload += 8
+        elif size == 0:
+            size = end - position
+        if size < payload - position:
+            return
+        yield box_type, position, payload, position + size
+        position += size
+
+
+def _mp4_metadata(f: BinaryIO, file_size: int) -> dict:
+    metadata = {}
+    for box_type, _, payload, box_end in _mp4_boxes(f, 0, file_size):
+        if box_type != b"moov":
+            continue
+        for child_type, _, child_payload, child_end in _mp4_boxes(f, payload, box_end):
+            if child_type == b"mvhd":
+                f.seek(child_payload)
+                version = f.read(4)[0]
+                if version == 1:
+                    created, _, timescale, duration = struct.unpack(">QQIQ", f.read(28))
+                else:
+                    created, _, timescale, duration = struct.unpack(">IIII", f.read(16))
+                if timescale:
+                    metadata["duration_seconds"] = round(duration / timescale, 3)
+                if created:
+                    metadata["captured_at"] = MP4_EPOCH + timedelta(seconds=created)
+            elif child_type == b"trak" and "width" not in metadata:
+                metadata.update(_mp4_video_track(f, child_payload, child_end))
+        break
+    return metadata
+
+
+def _mp4_video_track(f: BinaryIO, start: int, end: int) -> dict:
+    track = {}
+    is_video = False
+    for box_type, _, payload, box_end in _mp4_boxes(f, start, end):
+        if box_type == b"tkhd":
+            f.seek(payload)
+            version = f.read(1)[0]
+            matrix_offset = payload + (52 if version == 1 else 40)
+            f.seek(matrix_offset)
+            a, b = struct.unpack(">ii", f.read(8))
+            f.seek(matrix_offset + 36)
+            width, height = struct.unpack(">II", f.read(8))
+            rotation = {(0, 1): 90, (-1, 0): 180, (0, -1): 270}.get((a >> 16, b >> 16), 0)
+            track = {"width": width >> 16, "height": height >> 16,
+                     "orientation": ROTATION_ORIENTATION[rotation]}
+        elif box_type == b"mdia":
+            for child_type, _, child_payload, _ in _mp4_boxes(f, payload, box_end):
+                if child_type == b"hdlr":
+                    f.seek(child_payload + 8)
+                    is_video = f.read(4) == b"vide"
+    return track if is_video and track.get("width") else {}
+
+
+def _ebml_vint(f: BinaryIO, keep_marker: bool) -> Tuple[Optional[int], int]:
+    """(value, length) of an EBML variable length integer; value None means unknown size"""
+    first = f.read(1)
+    if not first:
+        raise EOFError
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first[0] & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML integer")
+    value = first[0] if keep_marker else first[0] & (mask - 1)
+    unknown = not keep_marker and value == mask - 1
+    for byte in f.read(length - 1):
+        value = (value << 8) | byte
+        unknown = unknown and byte == 0xFF
+    return (None if unknown else value), length
+
+
+def _ebml_elements(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+    """(id, payload offset, payload end) for each element between start and end"""
+    position = start
+    while position < end:
+        f.seek(position)
+        try:
+            element_id, id_length = _ebml_vint(f, keep_marker=True)
+            size, size_length = _ebml_vint(f, keep_marker=False)
+        except (EOFError, ValueError):
+            return
+        payload = position + id_length + size_length
+        payload_end = end if size is None else min(payload + size, end)
+        yield element_id, payload, payload_end
+        if size is None:
+            return
+        position = payload_end
+
+
+def _ebml_read(f: BinaryIO, payload: int, payload_end: int) -> bytes:
+    f.seek(payload)
+    return f.read(min(payload_end - payload, MKV_MAX_LEAF))
+
+
+def _ebml_uint(f: BinaryIO, payload: int, payload_end: int) -> int:
+    return int.from_bytes(_ebml_read(f, payload, payload_end), "big")
+
+
+def _matroska_metadata(f: BinaryIO, file_size: int) -> dict:
+    metadata = {}
+    for element_id, payload, payload_end in _ebml_elements(f, 0, file_size):
+        if element_id != MKV_SEGMENT:
+            continue
+        scale, duration = 1000000, None
+        for child_id, child_payload, child_end in _ebml_elements(f, payload, payload_end):
+            if child_id == MKV_CLUSTER:
+                break  # Media data follows; headers come first in practice
+            if child_id == MKV_INFO:
+                for info_id, info_payload, info_end in _ebml_elements(f, child_payload, child_end):
+                    if info_id == MKV_TIMECODE_SCALE:
+                        scale = _ebml_uint(f, info_payload, info_end)
+                    elif info_id == MKV_DURATION:
+                        raw = _ebml_read(f, info_payload, info_end)
+                        duration = struct.unpack(">f" if len(raw) == 4 else ">d", raw)[0]
+                    elif info_id == MKV_DATE_UTC:
+                        nanoseconds = int.from_bytes(_ebml_read(f, info_payload, info_end), "big", signed=True)
+                        metadata["captured_at"] = MATROSKA_EPOCH + timedelta(microseconds=nanoseconds // 1000)
+            elif child_id == MKV_TRACKS and "width" not in metadata:
+                metadata.update(_matroska_video_track(f, child_payload, child_end))
+        if duration is not None:
+            metadata["duration_seconds"] = round(duration * scale / 1e9, 3)
+        break
+    return metadata
+
+
+def _matroska_video_track(f: BinaryIO, start: int, end: int) -> dict:
+    for element_id, payload, payload_end in _ebml_elements(f, start, end):
+        if element_id != MKV_TRACK_ENTRY:
+            continue
+        track_type, size = None, {}
+        for child_id, child_payload, child_end in _ebml_elements(f, payload, payload_end):
+            if child_id == MKV_TRACK_TYPE:
+                track_type = _ebml_uint(f, child_payload, child_end)
+            elif child_id == MKV_VIDEO:
+                for video_id, video_payload, video_end in _ebml_elements(f, child_payload, child_end):
+                    if video_id == MKV_PIXEL_WIDTH:
+                        size["width"] = _ebml_uint(f, video_payload, video_end)
+                    elif video_id == MKV_PIXEL_HEIGHT:
+                        size["height"] = _ebml_uint(f, video_payload, video_end)
+        if track_type == 1 and size:
+            return size
+    return {}
+
+
+def video_metadata(f: BinaryIO, detected_type: Optional[str]) -> dict:
+    """Duration, resolution, rotation and creation time from MP4/MOV or WebM/Matroska headers"""
+    try:
+        file_size = f.seek(0, os.SEEK_END)
+        if detected_type in ("video/mp4", "video/quicktime"):
+            return _mp4_metadata(f, file_size)
+        if detected_type in ("video/webm", "video/x-matroska"):
+            return _matroska_metadata(f, file_size)
+    except Exception as e:
+        logger.warning(f"Could not read video metadata: {str(e)}")
+    return {}
+
+
+def strip_video_location(f: BinaryIO, detected_type: Optional[str]) -> int:
+    """Turn MP4/MOV location atoms into free space, in place; returns how many were removed
+
+    The atom keeps its size, so no offsets in the file move.
+    """
+    if detected_type not in ("video/mp4", "video/quicktime"):
+        return 0
+    removed = 0
+
+    def walk(start: int, end: int) -> None:
+        nonlocal removed
+        for box_type, box_offset, payload, box_end in list(_mp4_boxes(f, start, end)):
+            if box_type == MP4_LOCATION:
+                f.seek(box_offset + 4)
+                f.write(b"free")
+                removed += 1
+            elif box_type in MP4_CONTAINERS:
+                walk(payload, box_end)
+
+    try:
+        walk(0, f.seek(0, os.SEEK_END))
+    except Exception as e:
+        logger.warning(f"Could not strip video location: {str(e)}")
+    return removed
@@ -0,0 +1,146 @@
+import os
+import asyncio
+import mimetypes
+from datetime import datetime
+from typing import Optional, Set
+from sqlalchemy import or_
+from app.database import SessionLocal
+from app import models, crud
+from app.media_references import reference_for
+from app.services.storage_backends import LocalStorageBackend
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MediaRecordBackfill:
+    """Create MediaFile rows for task media that was stored without one
+
+    Proof submitted through /tasks/{id}/submit before it recorded media
+    only exists as a URL on the task, so the gallery (which reads
+    MediaFile) cannot see it. Walks tasks in id order and records every
+    Cloudinary or local URL that has no row yet; external URLs are not our
+    media and are left alone. Safe to re-run.
+    """
+
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self.status = {"state": "idle"}
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> dict:
+        """Start the backfill in the background"""
+        if self.is_running:
+            return self.status
+
+        self.status = {
+            "state": "running",
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "tasks_scanned": 0,
+            "records_created": 0,
+            "skipped": 0
+        }
+        self._task = asyncio.create_task(self._run())
+        return self.status
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self._backfill)
+            self.status["state"] = "completed"
+        except Exception as e:
+            logger.error(f"Media record backfill failed: {str(e)}")
+            self.status["state"] = "failed"
+            self.status["error"] = str(e)
+        finally:
+            self.status["finished_at"] = datetime.utcnow().isoformat()
+
+    def _media_data(self, local: LocalStorageBackend, task: models.Task, field: str) -> Optional[dict]:
+        url = getattr(task, f"{field}_url")
+        reference = reference_for(url, getattr(task, f"{field}_ref"))
+        if reference is None or reference.provider == "external":
+            return None
+
+        if reference.provider == "cloudinary":
+            file_path = reference.public_id
+            file_size = 0  # Unknown without an Admin API call per asset
+        else:
+            file_path = os.path.join(local.root, *reference.public_id.split("/"))
+            if not os.path.isfile(file_path):
+                return None
+            file_size = os.path.getsize(file_path)
+
+        filename = os.path.basename(url.split("?")[0])
+        return {
+            "task_id": task.id,
+            "restaurant_id": task.restaurant_id,
+            "filename": filename,
+            "original_filename": filename,
+            "file_path": file_path,
+            "file_url": url,
+            "file_size": file_size,
+            "mime_type": mimetypes.guess_type(filename)[0] or f"{reference.resource_type}/{reference.format}",
+            "file_type": reference.resource_type,
+            "storage_type": reference.provider,
+            "cloudinary_id": reference.public_id if reference.provider == "cloudinary" else None,
+            # Keep the gallery in submission order
+            "created_at": task.updated_at or task.created_at
+        }
+
+    def _backfill(self) -> None:
+        local = LocalStorageBackend()
+        restaurants: Set[int] = set()
+        last_id = 0
+        while True:
+            db = SessionLocal()
+            try:
+                tasks = db.query(models.Task).filter(
+                    models.Task.id > last_id,
+                    or_(models.Task.image_url.isnot(None), models.Task.video_url.isnot(None))
+                ).order_by(models.Task.id).limit(self.batch_size).all()
+                if not tasks:
+                    break
+
+                recorded = {
+                    (task_id, file_url) for task_id, file_url in db.query(
+                        models.MediaFile.task_id, models.MediaFile.file_url
+                    ).filter(models.MediaFile.task_id.in_([task.id for task in tasks]))
+                }
+                for task in tasks:
+                    self.status["tasks_scanned"] += 1
+                    for field in ("image", "video"):
+                        url = getattr(task, f"{field}_url")
+                        if not url or (task.id, url) in recorded:
+                            continue
+                        media_data = self._media_data(local, task, field)
+                        if media_data is None:
+                            self.status["skipped"] += 1
+                            continue
+                        db.add(models.MediaFile(**media_data))
+                        restaurants.add(task.restaurant_id)
+                        self.status["records_created"] += 1
+
+                db.commit()
+                last_id = tasks[-1].id
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+        # Rows were added in bulk, so rebuild the counters they affect
+        db = SessionLocal()
+        try:
+            for restaurant_id in restaurants:
+                crud.recalculate_media_counts(db, restaurant_id)
+        finally:
+            db.close()
+
+
+# Create job instance
+media_record_backfill = MediaRecordBackfill()
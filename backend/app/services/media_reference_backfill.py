@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import and_, or_
+from app.database import SessionLocal
+from app import models
+from app.media_references import parse_media_url
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MediaReferenceBackfill:
+    """Parse the media URLs of tasks written before references were stored
+
+    Walks tasks in id order, a batch per transaction, and fills image_ref
+    and video_ref for any URL that does not have one yet. Rows that already
+    have references are skipped, so the job is safe to re-run.
+    """
+
+    def __init__(self, batch_size: int = 500):
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+        self.status = {"state": "idle"}
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> dict:
+        """Start the backfill in the background"""
+        if self.is_running:
+            return self.status
+
+        self.status = {
+            "state": "running",
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "tasks_updated": 0,
+            "references_written": 0
+        }
+        self._task = asyncio.create_task(self._run())
+        return self.status
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self._backfill)
+            self.status["state"] = "completed"
+        except Exception as e:
+            logger.error(f"Media reference backfill failed: {str(e)}")
+            self.status["state"] = "failed"
+            self.status["error"] = str(e)
+        finally:
+            self.status["finished_at"] = datetime.utcnow().isoformat()
+
+    def _backfill(self) -> None:
+        last_id = 0
+        while True:
+            db = SessionLocal()
+            try:
+                tasks = db.query(models.Task).filter(
+                    models.Task.id > last_id,
+                    or_(
+                        and_(models.Task.image_url.isnot(None), models.Task.image_ref.is_(None)),
+                        and_(models.Task.video_url.isnot(None), models.Task.video_ref.is_(None))
+                    )
+                ).order_by(models.Task.id).limit(self.batch_size).all()
+                if not tasks:
+                    return
+
+                for task in tasks:
+                    for field in ("image", "video"):
+                        url = getattr(task, f"{field}_url")
+                        if url and getattr(task, f"{field}_ref") is None:
+                            setattr(task, f"{field}_ref", parse_media_url(url).to_dict())
+                            self.status["references_written"] += 1
+                    self.status["tasks_updated"] += 1
+
+                db.commit()
+                last_id = tasks[-1].id
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+
+# Create job instance
+media_reference_backfill = MediaReferenceBackfill()
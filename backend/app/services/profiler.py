@@ -0,0 +1,261 @@
+"""
+On-demand CPU and memory profiling of the running process
+
+SamplingProfiler is a statistical profiler: a background thread reads
+every thread's Python stack with sys._current_frames() at a fixed
+interval and counts identical stacks. Nothing is hooked into the code
+being profiled, so the cost is the sampler's own walk of the stacks
+(reported as sampling_seconds) and it stops when the time is up.
+Sampling is by wall clock, so an idle event loop shows up waiting in
+its selector. Samples can be limited to stacks with one of a set of
+endpoint functions on them; an async endpoint is then seen only while
+its own code runs, not while it awaits.
+Results export as collapsed stacks (flamegraph.pl, speedscope, etc.)
+or speedscope JSON.
+
+MemoryTracker wraps tracemalloc, which does slow every allocation down
+while it is tracing; it runs only between explicit start and stop calls.
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from types import CodeType
+from typing import Dict, Iterable, Optional, Set
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_DEPTH = 128
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(BACKEND_DIR + os.sep):
+        return os.path.relpath(filename, BACKEND_DIR)
+    marker = f"site-packages{os.sep}"
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return filename
+
+
+def frame_label(code: CodeType) -> str:
+    """e.g. "FileUploadService.save_image (app/services/file_service.py:194)" """
+    name = getattr(code, "co_qualname", code.co_name)
+    # Semicolons separate frames in the collapsed format
+    return f"{name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Samples Python stacks of every thread for a fixed time"""
+
+    def __init__(self):
+        self.max_seconds = settings.PROFILING_MAX_SECONDS
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # (thread name, outermost code, ..., innermost code) -> samples
+        self.stacks: Counter = Counter()
+        self.status = {"state": "idle"}
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval_ms: float = 10, route: Optional[str] = None,
+              endpoints: Optional[Iterable[CodeType]] = None) -> dict:
+        """Sample for `seconds`; with endpoints, only stacks running one of them count"""
+        if self.is_running:
+            return self.status
+
+        self.stacks = Counter()
+        self._stop.clear()
+        self.status = {
+            "state": "running",
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "seconds": seconds,
+            "interval_ms": interval_ms,
+            "route": route,
+            "samples": 0,
+            "stacks": 0,
+            "sampling_seconds": 0.0
+        }
+        targets = set(endpoints) if endpoints else None
+        self._thread = threading.Thread(
+            target=self._run, args=(seconds, interval_ms / 1000, targets), name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Sampling profiler started for {seconds}s every {interval_ms}ms"
+                    + (f" on {route}" if route else ""))
+        return self.status
+
+    def stop(self) -> dict:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.status
+
+    def _sample(self, targets: Optional[Set[CodeType]]) -> int:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        recorded = 0
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            if targets is not None and targets.isdisjoint(stack):
+                continue
+            stack.reverse()
+            self.stacks[(names.get(ident, str(ident)), *stack)] += 1
+            recorded += 1
+        return recorded
+
+    def _run(self, seconds: float, interval: float, targets: Optional[Set[CodeType]]) -> None:
+        deadline = time.monotonic() + seconds
+        try:
+            while not self._stop.is_set() and time.monotonic() < deadline:
+                started = time.perf_counter()
+                self.status["samples"] += self._sample(targets)
+                self.status["sampling_seconds"] += time.perf_counter() - started
+                self._stop.wait(interval)
+            self.status["state"] = "completed" if not self._stop.is_set() else "stopped"
+        except Exception as e:
+            logger.error(f"Sampling profiler failed: {str(e)}")
+            self.status["state"] = "failed"
+            self.status["error"] = str(e)
+        finally:
+            self.status["stacks"] = len(self.stacks)
+            self.status["sampling_seconds"] = round(self.status["sampling_seconds"], 4)
+            self.status["finished_at"] = datetime.utcnow().isoformat()
+
+    def collapsed(self) -> str:
+        """One "thread;outer;...;inner count" line per distinct stack"""
+        labels: Dict[CodeType, str] = {}
+        lines = []
+        for (thread_name, *codes), count in self.stacks.most_common():
+            frames = [f"thread {thread_name}".replace(";", ":")]
+            for code in codes:
+                if code not in labels:
+                    labels[code] = frame_label(code)
+                frames.append(labels[code])
+            lines.append(f"{';'.join(frames)} {count}")
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def speedscope(self) -> dict:
+        """The samples as a speedscope "sampled" profile, weighted in milliseconds"""
+        interval_ms = self.status.get("interval_ms", 10)
+        frames, index = [], {}
+
+        def frame_index(key, name: str, file: Optional[str] = None, line: Optional[int] = None) -> int:
+            if key not in index:
+                index[key] = len(frames)
+                frames.append({"name": name, **({"file": file, "line": line} if file else {})})
+            return index[key]
+
+        samples, weights = [], []
+        for (thread_name, *codes), count in self.stacks.most_common():
+            stack = [frame_index(("thread", thread_name), f"thread {thread_name}")]
+            for code in codes:
+                stack.append(frame_index(code, getattr(code, "co_qualname", code.co_name),
+                                         _short_path(code.co_filename), code.co_firstlineno))
+            samples.append(stack)
+            weights.append(count * interval_ms)
+
+        total = sum(weights)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"RestroManage backend {self.status.get('started_at', '')}",
+            "exporter": "app.services.profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.status.get("route") or "all threads",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+
+
+class MemoryTracker:
+    """tracemalloc snapshots, each compared against the previous one"""
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self.status = {"state": "idle"}
+
+    @property
+    def is_tracing(self) -> bool:
+        return self._baseline is not None and tracemalloc.is_tracing()
+
+    @staticmethod
+    def _take_snapshot() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    async def start(self, frames: int = 10) -> dict:
+        """Start tracing and take the baseline snapshot"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        loop = asyncio.get_event_loop()
+        self._baseline = await loop.run_in_executor(None, self._take_snapshot)
+        self.status = {
+            "state": "tracing",
+            "started_at": datetime.utcnow().isoformat(),
+            "frames": tracemalloc.get_traceback_limit(),
+            "snapshots": 0
+        }
+        return self.status
+
+    def _diff(self, key_type: str, limit: int, reset: bool) -> dict:
+        snapshot = self._take_snapshot()
+        stats = snapshot.compare_to(self._baseline, key_type)
+        if reset:
+            self._baseline = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced_bytes": current,
+            "peak_traced_bytes": peak,
+            "size_diff": sum(stat.size_diff for stat in stats),
+            "top": [
+                {
+                    "location": [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback],
+                    "size_diff": stat.size_diff,
+                    "size": stat.size,
+                    "count_diff": stat.count_diff,
+                    "count": stat.count
+                }
+                for stat in stats[:limit]
+            ]
+        }
+
+    async def diff(self, key_type: str = "lineno", limit: int = 25, reset: bool = True) -> dict:
+        """Largest allocation changes since the previous snapshot, biggest growth first"""
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(None, self._diff, key_type, limit, reset)
+        self.status["snapshots"] += 1
+        return result
+
+    def stop(self) -> dict:
+        tracemalloc.stop()
+        self._baseline = None
+        self.status = {**self.status, "state": "stopped", "stopped_at": datetime.utcnow().isoformat()}
+        return self.status
+
+
+# Create profiler instances
+sampling_profiler = SamplingProfiler()
+memory_tracker = MemoryTracker()
@@ -0,0 +1,267 @@
+import os
+import json
+import uuid
+import shutil
+import asyncio
+import aiofiles
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+from fastapi import HTTPException, status
+from app.config import settings
+from app.services import media_metadata
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _append_file(src_path: str, dst_path: str) -> None:
+    """Append src to dst inside the kernel, without copying through user space"""
+    with open(src_path, 'rb') as src, open(dst_path, 'r+b') as dst:
+        size = os.fstat(src.fileno()).st_size
+        start = dst.seek(0, os.SEEK_END)
+        copied = 0
+        try:
+            while copied < size:
+                if hasattr(os, "copy_file_range"):
+                    n = os.copy_file_range(src.fileno(), dst.fileno(), size - copied, copied, start + copied)
+                else:
+                    n = os.sendfile(dst.fileno(), src.fileno(), copied, size - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            # Filesystem does not support in-kernel copies - fall back to a buffered copy
+            src.seek(copied)
+            dst.seek(start + copied)
+            shutil.copyfileobj(src, dst)
+
+
+class ResumableUploadService:
+    """tus-style resumable uploads staged on local disk
+
+    Each session lives in its own directory holding an info.json and the
+    bytes assembled so far. A PATCH body is first written to a chunk file
+    and only appended to the assembled data once it has fully arrived, so
+    a connection that drops mid-chunk never corrupts the upload offset.
+    """
+
+    def __init__(self):
+        # Staged outside UPLOAD_DIRECTORY, which is served publicly at /uploads
+        self.sessions_dir = settings.RESUMABLE_UPLOAD_DIRECTORY
+        self.max_upload_size = settings.MAX_RESUMABLE_UPLOAD_SIZE
+        self.expiry = timedelta(hours=settings.RESUMABLE_UPLOAD_EXPIRY_HOURS)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        os.makedirs(self.sessions_dir, exist_ok=True)
+        self._move_legacy_sessions(os.path.join(settings.UPLOAD_DIRECTORY, "resumable"))
+
+    def _move_legacy_sessions(self, legacy_dir: str) -> None:
+        """Move sessions staged under the public upload directory by earlier versions"""
+        if not os.path.isdir(legacy_dir) or os.path.realpath(legacy_dir) == os.path.realpath(self.sessions_dir):
+            return
+        for entry in os.scandir(legacy_dir):
+            try:
+                shutil.move(entry.path, os.path.join(self.sessions_dir, entry.name))
+            except OSError as e:
+                logger.warning(f"Failed to move resumable upload session {entry.name}: {str(e)}")
+        shutil.rmtree(legacy_dir, ignore_errors=True)
+
+    def _session_dir(self, upload_id: str) -> str:
+        # upload ids are generated by us; reject anything that could escape the directory
+        try:
+            uuid.UUID(upload_id)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+        return os.path.join(self.sessions_dir, upload_id)
+
+    def _info_path(self, upload_id: str) -> str:
+        return os.path.join(self._session_dir(upload_id), "info.json")
+
+    def data_path(self, upload_id: str) -> str:
+        return os.path.join(self._session_dir(upload_id), "data")
+
+    def _write_info(self, info: dict) -> None:
+        """Persist session state atomically"""
+        path = self._info_path(info["upload_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp_path, path)
+
+    def lock(self, upload_id: str) -> asyncio.Lock:
+        """Serializes appends and finalization of one session"""
+        if upload_id not in self._locks:
+            self._locks[upload_id] = asyncio.Lock()
+        return self._locks[upload_id]
+
+    def create_session(self, task_id: int, restaurant_id: int, filename: str,
+                       content_type: str, length: int) -> dict:
+        """Start a new upload session"""
+        if length <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Upload length must be greater than zero"
+            )
+        if length > self.max_upload_size:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Upload length {length} exceeds maximum allowed size {self.max_upload_size}"
+            )
+
+        upload_id = str(uuid.uuid4())
+        os.makedirs(self._session_dir(upload_id))
+        open(self.data_path(upload_id), 'wb').close()
+
+        now = datetime.utcnow()
+        info = {
+            "upload_id": upload_id,
+            "task_id": task_id,
+            "restaurant_id": restaurant_id,
+            "filename": filename,
+            "content_type": content_type,
+            "length": length,
+            "offset": 0,
+            "created_at": now.isoformat(),
+            "expires_at": (now + self.expiry).isoformat()
+        }
+        self._write_info(info)
+        return info
+
+    def get_session(self, upload_id: str, restaurant_id: Optional[int] = None) -> dict:
+        """Load a session, hiding sessions that belong to another restaurant"""
+        try:
+            with open(self._info_path(upload_id)) as f:
+                info = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+
+        if restaurant_id is not None and info["restaurant_id"] != restaurant_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+        if datetime.fromisoformat(info["expires_at"]) < datetime.utcnow():
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail="Upload session expired")
+        return info
+
+    async def append_chunk(self, upload_id: str, restaurant_id: int, offset: int,
+                           chunks: AsyncIterator[bytes]) -> dict:
+        """Append a PATCH body at the given offset and return the updated session"""
+        async with self.lock(upload_id):
+            info = self.get_session(upload_id, restaurant_id)
+            if offset != info["offset"]:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Upload-Offset {offset} does not match current offset {info['offset']}"
+                )
+
+            remaining = info["length"] - info["offset"]
+            chunk_path = os.path.join(self._session_dir(upload_id), f"chunk-{offset}.part")
+            received = 0
+            # The first bytes of the upload decide its type, so bad files stop here
+            head = b"" if offset == 0 else None
+            sniff_length = min(media_metadata.SNIFF_BYTES, info["length"])
+            try:
+                async with aiofiles.open(chunk_path, 'wb') as chunk_file:
+                    async for data in chunks:
+                        received += len(data)
+                        if received > remaining:
+                            raise HTTPException(
+                                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail="Chunk exceeds the declared upload length"
+                            )
+                        if head is not None:
+                            head += data[:sniff_length - len(head)]
+                            if len(head) >= sniff_length:
+                                self._check_type(head)
+                                head = None
+                        await chunk_file.write(data)
+
+                data_path = self.data_path(upload_id)
+                loop = asyncio.get_event_loop()
+
+                # Drop any bytes left behind by a crash between append and info update
+                if os.path.getsize(data_path) != info["offset"]:
+                    os.truncate(data_path, info["offset"])
+                await loop.run_in_executor(None, _append_file, chunk_path, data_path)
+            finally:
+                if os.path.exists(chunk_path):
+                    os.remove(chunk_path)
+
+            info["offset"] += received
+            self._write_info(info)
+            return info
+
+    def _check_type(self, head: bytes) -> None:
+        """Reject an upload whose first bytes are not an allowed video type"""
+        detected_type = media_metadata.sniff_type(head)
+        if not media_metadata.is_allowed(detected_type, settings.ALLOWED_VIDEO_TYPES):
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Upload content ({detected_type or 'unknown'}) is not an allowed video type"
+            )
+
+    def complete_session(self, upload_id: str, restaurant_id: int) -> dict:
+        """Check that every byte has arrived before the upload is finalized"""
+        info = self.get_session(upload_id, restaurant_id)
+        if info["offset"] != info["length"]:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload incomplete: {info['offset']} of {info['length']} bytes received"
+            )
+        return info
+
+    def delete_session(self, upload_id: str) -> None:
+        """Remove a session and any staged bytes"""
+        shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+        self._locks.pop(upload_id, None)
+
+    def _expired_sessions(self) -> List[str]:
+        """Directory names of sessions past their expiry time"""
+        expired = []
+        now = datetime.utcnow()
+        for entry in os.scandir(self.sessions_dir):
+            if not entry.is_dir():
+                continue
+            try:
+                with open(os.path.join(entry.path, "info.json")) as f:
+                    expires_at = datetime.fromisoformat(json.load(f)["expires_at"])
+            except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError):
+                # Half-created session - judge it by its age instead
+                expires_at = datetime.utcfromtimestamp(entry.stat().st_mtime) + self.expiry
+            if expires_at < now:
+                expired.append(entry.name)
+        return expired
+
+    async def cleanup_expired(self) -> int:
+        """Delete sessions past their expiry time"""
+        loop = asyncio.get_event_loop()
+        expired = []
+        for name in await loop.run_in_executor(None, self._expired_sessions):
+            # Leave sessions alone while a request is working on them
+            lock = self._locks.get(name)
+            if lock is not None and lock.locked():
+                continue
+            self._locks.pop(name, None)
+            expired.append(os.path.join(self.sessions_dir, name))
+
+        # Locks taken for ids whose session is already gone (e.g. a repeated finalize)
+        for name, lock in list(self._locks.items()):
+            if not lock.locked() and not os.path.isdir(os.path.join(self.sessions_dir, name)):
+                self._locks.pop(name, None)
+
+        await loop.run_in_executor(
+            None, lambda: [shutil.rmtree(path, ignore_errors=True) for path in expired]
+        )
+        return len(expired)
+
+    async def run_janitor(self, interval_seconds: int = 600) -> None:
+        """Periodically remove expired upload sessions"""
+        while True:
+            try:
+                removed = await self.cleanup_expired()
+                if removed:
+                    logger.info(f"Removed {removed} expired resumable upload sessions")
+            except Exception as e:
+                logger.error(f"Resumable upload janitor failed: {str(e)}")
+            await asyncio.sleep(interval_seconds)
+
+
+# Create service instance
+resumable_upload_service = ResumableUploadService()
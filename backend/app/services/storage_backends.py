@@ -0,0 +1,701 @@
+import os
+import glob
+import time
+import uuid
+import shutil
+import asyncio
+import calendar
+import hashlib
+import mimetypes
+import posixpath
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+import cloudinary
+import cloudinary.exceptions
+from cloudinary.utils import build_eager, cloudinary_api_url, cloudinary_url, sign_request
+from app.config import settings
+from app.services.image_pipeline import ProcessedImage
+from app.services.circuit_breaker import cloudinary_breaker
+from app.services.cloudinary_client import cloudinary_client
+from app.services.cloudinary_metadata import cloudinary_metadata
+from app.media_references import (
+    IMAGE_RENDITIONS, RENDITIONS, VIDEO_RENDITIONS, VIDEO_RENDITION_FORMAT
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# boto3 is only needed when the S3 backend is selected
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+# Uploaded objects are written once under a unique key and never modified
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class StoredObject:
+    """Where a backend put an object, in the terms MediaFile records it"""
+    key: str
+    file_path: str
+    file_size: int
+    storage_type: str
+    file_url: Optional[str] = None
+    cloudinary_id: Optional[str] = None
+    renditions: Optional[Dict[str, str]] = None  # Rendition name -> URL (local: file path)
+    width: Optional[int] = None
+    height: Optional[int] = None
+
+
+def _resource_type(content_type: str) -> str:
+    return "video" if content_type and content_type.startswith("video/") else "image"
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class StorageBackend(ABC):
+    """Interface every media store implements
+
+    Keys are backend independent (``task_completions/<task_id>/<filename>``);
+    ``file_path`` is the backend's own locator that MediaFile rows keep.
+    Cloudinary is called through the async CloudinaryClient; the local and
+    S3 backends run their blocking file and boto3 calls in the default
+    executor (``_run``), so the event loop is never held up by storage I/O.
+    """
+
+    storage_type: str = ""
+    batch_delete_size: int = 100
+
+    @abstractmethod
+    async def put(self, key: str, content: bytes, content_type: str) -> StoredObject:
+        """Store bytes held in memory"""
+
+    @abstractmethod
+    async def put_file(self, key: str, source_path: str, content_type: str,
+                       move: bool = False) -> StoredObject:
+        """Stream a file from disk without reading it into memory"""
+
+    @abstractmethod
+    async def get(self, file_path: str, resource_type: str = "image") -> bytes:
+        """Read an object back"""
+
+    async def stream(self, file_path: str, resource_type: str = "image") -> AsyncIterator[bytes]:
+        """Read an object back in chunks; backends that can avoid buffering it override this"""
+        yield await self.get(file_path, resource_type)
+
+    @abstractmethod
+    async def delete(self, file_path: str, resource_type: str = "image") -> bool:
+        """Delete one object, returning False if it did not exist"""
+
+    @abstractmethod
+    async def delete_many(self, file_paths: List[str], resource_type: str = "image") -> int:
+        """Delete several objects in as few calls as the store allows"""
+
+    @abstractmethod
+    def url(self, file_path: str, base_url: Optional[str] = None,
+            resource_type: str = "image") -> str:
+        """Public URL for an object"""
+
+    @abstractmethod
+    async def inspect(self, key: str, head_size: int) -> Optional[Tuple[StoredObject, bytes]]:
+        """A directly uploaded object and its first bytes, or None if nothing was uploaded"""
+
+    @abstractmethod
+    async def check(self) -> dict:
+        """Verify the store is reachable and writable"""
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+
+def _write_file(path: str, content: bytes) -> None:
+    """Write via a temporary name so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _place_file(source_path: str, path: str, move: bool) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if move:
+        try:
+            # Same filesystem: a rename, no bytes copied
+            os.replace(source_path, path)
+            return
+        except OSError:
+            pass
+    # copyfile uses sendfile(2) on Linux
+    shutil.copyfile(source_path, path)
+    if move:
+        os.remove(source_path)
+
+
+def _remove_file(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+# Local renditions sit next to their source as <stem>@<name><ext>
+RENDITION_SEPARATOR = "@"
+
+
+def is_rendition(path: str) -> bool:
+    return RENDITION_SEPARATOR in os.path.basename(path)
+
+
+def _remove_with_renditions(path: str) -> bool:
+    stem = os.path.splitext(path)[0]
+    for rendition_path in glob.glob(f"{glob.escape(stem)}{RENDITION_SEPARATOR}*"):
+        _remove_file(rendition_path)
+    return _remove_file(path)
+
+
+class LocalStorageBackend(StorageBackend):
+    """Files under UPLOAD_DIRECTORY, served by the /uploads mount
+
+    In the sharded layout a key such as ``task_completions/12/<file>`` is
+    stored under ``media/<aa>/<bb>/task_completions/12/<file>``, where the
+    shard directories come from a hash of the key's directory. Files of one
+    task stay together while no directory grows beyond a few hundred
+    entries. The flat layout stores the key as-is, as uploads used to be.
+    """
+
+    storage_type = "local"
+    sharded_prefix = "media"
+
+    def __init__(self, root: Optional[str] = None, layout: Optional[str] = None,
+                 shard_depth: Optional[int] = None):
+        self.root = root or settings.UPLOAD_DIRECTORY
+        self.layout = layout or settings.LOCAL_STORAGE_LAYOUT
+        self.shard_depth = shard_depth or settings.LOCAL_STORAGE_SHARD_DEPTH
+
+    def _shards(self, key: str) -> List[str]:
+        digest = hashlib.sha256(posixpath.dirname(key).encode()).hexdigest()
+        return [digest[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+
+    def flat_path_for(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def sharded_path_for(self, key: str) -> str:
+        return os.path.join(self.root, self.sharded_prefix, *self._shards(key), *key.split("/"))
+
+    def path_for(self, key: str) -> str:
+        if self.layout == "sharded":
+            return self.sharded_path_for(key)
+        return self.flat_path_for(key)
+
+    def locate(self, key: str) -> Optional[str]:
+        """Find an existing file for a key in either layout"""
+        for path in (self.sharded_path_for(key), self.flat_path_for(key)):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def iter_directories(self, prefix: str) -> Iterator[str]:
+        """Lazily yield every directory directly under a key prefix, in both layouts"""
+        flat_base = self.flat_path_for(prefix)
+        if os.path.isdir(flat_base):
+            for entry in os.scandir(flat_base):
+                if entry.is_dir():
+                    yield entry.path
+
+        def walk_shards(path: str, depth: int) -> Iterator[str]:
+            if depth == self.shard_depth:
+                base = os.path.join(path, *prefix.split("/"))
+                if os.path.isdir(base):
+                    for entry in os.scandir(base):
+                        if entry.is_dir():
+                            yield entry.path
+                return
+            for entry in os.scandir(path):
+                if entry.is_dir() and len(entry.name) == 2:
+                    yield from walk_shards(entry.path, depth + 1)
+
+        sharded_base = os.path.join(self.root, self.sharded_prefix)
+        if os.path.isdir(sharded_base):
+            yield from walk_shards(sharded_base, 0)
+
+    async def put(self, key: str, content: bytes, content_type: str) -> StoredObject:
+        # One executor hop for open/write/rename instead of one per aiofiles call
+        path = self.path_for(key)
+        await self._run(_write_file, path, content)
+        return StoredObject(key=key, file_path=path, file_size=len(content), storage_type=self.storage_type)
+
+    async def put_file(self, key: str, source_path: str, content_type: str,
+                       move: bool = False) -> StoredObject:
+        path = self.path_for(key)
+        file_size = os.path.getsize(source_path)
+        await self._run(_place_file, source_path, path, move)
+        return StoredObject(key=key, file_path=path, file_size=file_size, storage_type=self.storage_type)
+
+    def rendition_path(self, file_path: str, name: str, extension: str) -> str:
+        return f"{os.path.splitext(file_path)[0]}{RENDITION_SEPARATOR}{name}{extension}"
+
+    async def put_renditions(self, file_path: str, renditions: Dict[str, ProcessedImage]) -> Dict[str, str]:
+        """Write encoded renditions next to a stored file; returns name -> file path"""
+        paths = {name: self.rendition_path(file_path, name, image.extension) for name, image in renditions.items()}
+
+        def write_all():
+            for name, image in renditions.items():
+                _write_file(paths[name], image.content)
+
+        await self._run(write_all)
+        return paths
+
+    async def get(self, file_path: str, resource_type: str = "image") -> bytes:
+        return await self._run(_read_file, file_path)
+
+    async def stream(self, file_path: str, resource_type: str = "image") -> AsyncIterator[bytes]:
+        f = await self._run(open, file_path, 'rb')
+        try:
+            while True:
+                chunk = await self._run(f.read, STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            f.close()
+
+    async def inspect(self, key: str, head_size: int) -> Optional[Tuple[StoredObject, bytes]]:
+        path = self.path_for(key)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            head = f.read(head_size)
+        stored = StoredObject(key=key, file_path=path, file_size=os.path.getsize(path), storage_type=self.storage_type)
+        return stored, head
+
+    async def delete(self, file_path: str, resource_type: str = "image") -> bool:
+        return await self._run(_remove_with_renditions, file_path)
+
+    async def delete_many(self, file_paths: List[str], resource_type: str = "image") -> int:
+        return await self._run(lambda: sum(_remove_with_renditions(path) for path in file_paths))
+
+    def url(self, file_path: str, base_url: Optional[str] = None,
+            resource_type: str = "image") -> str:
+        # Convert path to one relative to the upload directory
+        relative_path = os.path.relpath(file_path, self.root)
+        return f"{base_url or ''}/uploads/{relative_path.replace(os.sep, '/')}"
+
+    async def check(self) -> dict:
+        os.makedirs(self.root, exist_ok=True)
+        if not os.access(self.root, os.W_OK):
+            return {"status": "error", "message": f"Upload directory {self.root} is not writable"}
+        usage = shutil.disk_usage(self.root)
+        return {
+            "status": "success",
+            "message": f"Local storage writable at {os.path.abspath(self.root)}",
+            "free_bytes": usage.free
+        }
+
+
+class CloudinaryStorageBackend(StorageBackend):
+    """Cloudinary media library; the public_id is the key without its extension"""
+
+    storage_type = "cloudinary"
+    batch_delete_size = 100  # Admin API limit per delete_resources call
+    list_page_size = 500  # Admin API limit per resources call
+
+    def __init__(self):
+        # Admin API calls are rate limited per hour; keep some budget for the app
+        self.rate_limit_reserve = settings.CLOUDINARY_ADMIN_RATE_LIMIT_RESERVE
+        self.rate_limit_remaining: Optional[int] = None
+        self.rate_limit_reset_at: Optional[float] = None
+
+    async def _call(self, request, timed: bool = True):
+        # Every API call goes through the breaker, so an outage fails fast
+        # instead of each caller waiting out the request timeout
+        with cloudinary_breaker.guard(timed=timed):
+            return await request()
+
+    async def _admin_call(self, func, **options):
+        """Call the Admin API, pausing until the window resets when the budget runs low"""
+        for attempt in range(4):
+            if (self.rate_limit_remaining is not None and self.rate_limit_reset_at
+                    and self.rate_limit_remaining <= self.rate_limit_reserve):
+                wait = self.rate_limit_reset_at - time.time()
+                if wait > 0:
+                    logger.warning(f"Cloudinary Admin API budget low ({self.rate_limit_remaining} left), "
+                                   f"waiting {wait:.0f}s for the limit to reset")
+                    await asyncio.sleep(wait)
+                self.rate_limit_remaining = None
+
+            try:
+                response = await self._call(lambda: func(**options))
+            except cloudinary.exceptions.RateLimited:
+                backoff = 30 * 2 ** attempt
+                logger.warning(f"Cloudinary Admin API rate limited, retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                continue
+
+            if getattr(response, "rate_limit_remaining", None) is not None:
+                self.rate_limit_remaining = response.rate_limit_remaining
+            if getattr(response, "rate_limit_reset_at", None):
+                self.rate_limit_reset_at = calendar.timegm(response.rate_limit_reset_at)
+            return response
+        raise cloudinary.exceptions.RateLimited("Cloudinary Admin API rate limit exceeded")
+
+    async def list_resources(self, prefix: str, resource_type: str = "image") -> AsyncIterator[dict]:
+        """Page through every uploaded asset under a folder prefix"""
+        next_cursor = None
+        while True:
+            options = {
+                "type": "upload",
+                "prefix": prefix,
+                "resource_type": resource_type,
+                "max_results": self.list_page_size
+            }
+            if next_cursor:
+                options["next_cursor"] = next_cursor
+            response = await self._admin_call(cloudinary_client.resources, **options)
+            for resource in response.get("resources", []):
+                yield resource
+            next_cursor = response.get("next_cursor")
+            if not next_cursor:
+                return
+
+    def _public_id(self, key: str) -> str:
+        return os.path.splitext(key)[0]
+
+    @staticmethod
+    def _rendition_transformations(resource_type: str) -> Dict[str, dict]:
+        names = VIDEO_RENDITIONS if resource_type == "video" else IMAGE_RENDITIONS
+        transformations = {}
+        for name in names:
+            width, height, crop = RENDITIONS[name]
+            transformation = {"width": width, "height": height, "crop": crop}
+            if resource_type == "video":
+                transformation["format"] = VIDEO_RENDITION_FORMAT
+            transformations[name] = transformation
+        return transformations
+
+    @classmethod
+    def eager_options(cls, resource_type: str) -> dict:
+        """Upload options that have Cloudinary derive our renditions up front
+
+        Video frames are derived asynchronously so uploads do not wait on
+        video processing; their URLs are deterministic either way.
+        """
+        return {
+            "eager": list(cls._rendition_transformations(resource_type).values()),
+            "eager_async": resource_type == "video"
+        }
+
+    @classmethod
+    def renditions_from_result(cls, result: dict, resource_type: str) -> Dict[str, str]:
+        """Delivery URLs of the eager renditions for an upload response"""
+        return {
+            name: cloudinary_url(
+                result["public_id"],
+                resource_type=resource_type,
+                version=result.get("version"),
+                format=transformation.get("format", result.get("format")),
+                secure=True,
+                **{k: v for k, v in transformation.items() if k != "format"}
+            )[0]
+            for name, transformation in cls._rendition_transformations(resource_type).items()
+        }
+
+    def _stored(self, key: str, result: dict) -> StoredObject:
+        cloudinary_metadata.remember(result)
+        return StoredObject(
+            key=key,
+            file_path=result["public_id"],
+            file_size=result["bytes"],
+            storage_type=self.storage_type,
+            file_url=result["secure_url"],
+            cloudinary_id=result["public_id"],
+            renditions=self.renditions_from_result(result, result.get("resource_type", "image")),
+            width=result.get("width"),
+            height=result.get("height")
+        )
+
+    def signed_upload(self, key: str, content_type: str, notification_url: Optional[str] = None) -> dict:
+        """Form fields for a signed upload the client posts to Cloudinary itself
+
+        The signature covers the public_id, so a client can only upload the
+        object it was given; Cloudinary rejects the fields after an hour.
+        """
+        resource_type = _resource_type(content_type)
+        eager = self.eager_options(resource_type)
+        params = {
+            "public_id": self._public_id(key),
+            "timestamp": int(time.time()),
+            "eager": build_eager(eager["eager"]),
+            "eager_async": eager["eager_async"],
+            "notification_url": notification_url
+        }
+        return {
+            "method": "POST",
+            "upload_url": cloudinary_api_url("upload", resource_type=resource_type),
+            "fields": {name: str(value) for name, value in sign_request(params, {}).items()}
+        }
+
+    def _upload_options(self, key: str, content_type: str) -> dict:
+        resource_type = _resource_type(content_type)
+        options = {"public_id": self._public_id(key), "resource_type": resource_type}
+        if resource_type == "video":
+            options["quality"] = "auto:good"
+        options.update(self.eager_options(resource_type))
+        return options
+
+    async def put(self, key: str, content: bytes, content_type: str) -> StoredObject:
+        options = self._upload_options(key, content_type)
+        result = await self._call(lambda: cloudinary_client.upload(content, **options))
+        return self._stored(key, result)
+
+    async def put_file(self, key: str, source_path: str, content_type: str,
+                       move: bool = False) -> StoredObject:
+        options = self._upload_options(key, content_type)
+        options.pop("quality", None)
+        # upload_large streams the file in chunks instead of one request body
+        result = await self._call(lambda: cloudinary_client.upload_large(source_path, **options), timed=False)
+        if move:
+            os.remove(source_path)
+        return self._stored(key, result)
+
+    async def get(self, file_path: str, resource_type: str = "image") -> bytes:
+        # Delivery requests share the API client's pooled connections
+        response = await cloudinary_client.client.get(self.url(file_path, resource_type=resource_type))
+        response.raise_for_status()
+        return response.content
+
+    async def stream(self, file_path: str, resource_type: str = "image") -> AsyncIterator[bytes]:
+        async with cloudinary_client.client.stream("GET", self.url(file_path, resource_type=resource_type)) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                yield chunk
+
+    async def inspect(self, key: str, head_size: int) -> Optional[Tuple[StoredObject, bytes]]:
+        resource_type = _resource_type(mimetypes.guess_type(key)[0])
+        try:
+            result = await self._admin_call(
+                cloudinary_client.resource, public_id=self._public_id(key), resource_type=resource_type
+            )
+        except cloudinary.exceptions.NotFound:
+            return None
+        stored = self._stored(key, result)
+        if head_size <= 0:
+            return stored, b""
+        response = await cloudinary_client.client.get(stored.file_url, headers={"Range": f"bytes=0-{head_size - 1}"})
+        response.raise_for_status()
+        return stored, response.content[:head_size]
+
+    async def delete(self, file_path: str, resource_type: str = "image") -> bool:
+        result = await self._call(
+            lambda: cloudinary_client.destroy(file_path, resource_type=resource_type, invalidate=True)
+        )
+        cloudinary_metadata.forget(resource_type, file_path)
+        return result.get("result") == "ok"
+
+    async def delete_many(self, file_paths: List[str], resource_type: str = "image") -> int:
+        deleted = 0
+        for chunk in _chunks(list(file_paths), self.batch_delete_size):
+            result = await self._admin_call(
+                cloudinary_client.delete_resources,
+                public_ids=chunk,
+                resource_type=resource_type,
+                invalidate=True
+            )
+            for public_id in chunk:
+                cloudinary_metadata.forget(resource_type, public_id)
+            deleted += sum(1 for state in result.get("deleted", {}).values() if state == "deleted")
+        return deleted
+
+    def url(self, file_path: str, base_url: Optional[str] = None,
+            resource_type: str = "image") -> str:
+        return cloudinary_url(file_path, resource_type=resource_type, secure=True)[0]
+
+    async def check(self) -> dict:
+        await self._call(cloudinary_client.ping)
+        return {
+            "status": "success",
+            "message": f"Connected to Cloudinary cloud: {settings.CLOUDINARY_CLOUD_NAME}"
+        }
+
+
+class S3StorageBackend(StorageBackend):
+    """S3-compatible object storage (AWS S3, MinIO, R2, ...)"""
+
+    storage_type = "s3"
+    batch_delete_size = 1000  # DeleteObjects limit per request
+
+    def __init__(self, bucket: Optional[str] = None, endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, access_key_id: Optional[str] = None,
+                 secret_access_key: Optional[str] = None, public_base_url: Optional[str] = None):
+        if boto3 is None:
+            raise RuntimeError("The S3 storage backend requires boto3 (pip install boto3)")
+
+        self.bucket = bucket or settings.S3_BUCKET
+        self.endpoint_url = endpoint_url or settings.S3_ENDPOINT_URL or None
+        self.region = region or settings.S3_REGION
+        self.public_base_url = (public_base_url or settings.S3_PUBLIC_BASE_URL).rstrip("/")
+        if not self.bucket:
+            raise RuntimeError("S3_BUCKET is not configured")
+
+        # boto3 clients are thread-safe; one client shares its connection pool
+        # across every executor thread
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=self.endpoint_url,
+            region_name=self.region,
+            aws_access_key_id=access_key_id or settings.S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=secret_access_key or settings.S3_SECRET_ACCESS_KEY or None,
+            config=BotoConfig(
+                max_pool_connections=32,
+                retries={"max_attempts": 3, "mode": "standard"},
+                # MinIO and most self-hosted stand-ins only understand path-style URLs
+                s3={"addressing_style": "path" if self.endpoint_url else "auto"}
+            )
+        )
+
+    def _stored(self, key: str, file_size: int) -> StoredObject:
+        return StoredObject(
+            key=key,
+            file_path=key,
+            file_size=file_size,
+            storage_type=self.storage_type,
+            file_url=self.url(key)
+        )
+
+    async def put(self, key: str, content: bytes, content_type: str) -> StoredObject:
+        await self._run(lambda: self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=content,
+            ContentType=content_type,
+            CacheControl=IMMUTABLE_CACHE_CONTROL
+        ))
+        return self._stored(key, len(content))
+
+    async def put_file(self, key: str, source_path: str, content_type: str,
+                       move: bool = False) -> StoredObject:
+        file_size = os.path.getsize(source_path)
+        # upload_file switches to parallel multipart uploads for large files
+        await self._run(lambda: self.client.upload_file(
+            source_path,
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL}
+        ))
+        if move:
+            os.remove(source_path)
+        return self._stored(key, file_size)
+
+    async def get(self, file_path: str, resource_type: str = "image") -> bytes:
+        def read():
+            return self.client.get_object(Bucket=self.bucket, Key=file_path)["Body"].read()
+        return await self._run(read)
+
+    def presigned_put(self, key: str, content_type: str, expires_in: int) -> dict:
+        """A URL the client PUTs the object to itself; the signature fixes key and headers"""
+        headers = {"Content-Type": content_type, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        upload_url = self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": key, "ContentType": content_type,
+                    "CacheControl": IMMUTABLE_CACHE_CONTROL},
+            ExpiresIn=expires_in
+        )
+        return {"method": "PUT", "upload_url": upload_url, "headers": headers}
+
+    async def inspect(self, key: str, head_size: int) -> Optional[Tuple[StoredObject, bytes]]:
+        def read_head():
+            try:
+                head = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{head_size - 1}")
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                    return None
+                raise
+            total = int(head["ContentRange"].rsplit("/", 1)[1]) if head.get("ContentRange") else head["ContentLength"]
+            return self._stored(key, total), head["Body"].read()
+        return await self._run(read_head)
+
+    async def stream(self, file_path: str, resource_type: str = "image") -> AsyncIterator[bytes]:
+        body = (await self._run(lambda: self.client.get_object(Bucket=self.bucket, Key=file_path)))["Body"]
+        try:
+            while True:
+                chunk = await self._run(body.read, STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def delete(self, file_path: str, resource_type: str = "image") -> bool:
+        def remove():
+            try:
+                self.client.head_object(Bucket=self.bucket, Key=file_path)
+            except ClientError:
+                return False
+            self.client.delete_object(Bucket=self.bucket, Key=file_path)
+            return True
+        return await self._run(remove)
+
+    async def delete_many(self, file_paths: List[str], resource_type: str = "image") -> int:
+        deleted = 0
+        for chunk in _chunks(list(file_paths), self.batch_delete_size):
+            result = await self._run(lambda: self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": key} for key in chunk], "Quiet": True}
+            ))
+            errors = result.get("Errors", [])
+            for error in errors:
+                logger.warning(f"Failed to delete s3://{self.bucket}/{error.get('Key')}: {error.get('Message')}")
+            deleted += len(chunk) - len(errors)
+        return deleted
+
+    def url(self, file_path: str, base_url: Optional[str] = None,
+            resource_type: str = "image") -> str:
+        key = quote(file_path)
+        if self.public_base_url:
+            return f"{self.public_base_url}/{key}"
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{key}"
+
+    async def check(self) -> dict:
+        await self._run(lambda: self.client.head_bucket(Bucket=self.bucket))
+        return {
+            "status": "success",
+            "message": f"Successfully connected to bucket: {self.bucket}",
+            "endpoint": self.endpoint_url or "aws"
+        }
+
+
+BACKEND_CLASSES = {
+    "local": LocalStorageBackend,
+    "cloudinary": CloudinaryStorageBackend,
+    "s3": S3StorageBackend,
+}
+
+_backends: Dict[str, StorageBackend] = {}
+
+
+def get_storage_backend(storage_type: str) -> StorageBackend:
+    """Shared backend instance for a MediaFile storage_type"""
+    if storage_type not in BACKEND_CLASSES:
+        raise ValueError(f"Unknown storage backend: {storage_type}")
+    if storage_type not in _backends:
+        _backends[storage_type] = BACKEND_CLASSES[storage_type]()
+    return _backends[storage_type]
@@ -0,0 +1,273 @@
+import os
+import json
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+from sqlalchemy.orm import joinedload
+from app.config import settings
+from app.database import SessionLocal
+from app import models, crud
+from app.services.storage_backends import CloudinaryStorageBackend, LocalStorageBackend, is_rendition
+from app.services.circuit_breaker import cloudinary_breaker
+from app.services.cloudinary_client import cloudinary_client
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.avif')
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.avi', '.mov')
+
+
+def _hash_file(file_path: str) -> str:
+    """SHA-256 of a file on disk, read in 1MB blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StorageMigrationJob:
+    """Background migration of local task uploads to Cloudinary
+
+    Progress is checkpointed to an append-only JSON-lines manifest keyed by
+    content hash, so a restarted run skips everything that already made it
+    to Cloudinary instead of starting over.
+    """
+
+    def __init__(self):
+        self.upload_dir = settings.UPLOAD_DIRECTORY
+        self.manifest_path = os.path.join(self.upload_dir, "migration_manifest.jsonl")
+        self.concurrency = settings.STORAGE_MIGRATION_CONCURRENCY
+        self.batch_size = settings.STORAGE_MIGRATION_BATCH_SIZE
+        self._task: Optional[asyncio.Task] = None
+        self._manifest_lock = asyncio.Lock()
+        self._pending_updates = []
+        self.status = {"state": "idle"}
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, task_id: Optional[str] = None, task_ids: Optional[List[str]] = None) -> dict:
+        """Start the migration in the background, of everything or of some tasks only"""
+        if self.is_running:
+            return self.status
+
+        if task_id:
+            task_ids = [task_id]
+        self.status = {
+            "state": "running",
+            "task_id": task_id,
+            "task_ids": task_ids,
+            "started_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "concurrency": self.concurrency,
+            "scanned": 0,
+            "migrated": 0,
+            "skipped": 0,
+            "failed": 0,
+            "bytes_uploaded": 0,
+            "records_updated": 0,
+            "recent_errors": []
+        }
+        self._task = asyncio.create_task(self._run(task_ids))
+        return self.status
+
+    def _load_manifest(self) -> dict:
+        """Content hash -> Cloudinary result for every file already migrated"""
+        migrated = {}
+        if not os.path.exists(self.manifest_path):
+            return migrated
+        with open(self.manifest_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn final line from a crash
+                migrated[entry["content_hash"]] = entry
+        return migrated
+
+    async def _checkpoint(self, entry: dict) -> None:
+        async with self._manifest_lock:
+            with open(self.manifest_path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _walk(self, task_ids: Optional[List[str]]) -> Iterator[Tuple[str, str]]:
+        """Yield (file_path, cloudinary_folder) lazily instead of building lists"""
+        local = LocalStorageBackend(self.upload_dir)
+        if task_ids:
+            task_dirs = []
+            for task_id in task_ids:
+                sample_key = f"task_completions/{task_id}/_"
+                task_dirs += [
+                    os.path.dirname(local.flat_path_for(sample_key)),
+                    os.path.dirname(local.sharded_path_for(sample_key))
+                ]
+        else:
+            # Covers both the flat and the sharded directory layouts
+            task_dirs = local.iter_directories("task_completions")
+
+        for task_dir in task_dirs:
+            if not os.path.isdir(task_dir):
+                continue
+            folder = f"task_completions/{os.path.basename(task_dir)}"
+            for entry in os.scandir(task_dir):
+                # Renditions are derived again by Cloudinary, not migrated
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS) \
+                        and not is_rendition(entry.name):
+                    yield os.path.join(task_dir, entry.name), folder
+
+    async def _run(self, task_ids: Optional[List[str]]) -> None:
+        try:
+            migrated = self._load_manifest()
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+            workers = [asyncio.create_task(self._worker(queue, migrated)) for _ in range(self.concurrency)]
+
+            for item in self._walk(task_ids):
+                self.status["scanned"] += 1
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+            await self._flush_updates()
+            self.status["state"] = "completed"
+        except asyncio.CancelledError:
+            self.status["state"] = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Storage migration failed: {str(e)}")
+            self.status["state"] = "failed"
+            self.status["error"] = str(e)
+        finally:
+            self.status["finished_at"] = datetime.utcnow().isoformat()
+
+    async def _worker(self, queue: asyncio.Queue, migrated: dict) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            file_path, folder = item
+            try:
+                content_hash = await loop.run_in_executor(None, _hash_file, file_path)
+
+                entry = migrated.get(content_hash)
+                if entry:
+                    # Already in Cloudinary from an earlier run - only the DB may be behind
+                    self.status["skipped"] += 1
+                else:
+                    entry = await self._upload(file_path, folder, content_hash)
+                    migrated[content_hash] = entry
+                    await self._checkpoint(entry)
+                    self.status["migrated"] += 1
+                    self.status["bytes_uploaded"] += entry["bytes"]
+
+                self._pending_updates.append((file_path, entry))
+                if len(self._pending_updates) >= self.batch_size:
+                    await self._flush_updates()
+            except Exception as e:
+                self.status["failed"] += 1
+                self.status["recent_errors"] = (self.status["recent_errors"] + [
+                    {"local_path": file_path, "error": str(e)}
+                ])[-20:]
+                logger.error(f"Failed to migrate {file_path}: {str(e)}")
+
+    async def _upload(self, file_path: str, folder: str, content_hash: str) -> dict:
+        """Upload one file as-is - local images were already optimized at upload time"""
+        filename = os.path.basename(file_path)
+        resource_type = "image" if filename.lower().endswith(IMAGE_EXTENSIONS) else "video"
+        public_id = f"{folder}/{filename.rsplit('.', 1)[0]}"
+
+        # An open circuit fails the file fast; it stays local for the next run
+        with cloudinary_breaker.guard(timed=False):
+            result = await cloudinary_client.upload_large(
+                file_path,
+                public_id=public_id,
+                resource_type=resource_type,
+                overwrite=False,
+                **CloudinaryStorageBackend.eager_options(resource_type)
+            )
+        return {
+            "content_hash": content_hash,
+            "local_path": file_path,
+            "public_id": result["public_id"],
+            "secure_url": result["secure_url"],
+            "bytes": result["bytes"],
+            "resource_type": resource_type,
+            "renditions": CloudinaryStorageBackend.renditions_from_result(result, resource_type),
+            "migrated_at": datetime.utcnow().isoformat()
+        }
+
+    async def _flush_updates(self) -> None:
+        """Point MediaFile rows (and the task URLs that used them) at Cloudinary in one transaction"""
+        if not self._pending_updates:
+            return
+        batch, self._pending_updates = self._pending_updates, []
+        loop = asyncio.get_event_loop()
+        updated = await loop.run_in_executor(None, self._apply_updates, batch)
+        self.status["records_updated"] += updated
+
+    def _apply_updates(self, batch: list) -> int:
+        entries = dict(batch)
+        db = SessionLocal()
+        try:
+            media_files = db.query(models.MediaFile).options(
+                joinedload(models.MediaFile.task)
+            ).filter(
+                models.MediaFile.storage_type == "local",
+                models.MediaFile.file_path.in_(list(entries.keys()))
+            ).all()
+
+            # Each stored object moves from local to Cloudinary usage once
+            moved_usage = {}
+            for media in media_files:
+                if media.task is not None:
+                    moved_usage[media.file_path] = (media.task.restaurant_id, media.file_size)
+
+            # Local copies of the same content share one asset, which may
+            # already be counted from an earlier batch
+            counted_assets = set(db.query(models.Task.restaurant_id, models.MediaFile.file_path).join(
+                models.MediaFile.task
+            ).filter(
+                models.MediaFile.storage_type == "cloudinary",
+                models.MediaFile.file_path.in_({entry["public_id"] for entry in entries.values()})
+            ).all())
+
+            for media in media_files:
+                entry = entries[media.file_path]
+                task = media.task
+                if task is not None:
+                    if task.image_url == media.file_url:
+                        task.image_url = entry["secure_url"]
+                    if task.video_url == media.file_url:
+                        task.video_url = entry["secure_url"]
+                media.storage_type = "cloudinary"
+                media.file_path = entry["public_id"]
+                media.file_url = entry["secure_url"]
+                media.cloudinary_id = entry["public_id"]
+                # Manifest entries from before renditions were recorded have none
+                media.renditions = entry.get("renditions")
+
+            db.commit()
+
+            for file_path, (restaurant_id, file_size) in moved_usage.items():
+                crud.adjust_storage_usage(db, restaurant_id, "local", -file_size, -1)
+                asset = (restaurant_id, entries[file_path]["public_id"])
+                if asset not in counted_assets:
+                    counted_assets.add(asset)
+                    crud.adjust_storage_usage(db, restaurant_id, "cloudinary", entries[file_path]["bytes"], 1)
+            return len(media_files)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+# Create job instance
+storage_migration_job = StorageMigrationJob()
@@ -3,6 +3,9 @@ Helper module for handling enum conversions between SQLAlchemy and Pydantic
 """
 from typing import Any, Type, TypeVar, Dict, Union
 from enum import Enum
+import logging
+
+logger = logging.getLogger(__name__)
 
 T = TypeVar('T', bound=Enum)
 
@@ -21,11 +24,8 @@ def convert_enum_value_to_enum_member(value: Any, enum_class: type) -> Any:
     Raises:
         ValueError: If the value doesn't match any enum member
     """
-    print(f"Converting value '{value}' (type: {type(value)}) to enum {enum_class.__name__}")
-    
     # If it's already an enum member of the correct type, return it
     if isinstance(value, enum_class):
-        print(f"  Already correct enum type: {value}")
         return value
     
     # Convert to string for processing
@@ -34,21 +34,16 @@ def convert_enum_value_to_enum_member(value: Any, enum_class: type) -> Any:
     # Handle string representations like "TaskStatus.SUBMITTED" -> "SUBMITTED"
     if "." in value_str and value_str.startswith(enum_class.__name__):
         value_str = value_str.split(".")[-1]
-        print(f"  Extracted enum name: {value_str}")
     
     # Try to match by value first (this is what we usually want)
     for member in enum_class:
-        print(f"  Checking member {member.name} with value '{member.value}'")
         if member.value == value_str:
-            print(f"  Found match by value: {member}")
             return member
     
-    print(f"  No value match found for '{value_str}'")
-    
     # If no value match, try direct match with enum member name
     try:
         result = enum_class[value_str]
-        print(f"  Found by name: {result}")
+        logger.debug("Matched %r to %s by name", value, result)
         return result
     except KeyError:
         pass
@@ -103,7 +98,7 @@ def enhance_task_with_media_preview(task_dict: Dict[str, Any]) -> Dict[str, Any]
     # Process image URL
     if task_dict.get('image_url'):
         media_preview["has_media"] = True
-        image_info = CloudinaryService.get_media_info(task_dict['image_url'])
+        image_info = CloudinaryService.get_media_info(task_dict['image_url'], task_dict.get('image_ref'))
         media_preview["image_info"] = image_info
         media_preview["image_preview"] = {
             "thumbnail": image_info.get('thumbnail_url'),
@@ -115,7 +110,7 @@ def enhance_task_with_media_preview(task_dict: Dict[str, Any]) -> Dict[str, Any]
     # Process video URL  
     if task_dict.get('video_url'):
         media_preview["has_media"] = True
-        video_info = CloudinaryService.get_media_info(task_dict['video_url'])
+        video_info = CloudinaryService.get_media_info(task_dict['video_url'], task_dict.get('video_ref'))
         media_preview["video_info"] = video_info
         media_preview["video_preview"] = {
             "thumbnail": video_info.get('thumbnail_url'),
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark: image optimizer memory high-water mark and latency per image
+
+Compares the previous full-decode path against the draft-mode path in
+the image pipeline, both encoding JPEG. Each mode runs in its own
+subprocess so the peak RSS reported is not polluted by the other mode.
+
+Usage:
+    python benchmark_image_optimizer.py [image_dir] [--runs N]
+
+Without an image_dir a corpus of synthetic 12MP phone-style JPEGs is generated.
+"""
+import os
+import sys
+import io
+import json
+import math
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+import tempfile
+
+# Keep the benchmark offline - never ping Cloudinary on import
+os.environ.setdefault("USE_CLOUD_STORAGE", "false")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+
+def generate_corpus(directory: str, count: int = 5) -> None:
+    """Write synthetic 4032x3024 JPEGs, half of them tagged as portrait via EXIF"""
+    for i in range(count):
+        img = Image.effect_noise((4032, 3024), 64).convert("RGB")
+        exif = Image.Exif()
+        exif[0x0112] = 6 if i % 2 else 1
+        img.save(os.path.join(directory, f"sample_{i}.jpg"), format="JPEG", quality=92, exif=exif)
+
+
+def legacy_optimize(content: bytes) -> bytes:
+    """The optimizer as it was before draft-mode decoding"""
+    img = Image.open(io.BytesIO(content))
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+    max_width, max_height = 1920, 1080
+    if img.width > max_width or img.height > max_height:
+        img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    img.save(output, format='JPEG', optimize=True, quality=85)
+    return output.getvalue()
+
+
+def run_mode(mode: str, image_dir: str, runs: int) -> dict:
+    """Optimize every image in image_dir and report latency and peak RSS"""
+    from app.services.image_pipeline import ImagePipeline
+
+    pipeline = ImagePipeline(quality_tier="good")
+    files = sorted(
+        os.path.join(image_dir, f) for f in os.listdir(image_dir)
+        if f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp'))
+    )
+    contents = []
+    for path in files:
+        with open(path, 'rb') as f:
+            contents.append(f.read())
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = []
+    output_bytes = 0
+    for _ in range(runs):
+        for content in contents:
+            start = time.perf_counter()
+            if mode == "legacy":
+                result = legacy_optimize(content)
+            else:
+                result = pipeline.process(content, "JPEG").content
+            latencies.append((time.perf_counter() - start) * 1000)
+            output_bytes += len(result)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "images": len(latencies),
+        "mean_ms": statistics.mean(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, math.ceil(len(latencies) * 0.95) - 1)],
+        "peak_rss_mb": peak_rss / 1024,
+        "rss_growth_mb": (peak_rss - baseline_rss) / 1024,
+        "avg_output_kb": output_bytes / len(latencies) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir", nargs="?", help="Directory of sample images")
+    parser.add_argument("--runs", type=int, default=3, help="Passes over the corpus per mode")
+    parser.add_argument("--mode", choices=["legacy", "draft"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child process: run a single mode and report back as JSON
+        print(json.dumps(run_mode(args.mode, args.image_dir, args.runs)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_dir = args.image_dir
+        if not image_dir:
+            print("📸 Generating synthetic 12MP corpus...")
+            generate_corpus(tmp)
+            image_dir = tmp
+
+        print("🧪 Image optimizer benchmark")
+        print("=" * 72)
+        print(f"{'mode':<8}{'images':>8}{'mean ms':>10}{'p95 ms':>10}{'peak RSS MB':>14}{'growth MB':>12}{'out KB':>10}")
+        for mode in ("legacy", "draft"):
+            output = subprocess.run(
+                [sys.executable, __file__, image_dir, "--runs", str(args.runs), "--mode", mode],
+                check=True, capture_output=True, text=True
+            ).stdout
+            r = json.loads(output.strip().splitlines()[-1])
+            print(f"{r['mode']:<8}{r['images']:>8}{r['mean_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+                  f"{r['peak_rss_mb']:>14.1f}{r['rss_growth_mb']:>12.1f}{r['avg_output_kb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
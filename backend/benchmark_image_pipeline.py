@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bytes saved and CPU time per codec in the image pipeline
+
+Runs every image in a corpus through ImagePipeline once per codec and
+quality tier and reports the output size relative to the original upload
+and the CPU time spent decoding, resizing and encoding.
+
+Usage:
+    python benchmark_image_pipeline.py [image_dir] [--tiers low,good,best]
+
+Without an image_dir a small corpus of synthetic photos is generated.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# Keep the benchmark offline - never ping Cloudinary on import
+os.environ.setdefault("USE_CLOUD_STORAGE", "false")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image, ImageDraw, ImageFilter
+from app.services.image_pipeline import ImagePipeline, QUALITY_TIERS, avif_supported
+
+
+def generate_corpus(directory: str) -> None:
+    """Write a mix of photo-like, flat and transparent sample images"""
+    # Noisy 12MP "photo"
+    photo = Image.effect_noise((4032, 3024), 48).convert("RGB")
+    photo = photo.filter(ImageFilter.GaussianBlur(2))
+    photo.save(os.path.join(directory, "photo_12mp.jpg"), format="JPEG", quality=92)
+
+    # Screenshot-like flat colours with text-sized detail
+    flat = Image.new("RGB", (2400, 1600), "white")
+    draw = ImageDraw.Draw(flat)
+    for i in range(0, 1600, 40):
+        draw.rectangle((40, i + 10, 2360, i + 30), fill=(30 + i % 200, 80, 160))
+    flat.save(os.path.join(directory, "screenshot.png"), format="PNG")
+
+    # Transparent PNG
+    logo = Image.new("RGBA", (1200, 1200), (0, 0, 0, 0))
+    ImageDraw.Draw(logo).ellipse((100, 100, 1100, 1100), fill=(220, 40, 40, 255))
+    logo.save(os.path.join(directory, "transparent.png"), format="PNG")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir", nargs="?", help="Directory of sample images")
+    parser.add_argument("--tiers", default="good", help="Comma separated quality tiers to run")
+    args = parser.parse_args()
+
+    codecs = ["JPEG", "WEBP"] + (["AVIF"] if avif_supported() else [])
+    tiers = [t.strip() for t in args.tiers.split(",") if t.strip() in QUALITY_TIERS["JPEG"]]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_dir = args.image_dir
+        if not image_dir:
+            print("📸 Generating synthetic corpus...")
+            generate_corpus(tmp)
+            image_dir = tmp
+
+        corpus = []
+        for name in sorted(os.listdir(image_dir)):
+            if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp', '.gif')):
+                with open(os.path.join(image_dir, name), 'rb') as f:
+                    corpus.append((name, f.read()))
+
+        print("🧪 Image pipeline benchmark")
+        if "AVIF" not in codecs:
+            print("ℹ️  AVIF encoder not available - install pillow-avif-plugin to include it")
+        print("=" * 72)
+        print(f"{'codec':<6}{'tier':<6}{'images':>8}{'input KB':>12}{'output KB':>12}{'saved':>9}{'CPU ms/img':>13}")
+
+        for codec in codecs:
+            for tier in tiers:
+                pipeline = ImagePipeline(output_format=codec, quality_tier=tier)
+                input_bytes = output_bytes = 0
+                cpu_start = time.process_time()
+                for name, content in corpus:
+                    result = pipeline.process(content)
+                    input_bytes += len(content)
+                    output_bytes += len(result.content)
+                cpu_ms = (time.process_time() - cpu_start) * 1000 / len(corpus)
+                saved = 1 - output_bytes / input_bytes
+                print(f"{codec:<6}{tier:<6}{len(corpus):>8}{input_bytes / 1024:>12.1f}"
+                      f"{output_bytes / 1024:>12.1f}{saved:>9.1%}{cpu_ms:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
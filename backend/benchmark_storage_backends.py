@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Benchmark: throughput of each storage backend through the same harness
+
+Puts N objects of a given size with bounded concurrency, reads them back,
+stream-puts one large file and batch-deletes everything, reporting MB/s
+and operations per second for each phase.
+
+Usage:
+    python benchmark_storage_backends.py [--backends local,s3,cloudinary] [--objects 200]
+                                         [--size-kb 256] [--concurrency 8]
+                                         [--large-mb 64] [--latency-ms 80]
+                                         [--error-rate 0.02] [--bandwidth-kbps 20000]
+
+The s3 backend runs against S3_ENDPOINT_URL/S3_BUCKET when set, otherwise
+against an in-process moto server. The cloudinary backend runs against
+CLOUDINARY_UPLOAD_PREFIX when set, otherwise against an in-process
+fake_cloudinary server with the given latency, error rate and bandwidth;
+it never uploads to the real account. Delivery is served by Cloudinary's
+CDN rather than the API, so the get phase is skipped for it.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+import tempfile
+
+# Keep the benchmark offline - never ping Cloudinary on import
+os.environ.setdefault("USE_CLOUD_STORAGE", "false")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cloudinary
+from app.config import settings
+from app.services.storage_backends import (
+    CloudinaryStorageBackend, LocalStorageBackend, S3StorageBackend, StorageBackend
+)
+
+
+def make_s3_backend():
+    """Return (backend, stop) using a configured endpoint or a moto server"""
+    if settings.S3_BUCKET:
+        return S3StorageBackend(), lambda: None
+
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # Per-request access log
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    backend = S3StorageBackend(bucket="benchmark", endpoint_url=f"http://{host}:{port}",
+                               access_key_id="test", secret_access_key="test")
+    backend.client.create_bucket(Bucket="benchmark")
+    return backend, server.stop
+
+
+def make_cloudinary_backend(args):
+    """Return (backend, stop) using CLOUDINARY_UPLOAD_PREFIX or an in-process fake"""
+    stop = lambda: None
+    upload_prefix = settings.CLOUDINARY_UPLOAD_PREFIX
+    if not upload_prefix:
+        from fake_cloudinary import FakeCloudinaryServer, Faults
+        faults = Faults(latency_ms=args.latency_ms, error_rate=args.error_rate, bandwidth_kbps=args.bandwidth_kbps)
+        server = FakeCloudinaryServer(faults=faults).start()
+        upload_prefix, stop = server.url, server.stop
+    cloudinary.config(
+        cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+        api_key=settings.CLOUDINARY_API_KEY,
+        api_secret=settings.CLOUDINARY_API_SECRET,
+        upload_prefix=upload_prefix,
+        secure=True
+    )
+    return CloudinaryStorageBackend(), stop
+
+
+async def run_phase(concurrency: int, coroutines) -> tuple:
+    """Run coroutine factories with bounded concurrency; return (elapsed seconds, failures)"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(factory):
+        async with semaphore:
+            return await factory()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded(factory) for factory in coroutines), return_exceptions=True)
+    return time.perf_counter() - start, sum(1 for result in results if isinstance(result, Exception))
+
+
+async def benchmark_backend(backend: StorageBackend, args, workdir: str) -> list:
+    """(phase, ops/s, MB/s, failures) for each phase"""
+    payload = os.urandom(args.size_kb * 1024)
+    run_id = uuid.uuid4().hex[:8]
+    keys = [f"benchmark/{run_id}/{i}.bin" for i in range(args.objects)]
+    stored = {}
+
+    async def put(key):
+        stored[key] = await backend.put(key, payload, "image/webp")
+
+    put_s, put_failed = await run_phase(args.concurrency, [lambda k=k: put(k) for k in keys])
+    if backend.storage_type != "cloudinary":
+        get_s, get_failed = await run_phase(args.concurrency, [lambda k=k: backend.get(stored[k].file_path) for k in stored])
+
+    large_path = os.path.join(workdir, "large.bin")
+    with open(large_path, 'wb') as f:
+        for _ in range(args.large_mb):
+            f.write(os.urandom(1024 * 1024))
+    start = time.perf_counter()
+    large = await backend.put_file(f"benchmark/{run_id}/large.mp4", large_path, "video/mp4")
+    stream_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await backend.delete_many([s.file_path for s in stored.values()])
+    delete_s = time.perf_counter() - start
+    await backend.delete(large.file_path, "video")
+
+    total_mb = args.objects * args.size_kb / 1024
+    results = [("put", args.objects / put_s, total_mb / put_s, put_failed)]
+    if backend.storage_type != "cloudinary":
+        results.append(("get", len(stored) / get_s, total_mb / get_s, get_failed))
+    return results + [
+        ("stream-put", 1 / stream_s, args.large_mb / stream_s, 0),
+        ("batch-delete", len(stored) / delete_s, None, 0),
+    ]
+
+
+async def main_async(args):
+    print("🧪 Storage backend benchmark")
+    print(f"   {args.objects} x {args.size_kb}KB objects, concurrency {args.concurrency}, "
+          f"{args.large_mb}MB stream-put")
+    print("=" * 68)
+    print(f"{'backend':<12}{'phase':<14}{'ops/s':>12}{'MB/s':>12}{'failed':>8}")
+
+    for name in args.backends.split(","):
+        stop = lambda: None
+        with tempfile.TemporaryDirectory() as tmp:
+            if name == "local":
+                backend = LocalStorageBackend(root=os.path.join(tmp, "uploads"))
+            elif name == "s3":
+                backend, stop = make_s3_backend()
+            elif name == "cloudinary":
+                backend, stop = make_cloudinary_backend(args)
+            else:
+                print(f"⚠️ Unknown backend {name}, skipping")
+                continue
+
+            try:
+                for phase, ops, mb, failed in await benchmark_backend(backend, args, tmp):
+                    mb_text = f"{mb:>12.1f}" if mb is not None else f"{'-':>12}"
+                    print(f"{name:<12}{phase:<14}{ops:>12.1f}{mb_text}{failed:>8}")
+            finally:
+                stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="local,s3,cloudinary", help="Comma separated: local, s3, cloudinary")
+    parser.add_argument("--objects", type=int, default=200, help="Objects per put/get phase")
+    parser.add_argument("--size-kb", type=int, default=256, help="Size of each object")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent operations")
+    parser.add_argument("--large-mb", type=int, default=64, help="Size of the stream-put file")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Fake Cloudinary latency per request")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of fake Cloudinary requests that fail")
+    parser.add_argument("--bandwidth-kbps", type=float, default=None, help="Fake Cloudinary upload bandwidth")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Cloudinary Upload and Admin APIs
+
+Implements upload (including chunked uploads), destroy, ping and resources
+(list, lookup by public_ids, single resource and batch delete) over local
+HTTP, checking signatures and Admin API credentials the way Cloudinary
+does. Assets are kept in memory. Latency, error rate and upload bandwidth
+can be injected to benchmark upload paths offline.
+
+Usage:
+    python fake_cloudinary.py [--port 9400] [--latency-ms 80] [--jitter-ms 20]
+                              [--error-rate 0.02] [--error-status 503]
+                              [--bandwidth-kbps 2000]
+
+Point the app (and the SDK) at it with
+    CLOUDINARY_UPLOAD_PREFIX=http://127.0.0.1:9400
+The fake accepts the configured CLOUDINARY_API_KEY/CLOUDINARY_API_SECRET,
+so nothing else needs to change. Fault settings can be changed while it
+runs with PUT /_faults, e.g. {"error_rate": 0.1}.
+"""
+import os
+import sys
+import time
+import uuid
+import base64
+import random
+import asyncio
+import socket
+import argparse
+import threading
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import uvicorn
+from cloudinary.utils import api_sign_request
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class Faults:
+    """What the fake does to each API request"""
+    latency_ms: float = 0  # Added before every response
+    jitter_ms: float = 0  # Latency varies uniformly by up to this much either way
+    error_rate: float = 0  # Share of requests answered with error_status
+    error_status: int = 503
+    bandwidth_kbps: Optional[float] = None  # Request bodies are read no faster than this
+
+
+class FaultInjection:
+    """ASGI middleware applying the state's Faults to every API request
+
+    Bodies are paced as they are received, so a throttled upload applies
+    backpressure to the client like a slow link would. Failed requests
+    still read their body first, which keeps the connection reusable.
+    """
+
+    def __init__(self, app, state: dict):
+        self.app = app
+        self.state = state
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/_faults"):
+            return await self.app(scope, receive, send)
+
+        faults: Faults = self.state["faults"]
+        self.state["connections"].add(scope["client"][1])
+        self.state["requests"] += 1
+
+        async def throttled_receive():
+            message = await receive()
+            if faults.bandwidth_kbps and message["type"] == "http.request":
+                await asyncio.sleep(len(message.get("body", b"")) / (faults.bandwidth_kbps * 125))
+            return message
+
+        latency = faults.latency_ms + random.uniform(-faults.jitter_ms, faults.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+        fail = random.random() < faults.error_rate
+        if self.state.get("fail_next"):
+            self.state["fail_next"] -= 1
+            fail = True
+        if not fail:
+            return await self.app(scope, throttled_receive, send)
+
+        self.state["errors"] += 1
+        message = {"more_body": True}
+        while message.get("more_body"):
+            message = await throttled_receive()
+            if message["type"] == "http.disconnect":
+                return
+        response = JSONResponse({"error": {"message": "Injected failure"}}, status_code=faults.error_status)
+        await response(scope, receive, send)
+
+
+def fake_cloudinary_app(state: Optional[dict] = None, api_key: Optional[str] = None,
+                        api_secret: Optional[str] = None, faults: Optional[Faults] = None) -> FastAPI:
+    """Upload, destroy, ping and resources endpoints of one Cloudinary cloud
+
+    state holds the stored assets, the faults and request counters, so a
+    caller can inspect or change them while the app serves requests.
+    """
+    if api_key is None or api_secret is None:
+        from app.config import settings
+        api_key = api_key or settings.CLOUDINARY_API_KEY
+        api_secret = api_secret or settings.CLOUDINARY_API_SECRET
+
+    state = state if state is not None else {}
+    state.setdefault("faults", faults or Faults())
+    state.setdefault("connections", set())
+    state.setdefault("requests", 0)
+    state.setdefault("errors", 0)
+    assets = state.setdefault("assets", {})
+    chunks = {}
+
+    app = FastAPI(title="Fake Cloudinary")
+    app.add_middleware(FaultInjection, state=state)
+
+    def error(status_code: int, message: str) -> JSONResponse:
+        return JSONResponse({"error": {"message": message}}, status_code=status_code)
+
+    def resource(cloud: str, public_id: str) -> dict:
+        asset = assets[public_id]
+        return {"public_id": public_id, "resource_type": asset["resource_type"], "format": asset["format"],
+                "version": asset["version"], "bytes": len(asset["content"]), "type": "upload",
+                "created_at": asset["created_at"],
+                "secure_url": f"https://res.cloudinary.com/{cloud}/{asset['resource_type']}/upload/"
+                              f"v{asset['version']}/{public_id}.{asset['format']}"}
+
+    async def signed_params(request: Request):
+        form = await request.form()
+        params = {key: value for key, value in form.multi_items() if key not in ("file", "api_key", "signature")}
+        if form.get("api_key") != api_key or api_sign_request(params, api_secret) != form.get("signature"):
+            return form, None
+        return form, params
+
+    def admin_authorized(request: Request) -> bool:
+        expected = base64.b64encode(f"{api_key}:{api_secret}".encode()).decode()
+        return request.headers.get("authorization") == f"Basic {expected}"
+
+    def admin_response(content: dict) -> JSONResponse:
+        """Admin API result with the rate limit headers Cloudinary sends"""
+        return JSONResponse(content, headers={
+            "X-FeatureRateLimit-Limit": "500",
+            "X-FeatureRateLimit-Remaining": "499",
+            "X-FeatureRateLimit-Reset": time.strftime("%a, %d %b %Y %H:00:00 GMT", time.gmtime(time.time() + 3600))
+        })
+
+    @app.get("/_faults")
+    async def get_faults():
+        return asdict(state["faults"])
+
+    @app.put("/_faults")
+    async def set_faults(request: Request):
+        state["faults"] = Faults(**{**asdict(state["faults"]), **(await request.json())})
+        return asdict(state["faults"])
+
+    @app.post("/v1_1/{cloud}/{resource_type}/upload")
+    async def upload(cloud: str, resource_type: str, request: Request):
+        form, params = await signed_params(request)
+        if params is None:
+            return error(401, "Invalid Signature")
+        file = form.get("file")
+        if file is None:
+            return error(400, "Missing required parameter - file")
+        filename = "file"
+        if hasattr(file, "read"):
+            content = await file.read()
+            filename = file.filename or filename
+        elif file.startswith("data:"):
+            header, data = file.split(",", 1)
+            content = base64.b64decode(data)
+            filename = f"file.{header.split(';')[0].rsplit('/', 1)[-1]}"
+        else:
+            return error(400, "Remote URLs are not supported by the fake")
+        public_id = params.get("public_id") or uuid.uuid4().hex
+        if params.get("folder"):
+            public_id = f"{params['folder']}/{public_id}"
+
+        content_range = request.headers.get("content-range")
+        if content_range:
+            start, rest = content_range.split(" ")[1].split("-")
+            end, total = rest.split("/")
+            parts = chunks.setdefault(request.headers["x-unique-upload-id"], {})
+            parts[int(start)] = content
+            if int(end) + 1 < int(total):
+                return {"public_id": public_id, "done": False}
+            content = b"".join(parts[offset] for offset in sorted(chunks.pop(request.headers["x-unique-upload-id"])))
+
+        if params.get("overwrite") in ("0", "false") and public_id in assets:
+            return resource(cloud, public_id)
+        media_format = filename.rsplit(".", 1)[-1] if "." in filename else ("mp4" if resource_type == "video" else "jpg")
+        assets[public_id] = {"content": content, "resource_type": resource_type, "format": media_format,
+                             "version": int(time.time()), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                             "eager": params.get("eager")}
+        return resource(cloud, public_id)
+
+    @app.post("/v1_1/{cloud}/{resource_type}/destroy")
+    async def destroy(resource_type: str, request: Request):
+        form, params = await signed_params(request)
+        if params is None:
+            return error(401, "Invalid Signature")
+        return {"result": "ok" if assets.pop(params.get("public_id"), None) else "not found"}
+
+    @app.get("/v1_1/{cloud}/ping")
+    async def ping(request: Request):
+        if not admin_authorized(request):
+            return error(401, "Invalid credentials")
+        return admin_response({"status": "ok"})
+
+    @app.get("/v1_1/{cloud}/resources/{resource_type}/upload")
+    async def resources(cloud: str, resource_type: str, request: Request):
+        if not admin_authorized(request):
+            return error(401, "Invalid credentials")
+        public_ids = request.query_params.getlist("public_ids[]")
+        prefix = request.query_params.get("prefix", "")
+        found = [public_id for public_id in sorted(assets)
+                 if assets[public_id]["resource_type"] == resource_type
+                 and (public_id in public_ids if public_ids else public_id.startswith(prefix))]
+        # Listings page with an opaque cursor, like the real API
+        start = int(request.query_params.get("next_cursor") or 0)
+        max_results = int(request.query_params.get("max_results") or 10)
+        page = found[start:start + max_results]
+        content = {"resources": [resource(cloud, public_id) for public_id in page]}
+        if start + max_results < len(found):
+            content["next_cursor"] = str(start + max_results)
+        return admin_response(content)
+
+    @app.get("/v1_1/{cloud}/resources/{resource_type}/upload/{public_id:path}")
+    async def get_resource(cloud: str, resource_type: str, public_id: str, request: Request):
+        if not admin_authorized(request):
+            return error(401, "Invalid credentials")
+        if public_id not in assets or assets[public_id]["resource_type"] != resource_type:
+            return error(404, f"Resource not found - {public_id}")
+        return admin_response(resource(cloud, public_id))
+
+    @app.delete("/v1_1/{cloud}/resources/{resource_type}/upload")
+    async def delete_resources(resource_type: str, request: Request):
+        if not admin_authorized(request):
+            return error(401, "Invalid credentials")
+        return admin_response({"deleted": {public_id: "deleted" if assets.pop(public_id, None) else "not_found"
+                                         for public_id in request.query_params.getlist("public_ids[]")}})
+
+    return app
+
+
+class FakeCloudinaryServer:
+    """The fake served by uvicorn on a background thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **options):
+        self.state: dict = {}
+        self.app = fake_cloudinary_app(self.state, **options)
+        self.socket = socket.socket()
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.server = uvicorn.Server(uvicorn.Config(self.app, log_level="warning"))
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Value for CLOUDINARY_UPLOAD_PREFIX (or cloudinary.config(upload_prefix=...))"""
+        host, port = self.socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def faults(self) -> Faults:
+        return self.state["faults"]
+
+    def start(self) -> "FakeCloudinaryServer":
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        if self.thread is not None:
+            self.thread.join()
+        self.socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9400)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latency added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Latency varies by up to this much")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of requests that fail (0-1)")
+    parser.add_argument("--error-status", type=int, default=503, help="Status of injected failures")
+    parser.add_argument("--bandwidth-kbps", type=float, default=None, help="Upload bandwidth limit")
+    args = parser.parse_args()
+
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate, args.error_status, args.bandwidth_kbps)
+    app = fake_cloudinary_app(faults=faults)
+    print("☁️ Fake Cloudinary")
+    print(f"   CLOUDINARY_UPLOAD_PREFIX=http://{args.host}:{args.port}")
+    print(f"   Faults: {asdict(faults)}")
+    print("=" * 60)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -77,6 +77,192 @@ def fix_media_file_table():
                 END $$;
                 """,
                 
+                # Add content_hash column if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'content_hash') THEN
+                        ALTER TABLE media_files ADD COLUMN content_hash VARCHAR(64);
+                        RAISE NOTICE 'Added content_hash column';
+                    ELSE
+                        RAISE NOTICE 'content_hash column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Index content_hash for duplicate upload lookups
+                """
+                CREATE INDEX IF NOT EXISTS ix_media_files_content_hash ON media_files (content_hash);
+                """,
+                
+                # Add renditions column if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'renditions') THEN
+                        ALTER TABLE media_files ADD COLUMN renditions JSON;
+                        RAISE NOTICE 'Added renditions column';
+                    ELSE
+                        RAISE NOTICE 'renditions column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Add width column if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'width') THEN
+                        ALTER TABLE media_files ADD COLUMN width INTEGER;
+                        RAISE NOTICE 'Added width column';
+                    ELSE
+                        RAISE NOTICE 'width column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Add height column if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'height') THEN
+                        ALTER TABLE media_files ADD COLUMN height INTEGER;
+                        RAISE NOTICE 'Added height column';
+                    ELSE
+                        RAISE NOTICE 'height column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Add placeholder column if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'placeholder') THEN
+                        ALTER TABLE media_files ADD COLUMN placeholder TEXT;
+                        RAISE NOTICE 'Added placeholder column';
+                    ELSE
+                        RAISE NOTICE 'placeholder column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Add image_ref column (parsed image_url) to tasks if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'tasks' AND column_name = 'image_ref') THEN
+                        ALTER TABLE tasks ADD COLUMN image_ref JSON;
+                        RAISE NOTICE 'Added image_ref column';
+                    ELSE
+                        RAISE NOTICE 'image_ref column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Add video_ref column (parsed video_url) to tasks if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'tasks' AND column_name = 'video_ref') THEN
+                        ALTER TABLE tasks ADD COLUMN video_ref JSON;
+                        RAISE NOTICE 'Added video_ref column';
+                    ELSE
+                        RAISE NOTICE 'video_ref column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Add restaurant_id column (denormalized from the task) if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'restaurant_id') THEN
+                        ALTER TABLE media_files ADD COLUMN restaurant_id INTEGER REFERENCES restaurants(id);
+                        RAISE NOTICE 'Added restaurant_id column';
+                    ELSE
+                        RAISE NOTICE 'restaurant_id column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Fill restaurant_id for media recorded before it was stored
+                """
+                UPDATE media_files 
+                SET restaurant_id = tasks.restaurant_id 
+                FROM tasks 
+                WHERE media_files.task_id = tasks.id AND media_files.restaurant_id IS NULL;
+                """,
+                
+                # Index the gallery's keyset order
+                """
+                CREATE INDEX IF NOT EXISTS ix_media_files_gallery ON media_files (restaurant_id, created_at, id);
+                """,
+                
+                # Add detected_type column (type sniffed from the bytes) if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'detected_type') THEN
+                        ALTER TABLE media_files ADD COLUMN detected_type VARCHAR(100);
+                        RAISE NOTICE 'Added detected_type column';
+                    ELSE
+                        RAISE NOTICE 'detected_type column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Add duration_seconds column if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'duration_seconds') THEN
+                        ALTER TABLE media_files ADD COLUMN duration_seconds DOUBLE PRECISION;
+                        RAISE NOTICE 'Added duration_seconds column';
+                    ELSE
+                        RAISE NOTICE 'duration_seconds column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Add captured_at column (EXIF or container creation time) if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'captured_at') THEN
+                        ALTER TABLE media_files ADD COLUMN captured_at TIMESTAMP WITH TIME ZONE;
+                        RAISE NOTICE 'Added captured_at column';
+                    ELSE
+                        RAISE NOTICE 'captured_at column already exists';
+                    END IF;
+                END $$;
+                """,
+                
+                # Add orientation column if it doesn't exist
+                """
+                DO $$ 
+                BEGIN 
+                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
+                                  WHERE table_name = 'media_files' AND column_name = 'orientation') THEN
+                        ALTER TABLE media_files ADD COLUMN orientation INTEGER;
+                        RAISE NOTICE 'Added orientation column';
+                    ELSE
+                        RAISE NOTICE 'orientation column already exists';
+                    END IF;
+                END $$;
+                """,
+                
                 # Update existing records with default values
                 """
                 UPDATE media_files 
@@ -113,13 +299,15 @@ def init_production_database():
         # Create all tables
         print("📋 Creating database tables...")
         Base.metadata.create_all(bind=engine)
+        # Model tables are declared on app.models.Base; this creates any that are new
+        models.Base.metadata.create_all(bind=engine)
         print("✅ Database tables created successfully!")
         
         # Fix MediaFile table for PostgreSQL compatibility
         fix_media_file_table()
         
         # Print table information
-        tables = Base.metadata.tables.keys()
+        tables = models.Base.metadata.tables.keys()
         print(f"📋 Created tables: {', '.join(tables)}")
         
         return True
@@ -1,24 +1,27 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy import create_engine
 from app.config import settings
 from app.database import engine, Base
-from app.routers import auth, tasks, users, uploads, health, admin_storage, admin_media, nfc
+from app import models
+from app.routers import auth, tasks, users, uploads, health, admin_storage, admin_media, admin_profiling, nfc, metrics
 from app.middleware.error_handler import global_exception_handler, validation_exception_handler
 from app.middleware.cors_middleware import CustomCORSMiddleware
 from app.middleware.preflight_middleware import PreflightMiddleware
+from app.middleware.metrics_middleware import MetricsMiddleware
+from app.middleware.query_stats_middleware import QueryStatsMiddleware
+from app.middleware.request_id_middleware import RequestIdMiddleware
+from app.logging_config import configure_logging
+from app.services.media_delivery import MediaStaticFiles
 import uvicorn
 import os
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, settings.LOG_LEVEL),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+# Configure logging (written from a background thread, tagged with request ids)
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Create FastAPI app
 app = FastAPI(
@@ -29,9 +32,9 @@ app = FastAPI(
 )
 
 # CORS middleware - use settings for allowed origins
-print(f"🔍 CORS Allowed Origins: {settings.ALLOWED_ORIGINS}")
-print(f"🔍 Environment: {settings.ENVIRONMENT}")
-print(f"🔍 Debug Mode: {settings.DEBUG}")
+logger.info(f"CORS Allowed Origins: {settings.ALLOWED_ORIGINS}")
+logger.info(f"Environment: {settings.ENVIRONMENT}")
+logger.info(f"Debug Mode: {settings.DEBUG}")
 
 # Safety check for production - never use wildcard in production
 origins = settings.ALLOWED_ORIGINS
@@ -39,10 +42,10 @@ if origins == ["*"] or origins == "*":
     if settings.ENVIRONMENT == "production":
         # Force specific origins for production
         origins = ["https://task-module.up.railway.app", "https://radiant-amazement-production-d68f.up.railway.app"]
-        print("🔒 PRODUCTION: Overriding wildcard with specific origins for security")
+        logger.warning("PRODUCTION: Overriding wildcard with specific origins for security")
     else:
         origins = ["*"]
-        print("⚠️ WARNING: Using wildcard CORS origin in development.")
+        logger.warning("Using wildcard CORS origin in development.")
 elif isinstance(origins, str):
     origins = [origins]
 
@@ -64,10 +67,10 @@ production_origins = [
 for prod_origin in production_origins:
     if prod_origin not in origins and origins != ["*"]:
         origins.append(prod_origin)
-        print(f"✅ Added {prod_origin} to allowed origins")
+        logger.debug(f"Added {prod_origin} to allowed origins")
 
 # Print final origins list
-print(f"🔍 Final CORS Origins: {origins}")
+logger.info(f"Final CORS Origins: {origins}")
 
 # Add preflight middleware first (handles OPTIONS requests)
 app.add_middleware(PreflightMiddleware)
@@ -77,13 +80,25 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True if origins != ["*"] else False,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH", "HEAD"],
     allow_headers=["*"],
+    # Resumable upload clients read their progress from these headers
+    expose_headers=["Location", "Tus-Resumable", "Upload-Offset", "Upload-Length", "Upload-Expires",
+                    "Accept-Ranges", "Content-Range", "ETag", "X-Request-ID"],
 )
 
 # Then add our custom middleware as a backup
 app.add_middleware(CustomCORSMiddleware)
 
+# Per-request SQL counts and timings (Server-Timing header, N+1 warnings in debug)
+app.add_middleware(QueryStatsMiddleware)
+
+# Added last so it is outermost and times every request, preflights included
+app.add_middleware(MetricsMiddleware)
+
+# Outermost of all, so every log line for a request carries its id
+app.add_middleware(RequestIdMiddleware)
+
 # Exception handlers with CORS support
 async def global_exception_handler_with_cors(request: Request, exc: Exception):
     """Global exception handler for unhandled errors with CORS support"""
@@ -169,14 +184,16 @@ os.makedirs(settings.UPLOAD_DIRECTORY, exist_ok=True)
 # Create database tables (with error handling)
 try:
     Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created successfully!")
+    # Model tables are declared on app.models.Base; this creates any that are new
+    models.Base.metadata.create_all(bind=engine)
+    logger.info("Database tables created successfully")
 except Exception as e:
-    print(f"⚠️  Database connection issue: {e}")
-    print("💡 For development, you can use SQLite (no setup required)")
-    print("💡 For production, ensure PostgreSQL is running and accessible")
+    logger.error(f"Database connection issue: {e}")
+    logger.error("For development, you can use SQLite (no setup required); "
+                 "for production, ensure PostgreSQL is running and accessible")
 
-# Static files for serving uploads
-app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIRECTORY), name="uploads")
+# Static files for serving uploads (with Range support for video seeking)
+app.mount("/uploads", MediaStaticFiles(directory=settings.UPLOAD_DIRECTORY), name="uploads")
 
 # Include routers
 app.include_router(auth.router, prefix="/api")
@@ -186,7 +203,34 @@ app.include_router(uploads.router, prefix="/api")
 app.include_router(health.router, prefix="/api")
 app.include_router(admin_storage.router, prefix="/api")
 app.include_router(admin_media.router, prefix="/api")
+app.include_router(admin_profiling.router, prefix="/api")
 app.include_router(nfc.router, prefix="/api")
+# Prometheus scrapes /metrics at the root, next to the JSON /api/metrics
+app.include_router(metrics.router)
+
+# Background jobs
+@app.on_event("startup")
+async def start_background_jobs():
+    """Start periodic maintenance tasks"""
+    import asyncio
+    from app.services.resumable_upload_service import resumable_upload_service
+    from app.services.cloudinary_reconciler import cloudinary_reconciler
+    from app.services.direct_uploads import direct_upload_service
+    from app.services.file_service import file_service
+    from app.metrics import system_sampler
+    asyncio.create_task(file_service.check_cloud_storage())
+    asyncio.create_task(system_sampler.run())
+    asyncio.create_task(resumable_upload_service.run_janitor())
+    asyncio.create_task(direct_upload_service.run_janitor())
+    asyncio.create_task(cloudinary_reconciler.run())
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    """Stop worker processes so the server exits cleanly"""
+    from app.services.contact_sheets import contact_sheets
+    from app.services.cloudinary_client import cloudinary_client
+    contact_sheets.shutdown()
+    await cloudinary_client.aclose()
 
 # Root endpoint
 @app.get("/")
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Test the Cloudinary circuit breaker, the local fallback while it is open
+and the reconciliation that follows once it closes
+
+Cloudinary is replaced by stand-ins for the API client's calls; nothing here
+touches Cloudinary or the production database.
+"""
+import io
+import os
+import sys
+import time
+import uuid
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="circuit-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+os.environ["CLOUDINARY_API_KEY"] = "123456"
+os.environ["CLOUDINARY_API_SECRET"] = "test-secret"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import cloudinary.exceptions
+from PIL import Image
+from app import crud, models
+from app.database import SessionLocal, engine
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError, cloudinary_breaker
+from app.services.cloudinary_client import cloudinary_client
+from app.services.cloudinary_reconciler import cloudinary_reconciler
+from app.services.file_service import file_service
+from app.services.storage_backends import get_storage_backend
+from app.services.storage_migration import storage_migration_job
+
+
+def breaker(**overrides) -> CircuitBreaker:
+    options = dict(failure_rate=0.5, slow_call_rate=0.5, slow_call_seconds=0.05, window_size=10,
+                   min_calls=4, open_seconds=0.05, half_open_probes=2,
+                   ignored_exceptions=(cloudinary.exceptions.BadRequest,))
+    options.update(overrides)
+    return CircuitBreaker("test", **options)
+
+
+def call(cb: CircuitBreaker, outcome=None, duration: float = 0) -> None:
+    with cb.guard():
+        if duration:
+            time.sleep(duration)
+        if outcome:
+            raise outcome
+
+
+def attempt(cb: CircuitBreaker, outcome=None, duration: float = 0) -> None:
+    try:
+        call(cb, outcome, duration)
+    except (CircuitOpenError, RuntimeError, cloudinary.exceptions.BadRequest):
+        pass
+
+
+def test_opens_on_failure_rate_and_recovers():
+    cb = breaker()
+    for outcome in (None, RuntimeError("down"), None):
+        attempt(cb, outcome)
+    assert cb.state == circuit_breaker.CLOSED  # Too few calls to judge
+    attempt(cb, RuntimeError("down"))
+    assert cb.state == circuit_breaker.OPEN
+
+    # Open: nothing is called
+    with pytest.raises(CircuitOpenError):
+        call(cb)
+    assert cb.snapshot()["rejected_calls"] == 1
+
+    time.sleep(0.06)
+    call(cb)
+    assert cb.state == circuit_breaker.HALF_OPEN
+    call(cb)
+    assert cb.state == circuit_breaker.CLOSED
+
+
+def test_failed_probe_reopens():
+    cb = breaker()
+    cb.trip("test")
+    time.sleep(0.06)
+    attempt(cb, RuntimeError("still down"))
+    assert cb.state == circuit_breaker.OPEN
+    assert not cb.accepting_calls
+
+
+def test_slow_calls_open_the_circuit():
+    cb = breaker()
+    for _ in range(4):
+        attempt(cb, duration=0.06)
+    assert cb.state == circuit_breaker.OPEN
+
+    # Bulk transfers are left out of the latency threshold
+    cb = breaker()
+    for _ in range(4):
+        with cb.guard(timed=False):
+            time.sleep(0.06)
+    assert cb.state == circuit_breaker.CLOSED
+
+
+def test_caller_errors_do_not_count():
+    cb = breaker()
+    for _ in range(6):
+        attempt(cb, cloudinary.exceptions.BadRequest("Invalid image file"))
+    assert cb.state == circuit_breaker.CLOSED
+
+
+def jpeg() -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (32, 24), (10, 120, 200)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+@pytest.fixture
+def cloudinary_backend(monkeypatch):
+    """file_service pointed at Cloudinary, with a fresh breaker state"""
+    monkeypatch.setattr(file_service, "backend", get_storage_backend("cloudinary"))
+    monkeypatch.setattr(file_service, "fallback_tasks", {})
+    monkeypatch.setattr(cloudinary_breaker, "open_seconds", 0.05)
+    yield
+    with cloudinary_breaker._lock:
+        cloudinary_breaker._close()
+
+
+def test_open_circuit_saves_locally_without_calling_cloudinary(cloudinary_backend, monkeypatch):
+    async def unreachable(*args, **kwargs):
+        raise AssertionError("Cloudinary must not be called while the circuit is open")
+
+    monkeypatch.setattr(cloudinary_client, "upload", unreachable)
+    monkeypatch.setattr(cloudinary_breaker, "open_seconds", 60)
+    cloudinary_breaker.trip("test")
+
+    started = time.monotonic()
+    file_data = asyncio.run(file_service._store(jpeg(), "proof.jpg", "41", "image/jpeg", "image", "proof.jpg"))
+    assert time.monotonic() - started < 1
+    assert file_data["storage_type"] == "local"
+    assert os.path.exists(file_data["file_path"])
+    assert "41" in file_service.fallback_tasks
+
+
+def test_reconciles_once_the_circuit_closes(cloudinary_backend, monkeypatch):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"T{uuid.uuid4().hex[:8]}", name="Test", cuisine_type="Test",
+                                   contact_email="test@example.com", contact_phone="0", password_hash="x")
+    db.add(restaurant)
+    db.commit()
+    task = models.Task(restaurant_id=restaurant.id, task="Photograph the walk-in",
+                       category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+    db.add(task)
+    db.commit()
+
+    cloudinary_breaker.trip("test")
+    file_data = asyncio.run(file_service._store(jpeg(), "proof.jpg", str(task.id), "image/jpeg", "image", "proof.jpg"))
+    file_data["file_url"] = "http://testserver/uploads/proof.jpg"
+    crud.create_media_file(db, {"task_id": task.id, "restaurant_id": restaurant.id, **file_data})
+    task.image_url = file_data["file_url"]
+    db.commit()
+
+    pings = []
+
+    async def ping():
+        pings.append(1)
+        return {"status": "ok"}
+
+    async def upload_large(file_path, public_id, resource_type, **options):
+        return {"public_id": public_id, "version": 1700000000, "format": "jpg", "resource_type": resource_type,
+                "bytes": os.path.getsize(file_path),
+                "secure_url": f"https://res.cloudinary.com/test-cloud/image/upload/v1700000000/{public_id}.jpg"}
+
+    monkeypatch.setattr(cloudinary_client, "ping", ping)
+    monkeypatch.setattr(cloudinary_client, "upload_large", upload_large)
+
+    async def reconcile():
+        await asyncio.sleep(0.06)
+        await cloudinary_reconciler.reconcile()
+        # The reconciler probes with pings, so no upload had to risk the half-open circuit
+        assert cloudinary_breaker.is_closed and len(pings) == 2
+        await storage_migration_job._task
+        await cloudinary_reconciler.reconcile()
+
+    asyncio.run(reconcile())
+    assert storage_migration_job.status["migrated"] == 1
+    assert file_service.fallback_tasks == {}
+
+    db.expire_all()
+    media = db.query(models.MediaFile).filter(models.MediaFile.task_id == task.id).one()
+    assert media.storage_type == "cloudinary"
+    assert media.file_path == f"task_completions/{task.id}/{os.path.splitext(file_data['filename'])[0]}"
+    assert db.get(models.Task, task.id).image_url == media.file_url
+    db.close()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing the Cloudinary circuit breaker")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -10,6 +10,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.services.cloudinary_service import CloudinaryService
 from app.config import settings
 import base64
+import asyncio
 
 def test_cloudinary():
     """Test Cloudinary configuration and upload"""
@@ -42,18 +43,18 @@ def test_cloudinary():
     
     try:
         # Upload test image
-        upload_result = CloudinaryService.upload_base64_image(
+        upload_result = asyncio.run(CloudinaryService.upload_base64_image(
             data_url,
             folder="test",
             public_id="test_upload"
-        )
+        ))
         
         if upload_result:
             print(f"✅ Upload successful: {upload_result}")
             
             # Test cleanup
             print("\n🧹 Testing cleanup...")
-            delete_result = CloudinaryService.delete_by_url(upload_result)
+            delete_result = asyncio.run(CloudinaryService.delete_by_url(upload_result))
             print(f"Delete result: {delete_result}")
             
         else:
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test batched, cached Cloudinary resource metadata for the admin media views
+
+The Admin API resources call is replaced by a stand-in that counts calls;
+nothing here touches Cloudinary or the production database.
+"""
+import os
+import sys
+import uuid
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="cloudinary-metadata-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+os.environ["CLOUDINARY_API_KEY"] = "123456"
+os.environ["CLOUDINARY_API_SECRET"] = "test-secret"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi.testclient import TestClient
+import main
+from app import auth, crud, models
+from app.database import SessionLocal, engine
+from app.services.cloudinary_client import cloudinary_client
+from app.services.cloudinary_metadata import CloudinaryMetadataCache, cloudinary_metadata
+from app.services.storage_backends import CloudinaryStorageBackend
+
+
+def resource(resource_type: str, public_id: str) -> dict:
+    return {"public_id": public_id, "resource_type": resource_type, "format": "jpg", "bytes": 2048,
+            "width": 640, "height": 480, "created_at": "2026-03-02T09:30:00Z",
+            "duration": 12.5 if resource_type == "video" else None}
+
+
+@pytest.fixture
+def admin_api(monkeypatch):
+    """Stand-in for the Admin API resources call; records each call's public_ids"""
+    calls = []
+
+    async def resources(resource_type="image", type="upload", public_ids=(), **options):
+        calls.append((resource_type, list(public_ids)))
+        await asyncio.sleep(0.01)
+        # Assets whose id says so do not exist
+        return {"resources": [resource(resource_type, public_id) for public_id in public_ids
+                              if not public_id.startswith("missing")]}
+
+    monkeypatch.setattr(cloudinary_client, "resources", resources)
+    return calls
+
+
+def test_batches_by_type_and_caches(admin_api):
+    cache = CloudinaryMetadataCache()
+    keys = [("image", f"task_completions/1/{n}") for n in range(150)] + \
+           [("video", f"task_completions/1/v{n}") for n in range(40)] + [("image", "missing/1")]
+
+    metadata = asyncio.run(cache.get_many(keys + keys[:10]))
+    assert sorted((resource_type, len(ids)) for resource_type, ids in admin_api) == [
+        ("image", 51), ("image", 100), ("video", 40)
+    ]
+    assert metadata[("video", "task_completions/1/v3")]["duration"] == 12.5
+    assert metadata[("image", "task_completions/1/7")]["bytes"] == 2048
+    assert metadata[("image", "missing/1")] is None
+
+    # Found and missing assets are both served from the store
+    admin_api.clear()
+    asyncio.run(cache.get_many(keys))
+    assert admin_api == []
+    assert cache.stats["hits"] == len(keys)
+
+
+def test_concurrent_lookups_share_one_call(admin_api):
+    cache = CloudinaryMetadataCache()
+    keys = [("image", f"task_completions/2/{n}") for n in range(20)]
+
+    async def run():
+        return await asyncio.gather(*[cache.get_many(keys) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert len(admin_api) == 1
+    assert all(result == results[0] for result in results)
+
+
+def test_slow_cloudinary_does_not_hold_the_view(admin_api, monkeypatch):
+    cache = CloudinaryMetadataCache()
+    cache.wait_seconds = 0.05
+    key = ("image", "task_completions/3/slow")
+
+    async def slow_resources(resource_type="image", type="upload", public_ids=(), **options):
+        await asyncio.sleep(0.2)
+        return {"resources": [resource(resource_type, public_id) for public_id in public_ids]}
+
+    monkeypatch.setattr(cloudinary_client, "resources", slow_resources)
+
+    async def run():
+        assert (await cache.get_many([key]))[key] is None
+        # The fetch carries on and fills the store for the next view
+        await asyncio.sleep(0.3)
+        return await cache.get_many([key])
+
+    assert asyncio.run(run())[key]["width"] == 640
+
+
+def test_failed_lookups_are_not_cached(monkeypatch):
+    cache = CloudinaryMetadataCache()
+    key = ("image", "task_completions/4/a")
+
+    async def failing(**options):
+        raise RuntimeError("Cloudinary is down")
+
+    monkeypatch.setattr(cloudinary_client, "resources", failing)
+    assert asyncio.run(cache.get_many([key]))[key] is None
+    assert cache.stats["upstream_errors"] == 1
+    assert cache._cached(key) == (False, None)
+
+
+def test_gallery_page_costs_at_most_one_call(admin_api, monkeypatch):
+    monkeypatch.setattr(cloudinary_metadata, "_entries", type(cloudinary_metadata._entries)())
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"T{uuid.uuid4().hex[:8]}", name="Test", cuisine_type="Test",
+                                   contact_email="test@example.com", contact_phone="0", password_hash="x")
+    db.add(restaurant)
+    db.commit()
+    task = models.Task(restaurant_id=restaurant.id, task="Photograph the walk-in",
+                       category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+    db.add(task)
+    db.commit()
+
+    for n in range(25):
+        public_id = f"task_completions/{task.id}/{n}"
+        crud.create_media_file(db, {
+            "task_id": task.id, "restaurant_id": restaurant.id, "filename": f"{n}.jpg",
+            "original_filename": f"{n}.jpg", "file_path": public_id, "file_size": 2048, "mime_type": "image/jpeg", "file_type": "image",
+            "storage_type": "cloudinary", "cloudinary_id": public_id,
+            "file_url": f"https://res.cloudinary.com/test-cloud/image/upload/v1700000000/{public_id}.jpg"
+        })
+
+    # A new upload is remembered from its response, so it never needs a lookup
+    upload = resource("image", f"task_completions/{task.id}/new")
+    CloudinaryStorageBackend()._stored(f"task_completions/{task.id}/new.jpg",
+                                       {**upload, "version": 1700000000, "secure_url": "https://example"})
+    task.image_url = f"https://res.cloudinary.com/test-cloud/image/upload/v1700000000/{upload['public_id']}.jpg"
+    db.commit()
+
+    client = TestClient(main.app)
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': str(restaurant.id)})}"}
+    response = client.get("/api/admin/media/gallery?limit=20", headers=headers)
+    assert response.status_code == 200, response.text
+    gallery = response.json()["gallery"]
+    assert len(gallery) == 20 and all(item["metadata"]["bytes"] == 2048 for item in gallery)
+    assert len(admin_api) == 1 and len(admin_api[0][1]) == 20
+
+    # The same page again, and the task view of the new upload, come from the store
+    admin_api.clear()
+    assert client.get("/api/admin/media/gallery?limit=20", headers=headers).status_code == 200
+    response = client.get(f"/api/admin/media/tasks/{task.id}/media", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["media_items"][0]["metadata"]["width"] == 640
+    assert admin_api == []
+    db.close()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing batched Cloudinary metadata lookups")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Test gallery contact sheets: reuse, shared builds, invalidation and pruning
+
+Sheets are composed from thumbnails in a temporary upload directory, in
+the real worker process pool. Nothing here touches Cloudinary or the
+production database.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="contact-sheets-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import pytest
+from PIL import Image
+from app.config import settings
+from app.services.contact_sheets import EMPTY_TILE_COLOR, ContactSheetService
+
+CLOUDINARY_THUMBNAIL = "https://res.cloudinary.com/test-cloud/image/upload/c_fill,h_300,w_300/v1/task_completions/3/x.jpg"
+
+
+@pytest.fixture
+def service(tmp_path):
+    """A service with its own upload directory and a single worker"""
+    service = ContactSheetService()
+    service.upload_dir = str(tmp_path)
+    service.cache_dir = os.path.join(service.upload_dir, "cache")
+    service.sheet_dir = os.path.join(service.cache_dir, "contact_sheets")
+    service.thumbnail_dir = os.path.join(service.cache_dir, "thumbnails")
+    service.workers = 1
+    yield service
+    service.shutdown()
+
+
+def thumbnail(service, task_id: int, name: str, color) -> str:
+    """A local rendition; returns its URL"""
+    path = os.path.join(service.upload_dir, "task_completions", str(task_id), f"{name}@thumbnail.webp")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", (300, 300), color).save(path, format="WEBP")
+    return f"http://testserver/uploads/task_completions/{task_id}/{name}@thumbnail.webp"
+
+
+def item(media_id: int, task_id: int, thumbnail_url: str) -> dict:
+    return {"id": f"media_{media_id}", "task_id": task_id, "media_type": "image", "thumbnail_url": thumbnail_url}
+
+
+def sidecar_path(service, sheet_id: str) -> str:
+    return service.sheet_path(sheet_id)[:-len(".webp")] + ".json"
+
+
+def test_sheets_are_reused_by_content_hash(service):
+    items = [item(1, 1, thumbnail(service, 1, "a", (200, 20, 20))),
+             item(2, 1, thumbnail(service, 1, "b", (20, 200, 20))),
+             item(3, 2, None)]
+
+    async def run():
+        return [await service.get_sheet(items, 64, 2) for _ in range(2)]
+    first, second = asyncio.run(run())
+
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert first["sheet_id"] == second["sheet_id"] and first["path"] == second["path"]
+    assert service.stats == {"hits": 1, "misses": 1}
+    assert (first["width"], first["height"]) == (128, 128)
+    assert [(cell["x"], cell["y"]) for cell in first["items"]] == [(0, 0), (64, 0), (0, 64)]
+
+    with Image.open(first["path"]) as sheet:
+        assert sheet.size == (128, 128)
+        pixels = sheet.convert("RGB")
+        red, green, empty = pixels.getpixel((32, 32)), pixels.getpixel((96, 32)), pixels.getpixel((32, 96))
+    assert red[0] > 150 and green[1] > 150
+    # An item without a thumbnail gets an empty tile
+    assert all(abs(a - b) < 10 for a, b in zip(empty, EMPTY_TILE_COLOR))
+    with open(sidecar_path(service, first["sheet_id"])) as f:
+        assert json.load(f) == {"task_ids": [1, 2], "thumbnail_urls": [entry["thumbnail_url"] for entry in items]}
+
+    # A replaced thumbnail, another layout or another order is another sheet
+    replaced = items[:2] + [item(3, 2, thumbnail(service, 2, "c", (20, 20, 200)))]
+    assert service.sheet_id(replaced, 64, 2) != first["sheet_id"]
+    assert service.sheet_id(items, 64, 3) != first["sheet_id"]
+    assert service.sheet_id(items[::-1], 64, 2) != first["sheet_id"]
+
+
+def test_concurrent_requests_share_one_build(service, monkeypatch):
+    items = [item(i, 1, thumbnail(service, 1, f"t{i}", (i * 20, 80, 80))) for i in range(6)]
+    builds = []
+    build = service._build
+
+    async def counting(sheet_id, *args):
+        builds.append(sheet_id)
+        return await build(sheet_id, *args)
+    monkeypatch.setattr(service, "_build", counting)
+
+    async def run():
+        return await asyncio.gather(*(service.get_sheet(items, 32, 3) for _ in range(8)))
+    sheets = asyncio.run(run())
+
+    assert len(builds) == 1
+    assert {sheet["sheet_id"] for sheet in sheets} == {builds[0]}
+    assert all(not sheet["cached"] for sheet in sheets)
+    assert os.path.isfile(sheets[0]["path"])
+    assert service._building == {}
+
+
+def test_invalidate_tasks_removes_sheets_and_sidecars(service):
+    # A remote thumbnail already in the local cache, so nothing is fetched
+    cached_thumbnail = service._thumbnail_cache_path(CLOUDINARY_THUMBNAIL)
+    os.makedirs(os.path.dirname(cached_thumbnail))
+    Image.new("RGB", (300, 300), (90, 90, 90)).save(cached_thumbnail, format="JPEG")
+    local_thumbnail = thumbnail(service, 1, "a", (200, 20, 20))
+    shown = [item(1, 1, local_thumbnail), item(2, 2, CLOUDINARY_THUMBNAIL)]
+    other = [item(3, 3, thumbnail(service, 3, "b", (20, 200, 20)))]
+
+    async def run():
+        return await service.get_sheet(shown, 32, 2), await service.get_sheet(other, 32, 2)
+    shown_sheet, other_sheet = asyncio.run(run())
+
+    assert service.invalidate_tasks([2, 99]) == 1
+    assert not os.path.exists(shown_sheet["path"])
+    assert not os.path.exists(sidecar_path(service, shown_sheet["sheet_id"]))
+    assert not os.path.exists(cached_thumbnail)
+    # Other tasks' sheets and the renditions themselves stay
+    assert os.path.exists(other_sheet["path"]) and os.path.exists(sidecar_path(service, other_sheet["sheet_id"]))
+    assert service._local_path(local_thumbnail)
+    assert service.invalidate_tasks([2]) == 0
+
+
+def test_prune_stays_within_budget(service):
+    service.max_cache_bytes = 10_000
+    now = time.time()
+
+    def cached(path: str, size: int, age: int) -> str:
+        path = os.path.join(service.cache_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        os.utime(path, (now - age, now - age))
+        return path
+
+    oldest_sheet = cached("contact_sheets/aa/aaaa.webp", 3000, age=500)
+    # Its sidecar is newer, but goes with the sheet
+    oldest_sidecar = cached("contact_sheets/aa/aaaa.json", 100, age=10)
+    old_thumbnail = cached("thumbnails/bb/bbbb", 3000, age=400)
+    kept = [cached("thumbnails/cc/cccc", 3000, age=300), cached("contact_sheets/dd/dddd.webp", 3000, age=200),
+            cached("contact_sheets/dd/dddd.json", 100, age=200)]
+
+    service.prune()
+    remaining = sum(os.path.getsize(os.path.join(root, name))
+                    for root, _, files in os.walk(service.cache_dir) for name in files)
+    assert remaining <= service.max_cache_bytes * 0.8
+    assert not any(os.path.exists(path) for path in (oldest_sheet, oldest_sidecar, old_thumbnail))
+    assert all(os.path.exists(path) for path in kept)
+
+    # Under budget nothing is removed
+    service.prune()
+    assert all(os.path.exists(path) for path in kept)
+
+
+def test_only_our_stores_are_fetched(service, monkeypatch):
+    assert service._is_our_store(CLOUDINARY_THUMBNAIL)
+    for url in ("http://res.cloudinary.com/test-cloud/image/upload/x.jpg",
+                "https://res.cloudinary.com/other-cloud/image/upload/x.jpg",
+                "https://res.cloudinary.com/test-cloud-2/image/upload/x.jpg",
+                "https://res.cloudinary.com.example.com/test-cloud/image/upload/x.jpg",
+                "https://res.cloudinary.com@example.com/test-cloud/image/upload/x.jpg",
+                "https://res.cloudinary.com:8443/test-cloud/image/upload/x.jpg",
+                "http://169.254.169.254/latest/meta-data/",
+                "file:///etc/passwd",
+                "https://[::1/x.jpg"):
+        assert not service._is_our_store(url), url
+
+    monkeypatch.setattr(settings, "S3_BUCKET", "media")
+    monkeypatch.setattr(settings, "S3_PUBLIC_BASE_URL", "https://cdn.example.com/media/")
+    s3 = ContactSheetService()
+    assert s3._is_our_store("https://cdn.example.com/media/task_completions/3/x.jpg")
+    assert not s3._is_our_store("https://cdn.example.com/other/x.jpg")
+
+    # Anything else is never requested, and /uploads paths stay inside the upload directory
+    def refuse(request):
+        raise AssertionError(f"Fetched {request.url}")
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(refuse)) as client:
+            semaphore = asyncio.Semaphore(1)
+            return [await service._thumbnail(client, semaphore, url)
+                    for url in ("https://example.com/x.jpg", "http://testserver/uploads/../../etc/passwd")]
+    assert asyncio.run(run()) == [None, None]
+
+
+if __name__ == "__main__":
+    print("🎞️ Testing contact sheets")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Test signed direct-to-storage uploads
+
+The S3 flow runs against an in-process moto server (or MinIO when
+S3_TEST_ENDPOINT_URL is set), the local flow against a temporary upload
+directory. Cloudinary signatures are checked with throwaway credentials;
+nothing here touches Cloudinary or the production database.
+"""
+import io
+import os
+import sys
+import json
+import uuid
+import time
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="direct-upload-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["DIRECT_UPLOAD_STAGING_DIRECTORY"] = os.path.join(WORKDIR, "direct_uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+os.environ["CLOUDINARY_API_KEY"] = "123456"
+os.environ["CLOUDINARY_API_SECRET"] = "test-secret"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import pytest
+from PIL import Image
+from cloudinary.utils import api_sign_request, compute_hex_hash
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+import main
+from app import auth, models
+from app.database import SessionLocal, engine
+from app.services import storage_backends
+from app.services.contact_sheets import contact_sheets
+from app.services.direct_uploads import direct_upload_service
+from app.services.file_service import file_service
+from test_storage_backends import start_s3_stand_in
+
+
+def jpeg() -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (32, 24), (10, 120, 200)).save(output, format="JPEG")
+    return output.getvalue()
+
+
+@pytest.fixture(scope="module")
+def restaurant_task():
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"T{uuid.uuid4().hex[:8]}", name="Test", cuisine_type="Test",
+                                   contact_email="test@example.com", contact_phone="0", password_hash="x")
+    db.add(restaurant)
+    db.commit()
+    task = models.Task(restaurant_id=restaurant.id, task="Photograph the walk-in",
+                       category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+    db.add(task)
+    db.commit()
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': str(restaurant.id)})}"}
+    yield db, restaurant, task, headers
+    db.close()
+
+
+def create_intent(client, headers, task, content: bytes, content_type: str = "image/jpeg",
+                  filename: str = "proof.jpg"):
+    response = client.post("/api/upload/direct", headers=headers, json={
+        "task_id": task.id, "filename": filename, "content_type": content_type, "length": len(content)
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def test_local_direct_upload(restaurant_task):
+    db, restaurant, task, headers = restaurant_task
+    client = TestClient(main.app)
+    content = jpeg()
+    intent = create_intent(client, headers, task, content)
+    assert intent["method"] == "PUT" and intent["storage_type"] == "local"
+
+    path = httpx.URL(intent["upload_url"]).path
+    assert client.put(path, content=content, headers={"Content-Type": "text/plain"}).status_code == 400
+    assert client.put(path, content=content, headers=intent["headers"]).status_code == 204
+    # An upload is written once; the token cannot overwrite it
+    assert client.put(path, content=b"other", headers=intent["headers"]).status_code == 409
+
+    for _ in range(2):
+        response = client.post("/api/upload/direct/confirm", headers=headers, json={"token": intent["token"]})
+        assert response.status_code == 200, response.text
+    media = db.query(models.MediaFile).filter(models.MediaFile.task_id == task.id).all()
+    assert len(media) == 1
+    assert media[0].detected_type == "image/jpeg"
+    assert media[0].file_size == len(content)
+    db.refresh(task)
+    assert task.image_url == response.json()["url"]
+
+
+def test_local_upload_is_verified(restaurant_task):
+    db, restaurant, task, headers = restaurant_task
+    client = TestClient(main.app)
+
+    intent = create_intent(client, headers, task, b"%PDF-1.7 " * 20)
+    client.put(httpx.URL(intent["upload_url"]).path, content=b"%PDF-1.7 " * 20, headers=intent["headers"])
+    response = client.post("/api/upload/direct/confirm", headers=headers, json={"token": intent["token"]})
+    assert response.status_code == 415
+    key = direct_upload_service.verify_token(intent["token"])["key"]
+    assert not os.path.exists(file_service.local_backend.path_for(key))
+    assert not os.path.exists(direct_upload_service.staged_path(key))
+
+    intent = create_intent(client, headers, task, jpeg())
+    response = client.post("/api/upload/direct/confirm", headers=headers, json={"token": intent["token"]})
+    assert response.status_code == 409  # Nothing uploaded yet
+
+    assert client.put("/api/upload/direct/local/not-a-token", content=b"x").status_code == 403
+    with pytest.raises(HTTPException) as exc:
+        direct_upload_service.verify_token(intent["token"], restaurant.id + 1000)
+    assert exc.value.status_code == 404
+    # An upload token is not an access token
+    assert client.get("/api/tasks", headers={"Authorization": f"Bearer {intent['token']}"}).status_code == 401
+
+
+def test_local_upload_is_private_until_confirmed(restaurant_task):
+    db, restaurant, task, headers = restaurant_task
+    client = TestClient(main.app)
+    page = b"<html><script>alert(document.cookie)</script></html>"
+
+    # The key's extension follows the declared type, never the filename
+    intent = create_intent(client, headers, task, page, filename="proof.html")
+    key = direct_upload_service.verify_token(intent["token"])["key"]
+    assert key.endswith(".jpg")
+
+    assert client.put(httpx.URL(intent["upload_url"]).path, content=page, headers=intent["headers"]).status_code == 204
+    assert os.path.exists(direct_upload_service.staged_path(key))
+    assert file_service.local_backend.locate(key) is None
+    assert client.get(f"/uploads/{key}").status_code == 404
+
+    response = client.post("/api/upload/direct/confirm", headers=headers, json={"token": intent["token"]})
+    assert response.status_code == 415
+    assert not os.path.exists(direct_upload_service.staged_path(key))
+    assert file_service.local_backend.locate(key) is None
+
+    # Verified uploads are moved into the public tree
+    content = jpeg()
+    intent = create_intent(client, headers, task, content)
+    key = direct_upload_service.verify_token(intent["token"])["key"]
+    client.put(httpx.URL(intent["upload_url"]).path, content=content, headers=intent["headers"])
+    assert client.post("/api/upload/direct/confirm", headers=headers, json={"token": intent["token"]}).status_code == 200
+    assert not os.path.exists(direct_upload_service.staged_path(key))
+    with open(file_service.local_backend.locate(key), "rb") as f:
+        assert f.read() == content
+
+
+def test_confirm_invalidates_contact_sheets_after_responding(restaurant_task, monkeypatch):
+    db, restaurant, task, headers = restaurant_task
+    client = TestClient(main.app)
+    invalidated = []
+    monkeypatch.setattr(contact_sheets, "invalidate_tasks", invalidated.append)
+
+    content = jpeg()
+    intent = create_intent(client, headers, task, content)
+    client.put(httpx.URL(intent["upload_url"]).path, content=content, headers=intent["headers"])
+    assert client.post("/api/upload/direct/confirm", headers=headers, json={"token": intent["token"]}).status_code == 200
+    assert invalidated == [[task.id]]
+
+    # Confirming again records nothing new, so there is nothing to invalidate
+    client.post("/api/upload/direct/confirm", headers=headers, json={"token": intent["token"]})
+    assert invalidated == [[task.id]]
+
+
+def test_unconfirmed_uploads_expire(restaurant_task):
+    db, restaurant, task, headers = restaurant_task
+    client = TestClient(main.app)
+    intent = create_intent(client, headers, task, jpeg())
+    key = direct_upload_service.verify_token(intent["token"])["key"]
+    client.put(httpx.URL(intent["upload_url"]).path, content=jpeg(), headers=intent["headers"])
+    staged = direct_upload_service.staged_path(key)
+
+    assert asyncio.run(direct_upload_service.cleanup_staging()) == 0
+    stale = time.time() - direct_upload_service.expiry.total_seconds() - 120
+    os.utime(staged, (stale, stale))
+    assert asyncio.run(direct_upload_service.cleanup_staging()) == 1
+    assert not os.path.exists(staged)
+
+
+def test_s3_presigned_put(restaurant_task, monkeypatch):
+    if not os.environ.get("S3_TEST_ENDPOINT_URL"):
+        pytest.importorskip("moto.server")
+    db, restaurant, task, headers = restaurant_task
+    endpoint, access_key, secret_key, stop = start_s3_stand_in()
+    try:
+        bucket = f"test-{uuid.uuid4().hex[:12]}"
+        backend = storage_backends.S3StorageBackend(
+            bucket=bucket, endpoint_url=endpoint, access_key_id=access_key, secret_access_key=secret_key
+        )
+        backend.client.create_bucket(Bucket=bucket)
+        monkeypatch.setattr(file_service, "backend", backend)
+        monkeypatch.setitem(storage_backends._backends, "s3", backend)
+
+        client = TestClient(main.app)
+        content = jpeg()
+        intent = create_intent(client, headers, task, content)
+        assert intent["method"] == "PUT" and intent["upload_url"].startswith(endpoint)
+
+        # The bytes go to the store, not through the API
+        response = httpx.put(intent["upload_url"], content=content, headers=intent["headers"])
+        assert response.status_code == 200, response.text
+        response = client.post("/api/upload/direct/confirm", headers=headers, json={"token": intent["token"]})
+        assert response.status_code == 200, response.text
+
+        key = direct_upload_service.verify_token(intent["token"])["key"]
+        media = db.query(models.MediaFile).filter(models.MediaFile.file_path == key).one()
+        assert (media.storage_type, media.file_size, media.detected_type) == ("s3", len(content), "image/jpeg")
+
+        # A body that does not match the declared length is deleted, not recorded
+        intent = create_intent(client, headers, task, content + b"padding")
+        httpx.put(intent["upload_url"], content=content, headers=intent["headers"])
+        response = client.post("/api/upload/direct/confirm", headers=headers, json={"token": intent["token"]})
+        assert response.status_code == 400
+        assert backend.client.list_objects_v2(Bucket=bucket, Prefix=direct_upload_service.verify_token(
+            intent["token"])["key"]).get("KeyCount") == 0
+    finally:
+        stop()
+
+
+def test_cloudinary_signatures():
+    backend = storage_backends.CloudinaryStorageBackend()
+    upload = backend.signed_upload("task_completions/5/abc.jpg", "image/jpeg", "https://api.example.com/notify")
+    fields = dict(upload["fields"])
+    assert upload["upload_url"].endswith("/test-cloud/image/upload")
+    signature = fields.pop("signature")
+    fields.pop("api_key")
+    assert signature == api_sign_request(fields, "test-secret")
+    assert fields["public_id"] == "task_completions/5/abc"
+
+    claims = {"key": "task_completions/5/abc.jpg", "file_type": "image", "content_type": "image/jpeg",
+              "filename": "proof.jpg", "storage_type": "cloudinary"}
+    result = {"public_id": "task_completions/5/abc", "version": 1700000000, "resource_type": "image",
+              "format": "jpg", "bytes": 2048, "width": 32, "height": 24,
+              "secure_url": "https://res.cloudinary.com/test-cloud/image/upload/v1700000000/task_completions/5/abc.jpg"}
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(direct_upload_service.confirm(claims, {**result, "signature": "forged"}))
+    assert exc.value.status_code == 400
+    signed = {**result, "signature": api_sign_request({"public_id": result["public_id"],
+                                                       "version": result["version"]}, "test-secret")}
+    media = asyncio.run(direct_upload_service.confirm(claims, signed))
+    assert (media["file_path"], media["file_size"], media["mime_type"]) == ("task_completions/5/abc", 2048, "image/jpeg")
+
+    body = json.dumps({"notification_type": "upload", **result}).encode()
+    timestamp = str(int(time.time()))
+    notification_signature = compute_hex_hash(body.decode() + timestamp + "test-secret", "sha1")
+    assert direct_upload_service.verify_notification(body, timestamp, notification_signature)
+    assert not direct_upload_service.verify_notification(body, timestamp, "forged")
+    assert direct_upload_service.task_id_for(f"task_completions/5/{uuid.uuid4()}") == 5
+    assert direct_upload_service.task_id_for("tasks/restaurant_1/task_5_AB") is None
+
+
+if __name__ == "__main__":
+    print("🧪 Testing direct uploads")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test the local fake Cloudinary server and pointing the app at it
+
+CLOUDINARY_UPLOAD_PREFIX is set to the fake before the app is imported,
+so both the SDK and the app's own client reach it through configuration;
+nothing here touches Cloudinary or the production database.
+"""
+import io
+import os
+import sys
+import time
+import base64
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="fake-cloudinary-test-")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_cloudinary import FakeCloudinaryServer
+
+SERVER = FakeCloudinaryServer(api_key="123456", api_secret="test-secret")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+os.environ["CLOUDINARY_API_KEY"] = "123456"
+os.environ["CLOUDINARY_API_SECRET"] = "test-secret"
+os.environ["CLOUDINARY_UPLOAD_PREFIX"] = SERVER.url
+
+import httpx
+import pytest
+import cloudinary.api
+import cloudinary.exceptions
+import cloudinary.uploader
+from PIL import Image
+from fake_cloudinary import Faults
+from app.services.circuit_breaker import cloudinary_breaker
+from app.services.cloudinary_client import cloudinary_client
+from app.services.cloudinary_service import CloudinaryService
+
+
+@pytest.fixture(scope="module", autouse=True)
+def fake_cloudinary():
+    SERVER.start()
+    yield SERVER
+    SERVER.stop()
+
+
+@pytest.fixture(autouse=True)
+def no_faults():
+    SERVER.state["faults"] = Faults()
+    yield
+    SERVER.state["faults"] = Faults()
+    with cloudinary_breaker._lock:
+        cloudinary_breaker._close()
+
+
+def png_data_url() -> str:
+    output = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 40, 40)).save(output, format="PNG")
+    return f"data:image/png;base64,{base64.b64encode(output.getvalue()).decode()}"
+
+
+def test_sdk_uses_the_configured_prefix():
+    assert cloudinary.config().upload_prefix == SERVER.url
+    result = cloudinary.uploader.upload(b"sdk-bytes", public_id="sdk/one")
+    assert SERVER.state["assets"]["sdk/one"]["content"] == b"sdk-bytes"
+    assert result["secure_url"].startswith("https://res.cloudinary.com/test-cloud/image/upload/")
+
+    listed = cloudinary.api.resources(type="upload", prefix="sdk/")
+    assert [resource["public_id"] for resource in listed["resources"]] == ["sdk/one"]
+    assert cloudinary.uploader.destroy("sdk/one")["result"] == "ok"
+
+
+def test_app_upload_and_delete_paths():
+    url = asyncio.run(CloudinaryService.upload_base64_image(png_data_url(), folder="task_images", public_id="t1"))
+    assert url and "/task_images/t1." in url
+    assert "task_images/t1" in SERVER.state["assets"]
+
+    assert asyncio.run(CloudinaryService.delete_by_url(url))
+    assert "task_images/t1" not in SERVER.state["assets"]
+
+
+def test_latency_and_error_injection():
+    SERVER.state["faults"] = Faults(latency_ms=100)
+    started = time.monotonic()
+    asyncio.run(cloudinary_client.ping())
+    assert time.monotonic() - started >= 0.1
+
+    # Every request fails: the client retries, then reports the injected status
+    SERVER.state["faults"] = Faults(error_rate=1, error_status=502)
+    requests = SERVER.state["requests"]
+    with pytest.raises(cloudinary.exceptions.GeneralError):
+        asyncio.run(cloudinary_client.upload(b"x", public_id="always-fails"))
+    assert SERVER.state["requests"] - requests == cloudinary_client.max_retries + 1
+
+    # Failures are drawn at random at the configured rate
+    SERVER.state["faults"] = Faults(error_rate=0.5)
+    errors = SERVER.state["errors"]
+    for n in range(10):
+        try:
+            asyncio.run(cloudinary_client.upload(b"x", public_id=f"flaky/{n}"))
+        except cloudinary.exceptions.GeneralError:
+            pass
+    assert SERVER.state["errors"] > errors
+
+
+def test_bandwidth_injection_paces_uploads():
+    content = os.urandom(50 * 1024)
+    # 4000 kbps is 500KB/s, so 50KB takes at least ~0.1s on the wire
+    SERVER.state["faults"] = Faults(bandwidth_kbps=4000)
+    started = time.monotonic()
+    asyncio.run(cloudinary_client.upload(content, public_id="throttled"))
+    assert time.monotonic() - started >= 0.09
+    assert SERVER.state["assets"]["throttled"]["content"] == content
+
+
+def test_faults_can_change_while_running():
+    response = httpx.put(f"{SERVER.url}/_faults", json={"latency_ms": 5, "error_rate": 0.25})
+    assert response.json()["error_rate"] == 0.25
+    assert SERVER.faults.latency_ms == 5
+    assert httpx.get(f"{SERVER.url}/_faults").json()["latency_ms"] == 5
+
+
+if __name__ == "__main__":
+    print("🧪 Testing the fake Cloudinary server")
+    print("=" * 40)
+    # Collect this module rather than a second copy with its own server,
+    # as the settings already point at this one
+    sys.modules["test_fake_cloudinary"] = sys.modules["__main__"]
+    sys.exit(pytest.main([__file__, "-q"]))
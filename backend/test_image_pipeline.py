@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test that oversized images are rejected rather than stored as uploaded
+
+Builds a decompression bomb with Pillow (a blank PNG whose header claims
+more pixels than Pillow will open) and runs it through every image path.
+Runs against a temporary SQLite database and upload directory; Cloudinary
+is a local fake, and nothing here touches Cloudinary or the production database.
+"""
+import io
+import os
+import sys
+import base64
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="image-pipeline-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+os.environ["CLOUDINARY_API_KEY"] = "123456"
+os.environ["CLOUDINARY_API_SECRET"] = "test-secret"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import cloudinary
+from PIL import Image
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+from fake_cloudinary import FakeCloudinaryServer
+from app.services.cloudinary_service import CloudinaryService
+from app.services.file_service import file_service
+from app.services.image_pipeline import image_pipeline
+
+
+@pytest.fixture(scope="module")
+def bomb() -> bytes:
+    # Just over twice Pillow's limit, so Image.open itself refuses it
+    side = int((Image.MAX_IMAGE_PIXELS * 2) ** 0.5) + 100
+    output = io.BytesIO()
+    Image.new("1", (side, side)).save(output, format="PNG")
+    return output.getvalue()
+
+
+@pytest.fixture(scope="module")
+def fake_cloudinary():
+    server = FakeCloudinaryServer().start()
+    previous_prefix = cloudinary.config().upload_prefix
+    cloudinary.config(upload_prefix=server.url)
+    yield server.state
+    cloudinary.config(upload_prefix=previous_prefix)
+    server.stop()
+
+
+def assert_too_large(call):
+    with pytest.raises(HTTPException) as exc:
+        call()
+    assert exc.value.status_code == 413
+
+
+def stored_files() -> list:
+    return [name for _, _, files in os.walk(file_service.upload_dir) for name in files]
+
+
+def test_pipeline_rejects_bombs(bomb):
+    assert len(bomb) < 1024 * 1024
+    with pytest.raises(Image.DecompressionBombError):
+        Image.open(io.BytesIO(bomb))
+    assert_too_large(lambda: image_pipeline.process(bomb))
+    assert_too_large(lambda: image_pipeline.renditions(bomb, ["thumbnail"]))
+
+
+def test_upload_is_not_stored_as_original(bomb):
+    upload = UploadFile(file=io.BytesIO(bomb), size=len(bomb), filename="proof.png",
+                        headers=Headers({"content-type": "image/png"}))
+    assert_too_large(lambda: asyncio.run(file_service.save_image(upload, "1")))
+    assert stored_files() == []
+
+
+def test_base64_submission_is_rejected(bomb, fake_cloudinary):
+    data = f"data:image/png;base64,{base64.b64encode(bomb).decode()}"
+    assert_too_large(lambda: asyncio.run(CloudinaryService.upload_base64_image_media(data, folder="tasks/test")))
+    assert fake_cloudinary["requests"] == 0
+
+
+if __name__ == "__main__":
+    print("💣 Testing decompression bomb rejection")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Test resharding local uploads from the flat layout into media/<aa>/<bb>/
+
+Uploads go through the API in the flat layout first, then the reshard
+job moves them. Runs against a temporary SQLite database and upload
+directory; nothing here touches Cloudinary or the production database.
+"""
+import io
+import os
+import re
+import sys
+import uuid
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="local-layout-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["LOCAL_STORAGE_LAYOUT"] = "flat"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+from app import crud, models
+from app.auth import create_access_token
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.services.file_service import file_service
+from app.services.local_layout_migration import local_layout_migration
+from app.services.storage_backends import LocalStorageBackend
+from main import app
+
+UPLOAD_DIR = settings.UPLOAD_DIRECTORY
+SHARDED = re.compile(r"^media/[0-9a-f]{2}/[0-9a-f]{2}/task_completions/(\d+)/[^/]+$")
+
+
+def jpeg(color) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def relative_to(path: str, root) -> str:
+    return os.path.relpath(path, str(root)).replace(os.sep, "/")
+
+
+def relative(path: str) -> str:
+    return relative_to(path, UPLOAD_DIR)
+
+
+def usage(db, restaurant_id) -> dict:
+    db.expire_all()
+    return {row.storage_type: (row.object_count, row.bytes_used) for row in crud.get_storage_usage(db, restaurant_id)}
+
+
+@pytest.fixture(scope="module")
+def uploaded():
+    """Three flat uploads over two tasks, made through the API"""
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"L{uuid.uuid4().hex[:8]}", name="Layout", cuisine_type="Test",
+                                   contact_email="layout@example.com", contact_phone="0", password_hash="not-used")
+    db.add(restaurant)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(restaurant.id)})}"}
+
+    client = TestClient(app)
+    tasks = []
+    for colors in ([(10, 120, 200), (20, 200, 40)], [(200, 20, 20)]):
+        task = models.Task(restaurant_id=restaurant.id, task="Photograph the walk-in",
+                           category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+        db.add(task)
+        db.commit()
+        tasks.append(task)
+        for color in colors:
+            response = client.post("/api/upload/image", headers=headers, data={"task_id": str(task.id)},
+                                   files={"file": ("proof.jpg", jpeg(color), "image/jpeg")})
+            assert response.status_code == 200, response.text
+    yield db, restaurant, tasks, headers
+    db.close()
+
+
+def test_locate_finds_both_layouts(tmp_path):
+    flat = LocalStorageBackend(str(tmp_path), layout="flat")
+    sharded = LocalStorageBackend(str(tmp_path), layout="sharded")
+    asyncio.run(flat.put("task_completions/1/old.jpg", b"old", "image/jpeg"))
+    asyncio.run(sharded.put("task_completions/1/new.jpg", b"new", "image/jpeg"))
+
+    for backend in (flat, sharded):
+        assert backend.locate("task_completions/1/old.jpg") == flat.flat_path_for("task_completions/1/old.jpg")
+        assert backend.locate("task_completions/1/new.jpg") == sharded.sharded_path_for("task_completions/1/new.jpg")
+        assert backend.locate("task_completions/1/missing.jpg") is None
+    # Files of one task share their shard directories
+    assert os.path.dirname(sharded.path_for("task_completions/1/a.jpg")) == \
+        os.path.dirname(sharded.path_for("task_completions/1/b.jpg"))
+    assert SHARDED.match(relative_to(sharded.path_for("task_completions/1/a.jpg"), tmp_path))
+    # The task's flat directory and its sharded one
+    assert sorted(map(os.path.basename, flat.iter_directories("task_completions"))) == ["1", "1"]
+
+
+def test_reshard_moves_flat_files(uploaded):
+    db, restaurant, (first_task, second_task), headers = uploaded
+    db.expire_all()
+    media = db.query(models.MediaFile).order_by(models.MediaFile.id).all()
+    assert [relative(row.file_path).split("/")[0] for row in media] == ["task_completions"] * 3
+    before = usage(db, restaurant.id)
+    contents = {row.id: open(row.file_path, "rb").read() for row in media}
+
+    # A file moved by a run that stopped before its batch committed
+    interrupted = media[2]
+    key = relative(interrupted.file_path)
+    sharded_path = LocalStorageBackend(UPLOAD_DIR, layout="sharded").sharded_path_for(key)
+    os.makedirs(os.path.dirname(sharded_path))
+    os.replace(interrupted.file_path, sharded_path)
+
+    async def run():
+        local_layout_migration.start()
+        await local_layout_migration._task
+    asyncio.run(run())
+
+    status = local_layout_migration.status
+    assert status["state"] == "completed"
+    assert status["records_updated"] == 2 and status["records_repaired"] == 1
+    assert not os.path.exists(os.path.join(UPLOAD_DIR, "task_completions", str(first_task.id)))
+
+    db.expire_all()
+    client = TestClient(app)
+    for row in db.query(models.MediaFile).order_by(models.MediaFile.id).all():
+        match = SHARDED.match(relative(row.file_path))
+        assert match and match.group(1) == str(row.task_id)
+        with open(row.file_path, "rb") as f:
+            assert f.read() == contents[row.id]
+        assert row.file_url.endswith(f"/uploads/{relative(row.file_path)}")
+        # Renditions moved with their file
+        assert row.renditions and all(SHARDED.match(url.split("/uploads/", 1)[1]) for url in row.renditions.values())
+        assert client.get(f"/uploads/{relative(row.file_path)}").status_code == 200
+        assert file_service.local_backend.locate(relative(row.file_path).split("/", 3)[3]) == row.file_path
+
+    for task in (first_task, second_task):
+        db.refresh(task)
+        assert SHARDED.match(task.image_url.split("/uploads/", 1)[1])
+
+    # Files moved, not added: the counters match before and after, and a recount
+    assert usage(db, restaurant.id) == before
+    crud.recalculate_storage_usage(db, restaurant.id)
+    assert usage(db, restaurant.id) == before
+
+
+def test_reshard_is_platform_admin_only(uploaded, monkeypatch):
+    db, restaurant, tasks, headers = uploaded
+    client = TestClient(app)
+    monkeypatch.setattr(settings, "PLATFORM_ADMIN_RESTAURANT_IDS", [])
+    assert client.post("/api/admin/storage/reshard", headers=headers).status_code == 403
+    assert client.get("/api/admin/storage/reshard/status", headers=headers).status_code == 403
+    monkeypatch.setattr(settings, "PLATFORM_ADMIN_RESTAURANT_IDS", [restaurant.id])
+    assert client.get("/api/admin/storage/reshard/status", headers=headers).json()["state"] == "completed"
+
+
+if __name__ == "__main__":
+    print("🗂️ Testing the local storage reshard")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test content-hash deduplication of uploads and reference-counted deletes
+
+Runs against a temporary SQLite database and upload directory; nothing
+here touches Cloudinary or the production database.
+"""
+import io
+import os
+import sys
+import uuid
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="media-dedup-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+from app import crud, models
+from app.auth import create_access_token
+from app.database import SessionLocal, engine
+from app.services.file_service import file_service
+from main import app
+
+
+def jpeg(color=(10, 120, 200)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (48, 32), color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+@pytest.fixture(scope="module")
+def setup():
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"D{uuid.uuid4().hex[:8]}", name="Dedup", cuisine_type="Test",
+                                   contact_email="dedup@example.com", contact_phone="0", password_hash="not-used")
+    db.add(restaurant)
+    db.commit()
+    tasks = []
+    for name in ("Photograph the walk-in", "Photograph the pass"):
+        task = models.Task(restaurant_id=restaurant.id, task=name,
+                           category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+        db.add(task)
+        db.commit()
+        tasks.append(task)
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(restaurant.id)})}"}
+    yield db, restaurant, tasks, headers
+    db.close()
+
+
+def upload(client, headers, task, content: bytes, filename: str = "proof.jpg"):
+    response = client.post("/api/upload/image", headers=headers, data={"task_id": str(task.id)},
+                           files={"file": (filename, content, "image/jpeg")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def media_for(db, task) -> models.MediaFile:
+    db.expire_all()
+    return db.query(models.MediaFile).filter(models.MediaFile.task_id == task.id).one()
+
+
+def usage(db, restaurant) -> tuple:
+    db.expire_all()
+    local = [row for row in crud.get_storage_usage(db, restaurant.id) if row.storage_type == "local"]
+    return (local[0].object_count, local[0].bytes_used) if local else (0, 0)
+
+
+def test_identical_uploads_share_one_object(setup):
+    db, restaurant, (first_task, second_task), headers = setup
+    client = TestClient(app)
+    content = jpeg()
+
+    first = upload(client, headers, first_task, content)
+    second = upload(client, headers, second_task, content, filename="retry.jpg")
+    first_media, second_media = media_for(db, first_task), media_for(db, second_task)
+
+    assert first["url"] == second["url"]
+    assert first_media.id != second_media.id
+    assert (first_media.storage_type, first_media.file_path) == (second_media.storage_type, second_media.file_path)
+    assert first_media.content_hash == second_media.content_hash
+    assert second_media.original_filename == "retry.jpg"
+    assert crud.count_media_file_references(db, first_media) == 2
+
+    # Stored and counted once
+    stored = [name for _, _, files in os.walk(file_service.upload_dir) for name in files
+              if name == first_media.filename]
+    assert len(stored) == 1
+    assert usage(db, restaurant) == (1, first_media.file_size)
+
+    # Different bytes are stored separately
+    other = upload(client, headers, first_task, jpeg((200, 20, 20)))
+    assert other["url"] != first["url"]
+    other_media = db.query(models.MediaFile).filter(models.MediaFile.file_url == other["url"]).one()
+    assert client.delete(f"/api/upload/media/{other_media.id}", headers=headers).status_code == 200
+    assert usage(db, restaurant) == (1, first_media.file_size)
+
+
+def test_delete_keeps_shared_objects_until_the_last_reference(setup):
+    db, restaurant, (first_task, second_task), headers = setup
+    client = TestClient(app)
+    first_media, second_media = media_for(db, first_task), media_for(db, second_task)
+    path, file_size = first_media.file_path, first_media.file_size
+    assert os.path.exists(path)
+    objects, bytes_used = usage(db, restaurant)
+
+    assert client.delete(f"/api/upload/media/{first_media.id}", headers=headers).status_code == 200
+    assert os.path.exists(path)
+    assert usage(db, restaurant) == (objects, bytes_used)
+    assert crud.count_media_file_references(db, media_for(db, second_task)) == 1
+
+    assert client.delete(f"/api/upload/media/{second_media.id}", headers=headers).status_code == 200
+    assert not os.path.exists(path)
+    assert usage(db, restaurant) == (objects - 1, bytes_used - file_size)
+    assert db.query(models.MediaFile).filter(models.MediaFile.file_path == path).count() == 0
+
+
+if __name__ == "__main__":
+    print("🧬 Testing upload deduplication")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test local media delivery: byte ranges, validators and caching headers
+
+Serves files from a temporary directory through MediaStaticFiles and
+MediaFileResponse. Nothing here touches Cloudinary or a database.
+"""
+import os
+import sys
+import tempfile
+from email.utils import formatdate
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.services.media_delivery import (
+    IMMUTABLE_PUBLIC, MediaFileResponse, MediaStaticFiles, parse_range
+)
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+
+
+@pytest.fixture(scope="module")
+def client():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "clip.mp4")
+        with open(path, "wb") as f:
+            f.write(CONTENT)
+
+        app = FastAPI()
+        app.mount("/uploads", MediaStaticFiles(directory=tmp), name="uploads")
+
+        @app.api_route("/serve", methods=["GET", "HEAD"])
+        async def serve(request: Request):
+            return MediaFileResponse(path, request.headers, method=request.method)
+
+        yield TestClient(app)
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=-5000", 1000) == (0, 999)
+    assert parse_range("bytes=990-5000", 1000) == (990, 999)
+    # Malformed and multi-range headers are ignored
+    assert parse_range("bytes=0-1,5-9", 1000) is None
+    assert parse_range("items=0-9", 1000) is None
+    assert parse_range("bytes=-", 1000) is None
+    for unsatisfiable in ("bytes=1000-", "bytes=20-10", "bytes=-0"):
+        with pytest.raises(ValueError):
+            parse_range(unsatisfiable, 1000)
+
+
+@pytest.mark.parametrize("url", ["/uploads/clip.mp4", "/serve"])
+def test_full_response(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.headers["etag"].startswith('"')
+
+
+def test_public_mount_is_immutable(client):
+    assert client.get("/uploads/clip.mp4").headers["cache-control"] == IMMUTABLE_PUBLIC
+
+
+@pytest.mark.parametrize("url", ["/uploads/clip.mp4", "/serve"])
+def test_range_requests(client, url):
+    response = client.get(url, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+    assert response.headers["content-length"] == "100"
+
+    response = client.get(url, headers={"Range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[-10:]
+
+    response = client.get(url, headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+    assert response.content == b""
+
+    # Multiple ranges are not supported, so the whole file is sent
+    response = client.get(url, headers={"Range": "bytes=0-1,5-9"})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_range(client):
+    etag = client.head("/serve").headers["etag"]
+
+    response = client.get("/serve", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+    # A stale validator means the client's partial copy is outdated: send everything
+    response = client.get("/serve", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+    response = client.get("/serve", headers={"Range": "bytes=0-9", "If-Range": formatdate(0, usegmt=True)})
+    assert response.status_code == 200
+
+
+def test_conditional_requests(client):
+    head = client.head("/serve")
+    assert head.status_code == 200
+    assert head.content == b""
+    assert head.headers["content-length"] == str(len(CONTENT))
+
+    response = client.get("/serve", headers={"If-None-Match": head.headers["etag"]})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get("/serve", headers={"If-None-Match": f'"other", W/{head.headers["etag"]}'})
+    assert response.status_code == 304
+
+    response = client.get("/serve", headers={"If-Modified-Since": head.headers["last-modified"]})
+    assert response.status_code == 304
+
+    response = client.get("/serve", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+if __name__ == "__main__":
+    print("🧪 Testing media delivery")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
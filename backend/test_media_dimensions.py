@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Test the dimensions and placeholder stored with uploaded images
+
+Uploads go through the API and the media views read them back. Runs
+against a temporary SQLite database and upload directory; nothing here
+touches Cloudinary or the production database.
+"""
+import io
+import os
+import sys
+import uuid
+import base64
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="media-dimensions-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+from app import models
+from app.auth import create_access_token
+from app.database import SessionLocal, engine
+from app.services import media_metadata
+from app.services.image_pipeline import PLACEHOLDER_SIZE, image_pipeline
+from main import app
+
+
+def jpeg(orientation: int = None, color=(200, 40, 40)) -> bytes:
+    image = Image.new("RGB", (64, 48), color)
+    exif = Image.Exif()
+    if orientation:
+        exif[media_metadata.EXIF_ORIENTATION] = orientation
+    output = io.BytesIO()
+    image.save(output, format="JPEG", exif=exif)
+    return output.getvalue()
+
+
+def placeholder_size(placeholder: str) -> tuple:
+    header, data = placeholder.split(",", 1)
+    assert header == "data:image/webp;base64"
+    with Image.open(io.BytesIO(base64.b64decode(data))) as image:
+        return image.size
+
+
+@pytest.fixture(scope="module")
+def setup():
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"W{uuid.uuid4().hex[:8]}", name="Dimensions", cuisine_type="Test",
+                                   contact_email="dimensions@example.com", contact_phone="0", password_hash="not-used")
+    db.add(restaurant)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(restaurant.id)})}"}
+    yield db, restaurant, headers
+    db.close()
+
+
+def upload(setup, content: bytes) -> models.MediaFile:
+    """Upload to a new task; returns its media record"""
+    db, restaurant, headers = setup
+    task = models.Task(restaurant_id=restaurant.id, task="Photograph the walk-in",
+                       category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+    db.add(task)
+    db.commit()
+    response = TestClient(app).post("/api/upload/image", headers=headers, data={"task_id": str(task.id)},
+                                    files={"file": ("proof.jpg", content, "image/jpeg")})
+    assert response.status_code == 200, response.text
+    db.expire_all()
+    return db.query(models.MediaFile).filter(models.MediaFile.task_id == task.id).one()
+
+
+def layout(item: dict) -> tuple:
+    return item["width"], item["height"], item["aspect_ratio"], item["placeholder"]
+
+
+@pytest.mark.parametrize("orientation, size", [(None, (64, 48)), (1, (64, 48)), (6, (48, 64)), (8, (48, 64))])
+def test_dimensions_are_stored_as_displayed(setup, orientation, size):
+    media = upload(setup, jpeg(orientation))
+    assert (media.width, media.height) == size
+    assert media.aspect_ratio == round(size[0] / size[1], 4)
+    # The stored image is upright, so its pixels match the stored dimensions
+    with Image.open(media.file_path) as image:
+        assert image.size == size
+    # The placeholder is a tiny copy in the same orientation
+    width, height = placeholder_size(media.placeholder)
+    assert max(width, height) == PLACEHOLDER_SIZE
+    assert (width > height) == (size[0] > size[1])
+
+
+def test_media_views_return_the_layout(setup):
+    db, restaurant, headers = setup
+    rotated = upload(setup, jpeg(6, color=(10, 120, 200)))
+    expected = (48, 64, 0.75, rotated.placeholder)
+    client = TestClient(app)
+
+    gallery = client.get("/api/admin/media/gallery", headers=headers).json()["gallery"]
+    item = next(item for item in gallery if item["media_id"] == rotated.id)
+    assert layout(item) == expected
+
+    media_items = client.get(f"/api/admin/media/tasks/{rotated.task_id}/media", headers=headers).json()["media_items"]
+    assert [layout(item) for item in media_items] == [expected]
+
+    # A retried submission reuses the stored object and its layout
+    duplicate = upload(setup, jpeg(6, color=(10, 120, 200)))
+    assert duplicate.id != rotated.id
+    assert (duplicate.width, duplicate.height, duplicate.aspect_ratio, duplicate.placeholder) == expected
+
+
+def test_unoptimized_originals_keep_header_dimensions(setup, monkeypatch):
+    def failing(*args, **kwargs):
+        raise ValueError("encoder unavailable")
+    monkeypatch.setattr(image_pipeline, "process", failing)
+
+    media = upload(setup, jpeg(6, color=(20, 200, 40)))
+    # The original is stored with its EXIF stripped, so it displays as its pixels are
+    with Image.open(media.file_path) as image:
+        assert image.getexif().get(media_metadata.EXIF_ORIENTATION) is None
+        assert image.size == (64, 48)
+    assert (media.width, media.height, media.placeholder) == (64, 48, None)
+
+
+if __name__ == "__main__":
+    print("📐 Testing media dimensions")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
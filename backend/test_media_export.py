@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Test the streaming ZIP export of task media
+
+Streams files from a temporary local store; nothing here touches
+Cloudinary or a database.
+"""
+import io
+import os
+import sys
+import csv
+import asyncio
+import zipfile
+import tempfile
+from datetime import datetime
+
+# Nothing here needs a database or Cloudinary; make sure importing the app cannot reach them
+WORKDIR = tempfile.mkdtemp(prefix="export-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from app.services.media_export import MANIFEST_NAME, MediaExport
+from app.services.storage_backends import STREAM_CHUNK_SIZE, get_storage_backend
+
+
+def media_item(media_id: int, content: bytes = None) -> dict:
+    path = os.path.join(WORKDIR, f"{media_id}.jpg")
+    if content is not None:
+        with open(path, "wb") as f:
+            f.write(content)
+    return {
+        "id": media_id, "task_id": 7, "filename": f"{media_id}.jpg", "file_path": path,
+        "file_url": f"http://localhost/uploads/{media_id}.jpg", "file_size": len(content or b""),
+        "mime_type": "image/jpeg", "file_type": "image", "storage_type": "local",
+        "content_hash": None, "captured_at": None, "created_at": datetime(2026, 3, 2, 9, 30),
+        "task": "Clean the grill", "category": "Cleaning", "day": "Monday",
+        "task_status": "Submitted", "initials": "AB"
+    }
+
+
+def collect(export: MediaExport, items):
+    async def run():
+        return [chunk async for chunk in export.stream(items)]
+    return asyncio.run(run())
+
+
+def test_archive_and_manifest():
+    large = os.urandom(STREAM_CHUNK_SIZE * 2 + 10)
+    items = [media_item(1, b"first"), media_item(2), media_item(3, large)]
+    chunks = collect(MediaExport(concurrency=2), items)
+
+    # The archive goes out a block at a time, not as one buffer at the end
+    assert len([chunk for chunk in chunks if chunk]) > 3
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    assert archive.namelist() == ["2026-03-02/task-7-1.jpg", "2026-03-02/task-7-3.jpg", MANIFEST_NAME]
+    assert archive.read("2026-03-02/task-7-3.jpg") == large
+
+    rows = list(csv.DictReader(io.StringIO(archive.read(MANIFEST_NAME).decode())))
+    assert [(row["media_id"], row["export_status"]) for row in rows] == [
+        ("1", "included"), ("2", "missing"), ("3", "included")
+    ]
+    assert rows[0]["task"] == "Clean the grill"
+
+
+def test_fetches_are_bounded(monkeypatch):
+    backend = get_storage_backend("local")
+    original_stream = backend.stream
+    in_flight = peak = 0
+
+    async def counting_stream(file_path, resource_type="image"):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            async for chunk in original_stream(file_path, resource_type):
+                yield chunk
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(backend, "stream", counting_stream)
+    items = [media_item(media_id, os.urandom(1024)) for media_id in range(10, 30)]
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(collect(MediaExport(concurrency=3), items))))
+    assert len(archive.namelist()) == 21
+    assert peak <= 3
+
+
+if __name__ == "__main__":
+    print("🧪 Testing media export")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Test gallery keyset pagination, its media counters and the record backfill
+
+Runs against a temporary SQLite database and upload directory; nothing
+here touches Cloudinary or the production database.
+"""
+import os
+import sys
+import uuid
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+
+WORKDIR = tempfile.mkdtemp(prefix="media-gallery-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi.testclient import TestClient
+from app import crud, models
+from app.auth import create_access_token
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.services.media_record_backfill import media_record_backfill
+from main import app
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def new_restaurant(db, name: str) -> tuple:
+    restaurant = models.Restaurant(restaurant_code=f"P{uuid.uuid4().hex[:8]}", name=name, cuisine_type="Test",
+                                   contact_email=f"{name.lower()}@example.com", contact_phone="0",
+                                   password_hash="not-used")
+    db.add(restaurant)
+    db.commit()
+    return restaurant, {"Authorization": f"Bearer {create_access_token(data={'sub': str(restaurant.id)})}"}
+
+
+def new_task(db, restaurant, **urls) -> models.Task:
+    task = models.Task(restaurant_id=restaurant.id, task="Photograph the walk-in",
+                       category=models.TaskCategory.CLEANING, day=models.Day.MONDAY, **urls)
+    db.add(task)
+    db.commit()
+    return task
+
+
+def add_media(db, task, created_at: datetime, file_type: str = "image") -> models.MediaFile:
+    name = f"{uuid.uuid4().hex}.{'webp' if file_type == 'image' else 'mp4'}"
+    return crud.create_media_file(db, {
+        "task_id": task.id, "restaurant_id": task.restaurant_id, "filename": name, "original_filename": name,
+        "file_path": f"task_completions/{task.id}/{name}", "file_size": 10,
+        "file_url": f"http://testserver/uploads/task_completions/{task.id}/{name}",
+        "mime_type": "image/webp" if file_type == "image" else "video/mp4", "file_type": file_type,
+        "storage_type": "local", "created_at": created_at
+    })
+
+
+def walk(client, headers, limit: int, media_type: str = "all") -> list:
+    """Media ids of every gallery page, in order"""
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit, "media_type": media_type, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/admin/media/gallery", params=params, headers=headers).json()
+        ids.extend(item["media_id"] for item in page["gallery"])
+        assert page["has_more"] == (page["next_cursor"] is not None)
+        cursor = page["next_cursor"]
+        if not cursor:
+            return ids
+
+
+@pytest.fixture(scope="module")
+def gallery():
+    """23 media over two tenants' galleries, most sharing a created_at with others"""
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant, headers = new_restaurant(db, "Gallery")
+    other, other_headers = new_restaurant(db, "Other")
+    task = new_task(db, restaurant)
+    for index in range(20):
+        # Five uploads per second, images and videos mixed
+        add_media(db, task, START + timedelta(seconds=index // 5), "video" if index % 3 == 0 else "image")
+    other_task = new_task(db, other)
+    for index in range(3):
+        add_media(db, other_task, START)
+    yield db, (restaurant, headers), (other, other_headers), task
+    db.close()
+
+
+def newest_first(db, restaurant, media_type: str = None) -> list:
+    db.expire_all()
+    query = db.query(models.MediaFile).filter(models.MediaFile.restaurant_id == restaurant.id)
+    if media_type:
+        query = query.filter(models.MediaFile.file_type == media_type)
+    return [media.id for media in query.order_by(models.MediaFile.created_at.desc(), models.MediaFile.id.desc())]
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4, 5, 7, 20, 100])
+def test_pages_cover_the_gallery_once(gallery, limit):
+    db, (restaurant, headers), _, _ = gallery
+    ids = walk(TestClient(app), headers, limit)
+    # Ties on created_at are broken by id, so every page boundary is exact
+    assert ids == newest_first(db, restaurant)
+    assert len(ids) == len(set(ids)) == 20
+
+
+def test_pages_filtered_by_type(gallery):
+    db, (restaurant, headers), _, _ = gallery
+    client = TestClient(app)
+    for media_type in ("image", "video"):
+        assert walk(client, headers, 3, media_type) == newest_first(db, restaurant, media_type)
+
+
+def test_cursor_survives_changes_between_pages(gallery):
+    db, (restaurant, headers), _, task = gallery
+    client = TestClient(app)
+    expected = newest_first(db, restaurant)
+    page = client.get("/api/admin/media/gallery", params={"limit": 6}, headers=headers).json()
+    assert [item["media_id"] for item in page["gallery"]] == expected[:6]
+
+    # A newer upload and the deletion of the page's last item do not shift the next page
+    newer = add_media(db, task, START + timedelta(hours=1))
+    assert crud.delete_media_file(db, expected[5])
+    next_page = client.get("/api/admin/media/gallery", params={"limit": 6, "cursor": page["next_cursor"]},
+                           headers=headers).json()
+    assert [item["media_id"] for item in next_page["gallery"]] == expected[6:12]
+    assert crud.delete_media_file(db, newer.id)
+
+
+def test_foreign_and_malformed_cursors_are_rejected(gallery):
+    db, (restaurant, headers), (other, other_headers), _ = gallery
+    client = TestClient(app)
+    other_cursor = client.get("/api/admin/media/gallery", params={"limit": 1},
+                              headers=other_headers).json()["next_cursor"]
+    assert other_cursor
+    for cursor in (other_cursor, "not-a-cursor", "bm90IGEgY3Vyc29y"):
+        response = client.get("/api/admin/media/gallery", params={"cursor": cursor}, headers=headers)
+        assert response.status_code == 400, cursor
+        assert response.json()["detail"] == "Invalid gallery cursor"
+    assert client.get("/api/admin/media/gallery/sprite", params={"cursor": other_cursor},
+                      headers=headers).status_code == 400
+    # The other tenant's own cursor still works for them
+    assert client.get("/api/admin/media/gallery", params={"cursor": other_cursor},
+                      headers=other_headers).status_code == 200
+
+
+def test_counters_follow_uploads_and_deletes(gallery):
+    db, (restaurant, headers), (other, other_headers), task = gallery
+    client = TestClient(app)
+
+    def totals(request_headers) -> dict:
+        return {media_type: client.get("/api/admin/media/gallery", params={"media_type": media_type, "limit": 1},
+                                       headers=request_headers).json()["total_media"]
+                for media_type in ("all", "image", "video")}
+
+    def actual(owner) -> dict:
+        images, videos = len(newest_first(db, owner, "image")), len(newest_first(db, owner, "video"))
+        return {"all": images + videos, "image": images, "video": videos}
+
+    assert totals(headers) == actual(restaurant)
+    assert totals(other_headers) == actual(other) == {"all": 3, "image": 3, "video": 0}
+
+    # Deleting one record through the API, then a whole task with its media
+    media_id = newest_first(db, restaurant, "video")[0]
+    assert client.delete(f"/api/upload/media/{media_id}", headers=headers).status_code == 200
+    assert totals(headers) == actual(restaurant)
+    doomed = new_task(db, restaurant)
+    for index in range(4):
+        add_media(db, doomed, START, "video" if index % 2 else "image")
+    assert totals(headers) == actual(restaurant)
+    assert crud.delete_task(db, doomed.id, restaurant.id)
+    assert totals(headers) == actual(restaurant)
+
+    # The counters agree with a recount, and a restaurant without media counts zero
+    recount = client.post("/api/admin/media/counts/recalculate", headers=headers).json()["media_counts"]
+    assert recount == {"image": actual(restaurant)["image"], "video": actual(restaurant)["video"]}
+    _, empty_headers = new_restaurant(db, "Empty")
+    assert totals(empty_headers) == {"all": 0, "image": 0, "video": 0}
+    assert db.query(models.RestaurantMediaCount).filter(
+        models.RestaurantMediaCount.restaurant_id == other.id
+    ).count() == 2
+
+
+def test_record_backfill_adds_missing_media(gallery):
+    db, (restaurant, headers), _, _ = gallery
+    backfilled, _ = new_restaurant(db, "Backfill")
+    backfilled_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(backfilled.id)})}"}
+
+    # Media saved to tasks before submissions recorded it
+    local_key = f"task_completions/{uuid.uuid4().hex}/proof.webp"
+    local_path = os.path.join(settings.UPLOAD_DIRECTORY, *local_key.split("/"))
+    os.makedirs(os.path.dirname(local_path))
+    with open(local_path, "wb") as f:
+        f.write(b"local-bytes")
+    cloudinary = new_task(db, backfilled,
+                          image_url="https://res.cloudinary.com/demo/image/upload/v1/tasks/proof.jpg",
+                          video_url="https://res.cloudinary.com/demo/video/upload/v1/tasks/clip.mp4")
+    local = new_task(db, backfilled, image_url=f"http://testserver/uploads/{local_key}")
+    new_task(db, backfilled, image_url="https://cdn.example.com/photo.jpg",
+             video_url="http://testserver/uploads/task_completions/missing/clip.mp4")
+    recorded = new_task(db, backfilled)
+    recorded.image_url = add_media(db, recorded, START).file_url
+    db.commit()
+
+    async def run():
+        media_record_backfill.start()
+        await media_record_backfill._task
+    asyncio.run(run())
+    status = media_record_backfill.status
+    assert status["state"] == "completed", status.get("error")
+    assert (status["records_created"], status["skipped"]) == (3, 2)
+
+    db.expire_all()
+    rows = {row.file_url: row for row in db.query(models.MediaFile).filter(
+        models.MediaFile.restaurant_id == backfilled.id
+    )}
+    assert len(rows) == 4
+    assert (rows[cloudinary.video_url].file_type, rows[cloudinary.video_url].storage_type) == ("video", "cloudinary")
+    assert rows[cloudinary.image_url].file_path == "tasks/proof"
+    assert (rows[local.image_url].file_path, rows[local.image_url].file_size) == (local_path, len(b"local-bytes"))
+
+    # Visible in the gallery and counted
+    client = TestClient(app)
+    page = client.get("/api/admin/media/gallery", headers=backfilled_headers).json()
+    assert sorted(item["media_id"] for item in page["gallery"]) == sorted(row.id for row in rows.values())
+    assert page["total_media"] == 4
+    assert crud.get_media_counts(db, backfilled.id) == {"image": 3, "video": 1}
+
+    # Safe to re-run
+    asyncio.run(run())
+    assert media_record_backfill.status["records_created"] == 0
+
+
+def test_record_backfill_is_platform_admin_only(gallery, monkeypatch):
+    db, (restaurant, headers), _, _ = gallery
+    client = TestClient(app)
+    monkeypatch.setattr(settings, "PLATFORM_ADMIN_RESTAURANT_IDS", [])
+    assert client.post("/api/admin/media/records/backfill", headers=headers).status_code == 403
+    assert client.get("/api/admin/media/records/backfill/status", headers=headers).status_code == 403
+    monkeypatch.setattr(settings, "PLATFORM_ADMIN_RESTAURANT_IDS", [restaurant.id])
+    assert client.get("/api/admin/media/records/backfill/status", headers=headers).status_code == 200
+
+
+if __name__ == "__main__":
+    print("🗃️ Testing gallery pagination")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Test orphaned media garbage collection
+
+Cloudinary is a local fake (fake_cloudinary.py) seeded with assets, and
+local files live in a temporary upload directory. Runs against a temporary
+SQLite database; nothing here touches Cloudinary or the production database.
+"""
+import os
+import sys
+import uuid
+import time
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="media-gc-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+os.environ["CLOUDINARY_API_KEY"] = "123456"
+os.environ["CLOUDINARY_API_SECRET"] = "test-secret"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import cloudinary
+from fastapi.testclient import TestClient
+from fake_cloudinary import FakeCloudinaryServer
+from app import models
+from app.auth import create_access_token
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.services.cloudinary_client import cloudinary_client
+from app.services.file_service import file_service
+from app.services.media_gc import media_gc
+from app.services.storage_backends import RENDITION_SEPARATOR
+from main import app
+
+OLD = "2020-01-01T00:00:00Z"
+ORPHANED_ASSETS = 250
+
+
+@pytest.fixture(scope="module")
+def fake_cloudinary():
+    server = FakeCloudinaryServer().start()
+    previous_prefix = cloudinary.config().upload_prefix
+    cloudinary.config(upload_prefix=server.url)
+    yield server.state
+    cloudinary.config(upload_prefix=previous_prefix)
+    server.stop()
+
+
+def seed_asset(state: dict, public_id: str, created_at: str = OLD) -> str:
+    state["assets"][public_id] = {"content": b"x" * 10, "resource_type": "image", "format": "jpg",
+                                  "version": 1700000000, "created_at": created_at}
+    return public_id
+
+
+def local_file(key: str, age_seconds: int = 7 * 24 * 3600) -> str:
+    path = file_service.local_backend.path_for(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"local-bytes")
+    stale = time.time() - age_seconds
+    os.utime(path, (stale, stale))
+    return path
+
+
+@pytest.fixture(scope="module")
+def storage(fake_cloudinary):
+    """Referenced and orphaned media in both stores"""
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"G{uuid.uuid4().hex[:8]}", name="GC", cuisine_type="Test",
+                                   contact_email="gc@example.com", contact_phone="0", password_hash="not-used")
+    db.add(restaurant)
+    db.commit()
+    task = models.Task(restaurant_id=restaurant.id, task="Photograph the walk-in",
+                       category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+    db.add(task)
+    db.commit()
+
+    kept = {
+        # A MediaFile row and a task URL reference these
+        "row_asset": seed_asset(fake_cloudinary, f"task_completions/{task.id}/row"),
+        "url_asset": seed_asset(fake_cloudinary, f"tasks/restaurant_{restaurant.id}/task_{task.id}_AB"),
+        "row_file": local_file(f"task_completions/{task.id}/row.webp"),
+        "url_file": local_file(f"task_completions/{task.id}/url.webp"),
+        # Derived from a referenced file
+        "rendition": local_file(f"task_completions/{task.id}/row{RENDITION_SEPARATOR}thumbnail.webp"),
+        # Orphaned, but inside the grace period
+        "recent_asset": seed_asset(fake_cloudinary, "task_completions/9999/recent",
+                                   time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
+        "recent_file": local_file("task_completions/9999/recent.webp", age_seconds=60),
+        # Not one of our folders
+        "foreign_asset": seed_asset(fake_cloudinary, "marketing/banner"),
+    }
+    db.add(models.MediaFile(task_id=task.id, restaurant_id=restaurant.id, filename="row.jpg",
+                            original_filename="row.jpg", file_path=kept["row_asset"],
+                            file_url=f"https://res.cloudinary.com/test-cloud/image/upload/v1/{kept['row_asset']}.jpg",
+                            file_size=10, mime_type="image/jpeg", file_type="image", storage_type="cloudinary",
+                            cloudinary_id=kept["row_asset"]))
+    db.add(models.MediaFile(task_id=task.id, restaurant_id=restaurant.id, filename="row.webp",
+                            original_filename="row.jpg", file_path=kept["row_file"],
+                            file_url=file_service.get_file_url(kept["row_file"], "http://testserver"),
+                            file_size=11, mime_type="image/webp", file_type="image", storage_type="local"))
+    task.image_url = f"https://res.cloudinary.com/test-cloud/image/upload/v1/{kept['url_asset']}.jpg"
+    task.video_url = file_service.get_file_url(kept["url_file"], "http://testserver")
+    db.commit()
+
+    orphans = {
+        "assets": [seed_asset(fake_cloudinary, f"task_completions/{task.id}/orphan-{i:03d}")
+                   for i in range(ORPHANED_ASSETS)],
+        "files": [local_file(f"task_completions/{task.id}/orphan.webp"),
+                  local_file(f"task_completions/{task.id}/orphan{RENDITION_SEPARATOR}thumbnail.webp")]
+    }
+    yield restaurant, kept, orphans
+    db.close()
+
+
+@pytest.fixture
+def cloudinary_enabled(monkeypatch):
+    monkeypatch.setattr(file_service, "cloudinary_configured", True)
+
+
+@pytest.fixture
+def delete_calls(monkeypatch):
+    """Public ids passed to each delete_resources call"""
+    calls = []
+    delete_resources = cloudinary_client.delete_resources
+
+    async def recording(public_ids, **options):
+        calls.append(list(public_ids))
+        return await delete_resources(public_ids, **options)
+
+    monkeypatch.setattr(cloudinary_client, "delete_resources", recording)
+    return calls
+
+
+def collect(dry_run: bool) -> dict:
+    async def run():
+        media_gc.start(dry_run)
+        await media_gc._task
+        # The next run gets its own event loop; drop the client bound to this one
+        await cloudinary_client.aclose()
+    asyncio.run(run())
+    return media_gc.status
+
+
+def test_dry_run_deletes_nothing(storage, fake_cloudinary, cloudinary_enabled, delete_calls):
+    restaurant, kept, orphans = storage
+    assets_before = set(fake_cloudinary["assets"])
+
+    status = collect(dry_run=True)
+    assert status["state"] == "completed", status.get("error")
+    assert status["orphaned"] == ORPHANED_ASSETS + len(orphans["files"])
+    assert (status["deleted"], status["delete_calls"]) == (0, 0)
+    assert len(status["sample"]) == 50
+    assert delete_calls == []
+    assert set(fake_cloudinary["assets"]) == assets_before
+    assert all(os.path.exists(path) for path in orphans["files"])
+
+
+def test_collection_keeps_referenced_media(storage, fake_cloudinary, cloudinary_enabled, delete_calls):
+    restaurant, kept, orphans = storage
+
+    status = collect(dry_run=False)
+    assert status["state"] == "completed", status.get("error")
+    assert status["deleted"] == ORPHANED_ASSETS + len(orphans["files"])
+
+    # Cloudinary deletes go out in batches of at most 100 public ids
+    assert [len(call) for call in delete_calls] == [100, 100, 50]
+    assert sorted(public_id for call in delete_calls for public_id in call) == sorted(orphans["assets"])
+    assert status["delete_calls"] == len(delete_calls) + 1  # Plus one local batch
+
+    assert not any(public_id in fake_cloudinary["assets"] for public_id in orphans["assets"])
+    assert not any(os.path.exists(path) for path in orphans["files"])
+    for name in ("row_asset", "url_asset", "recent_asset", "foreign_asset"):
+        assert kept[name] in fake_cloudinary["assets"], name
+    for name in ("row_file", "url_file", "rendition", "recent_file"):
+        assert os.path.exists(kept[name]), name
+
+
+def test_gc_is_platform_admin_only(storage, monkeypatch):
+    restaurant, kept, orphans = storage
+    monkeypatch.setattr(settings, "PLATFORM_ADMIN_RESTAURANT_IDS", [])
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(restaurant.id)})}"}
+    client = TestClient(app)
+    assert client.post("/api/admin/storage/gc", headers=headers).status_code == 403
+    assert client.get("/api/admin/storage/gc/status", headers=headers).status_code == 403
+    assert client.get("/api/admin/storage/gc/status").status_code == 403
+
+    monkeypatch.setattr(settings, "PLATFORM_ADMIN_RESTAURANT_IDS", [restaurant.id])
+    assert client.get("/api/admin/storage/gc/status", headers=headers).json()["state"] == "completed"
+
+
+if __name__ == "__main__":
+    print("🧹 Testing media garbage collection")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
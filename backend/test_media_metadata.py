@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test metadata extraction at ingest: type sniffing, EXIF, container headers
+and location stripping
+
+Builds small images with Pillow and MP4/WebM headers by hand; no media
+tools, Cloudinary or database are needed.
+"""
+import io
+import os
+import sys
+import struct
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# Nothing here needs a database or Cloudinary; make sure importing the app cannot reach them
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='metadata-test-'), 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from PIL import Image
+from app.services import media_metadata
+from app.services.image_pipeline import image_pipeline
+
+GPS_IFD = 0x8825
+
+
+def jpeg_with_exif(orientation: int = 6) -> bytes:
+    image = Image.new("RGB", (64, 48), (200, 40, 40))
+    exif = Image.Exif()
+    exif[media_metadata.EXIF_ORIENTATION] = orientation
+    exif[media_metadata.EXIF_IFD] = {
+        media_metadata.EXIF_DATETIME_ORIGINAL: "2024:05:01 10:22:33",
+        media_metadata.EXIF_OFFSET_TIME_ORIGINAL: "+02:00"
+    }
+    exif[GPS_IFD] = {2: (51.0, 30.0, 0.0)}  # GPSLatitude
+    output = io.BytesIO()
+    image.save(output, format="JPEG", exif=exif)
+    return output.getvalue()
+
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mp4(rotation_matrix=(1, 0), created: int = 3800000000) -> bytes:
+    a, b = rotation_matrix
+    mvhd = struct.pack(">B3xIIII", 0, created, created, 1000, 12500) + b"\x00" * 80
+    matrix = struct.pack(">ii", a << 16, b << 16) + b"\x00" * 28
+    tkhd = struct.pack(">B3xIIIII", 0, 0, 0, 1, 0, 12500) + b"\x00" * 16 + matrix + struct.pack(">II", 1920 << 16, 1080 << 16)
+    hdlr = b"\x00" * 8 + b"vide" + b"\x00" * 12
+    location = box(b"\xa9xyz", b"\x00\x12\x15\xc7+51.5000-000.1200/")
+    moov = box(b"moov", box(b"mvhd", mvhd)
+               + box(b"trak", box(b"tkhd", tkhd) + box(b"mdia", box(b"hdlr", hdlr)))
+               + box(b"udta", location))
+    return box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2") + moov + box(b"mdat", os.urandom(256))
+
+
+def ebml(element_id: int, payload: bytes) -> bytes:
+    id_bytes = element_id.to_bytes((element_id.bit_length() + 7) // 8, "big")
+    return id_bytes + bytes([0x80 | len(payload)]) + payload
+
+
+def webm() -> bytes:
+    header = ebml(media_metadata.EBML_HEADER, ebml(media_metadata.EBML_DOCTYPE, b"webm"))
+    info = ebml(media_metadata.MKV_INFO, ebml(media_metadata.MKV_TIMECODE_SCALE, (1000000).to_bytes(3, "big"))
+                + ebml(media_metadata.MKV_DURATION, struct.pack(">d", 4250.0)))
+    video = ebml(media_metadata.MKV_VIDEO, ebml(media_metadata.MKV_PIXEL_WIDTH, (1280).to_bytes(2, "big"))
+                 + ebml(media_metadata.MKV_PIXEL_HEIGHT, (720).to_bytes(2, "big")))
+    tracks = ebml(media_metadata.MKV_TRACKS, ebml(media_metadata.MKV_TRACK_ENTRY,
+                                                  ebml(media_metadata.MKV_TRACK_TYPE, b"\x01") + video))
+    cluster = ebml(media_metadata.MKV_CLUSTER, os.urandom(64))
+    # Live recordings write the segment with an unknown size
+    segment = bytes.fromhex("18538067") + b"\x01\xff\xff\xff\xff\xff\xff\xff" + info + tracks + cluster
+    return header + segment
+
+
+@pytest.mark.parametrize("content, expected", [
+    (jpeg_with_exif(), "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n" + b"\x00" * 20, "image/png"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (mp4(), "video/mp4"),
+    (box(b"ftyp", b"qt  \x00\x00\x00\x00"), "video/quicktime"),
+    (webm(), "video/webm"),
+    (b"%PDF-1.7", None),
+])
+def test_sniff_type(content, expected):
+    assert media_metadata.sniff_type(content[:media_metadata.SNIFF_BYTES]) == expected
+
+
+def test_aliases_match_allowed_types():
+    assert media_metadata.is_allowed("video/quicktime", ["video/mp4", "video/mov"])
+    assert not media_metadata.is_allowed("image/heic", ["image/jpeg", "image/png"])
+    assert not media_metadata.is_allowed(None, ["image/jpeg"])
+
+
+def test_image_metadata():
+    metadata = media_metadata.image_metadata(jpeg_with_exif())
+    assert (metadata["width"], metadata["height"], metadata["orientation"]) == (64, 48, 6)
+    assert metadata["captured_at"] == datetime(2024, 5, 1, 10, 22, 33, tzinfo=timezone(timedelta(hours=2)))
+
+
+def test_gps_is_not_stored():
+    content = jpeg_with_exif()
+    assert Image.open(io.BytesIO(content)).getexif().get_ifd(GPS_IFD)
+
+    # Re-encoded images carry no EXIF at all
+    processed = image_pipeline.process(content)
+    assert not Image.open(io.BytesIO(processed.content)).getexif()
+
+    # Originals stored as uploaded lose their EXIF segment but keep the image
+    stripped = media_metadata.strip_exif(content)
+    image = Image.open(io.BytesIO(stripped))
+    assert not image.getexif()
+    assert image.size == (64, 48)
+
+
+def test_mp4_metadata_and_location():
+    buffer = io.BytesIO(mp4(rotation_matrix=(0, 1)))
+    metadata = media_metadata.video_metadata(buffer, "video/mp4")
+    assert metadata["duration_seconds"] == 12.5
+    assert (metadata["width"], metadata["height"]) == (1920, 1080)
+    assert metadata["orientation"] == 6  # Rotated 90 degrees
+    assert metadata["captured_at"] == media_metadata.MP4_EPOCH + timedelta(seconds=3800000000)
+
+    size = len(buffer.getvalue())
+    assert media_metadata.strip_video_location(buffer, "video/mp4") == 1
+    assert b"\xa9xyz" not in buffer.getvalue()
+    assert len(buffer.getvalue()) == size
+    # The file still parses after the atom was turned into free space
+    assert media_metadata.video_metadata(buffer, "video/mp4")["duration_seconds"] == 12.5
+
+
+def test_webm_metadata():
+    metadata = media_metadata.video_metadata(io.BytesIO(webm()), "video/webm")
+    assert metadata == {"duration_seconds": 4.25, "width": 1280, "height": 720}
+
+
+def test_truncated_video_does_not_raise():
+    assert media_metadata.video_metadata(io.BytesIO(mp4()[:40]), "video/mp4") == {}
+    assert media_metadata.video_metadata(io.BytesIO(webm()[:30]), "video/webm") == {}
+
+
+if __name__ == "__main__":
+    print("🧪 Testing media metadata")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test media URL parsing and delivery URL building
+
+Runs against a temporary SQLite database; nothing here touches Cloudinary
+or the production database.
+"""
+import os
+import sys
+import uuid
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="media-references-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi.testclient import TestClient
+from app import models
+from app.auth import create_access_token
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.media_references import MediaReference, build_delivery_url, parse_media_url, reference_for
+from app.services.cloudinary_service import CloudinaryService
+from main import app
+
+CLOUD = "https://res.cloudinary.com/demo"
+
+
+@pytest.mark.parametrize("url, expected", [
+    (f"{CLOUD}/image/upload/v1700000000/tasks/restaurant_4/task_12_AB.jpg",
+     ("cloudinary", "image", "tasks/restaurant_4/task_12_AB", "1700000000", "jpg", "demo")),
+    # Nested public_id with a dot in a folder name
+    (f"{CLOUD}/image/upload/v1/a/b.c/d/photo.PNG",
+     ("cloudinary", "image", "a/b.c/d/photo", "1", "png", "demo")),
+    # Transformation segments before the version are skipped
+    (f"{CLOUD}/image/upload/c_fill,h_300,w_300/v1700000000/task_completions/3/x.webp",
+     ("cloudinary", "image", "task_completions/3/x", "1700000000", "webp", "demo")),
+    # ... and without a version, every leading transformation segment is
+    (f"{CLOUD}/image/upload/c_limit,w_600/q_auto/task_completions/3/x.jpg",
+     ("cloudinary", "image", "task_completions/3/x", None, "jpg", "demo")),
+    # A folder that merely looks like a transformation is kept when it holds the file
+    (f"{CLOUD}/image/upload/x_1.jpg",
+     ("cloudinary", "image", "x_1", None, "jpg", "demo")),
+    (f"{CLOUD}/video/upload/v5/tasks/restaurant_4/task_12_video_AB.mp4",
+     ("cloudinary", "video", "tasks/restaurant_4/task_12_video_AB", "5", "mp4", "demo")),
+    # Raw public_ids keep their extension
+    (f"{CLOUD}/raw/upload/v2/exports/report.csv",
+     ("cloudinary", "raw", "exports/report.csv", "2", None, "demo")),
+    ("http://localhost:8000/uploads/media/ab/cd/task_completions/3/x.webp",
+     ("local", "image", "media/ab/cd/task_completions/3/x.webp", None, "webp", None)),
+    ("https://api.example.com/uploads/task_completions/3/clip.MOV?token=1",
+     ("local", "video", "task_completions/3/clip.MOV", None, "mov", None)),
+    ("https://cdn.example.com/images/photo.jpg",
+     ("external", "image", None, None, "jpg", None)),
+    # Not an upload URL on Cloudinary's host
+    ("https://cloudinary.com/documentation",
+     ("external", "image", None, None, None, None)),
+])
+def test_parse_media_url(url, expected):
+    assert tuple(parse_media_url(url)) == expected
+
+
+def test_empty_urls():
+    assert parse_media_url(None) is None and parse_media_url("") is None
+    assert reference_for(None) is None
+
+
+def test_build_delivery_url_round_trips():
+    for url in (f"{CLOUD}/image/upload/v1700000000/tasks/restaurant_4/task_12_AB.jpg",
+                f"{CLOUD}/image/upload/task_completions/3/x.jpg",
+                f"{CLOUD}/raw/upload/v2/exports/report.csv"):
+        assert build_delivery_url(parse_media_url(url)) == url
+
+    reference = parse_media_url(f"{CLOUD}/video/upload/v5/tasks/clip.mp4")
+    assert build_delivery_url(reference, "c_fill,h_300,w_300", "jpg") == \
+        f"{CLOUD}/video/upload/c_fill,h_300,w_300/v5/tasks/clip.jpg"
+    assert build_delivery_url(parse_media_url("http://localhost:8000/uploads/task_completions/3/x.jpg")) is None
+    assert build_delivery_url(parse_media_url("https://cdn.example.com/photo.jpg")) is None
+
+
+def test_stored_reference_wins_over_the_url():
+    stored = MediaReference("cloudinary", "image", "moved/photo", "9", "jpg", "demo").to_dict()
+    assert reference_for("https://cdn.example.com/photo.jpg", stored).public_id == "moved/photo"
+    # Rows written before references were stored fall back to parsing
+    assert reference_for(f"{CLOUD}/image/upload/v1/a.jpg", {}).public_id == "a"
+    assert MediaReference.from_dict({"provider": "cloudinary", "unexpected": 1}).public_id is None
+
+
+def test_preview_urls():
+    url = f"{CLOUD}/image/upload/v1700000000/tasks/restaurant_4/task_12_AB.jpg"
+    previews = CloudinaryService.generate_preview_urls(url, ["thumbnail", "medium", "original", "unknown"])["previews"]
+    assert previews == {
+        "thumbnail": f"{CLOUD}/image/upload/c_fill,h_300,w_300/v1700000000/tasks/restaurant_4/task_12_AB.jpg",
+        "medium": f"{CLOUD}/image/upload/c_fit,h_600,w_600/v1700000000/tasks/restaurant_4/task_12_AB.jpg",
+        "original": url
+    }
+    # Renditions generated at upload are used as they are
+    previews = CloudinaryService.generate_preview_urls(url, ["thumbnail"], renditions={"thumbnail": "https://t"})
+    assert previews["previews"] == {"thumbnail": "https://t"}
+
+    video = CloudinaryService.get_media_info(f"{CLOUD}/video/upload/v5/tasks/clip.mp4")
+    assert video["thumbnail_url"] == f"{CLOUD}/video/upload/c_fill,h_300,w_300/v5/tasks/clip.jpg"
+    assert video["poster_url"] == f"{CLOUD}/video/upload/c_fit,h_1200,w_1200/v5/tasks/clip.jpg"
+    assert video["streaming_url"] == f"{CLOUD}/video/upload/v5/tasks/clip.mp4"
+
+    local = "http://localhost:8000/uploads/task_completions/3/x.webp"
+    assert CloudinaryService.get_media_info(local)["is_cloudinary"] is False
+    assert CloudinaryService.generate_preview_urls(local) == {"error": "Not a Cloudinary URL"}
+
+
+@pytest.fixture(scope="module")
+def restaurant_id():
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"R{uuid.uuid4().hex[:8]}", name="Refs", cuisine_type="Test",
+                                   contact_email="refs@example.com", contact_phone="0", password_hash="not-used")
+    db.add(restaurant)
+    db.commit()
+    restaurant_id = restaurant.id
+    db.close()
+    return restaurant_id
+
+
+def test_preview_endpoints(restaurant_id):
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(restaurant_id)})}"}
+    client = TestClient(app)
+    url = f"{CLOUD}/image/upload/v1700000000/tasks/restaurant_4/task_12_AB.jpg"
+
+    preview = client.get("/api/admin/media/preview", params={"url": url, "size": "small"}, headers=headers).json()
+    assert preview["preview_url"] == f"{CLOUD}/image/upload/c_fit,h_300,w_300/v1700000000/tasks/restaurant_4/task_12_AB.jpg"
+    assert preview["available_sizes"] == ["thumbnail", "small", "medium", "large", "original"]
+    assert preview["filename"] == "task_12_AB.jpg"
+
+    local = "http://localhost:8000/uploads/task_completions/3/x.webp"
+    preview = client.get("/api/admin/media/preview", params={"url": local}, headers=headers).json()
+    assert (preview["is_cloudinary"], preview["preview_url"]) == (False, local)
+
+    response = client.get("/api/admin/media/redirect", params={"url": url, "size": "thumbnail"},
+                          headers=headers, follow_redirects=False)
+    assert response.headers["location"] == \
+        f"{CLOUD}/image/upload/c_fill,h_300,w_300/v1700000000/tasks/restaurant_4/task_12_AB.jpg"
+
+
+def test_reference_backfill_is_platform_admin_only(restaurant_id, monkeypatch):
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(restaurant_id)})}"}
+    client = TestClient(app)
+    monkeypatch.setattr(settings, "PLATFORM_ADMIN_RESTAURANT_IDS", [])
+    assert client.post("/api/admin/media/references/backfill", headers=headers).status_code == 403
+    assert client.get("/api/admin/media/references/backfill/status", headers=headers).status_code == 403
+    monkeypatch.setattr(settings, "PLATFORM_ADMIN_RESTAURANT_IDS", [restaurant_id])
+    assert client.get("/api/admin/media/references/backfill/status", headers=headers).status_code == 200
+
+
+if __name__ == "__main__":
+    print("🔗 Testing media references")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
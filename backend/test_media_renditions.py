@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Test the fixed renditions generated at upload and their use by the media views
+
+Local uploads go through the API; Cloudinary is a local fake
+(fake_cloudinary.py). Runs against a temporary SQLite database and upload
+directory; nothing here touches Cloudinary or the production database.
+"""
+import io
+import os
+import sys
+import uuid
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="media-renditions-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+os.environ["CLOUDINARY_API_KEY"] = "123456"
+os.environ["CLOUDINARY_API_SECRET"] = "test-secret"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import cloudinary
+from PIL import Image
+from fastapi.testclient import TestClient
+from fake_cloudinary import FakeCloudinaryServer
+from app import crud, models
+from app.auth import create_access_token
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.media_references import IMAGE_RENDITIONS, VIDEO_RENDITIONS, rendition_transformation
+from app.services.cloudinary_client import cloudinary_client
+from app.services.file_service import file_service
+from app.services.storage_backends import CloudinaryStorageBackend
+from main import app
+
+
+def jpeg(size=(800, 600), color=(10, 120, 200)) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", size, color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+def local_path(url: str) -> str:
+    return os.path.join(settings.UPLOAD_DIRECTORY, url.split("/uploads/", 1)[1])
+
+
+@pytest.fixture(scope="module")
+def fake_cloudinary():
+    server = FakeCloudinaryServer().start()
+    previous_prefix = cloudinary.config().upload_prefix
+    cloudinary.config(upload_prefix=server.url)
+    yield server.state
+    cloudinary.config(upload_prefix=previous_prefix)
+    server.stop()
+
+
+@pytest.fixture(scope="module")
+def setup():
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"N{uuid.uuid4().hex[:8]}", name="Renditions", cuisine_type="Test",
+                                   contact_email="renditions@example.com", contact_phone="0", password_hash="not-used")
+    db.add(restaurant)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(restaurant.id)})}"}
+    yield db, restaurant, headers
+    db.close()
+
+
+def new_task(db, restaurant) -> models.Task:
+    task = models.Task(restaurant_id=restaurant.id, task="Photograph the walk-in",
+                       category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+    db.add(task)
+    db.commit()
+    return task
+
+
+def test_local_upload_gets_the_image_renditions(setup):
+    db, restaurant, headers = setup
+    task = new_task(db, restaurant)
+    client = TestClient(app)
+
+    response = client.post("/api/upload/image", headers=headers, data={"task_id": str(task.id)},
+                           files={"file": ("proof.jpg", jpeg(), "image/jpeg")})
+    assert response.status_code == 200, response.text
+
+    db.expire_all()
+    media = db.query(models.MediaFile).filter(models.MediaFile.task_id == task.id).one()
+    renditions = media.renditions
+    assert set(renditions) == set(IMAGE_RENDITIONS)
+    sizes = {}
+    for name, url in renditions.items():
+        with Image.open(local_path(url)) as image:
+            sizes[name] = image.size
+        assert client.get("/" + url.split("://", 1)[1].split("/", 1)[1]).status_code == 200
+    # Fill crops to the box; fit scales down inside it and never up
+    assert sizes == {"thumbnail": (300, 300), "small": (300, 225), "medium": (600, 450), "large": (800, 600)}
+
+
+def test_cloudinary_uploads_derive_their_renditions_eagerly(fake_cloudinary):
+    backend = CloudinaryStorageBackend()
+
+    async def run():
+        image = await backend.put("task_completions/1/photo.jpg", jpeg(), "image/jpeg")
+        video = await backend.put("task_completions/1/clip.mp4", b"not-really-a-video", "video/mp4")
+        await cloudinary_client.aclose()
+        return image, video
+    image, video = asyncio.run(run())
+
+    assert set(image.renditions) == set(IMAGE_RENDITIONS)
+    assert set(video.renditions) == set(VIDEO_RENDITIONS)
+    version = fake_cloudinary["assets"][image.file_path]["version"]
+    for name, url in image.renditions.items():
+        assert url == (f"https://res.cloudinary.com/test-cloud/image/upload/{rendition_transformation(name)}"
+                       f"/v{version}/task_completions/1/photo.jpg")
+    # Video renditions are still frames
+    assert all(url.endswith("/task_completions/1/clip.jpg") for url in video.renditions.values())
+
+    # The URLs spell each transformation exactly as the upload asked Cloudinary to derive it
+    for stored, resource_type in ((image, "image"), (video, "video")):
+        eager = fake_cloudinary["assets"][stored.file_path]["eager"].split("|")
+        transformations = [url.split("/upload/", 1)[1].split("/", 1)[0] for url in stored.renditions.values()]
+        assert [step.split("/")[0] for step in eager] == transformations
+    assert CloudinaryStorageBackend.eager_options("video")["eager_async"] is True
+    assert CloudinaryStorageBackend.eager_options("image")["eager_async"] is False
+
+
+def test_media_views_serve_the_renditions(setup, fake_cloudinary):
+    db, restaurant, headers = setup
+    client = TestClient(app)
+
+    # A Cloudinary video recorded the way a submission records it
+    task = new_task(db, restaurant)
+
+    async def put_video():
+        stored = await CloudinaryStorageBackend().put(f"task_completions/{task.id}/clip.mp4", b"video", "video/mp4")
+        await cloudinary_client.aclose()
+        return stored
+    stored = asyncio.run(put_video())
+    video = crud.create_media_file(db, {
+        "task_id": task.id, "restaurant_id": restaurant.id,
+        **file_service._file_data(stored, "clip.mp4", "clip.mp4", "video/mp4", "video")
+    })
+    task.video_url = video.file_url
+    db.commit()
+
+    gallery = client.get("/api/admin/media/gallery", headers=headers).json()["gallery"]
+    items = {item["media_id"]: item for item in gallery}
+    images = db.query(models.MediaFile).filter(models.MediaFile.file_type == "image").all()
+    assert images
+    for media in images:
+        assert items[media.id]["thumbnail_url"] == media.renditions["thumbnail"]
+        assert items[media.id]["preview_url"] == media.renditions["medium"]
+    assert items[video.id]["thumbnail_url"] == video.renditions["thumbnail"]
+    assert items[video.id]["preview_url"] == video.file_url
+
+    image_task_id = images[0].task_id
+    media_items = client.get(f"/api/admin/media/tasks/{image_task_id}/media", headers=headers).json()["media_items"]
+    image_item = next(item for item in media_items if item["type"] == "image")
+    renditions = images[0].renditions
+    assert image_item["thumbnail_url"] == renditions["thumbnail"]
+    assert image_item["previews"] == {name: renditions[name] for name in IMAGE_RENDITIONS}
+
+    media_items = client.get(f"/api/admin/media/tasks/{task.id}/media", headers=headers).json()["media_items"]
+    video_item = next(item for item in media_items if item["type"] == "video")
+    assert video_item["thumbnail_url"] == video.renditions["thumbnail"]
+    assert video_item["poster_url"] == video.renditions["poster"]
+
+
+if __name__ == "__main__":
+    print("🖼️ Testing media renditions")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Test the Prometheus metrics and the /metrics exposition endpoint
+
+Runs against a temporary SQLite database and the local fake Cloudinary
+server; nothing here touches Cloudinary or the production database.
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="metrics-test-")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_cloudinary import FakeCloudinaryServer
+
+SERVER = FakeCloudinaryServer(api_key="123456", api_secret="test-secret")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+os.environ["CLOUDINARY_API_KEY"] = "123456"
+os.environ["CLOUDINARY_API_SECRET"] = "test-secret"
+os.environ["CLOUDINARY_UPLOAD_PREFIX"] = SERVER.url
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from app import metrics
+from app.config import settings
+from app.database import SessionLocal
+from app.middleware.metrics_middleware import MetricsMiddleware
+from app.services.cloudinary_client import cloudinary_client
+from app.services.cloudinary_metadata import cloudinary_metadata
+from app.services.file_service import file_service
+from main import app
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_requests_are_labelled_by_route_template(client):
+    before = sample("http_request_duration_seconds_count", method="GET", route="/api/health", status="200")
+    assert client.get("/api/health").status_code == 200
+    assert sample("http_request_duration_seconds_count",
+                  method="GET", route="/api/health", status="200") == before + 1
+
+    # Path ids never become label values
+    client.get("/api/tasks/12345")
+    client.get("/api/tasks/67890")
+    labels = {s.labels["route"] for family in REGISTRY.collect()
+              for s in family.samples if s.name == "http_request_duration_seconds_count"}
+    assert "/api/tasks/{task_id}" in labels
+    assert not any("12345" in route for route in labels)
+
+
+def test_unmatched_requests_share_one_label(client):
+    before = sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404")
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+    assert sample("http_request_duration_seconds_count",
+                  method="GET", route="unmatched", status="404") == before + 2
+
+
+def test_in_flight_gauge():
+    seen = []
+    probe = FastAPI()
+    probe.add_middleware(MetricsMiddleware)
+
+    @probe.get("/probe")
+    async def probe_route():
+        seen.append(sample("http_requests_in_flight", method="GET"))
+        return {}
+
+    before = sample("http_requests_in_flight", method="GET")
+    TestClient(probe).get("/probe")
+    assert seen == [before + 1]
+    assert sample("http_requests_in_flight", method="GET") == before
+
+
+def test_db_pool_checkout_is_timed():
+    before = sample("db_pool_checkout_wait_seconds_count")
+    db = SessionLocal()
+    try:
+        db.connection()
+    finally:
+        db.close()
+    assert sample("db_pool_checkout_wait_seconds_count") == before + 1
+    assert sample("db_pool_size") >= 1
+
+
+def test_cache_hit_rates():
+    hits = sample("cache_requests_total", cache="cloudinary_metadata", result="hit")
+    cloudinary_metadata.remember({"resource_type": "image", "public_id": "cached", "bytes": 10})
+    asyncio.run(cloudinary_metadata.get_many([("image", "cached")]))
+    assert sample("cache_requests_total", cache="cloudinary_metadata", result="hit") == hits + 1
+    assert REGISTRY.get_sample_value("cache_requests_total", {"cache": "delivery_url", "result": "miss"}) is not None
+
+
+def test_cloudinary_calls_are_timed():
+    SERVER.start()
+    try:
+        before = sample("cloudinary_request_duration_seconds_count", operation="upload", status="200")
+        asyncio.run(cloudinary_client.upload(b"bytes", public_id="timed"))
+        assert sample("cloudinary_request_duration_seconds_count",
+                      operation="upload", status="200") == before + 1
+        asyncio.run(cloudinary_client.ping())
+        assert sample("cloudinary_request_duration_seconds_count", operation="ping", status="200") >= 1
+    finally:
+        asyncio.run(cloudinary_client.aclose())
+        SERVER.stop()
+
+
+def test_upload_bytes_and_duration():
+    before = sample("media_upload_bytes_total", file_type="image", storage="local")
+    count = sample("media_upload_duration_seconds_count", file_type="image", storage="local")
+    asyncio.run(file_service._store(b"12345", "a.webp", "1", "image/webp", "image", "a.webp"))
+    assert sample("media_upload_bytes_total", file_type="image", storage="local") == before + 5
+    assert sample("media_upload_duration_seconds_count", file_type="image", storage="local") == count + 1
+
+
+def test_scrape_never_waits_on_system_stats(client):
+    asyncio.run(metrics.system_sampler.sample())
+    started = time.monotonic()
+    response = client.get("/metrics")
+    assert time.monotonic() - started < 0.5
+    assert response.status_code == 200
+    assert "text/plain" in response.headers["content-type"]
+    assert "system_cpu_percent" in response.text
+    assert "http_request_duration_seconds_bucket" in response.text
+
+    # The JSON view reads the same sample instead of blocking for a second
+    started = time.monotonic()
+    assert "cpu_percent" in client.get("/api/metrics").json()["system"]
+    assert time.monotonic() - started < 0.5
+
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+
+
+if __name__ == "__main__":
+    print("📈 Testing Prometheus metrics")
+    print("=" * 40)
+    # Collect this module rather than a second copy with its own fake server
+    sys.modules["test_metrics"] = sys.modules["__main__"]
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test the sampling profiler and tracemalloc endpoints
+
+Runs against a temporary SQLite database; nothing here touches Cloudinary
+or the production database.
+"""
+import os
+import sys
+import time
+import threading
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="profiler-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi.testclient import TestClient
+from app import models
+from app.auth import create_access_token
+from app.config import settings
+from app.database import SessionLocal
+from app.services.profiler import SamplingProfiler, sampling_profiler
+from main import app
+
+retained = []
+
+
+def make_restaurant(code: str) -> int:
+    db = SessionLocal()
+    restaurant = models.Restaurant(
+        restaurant_code=code, name=code, cuisine_type="Test",
+        contact_email="profiler@example.com", contact_phone="555", password_hash="not-used"
+    )
+    db.add(restaurant)
+    db.commit()
+    restaurant_id = restaurant.id
+    db.close()
+    return restaurant_id
+
+
+@pytest.fixture(scope="module")
+def tokens():
+    admin_id = make_restaurant("PROF01")
+    other_id = make_restaurant("PROF02")
+    settings.PLATFORM_ADMIN_RESTAURANT_IDS = [admin_id]
+    return {
+        "admin": {"Authorization": f"Bearer {create_access_token(data={'sub': str(admin_id)})}"},
+        "other": {"Authorization": f"Bearer {create_access_token(data={'sub': str(other_id)})}"},
+    }
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    with TestClient(app) as test_client:
+        yield test_client
+    sampling_profiler.stop()
+
+
+def busy_work(stop: threading.Event):
+    total = 0
+    while not stop.is_set():
+        total += sum(range(1000))
+    return total
+
+
+def idle_work(stop: threading.Event):
+    stop.wait()
+
+
+def wait_for_profile(client, headers):
+    for _ in range(200):
+        status = client.get("/api/admin/profiling/cpu/status", headers=headers).json()
+        if status["state"] != "running":
+            return status
+        time.sleep(0.05)
+    raise AssertionError("profile did not finish")
+
+
+def test_disabled_by_default(tokens):
+    assert settings.PROFILING_ENABLED is False
+    with TestClient(app) as client:
+        assert client.post("/api/admin/profiling/cpu", headers=tokens["admin"]).status_code == 404
+
+
+def test_platform_admins_only(client, tokens):
+    assert client.post("/api/admin/profiling/cpu", params={"seconds": 0.1}, headers=tokens["other"]).status_code == 403
+    assert client.get("/api/admin/profiling/cpu/status").status_code == 403
+
+
+def test_profile_targets_endpoint_code():
+    stop = threading.Event()
+    threads = [threading.Thread(target=busy_work, args=(stop,)), threading.Thread(target=idle_work, args=(stop,))]
+    for thread in threads:
+        thread.start()
+    profiler = SamplingProfiler()
+    try:
+        profiler.start(0.3, interval_ms=5, endpoints=[busy_work.__code__])
+        profiler._thread.join()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    assert profiler.status["state"] == "completed"
+    assert profiler.status["samples"] > 10
+    lines = profiler.collapsed().splitlines()
+    assert lines and all("busy_work (test_profiler.py:" in line for line in lines)
+    assert not any("idle_work" in line for line in lines)
+    assert all(line.startswith("thread ") and line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    profile = profiler.speedscope()
+    frames = profile["shared"]["frames"]
+    sampled = profile["profiles"][0]
+    assert sampled["type"] == "sampled" and len(sampled["samples"]) == len(sampled["weights"])
+    assert sampled["endValue"] == sum(sampled["weights"]) == profiler.status["samples"] * 5
+    assert all(0 <= index < len(frames) for stack in sampled["samples"] for index in stack)
+
+
+def test_cpu_profile_endpoints(client, tokens):
+    admin = tokens["admin"]
+    assert client.post("/api/admin/profiling/cpu", params={"seconds": 3600}, headers=admin).status_code == 400
+    assert client.post("/api/admin/profiling/cpu", params={"route": "/api/nope"}, headers=admin).status_code == 404
+
+    response = client.post("/api/admin/profiling/cpu", params={"seconds": 0.3, "interval_ms": 5}, headers=admin)
+    assert response.status_code == 202
+    assert client.post("/api/admin/profiling/cpu", params={"seconds": 0.3}, headers=admin).status_code == 409
+    assert client.get("/api/admin/profiling/cpu/result", headers=admin).status_code == 409
+
+    status = wait_for_profile(client, admin)
+    assert status["state"] == "completed" and status["samples"] > 0
+    # The sampler's own cost stays a small fraction of the time profiled
+    assert status["sampling_seconds"] < 0.3
+
+    collapsed = client.get("/api/admin/profiling/cpu/result", params={"format": "collapsed"}, headers=admin)
+    assert collapsed.headers["content-type"].startswith("text/plain")
+    assert "thread MainThread;" in collapsed.text
+    speedscope = client.get("/api/admin/profiling/cpu/result", headers=admin).json()
+    assert speedscope["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+
+
+def test_cpu_profile_by_route(client, tokens):
+    admin = tokens["admin"]
+    response = client.post("/api/admin/profiling/cpu", params={"seconds": 0.2, "route": "/api/health"}, headers=admin)
+    assert response.status_code == 202 and response.json()["route"] == "/api/health"
+    assert client.post("/api/admin/profiling/cpu/stop", headers=admin).json()["state"] == "stopped"
+
+
+def test_memory_snapshot_diff(client, tokens):
+    admin = tokens["admin"]
+    assert client.post("/api/admin/profiling/memory/snapshot", headers=admin).status_code == 409
+    assert client.post("/api/admin/profiling/memory/start", params={"frames": 5}, headers=admin).json()["state"] == "tracing"
+    try:
+        retained.append([bytes(1024) for _ in range(2048)])
+        diff = client.post("/api/admin/profiling/memory/snapshot", params={"limit": 10}, headers=admin).json()
+        assert diff["size_diff"] >= 2 * 1024 * 1024
+        top = diff["top"][0]
+        assert top["location"][0].startswith("test_profiler.py:") and top["size_diff"] >= 2 * 1024 * 1024
+
+        # The next snapshot is compared against the last one
+        again = client.post("/api/admin/profiling/memory/snapshot", params={"limit": 10}, headers=admin).json()
+        assert again["size_diff"] < 1024 * 1024
+    finally:
+        assert client.post("/api/admin/profiling/memory/stop", headers=admin).json()["state"] == "stopped"
+        retained.clear()
+
+
+if __name__ == "__main__":
+    print("🔬 Testing the profiling endpoints")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
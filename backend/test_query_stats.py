@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test per-request SQL statistics, the slow query log and the N+1 detector
+
+Runs against a temporary SQLite database; nothing here touches Cloudinary
+or the production database.
+"""
+import os
+import sys
+import logging
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="query-stats-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from app import models
+from app.auth import create_access_token
+from app.config import settings
+from app.database import SessionLocal
+from app.middleware.query_stats_middleware import QueryStatsMiddleware
+from app.query_stats import QueryStats, redact, statement_shape
+from main import app
+
+
+@pytest.fixture(scope="module")
+def restaurant():
+    db = SessionLocal()
+    restaurant = models.Restaurant(
+        restaurant_code="QS0001", name="Query Stats", cuisine_type="Test",
+        contact_email="qs@example.com", contact_phone="555", password_hash="not-used"
+    )
+    db.add(restaurant)
+    db.commit()
+    for n in range(6):
+        db.add(models.Location(restaurant_id=restaurant.id, address_line1=f"{n} Street",
+                               town_city="Town", postcode="AB1 2CD"))
+    db.commit()
+    restaurant_id = restaurant.id
+    db.close()
+    return restaurant_id
+
+
+def probe_app():
+    """An app that looks up each location's restaurant one at a time"""
+    probe = FastAPI()
+    probe.add_middleware(QueryStatsMiddleware)
+
+    @probe.get("/by-code")
+    def by_code():
+        db = SessionLocal()
+        try:
+            return {"id": db.execute(
+                text("SELECT id FROM restaurants WHERE restaurant_code = :code"), {"code": "QS0001"}
+            ).scalar()}
+        finally:
+            db.close()
+
+    @probe.get("/locations")
+    def locations():
+        db = SessionLocal()
+        try:
+            names = []
+            for location in db.query(models.Location).all():
+                names.append(db.execute(
+                    text("SELECT name FROM restaurants WHERE id = :id"), {"id": location.restaurant_id}
+                ).scalar())
+            return {"names": names}
+        finally:
+            db.close()
+
+    return probe
+
+
+def test_statement_shape():
+    assert statement_shape("SELECT *\n  FROM t WHERE id IN (?, ?, ?)") == "SELECT * FROM t WHERE id IN (?)"
+    assert statement_shape("SELECT * FROM t WHERE id IN (%(id_1)s, %(id_2)s) LIMIT 10") == \
+        "SELECT * FROM t WHERE id IN (?) LIMIT N"
+
+
+def test_redact_hides_values():
+    assert redact(("hunter22", 7)) == "[str, int]"
+    assert redact({"password": "hunter22"}) == "{password: str}"
+    assert redact([("a", 1), ("b", 2)]) == "2 rows of [str, int]"
+
+
+def test_requests_report_server_timing(restaurant):
+    before = REGISTRY.get_sample_value("db_queries_per_request_count") or 0
+    token = create_access_token(data={"sub": str(restaurant)})
+    with TestClient(app) as client:
+        response = client.get("/api/users/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    timing = response.headers["server-timing"]
+    # The token's restaurant, then its users
+    assert 'db;desc="2 queries"' in timing
+    assert "db-slowest;dur=" in timing
+    assert REGISTRY.get_sample_value("db_queries_per_request_count") == before + 1
+    assert REGISTRY.get_sample_value("db_query_duration_seconds_count", {"operation": "SELECT"}) >= 3
+
+
+def test_slow_queries_are_logged_without_values(restaurant, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "DB_SLOW_QUERY_MS", 0)
+    with caplog.at_level(logging.WARNING, logger="app.query_stats"):
+        TestClient(probe_app()).get("/by-code")
+    slow = [record.getMessage() for record in caplog.records if "Slow query" in record.getMessage()]
+    assert slow == ["Slow query (0ms): SELECT id FROM restaurants WHERE restaurant_code = ? params=[str]"]
+    assert REGISTRY.get_sample_value("db_slow_queries_total", {"operation": "SELECT"}) >= 1
+
+
+def test_n_plus_one_detector(restaurant, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "DEBUG", True)
+    with caplog.at_level(logging.WARNING, logger="app.middleware.query_stats_middleware"):
+        response = TestClient(probe_app()).get("/locations")
+    assert 'db;desc="7 queries"' in response.headers["server-timing"]
+    flagged = [record.getMessage() for record in caplog.records if "Possible N+1" in record.getMessage()]
+    assert len(flagged) == 1
+    assert "GET /locations: 6 x SELECT name FROM restaurants WHERE id = ?" in flagged[0]
+
+
+def test_n_plus_one_detector_is_off_outside_debug(restaurant, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "DEBUG", False)
+    with caplog.at_level(logging.WARNING, logger="app.middleware.query_stats_middleware"):
+        TestClient(probe_app()).get("/locations")
+    assert not any("Possible N+1" in record.getMessage() for record in caplog.records)
+    assert QueryStats().repeated(1) == []
+
+
+if __name__ == "__main__":
+    print("🗄️  Testing SQL query instrumentation")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Test the resumable (tus-style) upload protocol
+
+Runs against a temporary SQLite database and temporary upload and staging
+directories. Nothing here touches Cloudinary or the production database.
+"""
+import os
+import sys
+import json
+import uuid
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+
+WORKDIR = tempfile.mkdtemp(prefix="resumable-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["RESUMABLE_UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "resumable_uploads")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from fastapi import HTTPException
+from app.config import settings
+from app.services.resumable_upload_service import ResumableUploadService
+
+
+async def body(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+def new_service() -> ResumableUploadService:
+    return ResumableUploadService()
+
+
+def test_sessions_are_staged_outside_the_public_upload_directory():
+    service = new_service()
+    upload_root = os.path.realpath(settings.UPLOAD_DIRECTORY)
+    assert not os.path.realpath(service.sessions_dir).startswith(upload_root + os.sep)
+
+
+def test_legacy_sessions_are_moved_out_of_the_upload_directory():
+    legacy_dir = os.path.join(settings.UPLOAD_DIRECTORY, "resumable")
+    legacy_id = str(uuid.uuid4())
+    os.makedirs(os.path.join(legacy_dir, legacy_id))
+    service = new_service()
+    assert not os.path.exists(legacy_dir)
+    assert os.path.isdir(os.path.join(service.sessions_dir, legacy_id))
+
+
+def test_offset_conflict():
+    service = new_service()
+    info = service.create_session(1, 1, "clip.mp4", "video/mp4", 10)
+
+    async def run():
+        await service.append_chunk(info["upload_id"], 1, 0, body(b"abcd"))
+        with pytest.raises(HTTPException) as exc:
+            await service.append_chunk(info["upload_id"], 1, 0, body(b"abcd"))
+        assert exc.value.status_code == 409
+
+    asyncio.run(run())
+    assert service.get_session(info["upload_id"], 1)["offset"] == 4
+
+
+def test_oversized_chunk_is_rejected_without_moving_the_offset():
+    service = new_service()
+    info = service.create_session(1, 1, "clip.mp4", "video/mp4", 6)
+
+    async def run():
+        with pytest.raises(HTTPException) as exc:
+            await service.append_chunk(info["upload_id"], 1, 0, body(b"abcd", b"efgh"))
+        assert exc.value.status_code == 413
+
+    asyncio.run(run())
+    session_dir = os.path.dirname(service.data_path(info["upload_id"]))
+    assert service.get_session(info["upload_id"], 1)["offset"] == 0
+    assert os.path.getsize(service.data_path(info["upload_id"])) == 0
+    assert not [name for name in os.listdir(session_dir) if name.endswith(".part")]
+
+
+def test_bytes_left_by_a_crash_are_truncated():
+    service = new_service()
+    info = service.create_session(1, 1, "clip.mp4", "video/mp4", 8)
+
+    async def run():
+        await service.append_chunk(info["upload_id"], 1, 0, body(b"abcd"))
+        # Simulate a crash after appending a chunk but before info.json was updated
+        with open(service.data_path(info["upload_id"]), "ab") as f:
+            f.write(b"junk")
+        await service.append_chunk(info["upload_id"], 1, 4, body(b"efgh"))
+
+    asyncio.run(run())
+    with open(service.data_path(info["upload_id"]), "rb") as f:
+        assert f.read() == b"abcdefgh"
+
+
+def test_other_restaurants_cannot_see_a_session():
+    service = new_service()
+    info = service.create_session(1, 1, "clip.mp4", "video/mp4", 4)
+    with pytest.raises(HTTPException) as exc:
+        service.get_session(info["upload_id"], 2)
+    assert exc.value.status_code == 404
+
+
+def test_content_that_is_not_video_is_rejected_on_the_first_chunk():
+    service = new_service()
+    info = service.create_session(1, 1, "clip.mp4", "video/mp4", 1024)
+
+    async def run():
+        with pytest.raises(HTTPException) as exc:
+            await service.append_chunk(info["upload_id"], 1, 0, body(b"%PDF-1.7\n" + b"x" * 100))
+        assert exc.value.status_code == 415
+
+    asyncio.run(run())
+    assert service.get_session(info["upload_id"], 1)["offset"] == 0
+
+
+def test_incomplete_upload_cannot_be_completed():
+    service = new_service()
+    info = service.create_session(1, 1, "clip.mp4", "video/mp4", 8)
+    asyncio.run(service.append_chunk(info["upload_id"], 1, 0, body(b"abcd")))
+    with pytest.raises(HTTPException) as exc:
+        service.complete_session(info["upload_id"], 1)
+    assert exc.value.status_code == 409
+
+
+def test_janitor_removes_expired_sessions_and_stale_locks():
+    service = new_service()
+    expired = service.create_session(1, 1, "old.mp4", "video/mp4", 4)
+    busy = service.create_session(1, 1, "busy.mp4", "video/mp4", 4)
+    live = service.create_session(1, 1, "new.mp4", "video/mp4", 4)
+    for info in (expired, busy):
+        info["expires_at"] = (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+        service._write_info(info)
+
+    async def run():
+        service.lock(str(uuid.uuid4()))  # Lock for a session that no longer exists
+        async with service.lock(busy["upload_id"]):
+            assert await service.cleanup_expired() == 1
+
+    asyncio.run(run())
+    assert not os.path.exists(os.path.dirname(service.data_path(expired["upload_id"])))
+    assert os.path.exists(os.path.dirname(service.data_path(busy["upload_id"])))
+    assert os.path.exists(os.path.dirname(service.data_path(live["upload_id"])))
+    assert set(service._locks) == {busy["upload_id"]}
+
+
+def test_protocol_and_concurrent_finalize():
+    """Create, append, HEAD and finalize over HTTP; a second finalize must not race the first"""
+    import httpx
+    import main
+    from app import auth, models
+    from app.database import SessionLocal, engine
+
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"T{uuid.uuid4().hex[:8]}", name="Test", cuisine_type="Test",
+                                   contact_email="test@example.com", contact_phone="0", password_hash="x")
+    db.add(restaurant)
+    db.commit()
+    task = models.Task(restaurant_id=restaurant.id, task="Film the fryer",
+                       category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+    db.add(task)
+    db.commit()
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': str(restaurant.id)})}"}
+    content = b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2" + os.urandom(300 * 1024)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            response = await client.post("/api/upload/resumable", headers=headers, json={
+                "task_id": task.id, "filename": "clip.mp4", "content_type": "video/mp4", "length": len(content)
+            })
+            assert response.status_code == 201
+            location = response.headers["location"]
+
+            chunk_headers = {**headers, "Content-Type": "application/offset+octet-stream"}
+            for offset in range(0, len(content), 100 * 1024):
+                response = await client.patch(location, content=content[offset:offset + 100 * 1024],
+                                              headers={**chunk_headers, "Upload-Offset": str(offset)})
+                assert response.status_code == 204
+                assert int(response.headers["upload-offset"]) == min(offset + 100 * 1024, len(content))
+
+            response = await client.patch(location, content=b"x", headers={**chunk_headers, "Upload-Offset": "0"})
+            assert response.status_code == 409
+
+            response = await client.head(location, headers=headers)
+            assert response.headers["upload-offset"] == str(len(content))
+
+            first, second = await asyncio.gather(
+                client.post(f"{location}/finalize", headers=headers),
+                client.post(f"{location}/finalize", headers=headers)
+            )
+            return sorted([first.status_code, second.status_code]), first if first.status_code == 200 else second
+
+    statuses, finalized = asyncio.run(run())
+    assert statuses == [200, 404]
+
+    db.refresh(task)
+    assert task.video_url == finalized.json()["url"]
+    media = db.query(models.MediaFile).filter(models.MediaFile.task_id == task.id).one()
+    assert media.file_size == len(content)
+    with open(media.file_path, "rb") as f:
+        assert f.read() == content
+    db.close()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing resumable uploads")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))
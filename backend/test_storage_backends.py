@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test storage backends against local stand-ins
+
+The local backend writes to a temporary directory. The S3 backend talks to
+a MinIO server when S3_TEST_ENDPOINT_URL is set (with S3_TEST_ACCESS_KEY_ID
+and S3_TEST_SECRET_ACCESS_KEY), otherwise to an in-process moto server.
+Nothing here touches Cloudinary or the production database.
+"""
+import os
+import sys
+import uuid
+import asyncio
+import tempfile
+
+# Keep the test offline - never ping Cloudinary on import
+os.environ.setdefault("USE_CLOUD_STORAGE", "false")
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from app.services.storage_backends import LocalStorageBackend, S3StorageBackend, StorageBackend
+
+
+def start_s3_stand_in():
+    """Return (endpoint, access_key, secret_key, stop)"""
+    endpoint = os.environ.get("S3_TEST_ENDPOINT_URL")
+    if endpoint:
+        return (endpoint, os.environ.get("S3_TEST_ACCESS_KEY_ID", "minioadmin"),
+                os.environ.get("S3_TEST_SECRET_ACCESS_KEY", "minioadmin"), lambda: None)
+
+    from moto.server import ThreadedMotoServer
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    return f"http://{host}:{port}", "test", "test", server.stop
+
+
+async def exercise_backend(backend: StorageBackend, workdir: str) -> None:
+    """Round-trip put, stream-put, get, url and deletes through one backend"""
+    key = f"task_completions/1/{uuid.uuid4()}.webp"
+    stored = await backend.put(key, b"image-bytes", "image/webp")
+    assert stored.storage_type == backend.storage_type
+    assert stored.file_size == len(b"image-bytes")
+    assert await backend.get(stored.file_path) == b"image-bytes"
+
+    source_path = os.path.join(workdir, "video.mp4")
+    with open(source_path, 'wb') as f:
+        f.write(os.urandom(6 * 1024 * 1024))  # Large enough for a multipart upload
+    video_key = f"task_completions/1/{uuid.uuid4()}.mp4"
+    stored_video = await backend.put_file(video_key, source_path, "video/mp4", move=True)
+    assert not os.path.exists(source_path)
+    assert stored_video.file_size == 6 * 1024 * 1024
+    assert len(await backend.get(stored_video.file_path, "video")) == stored_video.file_size
+
+    assert backend.url(stored.file_path, "http://testserver").endswith(key)
+
+    assert await backend.delete(stored.file_path) is True
+    assert await backend.delete(stored.file_path) is False
+
+    keys = [f"task_completions/2/{uuid.uuid4()}.webp" for _ in range(5)]
+    paths = [(await backend.put(k, b"x", "image/webp")).file_path for k in keys]
+    assert await backend.delete_many(paths + [stored_video.file_path]) == 6
+
+    assert (await backend.check())["status"] == "success"
+
+
+def test_local_backend():
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = LocalStorageBackend(root=os.path.join(tmp, "uploads"))
+        asyncio.run(exercise_backend(backend, tmp))
+
+
+def test_s3_backend():
+    if not os.environ.get("S3_TEST_ENDPOINT_URL"):
+        pytest.importorskip("moto.server")
+    endpoint, access_key, secret_key, stop = start_s3_stand_in()
+    try:
+        bucket = f"test-{uuid.uuid4().hex[:12]}"
+        backend = S3StorageBackend(bucket=bucket, endpoint_url=endpoint, region="us-east-1",
+                                   access_key_id=access_key, secret_access_key=secret_key)
+        backend.client.create_bucket(Bucket=bucket)
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(exercise_backend(backend, tmp))
+        assert backend.url("task_completions/1/a.webp") == f"{endpoint}/{bucket}/task_completions/1/a.webp"
+    finally:
+        stop()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing storage backends")
+    print("=" * 40)
+    test_local_backend()
+    print("✅ Local backend")
+    test_s3_backend()
+    print("✅ S3 backend")
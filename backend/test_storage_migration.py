@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Test the resumable local to Cloudinary migration
+
+Cloudinary is a local fake (fake_cloudinary.py) and the database a
+temporary SQLite file; nothing here touches Cloudinary or the production
+database.
+"""
+import io
+import os
+import sys
+import json
+import uuid
+import asyncio
+import tempfile
+
+WORKDIR = tempfile.mkdtemp(prefix="storage-migration-test-")
+
+# Never let this test reach the production database or Cloudinary
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ["USE_CLOUD_STORAGE"] = "false"
+os.environ["UPLOAD_DIRECTORY"] = os.path.join(WORKDIR, "uploads")
+os.environ["CLOUDINARY_CLOUD_NAME"] = "test-cloud"
+os.environ["CLOUDINARY_API_KEY"] = "123456"
+os.environ["CLOUDINARY_API_SECRET"] = "test-secret"
+
+# Add current directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+import cloudinary
+from PIL import Image
+from fastapi.testclient import TestClient
+from fake_cloudinary import FakeCloudinaryServer
+from app import crud, models
+from app.auth import create_access_token
+from app.config import settings
+from app.database import SessionLocal, engine
+from app.services.cloudinary_client import cloudinary_client
+from app.services.file_service import file_service
+from app.services.storage_migration import storage_migration_job, _hash_file
+from main import app
+
+
+def jpeg(color) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (40, 30), color).save(output, format="JPEG")
+    return output.getvalue()
+
+
+@pytest.fixture(scope="module")
+def fake_cloudinary():
+    server = FakeCloudinaryServer().start()
+    previous_prefix = cloudinary.config().upload_prefix
+    cloudinary.config(upload_prefix=server.url)
+    yield server.state
+    cloudinary.config(upload_prefix=previous_prefix)
+    server.stop()
+
+
+@pytest.fixture(scope="module")
+def media():
+    """Two tasks with local media; the second task's photo repeats the first's"""
+    assert engine.url.get_backend_name() == "sqlite"
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    restaurant = models.Restaurant(restaurant_code=f"M{uuid.uuid4().hex[:8]}", name="Migrate", cuisine_type="Test",
+                                   contact_email="migrate@example.com", contact_phone="0", password_hash="not-used")
+    db.add(restaurant)
+    db.commit()
+
+    async def store(task, content):
+        key = f"task_completions/{task.id}/{uuid.uuid4()}.jpg"
+        stored = await file_service.local_backend.put(key, content, "image/jpeg")
+        file_url = file_service.get_file_url(stored.file_path, "http://testserver", "local")
+        crud.create_media_file(db, {
+            "task_id": task.id, "restaurant_id": restaurant.id, "filename": os.path.basename(key),
+            "original_filename": "proof.jpg", "file_path": stored.file_path, "file_url": file_url,
+            "file_size": stored.file_size, "mime_type": "image/jpeg", "file_type": "image", "storage_type": "local"
+        })
+        crud.adjust_storage_usage(db, restaurant.id, "local", stored.file_size, 1)
+        task.image_url = file_url
+        db.commit()
+        return stored.file_path
+
+    tasks, paths = [], []
+    shared = jpeg((10, 120, 200))
+    for contents in ([shared, jpeg((200, 20, 20))], [shared]):
+        task = models.Task(restaurant_id=restaurant.id, task="Photograph the walk-in",
+                           category=models.TaskCategory.CLEANING, day=models.Day.MONDAY)
+        db.add(task)
+        db.commit()
+        tasks.append(task)
+        for content in contents:
+            paths.append(asyncio.run(store(task, content)))
+    yield db, restaurant, tasks, paths
+    db.close()
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    """Public ids uploaded through the client"""
+    uploaded = []
+    upload_large = cloudinary_client.upload_large
+
+    async def counting(file_path, **options):
+        uploaded.append(options["public_id"])
+        return await upload_large(file_path, **options)
+
+    monkeypatch.setattr(cloudinary_client, "upload_large", counting)
+    return uploaded
+
+
+def migrate(**options) -> dict:
+    async def run():
+        storage_migration_job.start(**options)
+        await storage_migration_job._task
+        # Another loop runs the next migration; drop the client bound to this one
+        await cloudinary_client.aclose()
+    asyncio.run(run())
+    return storage_migration_job.status
+
+
+def manifest() -> list:
+    with open(storage_migration_job.manifest_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_migration_resumes_from_its_manifest(media, fake_cloudinary, uploads):
+    db, restaurant, (first_task, second_task), paths = media
+    first_path, second_path, _ = paths
+    shared_hash = _hash_file(first_path)
+
+    status = migrate(task_id=str(first_task.id))
+    assert (status["state"], status["scanned"], status["migrated"], status["skipped"]) == ("completed", 2, 2, 0)
+    assert len(uploads) == 2
+    assert {entry["content_hash"] for entry in manifest()} == {shared_hash, _hash_file(second_path)}
+
+    # A crash mid-write leaves a torn final line; the next run ignores it
+    with open(storage_migration_job.manifest_path, "a") as f:
+        f.write('{"content_hash": "tor')
+
+    uploads.clear()
+    status = migrate()
+    assert status["state"] == "completed" and status["failed"] == 0
+    # Local files stay until GC; every one, including the second task's
+    # copy of the first photo, is matched to the manifest by content hash
+    assert (status["scanned"], status["migrated"], status["skipped"]) == (3, 0, 3)
+    assert uploads == []
+    assert len(fake_cloudinary["assets"]) == 2
+
+    db.expire_all()
+    rows = db.query(models.MediaFile).order_by(models.MediaFile.id).all()
+    assert all(row.storage_type == "cloudinary" for row in rows)
+    assert rows[0].file_path == rows[2].file_path
+    assert rows[2].file_path in fake_cloudinary["assets"]
+    assert db.get(models.Task, second_task.id).image_url == rows[2].file_url
+
+    # The two copies of the first photo became one asset, counted once
+    usage = {row.storage_type: row.object_count for row in crud.get_storage_usage(db, restaurant.id)}
+    assert usage == {"local": 0, "cloudinary": 2}
+    recalculated = {row.storage_type: row.object_count for row in crud.recalculate_storage_usage(db, restaurant.id)}
+    assert recalculated.get("cloudinary") == 2 and not recalculated.get("local")
+
+
+def test_migration_is_platform_admin_only(media, monkeypatch):
+    db, restaurant, tasks, paths = media
+    other = models.Restaurant(restaurant_code=f"O{uuid.uuid4().hex[:8]}", name="Other", cuisine_type="Test",
+                              contact_email="other@example.com", contact_phone="0", password_hash="not-used")
+    db.add(other)
+    db.commit()
+    monkeypatch.setattr(settings, "PLATFORM_ADMIN_RESTAURANT_IDS", [restaurant.id])
+    admin = {"Authorization": f"Bearer {create_access_token(data={'sub': str(restaurant.id)})}"}
+    tenant = {"Authorization": f"Bearer {create_access_token(data={'sub': str(other.id)})}"}
+
+    client = TestClient(app)
+    assert client.post("/api/admin/storage/migrate", headers=tenant).status_code == 403
+    assert client.get("/api/admin/storage/migrate/status", headers=tenant).status_code == 403
+    assert client.get("/api/admin/storage/migrate/status", headers=admin).json()["state"] == "completed"
+    # Cloudinary is not configured in this process, so the admin is told so
+    assert client.post("/api/admin/storage/migrate", headers=admin).status_code == 400
+
+
+if __name__ == "__main__":
+    print("☁️ Testing the storage migration")
+    print("=" * 40)
+    sys.exit(pytest.main([__file__, "-q"]))